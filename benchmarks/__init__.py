@@ -0,0 +1 @@
+"""Offline benchmarks. Chạy từng file bằng `python -m benchmarks.<tên>`; kết quả in ra dạng JSON."""
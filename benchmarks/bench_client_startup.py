@@ -0,0 +1,91 @@
+"""Chi phí khởi tạo BedrockClient mỗi lần rerun vs client dùng chung, và latency request đầu tiên khi có/không warm-up.
+
+    python -m benchmarks.bench_client_startup [-n 20] [--live] [--out result.json]
+
+Phần khởi tạo chạy offline (tạo boto3 client + resolve credentials). --live gọi Bedrock thật
+(cần credentials, tốn vài token): mỗi kịch bản chạy trong process con mới để request đầu tiên
+thật sự phải bắt tay TLS từ đầu.
+"""
+
+import argparse
+import json
+import logging
+import subprocess
+import sys
+import time
+
+CHILD = """
+import json, sys, time
+from src.bedrock_client import BedrockClient
+from src.inference import build_body_for_model
+from src.utils import MODEL_ID
+warm = sys.argv[1] == "warm"
+client = BedrockClient()
+warmup_s = client.warm_up() if warm else 0.0
+body = build_body_for_model(MODEL_ID, "phở bò", 0.0, 16)
+t0 = time.perf_counter()
+client.invoke(MODEL_ID, body)
+first = time.perf_counter() - t0
+t0 = time.perf_counter()
+client.invoke(MODEL_ID, body)
+print(json.dumps({"warmup_s": warmup_s, "first_call_s": first, "second_call_s": time.perf_counter() - t0}))
+"""
+
+
+def measure_init(n: int) -> dict:
+    from src.bedrock_client import BedrockClient, get_bedrock_client
+
+    logging.getLogger("bedrock").setLevel(logging.WARNING)
+    BedrockClient()  # import/khởi tạo botocore lần đầu không tính
+    t0 = time.perf_counter()
+    for _ in range(n):
+        BedrockClient()
+    per_new = (time.perf_counter() - t0) / n
+
+    get_bedrock_client(warm_up=False)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        get_bedrock_client(warm_up=False)
+    per_shared = (time.perf_counter() - t0) / n
+    return {
+        "new_client_per_rerun_ms": round(per_new * 1000, 3),
+        "shared_client_per_rerun_ms": round(per_shared * 1000, 6),
+    }
+
+
+def measure_first_call(runs: int) -> dict:
+    out = {}
+    for mode in ("cold", "warm"):
+        samples = []
+        for _ in range(runs):
+            proc = subprocess.run([sys.executable, "-c", CHILD, mode], capture_output=True, text=True)
+            if proc.returncode != 0:
+                return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr else "child failed"}
+            samples.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        out[mode] = {
+            key: round(sorted(s[key] for s in samples)[len(samples) // 2], 4)
+            for key in ("warmup_s", "first_call_s", "second_call_s")
+        }
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-n", type=int, default=20, help="Số lần khởi tạo client")
+    ap.add_argument("--live", action="store_true", help="Đo request đầu tiên với Bedrock thật")
+    ap.add_argument("--runs", type=int, default=3, help="Số process con mỗi kịch bản (--live), lấy median")
+    ap.add_argument("--out", help="Ghi kết quả JSON ra file")
+    args = ap.parse_args(argv)
+
+    results = {"init": measure_init(args.n)}
+    if args.live:
+        results["first_call"] = measure_first_call(args.runs)
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Output bị cắt ở max_tokens: nối tiếp (src/continuation.py) so với chạy lại cả request, theo họ model.
+
+    python -m benchmarks.bench_continuation [--max-tokens 120] [--rerun-max-tokens 1024]
+                                            [--latency-ms 200] [--per-token-ms 15] [--runs 3] [--out result.json]
+
+Chạy offline trên FakeBedrockRuntime(honor_max_tokens=True): output mẫu bị cắt theo max_tokens của request
+với stop reason hết token như model thật, thời gian gọi = latency + per_token_ms * token output.
+  - rerun: lần gọi đầu bị cắt rồi chạy lại với --rerun-max-tokens (cách cũ: "Tăng max_tokens"),
+  - continuation: invoke_model tự nối tiếp từ JSON cắt dở.
+Cả hai đều tính lần gọi đầu; chi phí theo giá trong src/models.py.
+"""
+
+import argparse
+import json
+import statistics
+import time
+from typing import Any, Dict
+
+from src.bedrock_client import BedrockClient
+from src.inference import build_body_for_model, invoke_model
+from src.models import get_model_cost_estimates
+from src.parser import parse_and_validate
+
+from .bench_pipeline import _git_commit
+from .stub_bedrock import FakeBedrockRuntime
+
+MODELS = {
+    "claude": "anthropic.claude-3-5-sonnet-20240620-v1:0",
+    "nova": "amazon.nova-lite-v1:0",
+    "titan": "amazon.titan-text-express-v1",
+    "llama": "meta.llama3-8b-instruct-v1:0",
+}
+DESC = "bún bò huế"
+
+
+def _cost(model_id: str, tokens_in: int, tokens_out: int) -> float:
+    cost_in_1k, cost_out_1k = get_model_cost_estimates(model_id)
+    return (tokens_in / 1000.0) * cost_in_1k + (tokens_out / 1000.0) * cost_out_1k
+
+
+def run_rerun(client: BedrockClient, model_id: str, max_tokens: int, rerun_max_tokens: int) -> Dict[str, Any]:
+    tokens_in = tokens_out = 0
+    t0 = time.perf_counter()
+    for limit in (max_tokens, rerun_max_tokens):
+        _, hdrs = client.invoke(model_id=model_id, body=build_body_for_model(model_id, DESC, 0.2, limit))
+        tokens_in += int(hdrs["x-amzn-bedrock-input-token-count"])
+        tokens_out += int(hdrs["x-amzn-bedrock-output-token-count"])
+    return {"latency_s": time.perf_counter() - t0, "tokens_in": tokens_in, "tokens_out": tokens_out}
+
+
+def run_continuation(client: BedrockClient, model_id: str, max_tokens: int) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    raw, metrics = invoke_model(client, DESC, model_id, 0.2, max_tokens, use_cache=False, hedge=False)
+    latency = time.perf_counter() - t0
+    parse_and_validate(raw, model_id)  # phải ra Dish hợp lệ
+    return {"latency_s": latency, "tokens_in": metrics["tokens_in"], "tokens_out": metrics["tokens_out"],
+            "estimate": metrics.get("continuation") or {}}
+
+
+def bench_model(client: BedrockClient, model_id: str, args) -> Dict[str, Any]:
+    rerun = [run_rerun(client, model_id, args.max_tokens, args.rerun_max_tokens) for _ in range(args.runs)]
+    cont = [run_continuation(client, model_id, args.max_tokens) for _ in range(args.runs)]
+    r, c = rerun[-1], cont[-1]
+    r_cost, c_cost = _cost(model_id, r["tokens_in"], r["tokens_out"]), _cost(model_id, c["tokens_in"], c["tokens_out"])
+    r_s = statistics.median(x["latency_s"] for x in rerun)
+    c_s = statistics.median(x["latency_s"] for x in cont)
+    est = c["estimate"]
+    return {
+        "rerun": {"tokens_in": r["tokens_in"], "tokens_out": r["tokens_out"],
+                  "cost_usd": round(r_cost, 6), "latency_s": round(r_s, 3)},
+        "continuation": {"tokens_in": c["tokens_in"], "tokens_out": c["tokens_out"], "rounds": est.get("rounds"),
+                         "cost_usd": round(c_cost, 6), "latency_s": round(c_s, 3)},
+        "saved": {"tokens_out": r["tokens_out"] - c["tokens_out"], "cost_usd": round(r_cost - c_cost, 6),
+                  "cost_pct": round(100 * (r_cost - c_cost) / r_cost, 1) if r_cost else 0.0,
+                  "latency_s": round(r_s - c_s, 3)},
+        # Ước lượng của continuation.py (chỉ so phần sau lần gọi đầu) để đối chiếu với số đo
+        "metrics_estimate": {"cost_saved_usd": est.get("cost_saved_usd"),
+                             "latency_saved_s": est.get("latency_saved_s")},
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--max-tokens", type=int, default=120, help="max_tokens của request (đủ nhỏ để output bị cắt)")
+    ap.add_argument("--rerun-max-tokens", type=int, default=1024, help="max_tokens khi chạy lại")
+    ap.add_argument("--latency-ms", type=float, default=200.0, help="Độ trễ cố định mỗi lần gọi")
+    ap.add_argument("--per-token-ms", type=float, default=15.0, help="Thời gian sinh mỗi token output")
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--out", help="Ghi kết quả JSON ra file")
+    args = ap.parse_args(argv)
+
+    client = BedrockClient(client=FakeBedrockRuntime(latency_ms=args.latency_ms, per_token_ms=args.per_token_ms,
+                                                     honor_max_tokens=True))
+    results = {
+        "commit": _git_commit(),
+        "max_tokens": args.max_tokens,
+        "rerun_max_tokens": args.rerun_max_tokens,
+        "models": {family: bench_model(client, model_id, args) for family, model_id in MODELS.items()},
+    }
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Peak memory của một request ảnh: đường cũ (decode -> PNG -> base64 str -> json.dumps) vs đường bytes.
+
+    python -m benchmarks.bench_image_memory [--out result.json]
+
+Mỗi kịch bản chạy trong một process con để số peak RSS (ru_maxrss) không bị lẫn;
+tracemalloc chỉ thấy bộ nhớ do Python cấp phát, không thấy buffer pixel của Pillow.
+"""
+
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+from PIL import Image
+
+MODEL_ID = "anthropic.claude-3-5-sonnet-20240620-v1:0"
+SCENARIOS = {
+    # tên: (ảnh đầu vào, đường xử lý)
+    "legacy_small": ("small", "legacy"),
+    "bytes_small": ("small", "bytes"),
+    "legacy_large": ("large", "legacy"),
+    "bytes_large": ("large", "bytes"),
+}
+
+
+def _max_rss_bytes() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _legacy_body(data: bytes) -> str:
+    """Đường xử lý trước đây: PIL decode, PNG, bytes, base64 str, dict, json.dumps."""
+    from src.prompt_builder import build_prompt_with_image
+    from src.utils import to_base64
+
+    img = Image.open(io.BytesIO(data))
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    b64 = to_base64(buf.getvalue())
+    body = build_prompt_with_image("", b64, "image/png")
+    return json.dumps(body)
+
+
+def _bytes_body(data: bytes):
+    from src.inference import _build_request_body
+
+    body, _ = _build_request_body(MODEL_ID, "", 0.2, 512, data, 0)
+    return body
+
+
+def _run_child(image_path: str, path: str) -> dict:
+    with open(image_path, "rb") as f:
+        data = f.read()
+    import src.inference  # noqa: F401  (import trước khi đo)
+
+    rss_before = _max_rss_bytes()
+    tracemalloc.start()
+    body = _legacy_body(data) if path == "legacy" else _bytes_body(data)
+    _, py_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "input_bytes": len(data),
+        "body_bytes": len(body),
+        "python_peak_bytes": py_peak,
+        "rss_peak_growth_bytes": max(0, _max_rss_bytes() - rss_before),
+    }
+
+
+def _make_images(tmp: str) -> dict:
+    paths = {}
+    for name, size in (("small", (1024, 768)), ("large", (4000, 3000))):
+        path = os.path.join(tmp, f"{name}.jpg")
+        Image.effect_noise(size, 8).convert("RGB").save(path, "JPEG", quality=85)
+        paths[name] = path
+    return paths
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--out", help="Ghi kết quả JSON ra file")
+    ap.add_argument("--child", nargs=2, metavar=("IMAGE", "PATH"), help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(_run_child(*args.child)))
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        images = _make_images(tmp)
+        for name, (image, path) in SCENARIOS.items():
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_image_memory", "--child", images[image], path],
+                capture_output=True, text=True, check=True,
+                env={**os.environ, "IMAGE_CACHE_ENABLED": "false", "CACHE_ENABLED": "false"},
+            )
+            results[name] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Ngân sách thời gian import lúc cold start (python -X importtime), tách core inference và UI.
+
+    python -m benchmarks.bench_import_time [--runs 5] [--budget core=100] [--out result.json]
+
+Mỗi target được import trong process con mới, lấy median thời gian cumulative của module.
+Exit code 1 nếu target vượt ngân sách (ms) hoặc nạp module nặng không được phép lúc import
+(vd. core kéo theo boto3/Pillow/pydantic/streamlit). tests/test_import_time.py chạy cùng các target
+và ngân sách này trong pytest.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# tên: (module, ngân sách ms mặc định, module không được nạp lúc import)
+TARGETS = {
+    "core": ("src.inference", 100, ("boto3", "botocore.config", "tenacity", "PIL.Image", "pydantic",
+                                    "streamlit", "http.server")),
+    "batch": ("src.batch", 120, ("boto3", "botocore.config", "tenacity", "PIL.Image", "streamlit")),
+    "client": ("src.bedrock_client", 150, ("boto3", "botocore.config", "tenacity", "pydantic", "streamlit")),
+    "ui": ("src.app_main", 1500, ()),
+}
+
+
+def _import_profile(module: str) -> dict:
+    """{module_name: cumulative_us} cho một lần import trong process mới."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, cwd=ROOT)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed: {proc.stderr.strip().splitlines()[-1:]}")
+    profile = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        try:
+            profile[name.strip()] = int(cumulative.strip())
+        except ValueError:  # dòng tiêu đề
+            continue
+    return profile
+
+
+def measure(name: str, runs: int, budget_ms: float) -> dict:
+    module, _, forbidden = TARGETS[name]
+    samples, heaviest, loaded = [], [], set()
+    for _ in range(runs):
+        profile = _import_profile(module)
+        samples.append(profile.get(module, 0) / 1000.0)
+        loaded |= set(profile)
+        heaviest = sorted(((v / 1000.0, k) for k, v in profile.items() if k != module), reverse=True)[:8]
+    elapsed = statistics.median(samples)
+    bad = sorted(m for m in forbidden if m in loaded)
+    return {
+        "module": module,
+        "import_ms": round(elapsed, 1),
+        "budget_ms": budget_ms,
+        "ok": elapsed <= budget_ms and not bad,
+        "forbidden_loaded": bad,
+        "heaviest_ms": {k: round(v, 1) for v, k in heaviest},
+        "modules_loaded": len(loaded),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--target", action="append", choices=sorted(TARGETS), help="Mặc định: tất cả")
+    ap.add_argument("--budget", action="append", default=[], metavar="NAME=MS", help="Ghi đè ngân sách")
+    ap.add_argument("--out", help="Ghi kết quả JSON ra file")
+    args = ap.parse_args(argv)
+
+    budgets = {name: spec[1] for name, spec in TARGETS.items()}
+    for item in args.budget:
+        name, _, value = item.partition("=")
+        budgets[name] = float(value)
+
+    results = {name: measure(name, args.runs, budgets[name]) for name in (args.target or TARGETS)}
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+    failed = [name for name, r in results.items() if not r["ok"]]
+    if failed:
+        print(f"Import budget exceeded: {', '.join(failed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""Tốc độ và độ tin cậy của bước tách JSON: hai bộ quét ngoặc cũ vs json_extract.find_json_object.
+
+    python -m benchmarks.bench_json_extract [--corpus FILE] [--fuzz N] [--out result.json]
+
+Corpus (benchmarks/corpus/model_outputs.jsonl): mỗi dòng {"model_id", "family", "text"} là
+output thô của model (lời dẫn, ```json fence, ngoặc trong string, bị cắt...). Fuzz cắt mỗi
+mẫu tại N vị trí ngẫu nhiên (giả lập max_tokens) và đếm số lần ra được Dish hợp lệ.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import time
+
+from pydantic import ValidationError
+
+from src.json_extract import find_json_object
+from src.parser import _drop_partial_ingredients
+from src.schema import Dish
+
+CORPUS = os.path.join(os.path.dirname(__file__), "corpus", "model_outputs.jsonl")
+
+
+# =========================
+# Bản cũ (giữ lại để so sánh)
+# =========================
+def _legacy_parser(text: str) -> str:
+    t = text.strip()
+    if t.startswith("```"):
+        t = re.sub(r"^```[a-zA-Z]*\n?", "", t)
+        t = re.sub(r"\n?```$", "", t).strip()
+    start = t.find("{")
+    if start == -1:
+        return t
+    depth = 0
+    for i in range(start, len(t)):
+        if t[i] == "{":
+            depth += 1
+        elif t[i] == "}":
+            depth -= 1
+            if depth == 0:
+                candidate = t[start:i + 1]
+                try:
+                    json.loads(candidate)
+                    return candidate
+                except Exception:
+                    break
+    m = re.search(r"\{[\s\S]*\}", t)
+    return m.group(0) if m else t
+
+
+def _legacy_processor(text: str) -> str:
+    text = text.strip()
+    start_idx = text.find("{")
+    if start_idx == -1:
+        raise ValueError("No JSON found in response")
+    brace_count = 0
+    for i in range(start_idx, len(text)):
+        if text[i] == "{":
+            brace_count += 1
+        elif text[i] == "}":
+            brace_count -= 1
+            if brace_count == 0:
+                return text[start_idx:i + 1]
+    json_text = text[start_idx:]
+    open_braces = json_text.count("{") - json_text.count("}")
+    open_brackets = json_text.count("[") - json_text.count("]")
+    return json_text + "]" * max(0, open_brackets) + "}" * max(0, open_braces)
+
+
+def _new(text: str) -> str:
+    return find_json_object(text)[0]
+
+
+EXTRACTORS = {
+    "legacy_parser": _legacy_parser,
+    "legacy_processor": _legacy_processor,
+    "json_extract": _new,
+}
+
+
+def _to_dish(extract, text: str, repair_items: bool = False) -> bool:
+    try:
+        data = json.loads(extract(text))
+        if repair_items:
+            data = _drop_partial_ingredients(data)
+        Dish.model_validate(data)
+        return True
+    except (ValueError, ValidationError):
+        return False
+
+
+def _load(path: str):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _timeit(fn, texts, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for t in texts:
+            try:
+                fn(t)
+            except ValueError:
+                pass
+    return (time.perf_counter() - start) / (repeat * len(texts)) * 1e6
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--corpus", default=CORPUS)
+    ap.add_argument("--fuzz", type=int, default=200, help="Số điểm cắt ngẫu nhiên mỗi mẫu")
+    ap.add_argument("--repeat", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", help="Ghi kết quả JSON ra file")
+    args = ap.parse_args(argv)
+
+    samples = _load(args.corpus)
+    texts = [s["text"] for s in samples]
+    # văn bản dài (output nhiều nguyên liệu) để thấy chênh lệch quét từng ký tự
+    long_texts = [t.replace('"ingredients": [', '"ingredients": [' + '{"name": "x", "quantity": "1"}, ' * 200, 1)
+                  for t in texts]
+
+    rng = random.Random(args.seed)
+    truncated = []
+    for s in samples:
+        t = s["text"]
+        for _ in range(args.fuzz):
+            truncated.append((s["family"], t[:rng.randint(1, len(t))]))
+
+    results = {}
+    for name, fn in EXTRACTORS.items():
+        per_family = {}
+        for s in samples:
+            stats = per_family.setdefault(s["family"], {"samples": 0, "valid": 0})
+            stats["samples"] += 1
+            stats["valid"] += _to_dish(fn, s["text"], repair_items=(name == "json_extract"))
+        fuzz_ok = sum(_to_dish(fn, t, repair_items=(name == "json_extract")) for _, t in truncated)
+        results[name] = {
+            "us_per_call": round(_timeit(fn, texts, args.repeat), 2),
+            "us_per_call_long": round(_timeit(fn, long_texts, max(1, args.repeat // 10)), 2),
+            "corpus_valid": sum(v["valid"] for v in per_family.values()),
+            "corpus_total": len(samples),
+            "per_family": per_family,
+            "truncated_valid_rate": round(fuzz_ok / len(truncated), 4) if truncated else None,
+        }
+
+    text = json.dumps({"corpus": os.path.relpath(args.corpus), "truncated_cases": len(truncated),
+                       "results": results}, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Knowledge base món ăn (src/knowledge_base.py): thời gian nạp file, latency lookup, tỉ lệ hit và hit sai.
+
+    python -m benchmarks.bench_knowledge_base [--dishes 300000] [--queries 5000] [--file FILE] [--out result.json]
+
+Knowledge base được dựng từ các món tổng hợp (món x kiểu x nguyên liệu thêm, tên đều khác nhau) với
+Dish đầy đủ nguyên liệu; --file giữ file để chạy lại không phải dựng. Truy vấn gồm:
+  - known: tên món đã có, viết trong câu hỏi khác / không dấu / đảo thứ tự -> phải hit đúng món,
+  - servings: cùng tên món nhưng thêm khẩu phần ("cho 4 người") -> phải miss,
+  - unseen: món không có trong knowledge base -> phải miss.
+Hit sai = hit ở hai nhóm sau, hoặc hit vào món khác với món của câu hỏi.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+from src.knowledge_base import KnowledgeBase
+from src.semantic_cache import _fold
+
+from .bench_pipeline import _git_commit
+from .bench_semantic_cache import DISHES, EXTRAS, STYLES, TEMPLATES, UNSEEN, _pct
+
+UNITS = ("g", "ml", "muỗng canh", "muỗng cà phê", "củ", "quả", "bó")
+
+
+def synthetic_names(n: int, seed: int = 0) -> List[str]:
+    """n tên món khác nhau: món [kiểu] [nguyên liệu thêm...]."""
+    rng = random.Random(seed)
+    combos = itertools.chain(
+        ((d, s, ()) for d in DISHES for s in STYLES),
+        ((d, s, (e,)) for d in DISHES for s in STYLES for e in EXTRAS),
+        ((d, s, pair) for d in DISHES for s in STYLES for pair in itertools.combinations(EXTRAS, 2)),
+        ((d, s, triple) for d in DISHES for s in STYLES for triple in itertools.combinations(EXTRAS, 3)),
+    )
+    names = [" ".join(p for p in (dish, style, *extras) if p) for dish, style, extras in itertools.islice(combos, n)]
+    rng.shuffle(names)
+    return names
+
+
+def _dish(rng: random.Random, name: str) -> Dict[str, Any]:
+    return {
+        "dish_name": name,
+        "cuisine": "Vietnamese",
+        "ingredients": [
+            {"name": item, "quantity": str(rng.randint(1, 500)), "unit": rng.choice(UNITS)}
+            for item in rng.sample(EXTRAS, rng.randint(4, 10))
+        ],
+    }
+
+
+def build(kb: KnowledgeBase, names: List[str], chunk: int = 10000) -> float:
+    rng = random.Random(1)
+    t0 = time.perf_counter()
+    for start in range(0, len(names), chunk):
+        kb.promote_many((_dish(rng, name), ()) for name in names[start:start + chunk])
+    return time.perf_counter() - t0
+
+
+def _ask(rng: random.Random, name: str) -> str:
+    words = name.split()
+    if rng.random() < 0.3:
+        rng.shuffle(words)  # đảo thứ tự từ
+    text = rng.choice(TEMPLATES).format(d=" ".join(words))
+    return _fold(text.lower()) if rng.random() < 0.3 else text  # gõ không dấu
+
+
+def run_queries(kb: KnowledgeBase, names: List[str], n: int, seed: int = 2) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    groups: Dict[str, List[Tuple[str, str]]] = {"known": [], "servings": [], "unseen": []}
+    for _ in range(n):
+        name = rng.choice(names)
+        groups["known"].append((_ask(rng, name), name))
+        groups["servings"].append((_ask(rng, f"{name} cho {rng.randint(2, 12)} người"), ""))
+        groups["unseen"].append((_ask(rng, f"{rng.choice(UNSEEN)} {rng.choice(STYLES)}".strip()), ""))
+
+    results = {}
+    for group, queries in groups.items():
+        latencies, hits, wrong = [], 0, []
+        for query, expected in queries:
+            t0 = time.perf_counter()
+            dish = kb.lookup(query)
+            latencies.append(time.perf_counter() - t0)
+            if dish is None:
+                continue
+            hits += 1
+            matched = json.loads(dish)["dish_name"]
+            if matched != expected:
+                wrong.append({"query": query, "matched": matched})
+        results[group] = {
+            "queries": len(queries),
+            "hit_rate": round(hits / len(queries), 4),
+            "false_hits": len(wrong),
+            "false_hit_samples": wrong[:5],
+            "lookup_us": {"mean": round(statistics.mean(latencies) * 1e6, 1),
+                          "p50": round(_pct(latencies, 0.5) * 1e6, 1),
+                          "p99": round(_pct(latencies, 0.99) * 1e6, 1)},
+        }
+    return results
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--dishes", type=int, default=300000, help="Số món trong knowledge base")
+    ap.add_argument("--queries", type=int, default=5000, help="Số truy vấn mỗi nhóm")
+    ap.add_argument("--file", help="File knowledge base (giữ lại giữa các lần chạy); mặc định file tạm")
+    ap.add_argument("--out", help="Ghi kết quả JSON ra file")
+    args = ap.parse_args(argv)
+
+    tmp = None
+    path = args.file
+    if not path:
+        tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp.name, "dishes.kb")
+    names = synthetic_names(args.dishes)
+    kb = KnowledgeBase(path).load()
+    build_s = build(kb, names) if len(kb) < len(names) else 0.0
+
+    # Nạp lại từ file: đo đúng chi phí khởi động của process mới
+    kb = KnowledgeBase(path).load()
+    queries = run_queries(kb, names, args.queries)
+    report = kb.report()
+    results = {
+        "commit": _git_commit(),
+        "dishes": report["dishes"],
+        "keys": report["keys"],
+        "ambiguous_folded_keys": report["ambiguous_folded_keys"],
+        "build_s": round(build_s, 1),
+        "load_s": report["load_s"],
+        "file_mb": round(os.path.getsize(path) / 1e6, 1),
+        "queries": queries,
+        "hit_rate": report["kb_hit_rate"],
+    }
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""max_tokens tự động (src/length_predictor.py) so với get_default_max_tokens: tỉ lệ bị cắt, throughput, latency.
+
+    python -m benchmarks.bench_length_predictor [--history FILE] [--samples 4000] [--quantile 0.99] [--out result.json]
+
+--history: lịch sử thật (LENGTH_HISTORY_FILE, ghi khi chạy app/batch với LENGTH_HISTORY=true). Không có thì
+dùng lịch sử tổng hợp: mô tả = món [kiểu] + 0-6 nguyên liệu thêm [+ khẩu phần], tokens_out tăng theo số
+thành phần liệt kê và khẩu phần, nhiễu log-normal theo model. Lịch sử được phát lại theo thứ tự (dự đoán rồi mới học từng mẫu),
+nên số liệu gồm cả giai đoạn chưa đủ mẫu (fallback về max_tokens cố định).
+throughput_gain_pct: số request thêm được trong cùng quota tokens/phút (Bedrock giữ chỗ input + max_tokens).
+"""
+
+import argparse
+import json
+import math
+import random
+import time
+from typing import Any, Dict, List
+
+from src.length_predictor import LengthPredictor, evaluate, read_history
+from src.token_estimator import get_token_estimator
+
+from .bench_pipeline import _git_commit
+from .bench_semantic_cache import DISHES, EXTRAS, STYLES, _pct
+
+# (model, tokens_out trung bình của một món không thêm gì, độ lệch log)
+MODELS = (
+    ("anthropic.claude-3-5-sonnet-20240620-v1:0", 210, 0.12),
+    ("us.anthropic.claude-3-5-haiku-20241022-v1:0", 190, 0.15),
+    ("amazon.titan-text-lite-v1", 260, 0.25),
+    ("meta.llama3-8b-instruct-v1:0", 280, 0.2),
+)
+
+
+def synthetic_history(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    estimator = get_token_estimator()
+    history = []
+    for _ in range(n):
+        model_id, base, sigma = rng.choice(MODELS)
+        extras = rng.sample(EXTRAS, rng.choice((0, 0, 1, 2, 3, 4, 6)))
+        servings = rng.random() < 0.3
+        desc = " ".join(p for p in (rng.choice(DISHES), rng.choice(STYLES)) if p)
+        if extras:
+            desc += " với " + ", ".join(extras)
+        if servings:
+            desc += f" cho {rng.randint(2, 12)} người"
+        tokens_out = base * (1 + 0.3 * len(extras)) * (1.25 if servings else 1.0) * math.exp(rng.gauss(0, sigma))
+        history.append({"model_id": model_id, "prompt_version": 0, "image": False, "desc": desc,
+                        "tokens_in_est": estimator.estimate(model_id, desc), "tokens_out": int(tokens_out),
+                        "truncated": False})
+    return history
+
+
+def predict_latency_us(history: List[Dict[str, Any]], n: int = 2000) -> Dict[str, float]:
+    predictor = LengthPredictor(min_samples=1)
+    predictor.train(history)
+    latencies = []
+    for entry in history[:n]:
+        t0 = time.perf_counter()
+        predictor.max_tokens(entry["model_id"], entry["desc"])
+        latencies.append(time.perf_counter() - t0)
+    return {"p50": round(_pct(latencies, 0.5) * 1e6, 1), "p99": round(_pct(latencies, 0.99) * 1e6, 1)}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--history", help="File lịch sử JSONL thật; mặc định lịch sử tổng hợp")
+    ap.add_argument("--samples", type=int, default=4000, help="Số mẫu lịch sử tổng hợp")
+    ap.add_argument("--quantile", type=float, default=0.99)
+    ap.add_argument("--out", help="Ghi kết quả JSON ra file")
+    args = ap.parse_args(argv)
+
+    history = list(read_history(args.history)) if args.history else synthetic_history(args.samples)
+    results = {
+        "commit": _git_commit(),
+        "history": args.history or "synthetic",
+        "samples": len(history),
+        "quantile": args.quantile,
+        "models": evaluate(history, quantile=args.quantile),
+        "predict_us": predict_latency_us(history),
+    }
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Chế độ ràng buộc output (prefill '{' + stop sequences) so với prompt thường: token output và thời gian parse.
+
+    python -m benchmarks.bench_output_constraint [--corpus FILE] [--repeat 200] [--out result.json]
+
+Corpus (benchmarks/corpus/model_outputs.jsonl): output thô đã ghi của từng model với prompt thường
+(lời dẫn, ```json fence, giải thích sau JSON, lượt "User:" Titan tự viết thêm...). Output của cùng model
+khi ràng buộc được dựng lại từ chính output đó theo cách request ràng buộc hoạt động:
+  - model bắt đầu ngay sau '{' của JSON (prefill: lời dẫn/fence phía trước không được sinh ra),
+  - Claude/Nova dừng ở stop sequence đầu tiên ("}\\n\\n", "```"), Titan ở "User:",
+    Llama 3 (không có stop sequence) kết thúc lượt assistant khi object đóng,
+  - output bị cắt vẫn bị cắt (stop sequence không giúp gì).
+Token output ước lượng bằng src/token_estimator.py; parse = parse_and_validate (ràng buộc: cộng cả
+parser.restore_prefill). tokens_in_added: token prompt thêm vào (prefill, chat template Llama).
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import statistics
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.adapters import model_family
+from src.inference import build_body_for_model
+from src.parser import parse_and_validate, restore_prefill
+from src.prompt_builder import JSON_STOP_SEQUENCES, TITAN_STOP_SEQUENCES
+from src.token_estimator import _body_text_units, get_token_estimator, text_units
+
+from .bench_json_extract import CORPUS, _load
+from .bench_pipeline import _git_commit
+
+# '{' mở JSON object (theo sau là key), bỏ qua ngoặc trong lời dẫn như "recipe {as described}"
+_OBJECT_START = re.compile(r'\{\s*"')
+_DECODER = json.JSONDecoder()
+_SPECIAL_TOKEN = re.compile(r"<\|[a-z_]+\|>")
+
+STOP_SEQUENCES = {"claude": JSON_STOP_SEQUENCES, "nova": JSON_STOP_SEQUENCES, "titan": TITAN_STOP_SEQUENCES}
+STOP_REASON = {"claude": "stop_sequence", "nova": "stop_sequence", "titan": "STOP_CRITERIA_MET"}
+
+
+def constrained_output(family: str, text: str) -> Tuple[str, Optional[str]]:
+    """(output khi ràng buộc, stop reason) dựng lại từ output thường `text`."""
+    m = _OBJECT_START.search(text)
+    start = m.start() if m else max(text.find("{"), 0)
+    if family == "llama":
+        try:
+            end = _DECODER.raw_decode(text, start)[1]
+            return text[start + 1:end], "stop"
+        except json.JSONDecodeError:
+            return text[start + 1:], "length"
+    rest = text[start + 1:]
+    cuts = [i for i in (rest.find(seq) for seq in STOP_SEQUENCES[family]) if i != -1]
+    if cuts:
+        return rest[:min(cuts)], STOP_REASON[family]
+    return rest, None
+
+
+def _response(text: str, stop_reason: Optional[str] = None) -> Dict[str, Any]:
+    raw: Dict[str, Any] = {"content": [{"type": "text", "text": text}]}
+    if stop_reason:
+        raw["stop_reason"] = stop_reason
+    return raw
+
+
+def _parse(model_id: str, raw: Dict[str, Any]) -> bool:
+    try:
+        parse_and_validate(raw, model_id)
+        return True
+    except ValueError:
+        return False
+
+
+def _timeit(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def _prompt_units(body: Dict[str, Any]) -> float:
+    # special token của chat template Llama 3 (<|eot_id|>...) là một token, không phải một chuỗi ký tự
+    if "prompt" in body:
+        body = {**body, "prompt": _SPECIAL_TOKEN.sub(" x ", body["prompt"])}
+    return _body_text_units(body)
+
+
+def tokens_in_added(model_id: str) -> int:
+    estimator = get_token_estimator()
+    plain = build_body_for_model(model_id, "phở bò", 0.2, 512, constrained=False)
+    constrained = build_body_for_model(model_id, "phở bò", 0.2, 512, constrained=True)
+    return (estimator.estimate_units(model_id, _prompt_units(constrained))
+            - estimator.estimate_units(model_id, _prompt_units(plain)))
+
+
+def bench_model(model_id: str, texts: List[str], repeat: int) -> Dict[str, Any]:
+    family = model_family(model_id)
+    estimator = get_token_estimator()
+    out_plain = out_constrained = valid_plain = valid_constrained = 0
+    us_plain: List[float] = []
+    us_constrained: List[float] = []
+    for text in texts:
+        ctext, reason = constrained_output(family, text)
+        out_plain += estimator.estimate_units(model_id, text_units(text))
+        out_constrained += estimator.estimate_units(model_id, text_units(ctext))
+
+        raw = _response(text)
+        valid_plain += _parse(model_id, raw)
+        us_plain.append(_timeit(lambda: _parse(model_id, raw), repeat))
+
+        def constrained_parse(ctext=ctext, reason=reason):
+            return _parse(model_id, _response(restore_prefill(ctext, reason).strip()))
+
+        valid_constrained += constrained_parse()
+        us_constrained.append(_timeit(constrained_parse, repeat))
+    return {
+        "samples": len(texts),
+        "tokens_out": {"plain": out_plain, "constrained": out_constrained,
+                       "saved_pct": round(100 * (out_plain - out_constrained) / out_plain, 1) if out_plain else 0.0},
+        "tokens_in_added": tokens_in_added(model_id),
+        "parse_us": {"plain": round(statistics.mean(us_plain), 1),
+                     "constrained": round(statistics.mean(us_constrained), 1)},
+        "valid": {"plain": valid_plain, "constrained": valid_constrained},
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--corpus", default=CORPUS)
+    ap.add_argument("--repeat", type=int, default=200, help="Số lần parse mỗi mẫu khi đo thời gian")
+    ap.add_argument("--out", help="Ghi kết quả JSON ra file")
+    args = ap.parse_args(argv)
+
+    by_model: Dict[str, List[str]] = {}
+    for sample in _load(args.corpus):
+        by_model.setdefault(sample["model_id"], []).append(sample["text"])
+
+    # output cắt dở / sai schema làm parser log lỗi mỗi lần
+    logging.disable(logging.ERROR)
+    try:
+        models = {model_id: bench_model(model_id, texts, args.repeat) for model_id, texts in by_model.items()}
+    finally:
+        logging.disable(logging.NOTSET)
+    results = {
+        "commit": _git_commit(),
+        "corpus": os.path.relpath(args.corpus),
+        "models": models,
+    }
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
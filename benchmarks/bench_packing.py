@@ -0,0 +1,124 @@
+"""Gói nhiều mô tả vào một request (src/packing.py) so với mỗi mô tả một request: số request, token, chi phí, latency.
+
+    python -m benchmarks.bench_packing [--items 200] [--max-items 16] [--drop-rate 0.05] [--max-tokens 0]
+        [--out result.json]
+
+Mô tả tổng hợp (món [kiểu] + 0-3 nguyên liệu thêm) chạy qua BedrockClient + FakeBedrockRuntime cho từng
+họ model, không cache. Stub trả mảng Dish theo index cho request gói, bỏ ngẫu nhiên --drop-rate phần tử
+để đo chi phí gửi lại; tokens_in của request gói tăng theo độ dài prompt. requests = số lần gọi stub.
+"""
+
+import argparse
+import json
+import logging
+import random
+import time
+from typing import Any, Dict, List
+
+from src.batch_inference import BatchSummary, iter_invoke_many
+from src.bedrock_client import BedrockClient
+from src.packing import iter_invoke_packed
+
+from .bench_pipeline import _git_commit
+from .bench_semantic_cache import DISHES, EXTRAS, STYLES
+from .stub_bedrock import FakeBedrockRuntime
+
+MODELS = (
+    "anthropic.claude-3-5-sonnet-20240620-v1:0",
+    "amazon.nova-lite-v1:0",
+    "amazon.titan-text-express-v1",
+    "meta.llama3-8b-instruct-v1:0",
+)
+
+
+def synthetic_descs(n: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    descs = []
+    for _ in range(n):
+        desc = " ".join(p for p in (rng.choice(DISHES), rng.choice(STYLES)) if p)
+        extras = rng.sample(EXTRAS, rng.randint(0, 3))
+        if extras:
+            desc += " với " + ", ".join(extras)
+        descs.append(desc)
+    return descs
+
+
+def run_mode(model_id: str, descs: List[str], packed: bool, args) -> Dict[str, Any]:
+    stub = FakeBedrockRuntime(latency_ms=args.latency_ms, per_token_ms=args.per_token_ms,
+                              pack_drop_rate=args.drop_rate if packed else 0.0)
+    client = BedrockClient(client=stub)
+    requests = ({"desc": d, "model_id": model_id, "max_tokens": args.max_tokens, "use_cache": False} for d in descs)
+    summary = BatchSummary()
+    t0 = time.perf_counter()
+    if packed:
+        results = iter_invoke_packed(client, requests, args.concurrency, max_items=args.max_items)
+    else:
+        results = iter_invoke_many(client, requests, args.concurrency)
+    for result in results:
+        summary.add(result)
+    wall = time.perf_counter() - t0
+    d = summary.to_dict()
+    out = {
+        "requests": stub.calls,
+        "ok": d["ok"],
+        "tokens_in": d["tokens_in"],
+        "tokens_out": d["tokens_out"],
+        "cost_est_usd": d["cost_est_usd"],
+        "wall_s": round(wall, 3),
+    }
+    if packed and d["packing"]:
+        out["reissued"] = d["packing"]["reissued"]
+    return out
+
+
+def _saved_pct(before: float, after: float) -> float:
+    return round(100 * (before - after) / before, 1) if before else 0.0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--items", type=int, default=200, help="Số mô tả mỗi model")
+    ap.add_argument("--max-items", type=int, default=16, help="Số mô tả tối đa mỗi gói (PACK_MAX_ITEMS)")
+    ap.add_argument("--drop-rate", type=float, default=0.05, help="Tỉ lệ phần tử stub bỏ khỏi mảng trả về")
+    ap.add_argument("--max-tokens", type=int, default=0,
+                    help="max_tokens mỗi mô tả; 0 = tự động theo độ dài output dự đoán")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--latency-ms", type=float, default=20.0, help="Latency giả lập mỗi request")
+    ap.add_argument("--per-token-ms", type=float, default=0.0, help="Latency giả lập mỗi token output")
+    ap.add_argument("--out", help="Ghi kết quả JSON ra file")
+    args = ap.parse_args(argv)
+
+    descs = synthetic_descs(args.items)
+    models = {}
+    # phần tử bị bỏ / request lỗi làm pipeline log cảnh báo mỗi lần
+    logging.disable(logging.WARNING)
+    try:
+        for model_id in MODELS:
+            unpacked = run_mode(model_id, descs, False, args)
+            packed = run_mode(model_id, descs, True, args)
+            models[model_id] = {
+                "unpacked": unpacked,
+                "packed": packed,
+                "requests_saved_pct": _saved_pct(unpacked["requests"], packed["requests"]),
+                "tokens_in_saved_pct": _saved_pct(unpacked["tokens_in"], packed["tokens_in"]),
+                "cost_saved_pct": _saved_pct(unpacked["cost_est_usd"], packed["cost_est_usd"]),
+            }
+    finally:
+        logging.disable(logging.NOTSET)
+    results = {
+        "commit": _git_commit(),
+        "items": args.items,
+        "max_items": args.max_items,
+        "drop_rate": args.drop_rate,
+        "max_tokens": args.max_tokens,
+        "models": models,
+    }
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
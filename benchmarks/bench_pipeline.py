@@ -0,0 +1,227 @@
+"""Microbenchmark toàn pipeline, chạy offline với bedrock-runtime giả (benchmarks/stub_bedrock.py).
+
+    python -m benchmarks.bench_pipeline [-n 2000] [--latency-ms 0] [--jitter-ms 0]
+                                        [--concurrency 8] [--out result.json] [--compare baseline.json]
+                                        [--cassette FILE --cassette-latency distribution]
+
+Đo riêng từng bước (build_body, image_encode, normalize, extract_json, pydantic_validate) theo họ model
+và end-to-end (invoke_model + parse_and_validate, tuần tự / song song / stream) qua BedrockClient thật
+với client giả. Mỗi mục có us_per_op, ops_per_s và peak_alloc_bytes_per_op (tracemalloc).
+Kết quả kèm commit git để so sánh giữa các commit: --compare in chênh lệch % so với file cũ.
+--cassette phát lại response Bedrock thật đã ghi (src/cassette.py) thay cho response mẫu;
+cassette phải được ghi với cùng DESC/tham số của benchmark này (BEDROCK_CASSETTE_MODE=record).
+"""
+
+import argparse
+import io
+import json
+import logging
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from PIL import Image
+
+from src import token_estimator
+from src.adapters import ADAPTERS
+from src.batch_inference import invoke_many
+from src.bedrock_client import BedrockClient
+from src.cassette import CassetteRuntime
+from src.inference import _build_request_body, invoke_model, invoke_model_stream
+from src.json_extract import find_json_object
+from src.parser import parse_and_validate
+from src.response_processor import normalize_to_claude_like
+from src.schema import Dish
+from src.telemetry import get_telemetry
+
+from .stub_bedrock import FakeBedrockRuntime, load_fixtures
+
+MODELS = {
+    "claude": "anthropic.claude-3-5-sonnet-20240620-v1:0",
+    "nova": "amazon.nova-lite-v1:0",
+    "titan": "amazon.titan-text-lite-v1",
+    "llama": "meta.llama3-8b-instruct-v1:0",
+}
+DESC = "Hãy cho tôi nguyên liệu của món bún bò Huế cho 4 người."
+# Các key dùng để so sánh khi --compare (càng nhỏ càng tốt)
+COMPARE_KEYS = ("us_per_op", "peak_alloc_bytes_per_op")
+
+
+def _measure(fn: Callable[[], Any], n: int, alloc_samples: int = 200) -> Dict[str, Any]:
+    fn()  # warm-up (cache adapter, template, import lười)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    elapsed = time.perf_counter() - t0
+
+    samples = max(1, min(n, alloc_samples))
+    tracemalloc.start()
+    peaks = 0
+    for _ in range(samples):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn()
+        peaks += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return {
+        "n": n,
+        "us_per_op": round(elapsed / n * 1e6, 3),
+        "ops_per_s": round(n / elapsed, 1) if elapsed else None,
+        "peak_alloc_bytes_per_op": round(peaks / samples),
+    }
+
+
+def _jpeg(size) -> bytes:
+    buf = io.BytesIO()
+    Image.effect_noise(size, 8).convert("RGB").save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+def run_isolated(n: int) -> Dict[str, Any]:
+    fixtures = load_fixtures()
+    results: Dict[str, Any] = {}
+    for family, model_id in MODELS.items():
+        raw = fixtures[family]["body"]
+        text = ADAPTERS[family].extract_text(raw)
+        json_text = find_json_object(text)[0]
+        data = json.loads(json_text)
+
+        results[f"build_body/{family}"] = _measure(
+            lambda: _build_request_body(model_id, DESC, 0.2, 512, None, 0), n)
+        results[f"normalize/{family}"] = _measure(lambda: normalize_to_claude_like(raw, model_id), n)
+        results[f"extract_json/{family}"] = _measure(lambda: json.loads(find_json_object(text)[0]), n)
+        results[f"pydantic_validate/{family}"] = _measure(lambda: Dish.model_validate(data), n)
+        results[f"parse_and_validate/{family}"] = _measure(lambda: parse_and_validate(raw, model_id), n)
+
+    # Ảnh: JPEG nhỏ gửi thẳng (passthrough) và JPEG lớn phải resize + encode lại
+    model_id = MODELS["claude"]
+    for name, size, reps in (("small_passthrough", (1024, 768), max(1, n // 10)),
+                             ("large_resize", (4000, 3000), max(1, n // 200))):
+        data = _jpeg(size)
+        results[f"image_encode/{name}"] = _measure(
+            lambda: _build_request_body(model_id, DESC, 0.2, 512, data, 0), reps, alloc_samples=5)
+    return results
+
+
+def run_end_to_end(n: int, latency_ms: float, jitter_ms: float, concurrency: int,
+                   cassette: str = "", cassette_latency: str = "none") -> Dict[str, Any]:
+    if cassette:
+        stub = CassetteRuntime(cassette, "replay", latency=cassette_latency)
+    else:
+        stub = FakeBedrockRuntime(latency_ms=latency_ms, jitter_ms=jitter_ms)
+    client = BedrockClient(client=stub)
+    if cassette and cassette_latency != "none":
+        latency_ms = 1000.0  # chưa biết latency đã ghi: coi như request chậm để giới hạn số lần gọi
+    # Nếu có độ trễ giả lập thì giảm số request để benchmark không chạy quá lâu
+    n_e2e = n if not latency_ms else max(10, min(n, int(20000 / max(latency_ms, 1.0))))
+    results: Dict[str, Any] = {}
+    get_telemetry().reset()
+
+    for family, model_id in MODELS.items():
+        def one():
+            raw, _ = invoke_model(client, DESC, model_id, 0.2, 512, use_cache=False)
+            return parse_and_validate(raw, model_id)
+
+        def one_stream():
+            for event in invoke_model_stream(client, DESC, model_id, 0.2, 512, use_cache=False):
+                if event["type"] == "done":
+                    return parse_and_validate(event["raw"], model_id)
+
+        results[f"invoke/{family}"] = _measure(one, n_e2e, alloc_samples=50)
+        results[f"invoke_stream/{family}"] = _measure(one_stream, n_e2e, alloc_samples=50)
+
+    # Song song qua invoke_many (thread pool); đo thông lượng, không đo bộ nhớ
+    requests = [{"desc": DESC, "model_id": MODELS[f], "use_cache": False}
+                for _ in range(max(1, n_e2e // len(MODELS))) for f in MODELS]
+    t0 = time.perf_counter()
+    batch, summary = invoke_many(client, requests, max_concurrency=concurrency)
+    elapsed = time.perf_counter() - t0
+    results["invoke_many"] = {
+        "n": len(batch),
+        "concurrency": concurrency,
+        "us_per_op": round(elapsed / len(batch) * 1e6, 3),
+        "ops_per_s": round(len(batch) / elapsed, 1) if elapsed else None,
+        "failed": summary["failed"],
+    }
+    results["stub_calls"] = stub.stats() if cassette else stub.calls
+    results["stage_latency"] = get_telemetry().summary()
+    return results
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Chênh lệch (%) của COMPARE_KEYS giữa hai lần chạy; dương = chậm hơn / tốn bộ nhớ hơn."""
+    rows = []
+    for section in ("isolated", "end_to_end"):
+        old_section = baseline.get(section) or {}
+        for name, cur in (current.get(section) or {}).items():
+            old = old_section.get(name)
+            if not isinstance(cur, dict) or not isinstance(old, dict):
+                continue
+            for key in COMPARE_KEYS:
+                if cur.get(key) is None or not old.get(key):
+                    continue
+                rows.append({
+                    "name": f"{section}/{name}", "metric": key,
+                    "baseline": old[key], "current": cur[key],
+                    "delta_pct": round(100.0 * (cur[key] - old[key]) / old[key], 1),
+                })
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-n", type=int, default=2000, help="Số lần lặp cho mỗi bước")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="Độ trễ giả lập mỗi lần gọi Bedrock")
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--cassette", help="Phát lại cassette Bedrock đã ghi thay cho response mẫu")
+    ap.add_argument("--cassette-latency", default="none", choices=("none", "recorded", "distribution"))
+    ap.add_argument("--skip-e2e", action="store_true", help="Chỉ đo từng bước riêng lẻ")
+    ap.add_argument("--out", help="Ghi kết quả JSON ra file")
+    ap.add_argument("--compare", help="File kết quả cũ để so sánh")
+    args = ap.parse_args(argv)
+
+    # Log INFO mỗi request làm sai lệch số đo; estimator riêng để không ghi vào file hiệu chỉnh thật
+    for name in ("inference", "bedrock", "parser", "response_processor", "batch_inference"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    token_estimator._shared = token_estimator.TokenEstimator()
+
+    results: Dict[str, Any] = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {"n": args.n, "latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms,
+                   "concurrency": args.concurrency, "cassette": args.cassette or None},
+        "isolated": run_isolated(args.n),
+    }
+    if not args.skip_e2e:
+        results["end_to_end"] = run_end_to_end(args.n, args.latency_ms, args.jitter_ms, args.concurrency,
+                                               args.cassette, args.cassette_latency)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        results["compare"] = {"baseline_commit": baseline.get("commit"), "rows": compare(results, baseline)}
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+    if args.compare:
+        for row in results["compare"]["rows"]:
+            print(f"{row['delta_pct']:+7.1f}%  {row['metric']:<24} {row['name']}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Microbenchmark: prompt template đã biên dịch vs render lại toàn bộ mỗi request.
+
+    python -m benchmarks.bench_prompt_builder [-n 20000] [--out result.json]
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import time
+import tracemalloc
+
+from src import prompt_builder as pb
+from src.adapters import get_adapter
+from src.inference import build_body_for_model
+
+DESCS = [
+    "Nguyên liệu làm phở bò",
+    "Hãy cho tôi nguyên liệu của món bún chả Hà Nội cho 4 người.",
+    "cơm tấm sườn bì chả",
+]
+
+TEMPLATES = {
+    "default": pb._user_text_default,
+    "v1": pb._user_text_v1,
+    "v2": pb._user_text_v2,
+    "v3": pb._user_text_v3,
+    "image_claude": pb._image_user_text,
+    "image_nova": pb._nova_image_user_text,
+}
+
+
+def _legacy(render):
+    """Giả lập hành vi cũ: json.dumps schema/ví dụ + dựng lại f-string mỗi lần gọi."""
+    def call(desc):
+        pb._schema_str.cache_clear()
+        pb._example_str.cache_clear()
+        return render(desc)
+    return call
+
+
+def _measure(fn, n: int) -> dict:
+    for d in DESCS:  # warm-up (biên dịch template lần đầu)
+        fn(d)
+    t0 = time.perf_counter()
+    for i in range(n):
+        fn(DESCS[i % len(DESCS)])
+    elapsed = time.perf_counter() - t0
+
+    samples = min(n, 500)
+    tracemalloc.start()
+    peaks = 0
+    for i in range(samples):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn(DESCS[i % len(DESCS)])
+        peaks += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return {
+        "us_per_call": round(elapsed / n * 1e6, 3),
+        "peak_alloc_bytes_per_call": round(peaks / samples),
+    }
+
+
+def run(n: int) -> dict:
+    results = {}
+    for name, compiled in TEMPLATES.items():
+        legacy = _measure(_legacy(compiled.render), n)
+        fast = _measure(compiled, n)
+        results[name] = {
+            "legacy": legacy,
+            "compiled": fast,
+            "speedup": round(legacy["us_per_call"] / max(fast["us_per_call"], 1e-9), 2),
+        }
+
+    models = [
+        "anthropic.claude-3-5-sonnet-20240620-v1:0", "amazon.titan-text-lite-v1",
+        "meta.llama3-8b-instruct-v1:0", "amazon.nova-lite-v1:0",
+    ]
+    body_calls = itertools.cycle([(m, v) for m in models for v in range(4)])
+
+    def build_body(desc):
+        m, v = next(body_calls)
+        return build_body_for_model(m, desc, 0.2, 512, prompt_version=v)
+
+    logging.getLogger("inference").setLevel(logging.WARNING)
+    results["build_body_for_model"] = _measure(build_body, n)
+    results["adapter_cache"] = get_adapter.cache_info()._asdict()
+    return results
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-n", type=int, default=20000, help="Số request giả lập cho mỗi template")
+    ap.add_argument("--out", help="Ghi kết quả JSON ra file")
+    args = ap.parse_args(argv)
+    results = run(args.n)
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
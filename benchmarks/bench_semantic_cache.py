@@ -0,0 +1,168 @@
+"""Semantic cache (src/semantic_cache.py): latency lookup theo số entry, tỉ lệ hit với câu diễn đạt lại và hit sai.
+
+    python -m benchmarks.bench_semantic_cache [--entries 200000] [--queries 2000] [--db FILE] [--out result.json]
+
+Index được dựng từ các mô tả tổng hợp (món x kiểu x nguyên liệu thêm x khẩu phần, đều khác nhau);
+--db giữ file SQLite để chạy lại không phải dựng (1M entry mất vài phút). Truy vấn gồm:
+  - paraphrase: mô tả đã có, viết lại bằng câu hỏi khác / không dấu / đảo thứ tự -> phải hit đúng entry,
+  - other_servings: cùng món nhưng khác khẩu phần -> phải miss,
+  - unseen: món không có trong index -> phải miss.
+Hit sai = hit ở hai nhóm sau, hoặc hit vào entry khác với entry gốc của câu paraphrase.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+from src.semantic_cache import SemanticCache, _fold
+
+from .bench_pipeline import _git_commit
+
+SCOPE = "anthropic.claude-3-5-sonnet-20240620-v1:0|v0"
+DISHES = (
+    "phở bò", "phở gà", "bún bò Huế", "bún chả", "bún riêu cua", "bún mắm", "bún thịt nướng", "bánh xèo",
+    "bánh canh cua", "cơm tấm sườn", "cơm gà Hội An", "hủ tiếu Nam Vang", "mì Quảng", "cao lầu",
+    "canh chua cá lóc", "cá kho tộ", "thịt kho trứng", "gà kho gừng", "bò lúc lắc", "bò kho",
+    "lẩu thái", "lẩu mắm", "gỏi cuốn", "chả giò", "nem nướng", "bánh cuốn", "xôi gà", "cháo lòng",
+    "miến gà", "canh bí đỏ", "rau muống xào tỏi", "đậu hũ sốt cà", "mực xào chua ngọt", "tôm rim",
+    "sườn xào chua ngọt", "gà xào sả ớt", "ếch xào lăn", "ốc luộc sả", "chè đậu đen", "bánh flan",
+)
+UNSEEN = (
+    "pizza hải sản", "mì Ý sốt bò bằm", "cà ri gà Ấn Độ", "sushi cá hồi", "salad Caesar", "bò bít tết",
+    "súp bí đỏ kem", "gà rán Hàn Quốc", "kimchi cải thảo", "pad thái tôm", "ramen tonkotsu", "tacos bò",
+)
+STYLES = ("", "kiểu miền Bắc", "kiểu miền Nam", "kiểu miền Trung", "chay", "cay", "ít dầu mỡ", "cho bé",
+          "nấu nhanh", "đãi tiệc")
+EXTRAS = ("nấm rơm", "đậu phụ", "trứng cút", "rau răm", "hành phi", "tiêu đen", "ớt hiểm", "sả", "gừng",
+          "nghệ", "me chua", "dứa", "cà chua", "giá đỗ", "rau thơm", "huyết", "chả lụa", "tóp mỡ", "mắm tôm",
+          "nước cốt dừa", "đậu phộng", "mè rang", "bắp non", "cà rốt", "củ cải", "khoai môn", "hẹ",
+          "lá chanh", "ngò gai", "thì là")
+TEMPLATES = (
+    "Hãy cho tôi nguyên liệu của món {d}.", "nguyên liệu {d}", "{d} cần gì", "Cách nấu {d} như thế nào?",
+    "cho mình xin công thức {d} nhé",
+)
+
+
+def _describe(dish: str, style: str, extras: Tuple[str, ...], servings: int) -> str:
+    text = " ".join(p for p in (dish, style) if p)
+    if extras:
+        text += " thêm " + " và ".join(extras)
+    return f"{text} cho {servings} người"
+
+
+def synthetic_entries(n: int, seed: int = 0) -> List[Tuple[str, str, Tuple[str, ...], int]]:
+    """n bộ (món, kiểu, nguyên liệu thêm, khẩu phần) khác nhau."""
+    rng = random.Random(seed)
+    seen, out = set(), []
+    while len(out) < n:
+        spec = (rng.choice(DISHES), rng.choice(STYLES),
+                tuple(rng.sample(EXTRAS, rng.randint(0, 2))), rng.randint(1, 12))
+        key = (spec[0], spec[1], frozenset(spec[2]), spec[3])
+        if key not in seen:
+            seen.add(key)
+            out.append(spec)
+    return out
+
+
+def build(cache: SemanticCache, specs, chunk: int = 5000) -> float:
+    t0 = time.perf_counter()
+    for start in range(0, len(specs), chunk):
+        cache.add_many(SCOPE, [
+            (desc, json.dumps({"dish_name": desc}, ensure_ascii=False), 1000, 300)
+            for desc in (_describe(*spec) for spec in specs[start:start + chunk])
+        ])
+    return time.perf_counter() - t0
+
+
+def _paraphrase(rng: random.Random, dish, style, extras, servings) -> str:
+    extras = tuple(rng.sample(extras, len(extras)))  # đảo thứ tự nguyên liệu thêm
+    text = rng.choice(TEMPLATES).format(d=_describe(dish, style, extras, servings))
+    return _fold(text.lower()) if rng.random() < 0.3 else text  # gõ không dấu
+
+
+def _pct(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def run_queries(cache: SemanticCache, specs, n: int, seed: int = 1) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    groups: Dict[str, List[Tuple[str, str]]] = {"paraphrase": [], "other_servings": [], "unseen": []}
+    for _ in range(n):
+        spec = rng.choice(specs)
+        groups["paraphrase"].append((_paraphrase(rng, *spec), _describe(*spec)))
+        servings = spec[3] + 100  # khẩu phần không có trong index
+        groups["other_servings"].append((_paraphrase(rng, spec[0], spec[1], spec[2], servings), ""))
+        groups["unseen"].append((_paraphrase(rng, rng.choice(UNSEEN), rng.choice(STYLES), (), spec[3]), ""))
+
+    results = {}
+    for name, queries in groups.items():
+        latencies, hits, wrong = [], 0, []
+        for query, expected in queries:
+            t0 = time.perf_counter()
+            hit = cache.lookup(SCOPE, query)
+            latencies.append(time.perf_counter() - t0)
+            if hit is None:
+                continue
+            hits += 1
+            matched = json.loads(hit[0])["dish_name"]
+            if matched != expected:
+                wrong.append({"query": query, "matched": matched, "similarity": hit[1]})
+        results[name] = {
+            "queries": len(queries),
+            "hit_rate": round(hits / len(queries), 4),
+            "false_hits": len(wrong),
+            "false_hit_samples": wrong[:5],
+            "lookup_ms": {"mean": round(statistics.mean(latencies) * 1e3, 3),
+                          "p50": round(_pct(latencies, 0.5) * 1e3, 3),
+                          "p99": round(_pct(latencies, 0.99) * 1e3, 3)},
+        }
+    return results
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--entries", type=int, default=200000, help="Số entry trong index")
+    ap.add_argument("--queries", type=int, default=2000, help="Số truy vấn mỗi nhóm")
+    ap.add_argument("--db", help="File SQLite (giữ lại giữa các lần chạy); mặc định file tạm")
+    ap.add_argument("--out", help="Ghi kết quả JSON ra file")
+    args = ap.parse_args(argv)
+
+    tmp = None
+    path = args.db
+    if not path:
+        tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp.name, "semantic.sqlite3")
+    specs = synthetic_entries(args.entries)
+    cache = SemanticCache(path, audit_rate=1.0)
+    existing = cache.report(audit_limit=0)["entries"]
+    build_s = build(cache, specs) if existing < len(specs) else 0.0
+    cache = SemanticCache(path, audit_rate=1.0)  # stats sạch, kết nối mới (không còn trang nóng từ lúc dựng)
+
+    queries = run_queries(cache, specs, args.queries)
+    report = cache.report(audit_limit=10)
+    results = {
+        "commit": _git_commit(),
+        "entries": report["entries"],
+        "build_s": round(build_s, 1),
+        "db_mb": round(os.path.getsize(path) / 1e6, 1),
+        "queries": queries,
+        "hit_rate": report["semantic_hit_rate"],
+        "audit_samples": report["audit_samples"],
+    }
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Thông lượng parse + validate output model: fast path TypeAdapter.validate_json vs json.loads + model_validate.
+
+    python -m benchmarks.bench_validate [-n 5000] [--cassette FILE] [--repeat 3] [--out result.json]
+
+Corpus: các response InvokeModel thành công trong cassette đã ghi (src/cassette.py), hoặc sinh từ
+response mẫu (benchmarks/fixtures) với tỉ lệ gần thực tế: phần lớn JSON sạch, một phần bọc code fence,
+lẫn chữ hoặc bị cắt (đi đường sửa JSON). Corpus được lặp lại cho đủ -n output.
+"""
+
+import argparse
+import copy
+import json
+import logging
+import random
+import time
+from typing import Any, Dict, List, Tuple
+
+from src.adapters import model_family
+from src.json_extract import find_json_object
+from src.parser import (
+    _clean_json_candidate, _drop_partial_ingredients, _strip_code_fences, extract_text, parse_and_validate,
+)
+from src.schema import Dish, dish_adapter
+from src.telemetry import get_telemetry, span
+
+from .bench_pipeline import MODELS, _git_commit
+from .stub_bedrock import load_fixtures
+
+# (tỉ lệ, kiểu) cho corpus sinh từ response mẫu
+VARIANTS = ((0.80, "clean"), (0.10, "fenced"), (0.07, "prose"), (0.03, "truncated"))
+
+
+def _with_text(family: str, body: Dict[str, Any], text: str) -> Dict[str, Any]:
+    body = copy.deepcopy(body)
+    if family == "claude":
+        body["content"][0]["text"] = text
+    elif family == "nova":
+        body["output"]["message"]["content"][0]["text"] = text
+    elif family == "titan":
+        body["results"][0]["outputText"] = text
+    else:
+        body["generation"] = text
+    return body
+
+
+def synthetic_corpus(size: int, seed: int = 0) -> List[Tuple[str, Dict[str, Any]]]:
+    rng = random.Random(seed)
+    fixtures = load_fixtures()
+    corpus = []
+    for i in range(size):
+        family = list(MODELS)[i % len(MODELS)]
+        model_id = MODELS[family]
+        body = fixtures[family]["body"]
+        data = json.loads(find_json_object(extract_text(body, model_id))[0])
+        items = data["ingredients"]
+        data = {**data, "ingredients": rng.sample(items, rng.randint(1, len(items)))}
+        text = json.dumps(data, ensure_ascii=False, indent=rng.choice((None, 2)))
+        kind = rng.choices([k for _, k in VARIANTS], weights=[w for w, _ in VARIANTS])[0]
+        if kind == "fenced":
+            text = f"```json\n{text}\n```"
+        elif kind == "prose":
+            text = f"Dưới đây là danh sách nguyên liệu:\n{text}\nChúc bạn nấu ngon!"
+        elif kind == "truncated":
+            text = text[: int(len(text) * rng.uniform(0.6, 0.95))]
+        corpus.append((model_id, _with_text(family, body, text)))
+    return corpus
+
+
+def cassette_corpus(path: str) -> List[Tuple[str, Dict[str, Any]]]:
+    from src.cassette import CassetteRuntime
+
+    cassette = CassetteRuntime(path, "replay")
+    corpus = []
+    for entries in cassette._entries.values():
+        for entry in entries:
+            if entry.get("op") == "invoke_model" and "error" not in entry and entry.get("body"):
+                corpus.append((entry["model_id"], json.loads(entry["body"])))
+    return corpus
+
+
+def legacy_parse(model_response: Dict[str, Any], model_id: str) -> Dish:
+    """Đường cũ (cùng span telemetry): luôn tìm object, json.loads ra dict rồi model_validate."""
+    with span("extract_json", model_id):
+        raw_text = extract_text(model_response, model_id)
+        try:
+            json_text, repaired = find_json_object(raw_text)
+        except ValueError:
+            json_text, repaired = _strip_code_fences(raw_text), False
+        data = json.loads(json_text)
+    with span("pydantic_validate", model_id):
+        if repaired:
+            data = _drop_partial_ingredients(data)
+        return Dish.model_validate(data)
+
+
+def _run(fn, corpus, n: int, repeat: int) -> Dict[str, Any]:
+    best, failed = None, 0
+    for _ in range(repeat):
+        failed = 0
+        t0 = time.perf_counter()
+        for i in range(n):
+            model_id, body = corpus[i % len(corpus)]
+            try:
+                fn(body, model_id)
+            except ValueError:
+                failed += 1
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return {"us_per_output": round(best / n * 1e6, 2), "outputs_per_s": round(n / best, 1), "failed": failed}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-n", type=int, default=5000, help="Số output validate mỗi lượt")
+    ap.add_argument("--cassette", help="Lấy output đã ghi trong cassette thay cho corpus sinh")
+    ap.add_argument("--repeat", type=int, default=3, help="Số lượt, lấy lượt nhanh nhất")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", help="Ghi kết quả JSON ra file")
+    args = ap.parse_args(argv)
+
+    logging.getLogger("parser").setLevel(logging.CRITICAL)  # output bị cắt/hỏng log cả traceback
+    corpus = cassette_corpus(args.cassette) if args.cassette else synthetic_corpus(min(args.n, 2000), args.seed)
+    if not corpus:
+        raise SystemExit("Corpus rỗng (cassette không có response InvokeModel thành công)")
+
+    for model_id, body in corpus:  # warm-up: TypeAdapter, adapter, import lười
+        for fn in (legacy_parse, parse_and_validate):
+            try:
+                fn(body, model_id)
+            except ValueError:
+                pass
+
+    # Riêng bước JSON -> Dish trên các output đi fast path (không tính extract_text, span, counter)
+    texts = [(m, t) for m, t in ((m, extract_text(b, m)) for m, b in corpus) if _clean_json_candidate(t)]
+    adapter = dish_adapter()
+    decode_only = {
+        "loads_model_validate": _run(lambda t, m: Dish.model_validate(json.loads(find_json_object(t)[0])),
+                                     texts, args.n, args.repeat),
+        "validate_json": _run(lambda t, m: adapter.validate_json(_clean_json_candidate(t)),
+                              texts, args.n, args.repeat),
+    }
+
+    legacy = _run(legacy_parse, corpus, args.n, args.repeat)
+    telemetry = get_telemetry()
+    telemetry.reset()
+    fast = _run(parse_and_validate, corpus, args.n, args.repeat)
+    paths = {}
+    for labels, value in telemetry.counter("food_parse_path_total").items():
+        path = dict(labels)["path"]
+        paths[path] = paths.get(path, 0) + value / args.repeat
+
+    results = {
+        "commit": _git_commit(),
+        "corpus": {"source": args.cassette or "synthetic", "size": len(corpus),
+                   "families": sorted({model_family(m) for m, _ in corpus})},
+        "n": args.n,
+        "decode_only": decode_only,
+        "legacy": legacy,
+        "fast_path": fast,
+        "speedup": round(legacy["us_per_output"] / fast["us_per_output"], 2),
+        "path_share": {k: round(v / args.n, 3) for k, v in sorted(paths.items())},
+    }
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
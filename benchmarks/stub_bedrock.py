@@ -0,0 +1,269 @@
+"""bedrock-runtime giả cho benchmark offline: trả response đã ghi sẵn theo họ model, có độ trễ giả lập.
+
+    from benchmarks.stub_bedrock import FakeBedrockRuntime
+    client = BedrockClient(client=FakeBedrockRuntime(latency_ms=300, jitter_ms=50))
+
+Response mẫu nằm ở benchmarks/fixtures/bedrock_responses.json ({family: {"body", "headers"}}).
+Cùng giao diện với boto3 client (invoke_model, invoke_model_with_response_stream, count_tokens)
+nên toàn bộ BedrockClient (retry, span, đọc StreamingBody) vẫn chạy như thật.
+"""
+
+import io
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+from src.adapters import ADAPTERS, model_family
+from src.json_extract import find_json_object
+from src.token_estimator import _body_text_units
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "bedrock_responses.json")
+STREAM_CHUNKS = 12
+# Mô tả thứ i trong prompt gói (prompt_builder.build_packed_user_text)
+_PACKED_ITEM = re.compile(r'^\[(\d+)\] """', re.M)
+_PACKED_MARKER = b'[0] \\"\\"\\"'  # '[0] """' trong body đã serialize
+
+
+def load_fixtures(path: str = FIXTURES_PATH) -> Dict[str, Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _split(text: str, n: int) -> List[str]:
+    step = max(1, -(-len(text) // n))
+    return [text[i:i + step] for i in range(0, len(text), step)]
+
+
+# Stop reason theo họ model: (dừng tự nhiên, hết max_tokens)
+STOP_REASONS = {
+    "claude": ("end_turn", "max_tokens"),
+    "nova": ("end_turn", "max_tokens"),
+    "titan": ("FINISH", "LENGTH"),
+    "llama": ("stop", "length"),
+}
+
+
+def _stream_payloads(family: str, body: Dict[str, Any], tokens_in: int, tokens_out: int) -> List[Dict[str, Any]]:
+    """Dựng chuỗi chunk giống InvokeModelWithResponseStream của từng họ model từ response đầy đủ."""
+    adapter = ADAPTERS[family]
+    parts = _split(adapter.extract_text(body, strip=False), STREAM_CHUNKS)
+    stop = adapter.stop_reason(body) or STOP_REASONS[family][0]
+    metrics = {"amazon-bedrock-invocationMetrics": {"inputTokenCount": tokens_in, "outputTokenCount": tokens_out}}
+    if family == "claude":
+        return (
+            [{"type": "message_start", "message": {"usage": {"input_tokens": tokens_in}}}]
+            + [{"type": "content_block_delta", "delta": {"type": "text_delta", "text": p}} for p in parts]
+            + [{"type": "message_delta", "delta": {"stop_reason": stop}, "usage": {"output_tokens": tokens_out}},
+               {"type": "message_stop", **metrics}]
+        )
+    if family == "nova":
+        return (
+            [{"contentBlockDelta": {"delta": {"text": p}}} for p in parts]
+            + [{"messageStop": {"stopReason": stop}},
+               {"metadata": {"usage": {"inputTokens": tokens_in, "outputTokens": tokens_out}}, **metrics}]
+        )
+    if family == "titan":
+        chunks: List[Dict[str, Any]] = [{"outputText": p} for p in parts]
+        chunks[0]["inputTextTokenCount"] = tokens_in
+        chunks[-1].update({"totalOutputTextTokenCount": tokens_out, "completionReason": stop, **metrics})
+        return chunks
+    chunks = [{"generation": p} for p in parts]
+    chunks[0]["prompt_token_count"] = tokens_in
+    chunks[-1].update({"generation_token_count": tokens_out, "stop_reason": stop, **metrics})
+    return chunks
+
+
+def _request_limits(family: str, request: Dict[str, Any], anchor: str) -> Tuple[Optional[int], str]:
+    """(max_tokens, phần output đã có gửi kèm để nối tiếp) của request; anchor = đầu output mẫu."""
+    if family in ("claude", "nova"):
+        max_tokens = request.get("max_tokens") if family == "claude" \
+            else (request.get("inferenceConfig") or {}).get("maxTokens")
+        last = (request.get("messages") or [{}])[-1]
+        prefill = ""
+        if last.get("role") == "assistant":
+            prefill = "".join(c.get("text", "") for c in last.get("content") or [])
+        return max_tokens, prefill
+    if family == "titan":
+        max_tokens, prompt = (request.get("textGenerationConfig") or {}).get("maxTokenCount"), request.get("inputText", "")
+    else:
+        max_tokens, prompt = request.get("max_gen_len"), request.get("prompt", "")
+    at = prompt.rfind(anchor) if anchor else -1
+    return max_tokens, (prompt[at:] if at != -1 else "")
+
+
+def _packed_size(request: Dict[str, Any]) -> int:
+    """Số mô tả trong request gói nhiều mô tả (src/packing.py); 0 nếu là request thường."""
+    texts = [request.get("prompt"), request.get("inputText")]
+    for message in request.get("messages") or []:
+        texts.extend(c.get("text") for c in message.get("content") or [])
+    return max((len(_PACKED_ITEM.findall(t)) for t in texts if isinstance(t, str)), default=0)
+
+
+def _packed_prefilled(request: Dict[str, Any]) -> bool:
+    """Request gói ràng buộc output: '[' đã nằm sẵn ở lượt assistant / cuối prompt nên output bắt đầu từ phần tử."""
+    last = (request.get("messages") or [{}])[-1]
+    if last.get("role") == "assistant":
+        return "".join(c.get("text", "") for c in last.get("content") or []).endswith("[")
+    prompt = request.get("inputText") or request.get("prompt") or ""
+    return prompt.endswith("[")
+
+
+def _family_body(family: str, text: str, tokens_in: int, tokens_out: int, truncated: bool) -> Dict[str, Any]:
+    stop = STOP_REASONS[family][truncated]
+    if family == "claude":
+        return {"content": [{"type": "text", "text": text}], "stop_reason": stop,
+                "usage": {"input_tokens": tokens_in, "output_tokens": tokens_out}}
+    if family == "nova":
+        return {"output": {"message": {"role": "assistant", "content": [{"text": text}]}}, "stopReason": stop,
+                "usage": {"inputTokens": tokens_in, "outputTokens": tokens_out}}
+    if family == "titan":
+        return {"inputTextTokenCount": tokens_in,
+                "results": [{"tokenCount": tokens_out, "outputText": text, "completionReason": stop}]}
+    return {"generation": text, "prompt_token_count": tokens_in, "generation_token_count": tokens_out,
+            "stop_reason": stop}
+
+
+class FakeBedrockRuntime:
+    """
+    latency_ms/jitter_ms: độ trễ mỗi lần gọi (ngẫu nhiên đều trong latency ± jitter).
+    throttle_rate: xác suất trả ThrottlingException (để đo đường retry).
+    with_headers=False: bỏ header token (buộc pipeline đọc usage trong body / ước lượng).
+    honor_max_tokens=True: output mẫu bị cắt theo max_tokens của request (stop reason hết token như
+    model thật); request nối tiếp (prefill / output đã có ở cuối prompt) nhận phần còn lại.
+    per_token_ms: độ trễ thêm cho mỗi token output (thời gian sinh), chỉ dùng với honor_max_tokens.
+    Request gói nhiều mô tả nhận JSON array (Dish mẫu kèm "index" cho từng mô tả); pack_drop_rate: xác suất
+    bỏ một phần tử (để đo đường gửi lại). Token input của request gói tỉ lệ theo độ dài prompt so với
+    request một mô tả.
+    """
+
+    def __init__(self, fixtures: Optional[Dict[str, Dict[str, Any]]] = None, latency_ms: float = 0.0,
+                 jitter_ms: float = 0.0, throttle_rate: float = 0.0, with_headers: bool = True, seed: int = 0,
+                 honor_max_tokens: bool = False, per_token_ms: float = 0.0, pack_drop_rate: float = 0.0):
+        self.fixtures = fixtures or load_fixtures()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.throttle_rate = throttle_rate
+        self.with_headers = with_headers
+        self.honor_max_tokens = honor_max_tokens
+        self.per_token_ms = per_token_ms
+        self.pack_drop_rate = pack_drop_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._encoded = {f: json.dumps(fx["body"], ensure_ascii=False).encode("utf-8")
+                         for f, fx in self.fixtures.items()}
+
+    def _wait(self, op: str):
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0
+            throttled = self._rng.random() < self.throttle_rate
+        if delay:
+            time.sleep(delay)
+        if throttled:
+            raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, op)
+
+    def _headers(self, family: str) -> Dict[str, str]:
+        headers = dict(self.fixtures[family].get("headers") or {})
+        if not self.with_headers:
+            headers = {k: v for k, v in headers.items() if not k.startswith("x-amzn-bedrock-")}
+        return headers
+
+    def _limited(self, family: str, body: Any) -> Tuple[Dict[str, Any], int, int]:
+        """Response mẫu cắt theo max_tokens của request: (body, tokens_in, tokens_out)."""
+        fx = self.fixtures[family]
+        headers = fx.get("headers") or {}
+        base_in = int(headers.get("x-amzn-bedrock-input-token-count", 0))
+        base_out = int(headers.get("x-amzn-bedrock-output-token-count", 0)) or 1
+        full = ADAPTERS[family].extract_text(fx["body"])
+        request = json.loads(body) if isinstance(body, (bytes, bytearray, str)) else dict(body or {})
+        max_tokens, prefill = _request_limits(family, request, full[:24])
+        chars_per_token = len(full) / base_out
+        done = prefill.rstrip()
+        rest = full[len(done):] if done and full.startswith(done) else full
+        limit = int((max_tokens or base_out) * chars_per_token)
+        text, truncated = rest[:limit], len(rest) > limit
+        tokens_in = base_in + math.ceil(len(prefill) / chars_per_token)
+        tokens_out = math.ceil(len(text) / chars_per_token)
+        if self.per_token_ms:
+            time.sleep(tokens_out * self.per_token_ms / 1000.0)
+        return _family_body(family, text, tokens_in, tokens_out, truncated), tokens_in, tokens_out
+
+    def _packed(self, family: str, request: Dict[str, Any], size: int) -> Tuple[Dict[str, Any], int, int]:
+        """Response của request gói `size` mô tả: (body, tokens_in, tokens_out)."""
+        fx = self.fixtures[family]
+        headers = fx.get("headers") or {}
+        base_in = int(headers.get("x-amzn-bedrock-input-token-count", 0))
+        base_out = int(headers.get("x-amzn-bedrock-output-token-count", 0)) or 1
+        full = ADAPTERS[family].extract_text(fx["body"])
+        dish = json.loads(find_json_object(full)[0])
+        with self._lock:
+            kept = [i for i in range(size) if self._rng.random() >= self.pack_drop_rate]
+        text = json.dumps([{"index": i, **dish} for i in kept], ensure_ascii=False)
+        if _packed_prefilled(request):
+            text = text[1:]
+        chars_per_token = len(full) / base_out
+        truncated = False
+        if self.honor_max_tokens:
+            max_tokens = _request_limits(family, request, "")[0]
+            limit = int((max_tokens or base_out) * chars_per_token)
+            text, truncated = text[:limit], len(text) > limit
+        single = _body_text_units(ADAPTERS[family].build_body("phở bò", 0.2, 512)) or 1
+        tokens_in = math.ceil(base_in * _body_text_units(request) / single)
+        tokens_out = math.ceil(len(text) / chars_per_token)
+        return _family_body(family, text, tokens_in, tokens_out, truncated), tokens_in, tokens_out
+
+    def invoke_model(self, modelId: str, body: Any = None, **kwargs) -> Dict[str, Any]:
+        self._wait("InvokeModel")
+        family = model_family(modelId)
+        data = self._encoded[family]
+        headers = self._headers(family)
+        size = 0
+        if _PACKED_MARKER in (body if isinstance(body, (bytes, bytearray)) else str(body or "").encode("utf-8")):
+            request = json.loads(body) if isinstance(body, (bytes, bytearray, str)) else dict(body or {})
+            size = _packed_size(request)
+        if size or self.honor_max_tokens:
+            out, tokens_in, tokens_out = self._packed(family, request, size) if size \
+                else self._limited(family, body)
+            data = json.dumps(out, ensure_ascii=False).encode("utf-8")
+            headers = {**headers, "x-amzn-bedrock-input-token-count": str(tokens_in),
+                       "x-amzn-bedrock-output-token-count": str(tokens_out)}
+            if not self.with_headers:
+                headers = {k: v for k, v in headers.items() if not k.startswith("x-amzn-bedrock-")}
+        return {
+            "ResponseMetadata": {"HTTPStatusCode": 200, "HTTPHeaders": headers},
+            "contentType": "application/json",
+            "body": StreamingBody(io.BytesIO(data), len(data)),
+        }
+
+    def invoke_model_with_response_stream(self, modelId: str, body: Any = None, **kwargs) -> Dict[str, Any]:
+        self._wait("InvokeModelWithResponseStream")
+        family = model_family(modelId)
+        headers = self.fixtures[family].get("headers") or {}
+        if self.honor_max_tokens:
+            payloads = _stream_payloads(family, *self._limited(family, body))
+        else:
+            payloads = _stream_payloads(
+                family, self.fixtures[family]["body"],
+                int(headers.get("x-amzn-bedrock-input-token-count", 0)),
+                int(headers.get("x-amzn-bedrock-output-token-count", 0)),
+            )
+
+        def events() -> Iterator[Dict[str, Any]]:
+            for payload in payloads:
+                yield {"chunk": {"bytes": json.dumps(payload, ensure_ascii=False).encode("utf-8")}}
+
+        return {"ResponseMetadata": {"HTTPStatusCode": 200, "HTTPHeaders": {}}, "body": events()}
+
+    def count_tokens(self, modelId: str, input: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        self._wait("CountTokens")
+        headers = self.fixtures[model_family(modelId)].get("headers") or {}
+        return {"inputTokens": int(headers.get("x-amzn-bedrock-input-token-count", 0))}
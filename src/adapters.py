@@ -0,0 +1,337 @@
+"""Adapter theo họ model (Claude, Nova, Titan, Llama): build request, lấy text, đọc token, decode stream.
+
+Adapter được chọn MỘT lần từ model_id (get_adapter, có cache) nên mỗi response chỉ đi
+đúng một đường xử lý của họ model đó thay vì thử lần lượt mọi định dạng.
+"""
+
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .prompt_builder import (
+    build_prompt, build_prompt_titan, build_prompt_llama, build_prompt_nova,
+    build_prompt_with_image, build_prompt_nova_with_image,
+    build_prompt_v1, build_prompt_v2, build_prompt_v3,
+    build_prompt_titan_v1, build_prompt_titan_v2, build_prompt_titan_v3,
+    build_prompt_llama_v1, build_prompt_llama_v2, build_prompt_llama_v3,
+    build_prompt_nova_v1, build_prompt_nova_v2, build_prompt_nova_v3,
+    OUTPUT_PREFILL, constrain_claude, constrain_nova, constrain_titan, constrain_llama,
+    PACKED_PREFILL, PACKED_STOP_SEQUENCES, TITAN_STOP_SEQUENCES,
+    build_prompt_packed, build_prompt_titan_packed, build_prompt_llama_packed, build_prompt_nova_packed,
+)
+
+# Headers token thật của InvokeModel (tên cũ/mới)
+_HEADER_TOKENS_IN = ("x-amzn-bedrock-input-token-count", "x-amzn-bedrock-input-tokens")
+_HEADER_TOKENS_OUT = ("x-amzn-bedrock-output-token-count", "x-amzn-bedrock-output-tokens")
+
+
+def _claude_like_text(raw: Dict[str, Any]) -> Optional[str]:
+    """Response dạng Claude (cũng là dạng lưu trong cache/ảnh cache cho mọi model)."""
+    content = raw.get("content")
+    if isinstance(content, list) and content and isinstance(content[0], dict) \
+            and content[0].get("type") == "text":
+        return content[0].get("text", "")
+    return None
+
+
+def _header_tokens(hdrs: Dict[str, Any], names) -> Optional[int]:
+    for name in names:
+        value = hdrs.get(name)
+        if value:
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def _user_turns(body: dict) -> list:
+    """Messages của request, bỏ lượt assistant prefill ('{' của chế độ ràng buộc output) nếu có."""
+    messages = body["messages"]
+    return messages[:-1] if messages and messages[-1].get("role") == "assistant" else messages
+
+
+def _append_partial(prompt: str, partial: str) -> str:
+    """Nối output bị cắt vào cuối prompt text completion; prompt đã mở sẵn '{' thì partial thay chỗ đó."""
+    if prompt.endswith(OUTPUT_PREFILL) and partial.lstrip().startswith(OUTPUT_PREFILL):
+        return prompt[:-len(OUTPUT_PREFILL)] + partial.lstrip()
+    return f"{prompt}\n{partial}"
+
+
+class ModelAdapter:
+    """Giao diện chung; lớp con điền builders và các hàm đọc response của họ model."""
+
+    family = "claude"
+    # builders[prompt_version] (0 = prompt mặc định cũ, 1/2/3 = các phiên bản mới)
+    builders: Tuple[Callable[..., dict], ...] = (build_prompt, build_prompt_v1, build_prompt_v2, build_prompt_v3)
+    image_builder: Callable[..., dict] = staticmethod(build_prompt_with_image)
+    # Chế độ ràng buộc output: prefill '{' + stop sequences (xem prompt_builder.constrain_*)
+    constrain: Callable[[dict], dict] = staticmethod(constrain_claude)
+    # Nhiều mô tả trong một request (xem src/packing.py)
+    packed_builder: Callable[..., dict] = staticmethod(build_prompt_packed)
+    packed_stop_sequences: Tuple[str, ...] = tuple(PACKED_STOP_SEQUENCES)
+
+    # ---------- Request ----------
+    def text_builder(self, prompt_version: int) -> Callable[..., dict]:
+        if prompt_version in (1, 2, 3):
+            return self.builders[prompt_version]
+        return self.builders[0]
+
+    def build_body(self, desc: str, temperature: float, max_tokens: int, prompt_version: int = 0,
+                   constrained: bool = False) -> dict:
+        body = self.text_builder(prompt_version)(desc, temperature=temperature, max_tokens=max_tokens)
+        return self.constrain(body) if constrained else body
+
+    def build_packed_body(self, descs, temperature: float, max_tokens: int, constrained: bool = False) -> dict:
+        body = self.packed_builder(descs, temperature=temperature, max_tokens=max_tokens)
+        return self.constrain(body, PACKED_PREFILL, self.packed_stop_sequences) if constrained else body
+
+    def build_image_body(self, desc: str, image_b64: str, mime: str, temperature: float, max_tokens: int,
+                         constrained: bool = False) -> dict:
+        body = self.image_builder(desc, image_b64, mime, temperature=temperature, max_tokens=max_tokens)
+        return self.constrain(body) if constrained else body
+
+    # ---------- Response ----------
+    def _family_text(self, raw: Dict[str, Any]) -> Optional[str]:
+        return None
+
+    def extract_text(self, raw: Dict[str, Any], strip: bool = True) -> str:
+        """
+        Text model trả về (mặc định đã strip). Raise ValueError nếu response không đúng định dạng của họ model.
+        strip=False giữ khoảng trắng đầu/cuối (phần nối tiếp ghép ngay sau output bị cắt).
+        """
+        if not isinstance(raw, dict):
+            raise ValueError(f"Unexpected {self.family} response type: {type(raw).__name__}")
+        text = _claude_like_text(raw)
+        if text is None:
+            text = self._family_text(raw)
+        if text is None or not text.strip():
+            raise ValueError(f"Unexpected {self.family} response format: keys={list(raw.keys())}")
+        return text.strip() if strip else text
+
+    def _family_stop_reason(self, raw: Dict[str, Any]) -> Optional[str]:
+        return None
+
+    def stop_reason(self, raw: Dict[str, Any]) -> Optional[str]:
+        """Lý do model dừng (end_turn, max_tokens, LENGTH, length...); None nếu response không có."""
+        if not isinstance(raw, dict):
+            return None
+        # Response đã chuẩn hoá dạng Claude (stream, cache, hedge) giữ stop_reason ở ngoài cùng
+        return raw.get("stop_reason") or self._family_stop_reason(raw)
+
+    def normalize(self, raw: Dict[str, Any]) -> Dict[str, Any]:
+        """Đưa về dạng Claude {"content":[{"type":"text","text":...}]}."""
+        if isinstance(raw, dict) and "content" in raw:
+            return raw
+        return {"content": [{"type": "text", "text": self.extract_text(raw)}]}
+
+    def _body_usage(self, raw: Dict[str, Any]) -> Tuple[Optional[int], Optional[int]]:
+        usage = raw.get("usage") if isinstance(raw, dict) else None
+        if not isinstance(usage, dict):
+            return None, None
+        return (usage.get("input_tokens") or usage.get("inputTokens"),
+                usage.get("output_tokens") or usage.get("outputTokens"))
+
+    def token_counts(self, raw: Dict[str, Any], hdrs: Dict[str, Any]) -> Tuple[Optional[int], Optional[int]]:
+        """(tokens_in, tokens_out) từ HTTP headers, thiếu thì lấy trong body; None nếu không có."""
+        tokens_in = _header_tokens(hdrs, _HEADER_TOKENS_IN) if hdrs else None
+        tokens_out = _header_tokens(hdrs, _HEADER_TOKENS_OUT) if hdrs else None
+        if tokens_in is None or tokens_out is None:
+            body_in, body_out = self._body_usage(raw)
+            tokens_in = tokens_in if tokens_in is not None else body_in
+            tokens_out = tokens_out if tokens_out is not None else body_out
+        return tokens_in, tokens_out
+
+    # ---------- Nối tiếp output bị cắt (xem src/continuation.py) ----------
+    # True: gửi phần đã có như lượt assistant (prefill), model viết tiếp đúng từ ký tự cuối
+    continuation_prefill = True
+
+    def build_continuation_body(self, body: dict, partial: str, max_tokens: int) -> dict:
+        """Body của request nối tiếp: prompt cũ + output bị cắt `partial` làm phần mở đầu của câu trả lời."""
+        # Claude không nhận prefill kết thúc bằng khoảng trắng
+        prefill = {"role": "assistant", "content": [{"type": "text", "text": partial.rstrip()}]}
+        return {**body, "messages": [*_user_turns(body), prefill], "max_tokens": max_tokens}
+
+    # ---------- Stream ----------
+    def _decode_family_chunk(self, payload: Dict[str, Any], usage: Dict[str, Any]) -> str:
+        return ""
+
+    def decode_stream_chunk(self, payload: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """
+        Tách (text_delta, usage) từ một chunk của InvokeModelWithResponseStream.
+        usage có thể chứa: input_tokens, output_tokens, stop_reason.
+        """
+        usage: Dict[str, Any] = {}
+        text = self._decode_family_chunk(payload, usage)
+
+        # Chunk cuối của mọi model có invocation metrics chuẩn của Bedrock
+        inv = payload.get("amazon-bedrock-invocationMetrics")
+        if isinstance(inv, dict):
+            if inv.get("inputTokenCount") is not None:
+                usage["input_tokens"] = inv["inputTokenCount"]
+            if inv.get("outputTokenCount") is not None:
+                usage["output_tokens"] = inv["outputTokenCount"]
+        return text, usage
+
+
+class ClaudeAdapter(ModelAdapter):
+    """Anthropic Claude (messages API)."""
+
+    def _decode_family_chunk(self, payload, usage):
+        ctype = payload.get("type")
+        if ctype == "content_block_delta":
+            return (payload.get("delta") or {}).get("text") or ""
+        if ctype == "message_start":
+            u = ((payload.get("message") or {}).get("usage")) or {}
+            if "input_tokens" in u:
+                usage["input_tokens"] = u["input_tokens"]
+        elif ctype == "message_delta":
+            u = payload.get("usage") or {}
+            if "output_tokens" in u:
+                usage["output_tokens"] = u["output_tokens"]
+            reason = (payload.get("delta") or {}).get("stop_reason")
+            if reason:
+                usage["stop_reason"] = reason
+        return ""
+
+
+class NovaAdapter(ModelAdapter):
+    """Amazon Nova (messages-v1)."""
+
+    family = "nova"
+    builders = (build_prompt_nova, build_prompt_nova_v1, build_prompt_nova_v2, build_prompt_nova_v3)
+    image_builder = staticmethod(build_prompt_nova_with_image)
+    constrain = staticmethod(constrain_nova)
+    packed_builder = staticmethod(build_prompt_nova_packed)
+
+    def _family_text(self, raw):
+        output = raw.get("output")
+        message = output.get("message") if isinstance(output, dict) else None
+        content = message.get("content") if isinstance(message, dict) else None
+        if isinstance(content, list) and content and isinstance(content[0], dict):
+            return content[0].get("text")
+        return None
+
+    def _family_stop_reason(self, raw):
+        return raw.get("stopReason")
+
+    def build_continuation_body(self, body, partial, max_tokens):
+        prefill = {"role": "assistant", "content": [{"text": partial.rstrip()}]}
+        config = {**body.get("inferenceConfig", {}), "maxTokens": max_tokens}
+        return {**body, "messages": [*_user_turns(body), prefill], "inferenceConfig": config}
+
+    def _decode_family_chunk(self, payload, usage):
+        if "contentBlockDelta" in payload:
+            return ((payload["contentBlockDelta"].get("delta")) or {}).get("text") or ""
+        if "messageStop" in payload:
+            reason = payload["messageStop"].get("stopReason")
+            if reason:
+                usage["stop_reason"] = reason
+        elif isinstance(payload.get("metadata"), dict):
+            u = payload["metadata"].get("usage") or {}
+            if "inputTokens" in u:
+                usage["input_tokens"] = u["inputTokens"]
+            if "outputTokens" in u:
+                usage["output_tokens"] = u["outputTokens"]
+        return ""
+
+
+class TitanAdapter(ModelAdapter):
+    """Amazon Titan Text (Lite/Express)."""
+
+    family = "titan"
+    builders = (build_prompt_titan, build_prompt_titan_v1, build_prompt_titan_v2, build_prompt_titan_v3)
+    constrain = staticmethod(constrain_titan)
+    packed_builder = staticmethod(build_prompt_titan_packed)
+    packed_stop_sequences = tuple(TITAN_STOP_SEQUENCES)
+
+    def _family_text(self, raw):
+        results = raw.get("results")
+        if isinstance(results, list) and results and isinstance(results[0], dict):
+            return results[0].get("outputText")
+        return raw.get("outputText")
+
+    def _family_stop_reason(self, raw):
+        results = raw.get("results")
+        if isinstance(results, list) and results and isinstance(results[0], dict):
+            return results[0].get("completionReason")
+        return raw.get("completionReason")
+
+    # Text completion: không có lượt assistant, output bị cắt được nối vào cuối prompt
+    continuation_prefill = False
+
+    def build_continuation_body(self, body, partial, max_tokens):
+        config = {**body.get("textGenerationConfig", {}), "maxTokenCount": max_tokens}
+        return {**body, "inputText": _append_partial(body["inputText"], partial), "textGenerationConfig": config}
+
+    def _body_usage(self, raw):
+        if not isinstance(raw, dict):
+            return None, None
+        results = raw.get("results")
+        tokens_out = results[0].get("tokenCount") if isinstance(results, list) and results else None
+        return raw.get("inputTextTokenCount"), tokens_out
+
+    def _decode_family_chunk(self, payload, usage):
+        if payload.get("inputTextTokenCount") is not None:
+            usage["input_tokens"] = payload["inputTextTokenCount"]
+        if payload.get("totalOutputTextTokenCount") is not None:
+            usage["output_tokens"] = payload["totalOutputTextTokenCount"]
+        if payload.get("completionReason"):
+            usage["stop_reason"] = payload["completionReason"]
+        return payload.get("outputText") or ""
+
+
+class LlamaAdapter(ModelAdapter):
+    """Meta Llama."""
+
+    family = "llama"
+    builders = (build_prompt_llama, build_prompt_llama_v1, build_prompt_llama_v2, build_prompt_llama_v3)
+    constrain = staticmethod(constrain_llama)
+    packed_builder = staticmethod(build_prompt_llama_packed)
+    packed_stop_sequences = ()
+
+    def _family_text(self, raw):
+        return raw.get("generation")
+
+    continuation_prefill = False
+
+    def build_continuation_body(self, body, partial, max_tokens):
+        return {**body, "prompt": _append_partial(body["prompt"], partial), "max_gen_len": max_tokens}
+
+    def _body_usage(self, raw):
+        if not isinstance(raw, dict):
+            return None, None
+        return raw.get("prompt_token_count"), raw.get("generation_token_count")
+
+    def _decode_family_chunk(self, payload, usage):
+        if payload.get("prompt_token_count") is not None:
+            usage["input_tokens"] = payload["prompt_token_count"]
+        if payload.get("generation_token_count") is not None:
+            usage["output_tokens"] = payload["generation_token_count"]
+        if payload.get("stop_reason"):
+            usage["stop_reason"] = payload["stop_reason"]
+        return payload.get("generation") or ""
+
+
+ADAPTERS: Dict[str, ModelAdapter] = {
+    "claude": ClaudeAdapter(),
+    "nova": NovaAdapter(),
+    "titan": TitanAdapter(),
+    "llama": LlamaAdapter(),
+}
+
+
+def model_family(model_id: str) -> str:
+    """Họ model suy từ model_id; không nhận ra thì mặc định Claude."""
+    mid = (model_id or "").strip().lower()
+    if "nova" in mid:
+        return "nova"
+    if "titan-text-lite" in mid or "titan-text-express" in mid:
+        return "titan"
+    if "llama" in mid:
+        return "llama"
+    return "claude"
+
+
+@lru_cache(maxsize=128)
+def get_adapter(model_id: str) -> ModelAdapter:
+    return ADAPTERS[model_family(model_id)]
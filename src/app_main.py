@@ -8,8 +8,15 @@ from .ui.components import (
     render_input_mode_selector, render_model_selector, render_controls,
     render_text_input, render_image_input, render_validation_warnings
 )
-from .ui.results import render_result
-from .inference import invoke_model
+from .ui.results import render_result, render_stream
+from .inference import invoke_model_dish, invoke_model_stream
+
+
+@st.cache_resource(show_spinner=False)
+def _shared_bedrock_client():
+    """Một BedrockClient cho cả process: không tạo lại boto3 client ở mỗi lần Streamlit rerun."""
+    from .bedrock_client import get_bedrock_client
+    return get_bedrock_client()
 
 
 class StreamlitApp:
@@ -22,8 +29,7 @@ class StreamlitApp:
     def _initialize_bedrock_client(self):
         """Initialize Bedrock client."""
         try:
-            from .bedrock_client import BedrockClient
-            self.bedrock_client = BedrockClient()
+            self.bedrock_client = _shared_bedrock_client()
         except Exception as e:
             st.sidebar.error(f"Không khởi tạo được Bedrock client: {e}")
 
@@ -65,7 +71,11 @@ class StreamlitApp:
         if run_extract:
             self._process_extraction(
                 input_mode, user_desc, img, selected_model_id,
-                model_name, temperature, max_tokens
+                model_name, temperature, max_tokens,
+                use_cache=not sidebar_state.get("bypass_cache", False),
+                streaming=sidebar_state.get("streaming", False),
+                hedge=sidebar_state.get("hedge", False),
+                constrained=sidebar_state.get("constrained")
             )
 
         # Footer
@@ -75,7 +85,8 @@ class StreamlitApp:
     def _process_extraction(
         self, input_mode: str, user_desc: str, img,
         selected_model_id: str, model_name: str,
-        temperature: float, max_tokens: int
+        temperature: float, max_tokens: int, use_cache: bool = True,
+        streaming: bool = False, hedge: bool = False, constrained: Optional[bool] = None
     ):
         """Process the extraction request."""
         try:
@@ -83,19 +94,32 @@ class StreamlitApp:
             if not render_validation_warnings(input_mode, user_desc, img):
                 return
 
+            if streaming:
+                desc = user_desc if input_mode == "Text" else ""
+                events = invoke_model_stream(
+                    self.bedrock_client, desc, selected_model_id,
+                    float(temperature), int(max_tokens),
+                    img if input_mode == "Image" else None, use_cache=use_cache, constrained=constrained
+                )
+                render_stream(events, model_name, model_id=selected_model_id)
+                return
+
             # Process with spinner
             with st.spinner(f"Đang xử lý với {model_name}..."):
                 if input_mode == "Text":
-                    raw_response, metrics = invoke_model(
+                    raw_response, metrics, dish = invoke_model_dish(
                         self.bedrock_client, user_desc, selected_model_id,
-                        float(temperature), int(max_tokens)                   )
+                        float(temperature), int(max_tokens), use_cache=use_cache, hedge=hedge,
+                        constrained=constrained
+                    )
                 else:
-                    raw_response, metrics = invoke_model(
+                    raw_response, metrics, dish = invoke_model_dish(
                         self.bedrock_client, "", selected_model_id,
-                        float(temperature), int(max_tokens), img
+                        float(temperature), int(max_tokens), img, use_cache=use_cache, hedge=hedge,
+                        constrained=constrained
                     )
 
-                render_result(raw_response, metrics, model_name)
+                render_result(raw_response, metrics, model_name, model_id=selected_model_id, dish=dish)
 
         except Exception as e:
             st.error(f"❌ Lỗi xử lý: {e}")
@@ -0,0 +1,334 @@
+"""Headless batch CLI: JSONL/CSV/thư mục ảnh -> JSONL Dish đã validate, có checkpoint để chạy tiếp.
+
+Ví dụ:
+    python -m src.batch recipes.jsonl -o dishes.jsonl --concurrency 16
+    python -m src.batch recipes.csv -o dishes.jsonl --model-id amazon.titan-text-lite-v1
+    python -m src.batch photos/ -o dishes.jsonl --model-id amazon.nova-lite-v1:0
+    python -m src.batch recipes.jsonl -o dishes.jsonl --pack     # nhiều mô tả mỗi request
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+from collections import deque
+from typing import Any, Dict, Iterator
+
+from .batch_inference import BatchSummary, iter_invoke_many
+from .length_predictor import get_length_predictor
+from .models import IMAGE_MODELS
+from .packing import estimate_packing, iter_invoke_packed
+from .parser import parse_and_validate
+from .response_processor import normalize_to_claude_like
+from .token_estimator import estimate_cost_preflight, get_token_estimator
+from .utils import get_logger, MODEL_ID, MAX_TOKENS, TEMPERATURE
+
+logger = get_logger("batch")
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+DESC_KEYS = ("desc", "description", "text")
+INVALID_KEY = "_invalid"  # dòng input hỏng: {"line", "error", "text"}
+
+
+# =========================
+# Input (đọc dần, không nạp cả file)
+# =========================
+def _row_desc(row: Dict[str, Any]) -> str:
+    for key in DESC_KEYS:
+        if row.get(key):
+            return str(row[key])
+    return ""
+
+
+def _invalid_row(line_no: int, error: str, text: str) -> Dict[str, Any]:
+    """Dòng input không đọc được: vẫn chiếm một dòng (checkpoint đếm đúng), được ghi vào file lỗi."""
+    return {"id": line_no, INVALID_KEY: {"line": line_no + 1, "error": error, "text": text}}
+
+
+def _iter_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield _invalid_row(line_no, f"JSONDecodeError: {e}", line)
+                continue
+            if isinstance(row, str):
+                row = {"desc": row}
+            elif not isinstance(row, dict):
+                yield _invalid_row(line_no, f"Row must be a JSON object or string, got {type(row).__name__}", line)
+                continue
+            row.setdefault("id", line_no)
+            yield row
+
+
+def _iter_csv(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8", newline="") as f:
+        for line_no, row in enumerate(csv.DictReader(f)):
+            row = {k: v for k, v in row.items() if v not in (None, "")}
+            row.setdefault("id", line_no)
+            yield row
+
+
+def _iter_images(path: str) -> Iterator[Dict[str, Any]]:
+    names = sorted(
+        e.name for e in os.scandir(path)
+        if e.is_file() and e.name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    for name in names:
+        with open(os.path.join(path, name), "rb") as f:
+            yield {"id": name, "desc": "", "img": f.read()}
+
+
+def iter_rows(path: str) -> Iterator[Dict[str, Any]]:
+    """Đọc input theo định dạng: thư mục ảnh, .csv, còn lại coi là JSONL."""
+    if os.path.isdir(path):
+        return _iter_images(path)
+    if path.lower().endswith(".csv"):
+        return _iter_csv(path)
+    return _iter_jsonl(path)
+
+
+# =========================
+# Checkpoint
+# =========================
+def _load_checkpoint(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _save_checkpoint(path: str, state: Dict[str, Any]):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _open_at(path: str, offset: int):
+    """Mở file để ghi tiếp, cắt bỏ phần đã ghi sau checkpoint cuối (nếu có)."""
+    f = open(path, "a+b")
+    f.truncate(offset)
+    f.seek(offset)
+    return f
+
+
+def _write_line(f, obj: Dict[str, Any]):
+    f.write(json.dumps(obj, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+# =========================
+# Runner
+# =========================
+def run_batch(bedrock_client, input_path: str, output_path: str, errors_path: str = None,
+              model_id: str = None, prompt_version: int = 0,
+              temperature: float = TEMPERATURE, max_tokens: int = MAX_TOKENS,
+              max_concurrency: int = 8, use_cache: bool = True,
+              checkpoint_every: int = 50, restart: bool = False, pack: bool = False) -> Dict[str, Any]:
+    """
+    Chạy batch và trả về summary. Kết quả theo thứ tự input:
+      - output_path: mỗi dòng {"id", "index", "dish", "metrics"}
+      - errors_path: mỗi dòng {"id", "index", "error", "raw_text"}; dòng input không đọc được (JSON hỏng,
+        không phải object/string, tham số sai kiểu) không gọi model; dòng JSONL hỏng có thêm "line" (số dòng)
+    Checkpoint (output_path + ".ckpt.json") lưu số dòng đã xong và offset của hai file
+    output; khi chạy lại sẽ bỏ qua các dòng đã xong thay vì gọi lại model.
+    pack=True: gói các mô tả text liên tiếp vào chung request (src/packing.py), summary["packing"].
+    """
+    errors_path = errors_path or output_path + ".errors.jsonl"
+    ckpt_path = output_path + ".ckpt.json"
+    is_image_dir = os.path.isdir(input_path)
+    model_id = model_id or (next(iter(IMAGE_MODELS)) if is_image_dir else MODEL_ID)
+
+    state = {} if restart else _load_checkpoint(ckpt_path)
+    if state and state.get("input") != os.path.abspath(input_path):
+        raise RuntimeError(f"Checkpoint {ckpt_path} belongs to another input: {state.get('input')}")
+    done = int(state.get("done", 0))
+    if done:
+        logger.info(f"Resuming from checkpoint: {done} rows already processed")
+
+    out_f = _open_at(output_path, int(state.get("out_offset", 0)))
+    err_f = _open_at(errors_path, int(state.get("err_offset", 0)))
+
+    # Dòng input hỏng không được gửi đi: (số request đã gửi trước nó, dòng) - ghi vào file lỗi đúng thứ tự input
+    rejected = deque()
+
+    def requests():
+        sent = 0
+        for row in itertools.islice(iter_rows(input_path), done, None):
+            invalid = row.get(INVALID_KEY)
+            if invalid is None:
+                try:
+                    req = {
+                        "id": row.get("id"),
+                        "desc": _row_desc(row),
+                        "img": row.get("img"),
+                        "model_id": row.get("model_id") or model_id,
+                        "prompt_version": int(row.get("prompt_version", prompt_version)),
+                        "temperature": float(row.get("temperature", temperature)),
+                        "max_tokens": int(row.get("max_tokens", max_tokens)),
+                        "use_cache": use_cache,
+                    }
+                except (TypeError, ValueError) as e:
+                    invalid = {"error": f"{type(e).__name__}: {e}"}
+            if invalid is not None:
+                rejected.append((sent, row.get("id"), invalid))
+                continue
+            sent += 1
+            yield req
+
+    def reject(before: int):
+        nonlocal done
+        while rejected and rejected[0][0] <= before:
+            _, row_id, invalid = rejected.popleft()
+            logger.warning(f"Skipping invalid input row {row_id}: {invalid['error']}")
+            entry = {"id": row_id, "index": done, "error": invalid["error"],
+                     "raw_text": invalid["text"][:2000] if invalid.get("text") else None}
+            if "line" in invalid:
+                entry["line"] = invalid["line"]
+            _write_line(err_f, entry)
+            summary.add({"ok": False})
+            done += 1
+            if done % checkpoint_every == 0:
+                checkpoint()
+
+    def checkpoint():
+        for f in (out_f, err_f):
+            f.flush()
+            os.fsync(f.fileno())
+        _save_checkpoint(ckpt_path, {
+            "input": os.path.abspath(input_path),
+            "done": done,
+            "out_offset": out_f.tell(),
+            "err_offset": err_f.tell(),
+        })
+
+    summary = BatchSummary()
+    try:
+        run = iter_invoke_packed if pack else iter_invoke_many
+        for result in run(bedrock_client, requests(), max_concurrency, ordered=True):
+            reject(result["index"])
+            index = done
+            raw_text = None
+            if result["ok"]:
+                try:
+                    normalized = normalize_to_claude_like(result["raw"], result["model_id"])
+                    raw_text = normalized["content"][0]["text"]
+                    dish = result.get("dish") or parse_and_validate(normalized)
+                    _write_line(out_f, {"id": result["id"], "index": index,
+                                        "dish": dish.model_dump(mode="json"),
+                                        "metrics": result["metrics"]})
+                except Exception as e:
+                    result.update(ok=False, error=f"{type(e).__name__}: {e}")
+            if not result["ok"]:
+                _write_line(err_f, {"id": result["id"], "index": index,
+                                    "error": result["error"],
+                                    "raw_text": raw_text[:2000] if raw_text else None})
+            summary.add(result)
+            done += 1
+            if done % checkpoint_every == 0:
+                checkpoint()
+        reject(float("inf"))
+    finally:
+        checkpoint()
+        out_f.close()
+        err_f.close()
+
+    return summary.to_dict()
+
+
+def estimate_batch(input_path: str, model_id: str = None, prompt_version: int = 0,
+                   max_tokens: int = MAX_TOKENS, pack: bool = False) -> Dict[str, Any]:
+    """
+    Ước lượng trước (không gọi Bedrock): input token theo estimator offline,
+    chi phí tối đa khi mọi request dùng hết max_tokens.
+    pack=True: thêm số request / input token khi gói nhiều mô tả so với mỗi mô tả một request.
+    """
+    is_image_dir = os.path.isdir(input_path)
+    model_id = model_id or (next(iter(IMAGE_MODELS)) if is_image_dir else MODEL_ID)
+    per_model: Dict[str, Dict[str, Any]] = {}
+    for row in iter_rows(input_path):
+        if INVALID_KEY in row:
+            continue
+        mid = row.get("model_id") or model_id
+        image_tokens = 0
+        if row.get("img") is not None:
+            from .image_preprocess import estimate_image_tokens, open_image
+            w, h = open_image(row["img"]).size
+            image_tokens = estimate_image_tokens(w, h, mid)
+        desc, pv = _row_desc(row), int(row.get("prompt_version", prompt_version))
+        row_max_tokens = int(row.get("max_tokens", max_tokens))
+        if row_max_tokens <= 0:
+            row_max_tokens = get_length_predictor().max_tokens(mid, desc, pv, image=row.get("img") is not None)
+        tokens_in, cost = estimate_cost_preflight(mid, desc, row_max_tokens, pv, image_tokens)
+        stats = per_model.setdefault(mid, {"rows": 0, "tokens_in_est": 0, "max_cost_usd": 0.0})
+        stats["rows"] += 1
+        stats["tokens_in_est"] += tokens_in
+        stats["max_cost_usd"] += cost
+    for stats in per_model.values():
+        stats["max_cost_usd"] = round(stats["max_cost_usd"], 6)
+    packing = None
+    if pack:
+        packing = estimate_packing(
+            {"desc": _row_desc(row), "img": row.get("img"), "model_id": row.get("model_id") or model_id,
+             "prompt_version": int(row.get("prompt_version", prompt_version))}
+            for row in iter_rows(input_path) if INVALID_KEY not in row
+        )
+    return {
+        "rows": sum(s["rows"] for s in per_model.values()),
+        "tokens_in_est": sum(s["tokens_in_est"] for s in per_model.values()),
+        "max_cost_usd": round(sum(s["max_cost_usd"] for s in per_model.values()), 6),
+        "per_model": per_model,
+        "estimator": get_token_estimator().report(),
+        "packing": packing,
+    }
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m src.batch", description=__doc__.splitlines()[0])
+    ap.add_argument("input", help="File .jsonl / .csv (cột desc|description|text) hoặc thư mục ảnh")
+    ap.add_argument("-o", "--output", required=True, help="File JSONL kết quả")
+    ap.add_argument("--errors", help="File JSONL lỗi (mặc định: <output>.errors.jsonl)")
+    ap.add_argument("--model-id", help="Model mặc định (dòng input có thể ghi đè bằng model_id)")
+    ap.add_argument("--prompt-version", type=int, default=0)
+    ap.add_argument("--temperature", type=float, default=TEMPERATURE)
+    ap.add_argument("--max-tokens", type=int, default=MAX_TOKENS,
+                    help="0 = tự động theo độ dài output dự đoán của model (src/length_predictor.py)")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--checkpoint-every", type=int, default=50)
+    ap.add_argument("--no-cache", action="store_true", help="Không dùng response cache")
+    ap.add_argument("--restart", action="store_true", help="Bỏ qua checkpoint, chạy lại từ đầu")
+    ap.add_argument("--pack", action="store_true",
+                    help="Gói nhiều mô tả vào một request (số mô tả theo giới hạn context/output của model)")
+    ap.add_argument("--estimate-only", action="store_true",
+                    help="Chỉ ước lượng token/chi phí tối đa, không gọi Bedrock")
+    args = ap.parse_args(argv)
+
+    if args.estimate_only:
+        estimate = estimate_batch(args.input, args.model_id, args.prompt_version, args.max_tokens, pack=args.pack)
+        print(json.dumps(estimate, ensure_ascii=False, indent=2))
+        return 0
+
+    from .bedrock_client import get_bedrock_client
+
+    summary = run_batch(
+        get_bedrock_client(), args.input, args.output, errors_path=args.errors,
+        model_id=args.model_id, prompt_version=args.prompt_version,
+        temperature=args.temperature, max_tokens=args.max_tokens,
+        max_concurrency=args.concurrency, use_cache=not args.no_cache,
+        checkpoint_every=args.checkpoint_every, restart=args.restart, pack=args.pack,
+    )
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+"""Concurrent batch inference on top of invoke_model_dish (thread pool, bounded parallelism)."""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .inference import invoke_model_dish
+from .models import get_model_cost_estimates
+from .rate_limiter import get_rate_limiter
+from .knowledge_base import peek_knowledge_base
+from .semantic_cache import peek_semantic_cache
+from .telemetry import get_telemetry
+from .token_estimator import get_token_estimator
+from .utils import get_logger, MODEL_ID, MAX_TOKENS, TEMPERATURE
+
+logger = get_logger("batch_inference")
+
+
+def run_one(bedrock_client, index: int, req: Dict[str, Any]) -> Dict[str, Any]:
+    """Chạy một request; lỗi được giữ lại trong kết quả, không làm hỏng cả batch."""
+    model_id = req.get("model_id") or MODEL_ID
+    result: Dict[str, Any] = {"index": index, "id": req.get("id", index), "model_id": model_id}
+    try:
+        raw, metrics, dish = invoke_model_dish(
+            bedrock_client,
+            req.get("desc", ""),
+            model_id,
+            float(req.get("temperature", TEMPERATURE)),
+            int(req.get("max_tokens", MAX_TOKENS)),
+            img=req.get("img"),
+            prompt_version=int(req.get("prompt_version", 0)),
+            use_cache=req.get("use_cache", True),
+            hedge=req.get("hedge"),
+            constrained=req.get("constrained"),
+        )
+        result.update(ok=True, raw=raw, metrics=metrics, dish=dish, error=None)
+    except Exception as e:
+        logger.warning(f"Batch item {index} failed: {e}")
+        result.update(ok=False, raw=None, metrics=None, dish=None,
+                      error=f"{type(e).__name__}: {e}")
+    return result
+
+
+def iter_invoke_many(
+    bedrock_client,
+    requests: Iterable[Dict[str, Any]],
+    max_concurrency: int = 8,
+    ordered: bool = True,
+    run: Optional[Callable[[Any, int, Dict[str, Any]], Dict[str, Any]]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Chạy nhiều request song song, tối đa `max_concurrency` request cùng lúc.
+
+    Mỗi request là dict: desc, model_id, temperature, max_tokens, img, prompt_version,
+    use_cache, hedge, constrained, id (tuỳ chọn). Thiếu key nào thì dùng cấu hình mặc định trong utils.
+    Yield dict kết quả: index, id, model_id, ok, raw, metrics, dish (Dish đã validate, None nếu
+    response không hợp lệ), error.
+
+    `requests` được đọc dần (có thể là generator rất dài); số request đang chạy
+    hoặc chờ trả về luôn bị chặn trên nên bộ nhớ không tăng theo kích thước input.
+    ordered=True trả theo thứ tự input, False trả theo thứ tự hoàn thành.
+    run(bedrock_client, index, request) -> dict có "index": đơn vị việc thay cho một request
+    (mặc định gọi invoke_model_dish; src/packing.py chạy cả một gói mô tả).
+    """
+    run = run or run_one
+    max_concurrency = max(1, int(max_concurrency))
+    window = max_concurrency * 2
+    source = enumerate(requests)
+    exhausted = False
+
+    with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="invoke") as pool:
+        pending = {}
+        finished: Dict[int, Dict[str, Any]] = {}
+        next_index = 0
+
+        def fill():
+            nonlocal exhausted
+            while not exhausted and len(pending) + len(finished) < window:
+                try:
+                    index, req = next(source)
+                except StopIteration:
+                    exhausted = True
+                    return
+                pending[pool.submit(run, bedrock_client, index, req)] = index
+
+        fill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.pop(future)
+                result = future.result()
+                if ordered:
+                    finished[result["index"]] = result
+                else:
+                    yield result
+            while next_index in finished:
+                yield finished.pop(next_index)
+                next_index += 1
+            fill()
+
+
+class BatchSummary:
+    """Cộng dồn thông số của một batch: throughput, tokens, chi phí theo từng model."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = 0
+        self.ok = 0
+        self.failed = 0
+        self.cache_hits = 0
+        # Request có output bị cắt được nối tiếp (xem src/continuation.py)
+        self.continuations = {"requests": 0, "complete": 0, "cost_saved_usd": 0.0, "latency_saved_s": 0.0}
+        # Mô tả chạy trong gói nhiều mô tả (batch --pack, xem src/packing.py)
+        self.packing = {"items": 0, "packs": 0, "reissued": 0, "tokens_in": 0, "tokens_in_unpacked_est": 0}
+        self.per_model: Dict[str, Dict[str, int]] = {}
+
+    def add(self, result: Dict[str, Any]):
+        self.total += 1
+        pack = result.get("pack")
+        if pack:
+            self.packing["items"] += 1
+            self.packing["packs"] += pack["position"] == 0
+            self.packing["reissued"] += pack["reissued"]
+            self.packing["tokens_in"] += pack["tokens_in"] + pack["reissue_tokens_in"]
+            self.packing["tokens_in_unpacked_est"] += pack["tokens_in_unpacked_est"]
+        if not result["ok"]:
+            self.failed += 1
+            return
+        self.ok += 1
+        metrics = result["metrics"] or {}
+        stats = self.per_model.setdefault(result["model_id"], {
+            "requests": 0, "tokens_in": 0, "tokens_out": 0,
+            "billed_tokens_in": 0, "billed_tokens_out": 0,
+        })
+        stats["requests"] += 1
+        stats["tokens_in"] += metrics.get("tokens_in", 0)
+        stats["tokens_out"] += metrics.get("tokens_out", 0)
+        cont = metrics.get("continuation")
+        if cont:
+            self.continuations["requests"] += 1
+            self.continuations["complete"] += cont["outcome"] == "complete"
+            self.continuations["cost_saved_usd"] += cont["cost_saved_usd"]
+            self.continuations["latency_saved_s"] += cont["latency_saved_s"]
+        if metrics.get("cache") in ("memory", "disk", "image", "semantic", "kb"):
+            self.cache_hits += 1
+        else:
+            stats["billed_tokens_in"] += metrics.get("tokens_in", 0)
+            stats["billed_tokens_out"] += metrics.get("tokens_out", 0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        per_model = {}
+        total_cost = 0.0
+        for model_id, stats in self.per_model.items():
+            cost_in_1k, cost_out_1k = get_model_cost_estimates(model_id)
+            cost = (stats["billed_tokens_in"] / 1000.0) * cost_in_1k \
+                + (stats["billed_tokens_out"] / 1000.0) * cost_out_1k
+            total_cost += cost
+            per_model[model_id] = {**stats, "cost_est_usd": round(cost, 6)}
+        semantic = peek_semantic_cache()
+        kb = peek_knowledge_base()
+        return {
+            "total": self.total,
+            "ok": self.ok,
+            "failed": self.failed,
+            "cache_hits": self.cache_hits,
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(self.total / elapsed, 3) if elapsed > 0 else 0.0,
+            "tokens_in": sum(s["tokens_in"] for s in self.per_model.values()),
+            "tokens_out": sum(s["tokens_out"] for s in self.per_model.values()),
+            "cost_est_usd": round(total_cost, 6),
+            "per_model": per_model,
+            # p50/p95/p99 từng bước theo model (telemetry dùng chung trong process)
+            "stage_latency": get_telemetry().summary(),
+            # Sai số của estimator token offline so với header token thật
+            "token_estimator": get_token_estimator().report(),
+            # Limit đồng thời hiện tại của từng model sau các lần bị throttle
+            "rate_limit": get_rate_limiter().snapshot(),
+            # Tỉ lệ hit của cache mô tả gần trùng trong process (None nếu tắt hoặc batch không dùng)
+            "semantic_cache": semantic.stats() if semantic is not None else None,
+            # Request được knowledge base món ăn trả lời, không gọi model (None nếu tắt hoặc batch không dùng)
+            "knowledge_base": kb.stats() if kb is not None else None,
+            # Output bị cắt được nối tiếp thay vì chạy lại: số request, phần tiết kiệm ước lượng
+            "continuations": {k: round(v, 6) if isinstance(v, float) else v for k, v in self.continuations.items()},
+            # Gói nhiều mô tả: số request, input token so với mỗi mô tả một request (None nếu không gói)
+            "packing": self._packing_summary(),
+        }
+
+    def _packing_summary(self) -> Optional[Dict[str, Any]]:
+        p = self.packing
+        if not p["items"]:
+            return None
+        requests = p["packs"] + p["reissued"]
+        saved = p["tokens_in_unpacked_est"] - p["tokens_in"]
+        return {
+            **p,
+            "requests": requests,
+            "requests_unpacked": p["items"],
+            "requests_saved": p["items"] - requests,
+            "tokens_in_saved_est": saved,
+            "tokens_in_saved_pct": round(100 * saved / p["tokens_in_unpacked_est"], 1)
+            if p["tokens_in_unpacked_est"] else 0.0,
+        }
+
+
+def invoke_many(
+    bedrock_client,
+    requests: Iterable[Dict[str, Any]],
+    max_concurrency: int = 8,
+    ordered: bool = True,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Chạy cả batch và trả về (results, summary).
+    summary: total, ok, failed, cache_hits, elapsed_s, throughput_rps,
+    tokens_in, tokens_out, cost_est_usd, per_model, stage_latency, token_estimator, rate_limit, semantic_cache, knowledge_base,
+    continuations, packing.
+    """
+    summary = BatchSummary()
+    results = []
+    for result in iter_invoke_many(bedrock_client, requests, max_concurrency, ordered):
+        summary.add(result)
+        results.append(result)
+    return results, summary.to_dict()
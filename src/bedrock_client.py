@@ -1,12 +1,20 @@
 from __future__ import annotations
+import functools
 import json
-import boto3
-from botocore.config import Config
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import BotoCoreError, ClientError
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from .utils import get_logger, REGION
-from botocore.response import StreamingBody
+from .adapters import get_adapter
+from .rate_limiter import LimiterTimeout, get_rate_limiter
+from .telemetry import get_telemetry, span
+from .utils import (
+    get_logger, REGION, MODEL_ID, RATE_LIMIT_ENABLED,
+    BEDROCK_MAX_POOL_CONNECTIONS, BEDROCK_WARMUP, BEDROCK_WARMUP_CONNECTIONS,
+    BEDROCK_CASSETTE, BEDROCK_CASSETTE_MODE, BEDROCK_CASSETTE_LATENCY, BEDROCK_CASSETTE_ERRORS,
+)
 
+# boto3/botocore.config (~0.2s) và tenacity chỉ được import khi thật sự tạo client / gọi lần đầu
 
 logger = get_logger("bedrock")
 
@@ -15,17 +23,118 @@ class BedrockError(RuntimeError): ...
 class BedrockRateLimit(BedrockError): ...
 class BedrockTimeout(BedrockError): ...
 class BedrockInvalidResponse(BedrockError): ...
+class BedrockQueueTimeout(BedrockError): ...  # chờ slot của limiter quá lâu: không retry (model đang bão hoà)
+
+
+def _retry(fn):
+    """Retry khi throttle/timeout: tối đa 4 lần, backoff mũ 1-8s (tenacity, import ở lần gọi đầu)."""
+    retrying = None
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        nonlocal retrying
+        if retrying is None:
+            from tenacity import Retrying, stop_after_attempt, wait_exponential, retry_if_exception_type
+            retrying = Retrying(
+                reraise=True,
+                stop=stop_after_attempt(4),
+                wait=wait_exponential(multiplier=0.8, min=1, max=8),
+                retry=retry_if_exception_type((BedrockRateLimit, BedrockTimeout, BotoCoreError, ClientError)),
+            )
+        return retrying.copy()(fn, *args, **kwargs)
+
+    return wrapper
+
+
+# Các event lỗi có thể xuất hiện giữa stream
+_STREAM_ERROR_KEYS = {
+    "internalServerException", "modelStreamErrorException", "validationException",
+    "throttlingException", "modelTimeoutException", "serviceUnavailableException",
+}
+
+
+def _serialize_body(body) -> bytes | bytearray | str:
+    """Body đã serialize sẵn (bytes/bytearray, vd. request ảnh) được gửi nguyên vẹn."""
+    if isinstance(body, (bytes, bytearray)):
+        return body
+    return json.dumps(body)
 
 
 class BedrockClient:
-    def __init__(self, region: str = REGION, timeout: int = 60):
-        cfg = Config(
-            region_name=region,
-            retries={"max_attempts": 0},
-            read_timeout=timeout,
-            connect_timeout=10,
-        )
-        self.client = boto3.client("bedrock-runtime", config=cfg)
+    def __init__(self, region: str = REGION, timeout: int = 60, client=None):
+        """
+        client: bedrock-runtime client có sẵn (vd. stub/cassette cho benchmark); None thì tạo bằng boto3.
+        BEDROCK_CASSETTE bật record/replay (src/cassette.py); replay không tạo client boto3.
+        Mọi BedrockClient trong process dùng chung một limiter đồng thời theo model (src/rate_limiter.py).
+        App/batch nên dùng get_bedrock_client() thay vì tạo mới mỗi lần.
+        """
+        self.limiter = get_rate_limiter() if RATE_LIMIT_ENABLED else None
+        self.warmed = False
+        self._first_call_logged = False
+        self._live = False
+        if client is not None:
+            self.client = client
+            return
+
+        def make_runtime():
+            import boto3
+            from botocore.config import Config
+
+            cfg = Config(
+                region_name=region,
+                retries={"max_attempts": 0},
+                read_timeout=timeout,
+                connect_timeout=10,
+                # đủ kết nối cho limiter / batch / hedging chạy song song, giữ kết nối sống giữa các request
+                max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+                tcp_keepalive=True,
+            )
+            return boto3.client("bedrock-runtime", config=cfg)
+
+        if BEDROCK_CASSETTE:
+            from .cassette import CassetteRuntime
+            self.client = CassetteRuntime(
+                BEDROCK_CASSETTE, BEDROCK_CASSETTE_MODE,
+                inner_factory=None if BEDROCK_CASSETTE_MODE == "replay" else make_runtime,
+                latency=BEDROCK_CASSETTE_LATENCY, replay_errors=BEDROCK_CASSETTE_ERRORS,
+            )
+        else:
+            self.client = make_runtime()
+            self._live = True
+
+    def warm_up(self, model_id: str = MODEL_ID, connections: int = BEDROCK_WARMUP_CONNECTIONS) -> float:
+        """
+        Mở sẵn `connections` kết nối TLS tới bedrock-runtime trước request đầu tiên của người dùng.
+        Gửi CountTokens rỗng (không tính phí, không gọi model); lỗi trả về vẫn để lại kết nối trong pool.
+        Trả về thời gian warm-up (giây); client giả / cassette thì bỏ qua.
+        """
+        if not self._live:
+            return 0.0
+        t0 = time.perf_counter()
+
+        def ping(_):
+            try:
+                self.client.count_tokens(modelId=model_id, input={"invokeModel": {"body": b"{}"}})
+            except Exception as e:  # ValidationException/AccessDenied... đều đã qua handshake
+                logger.debug(f"Warm-up request: {type(e).__name__}")
+
+        connections = max(1, connections)
+        with ThreadPoolExecutor(max_workers=connections, thread_name_prefix="bedrock-warmup") as pool:
+            list(pool.map(ping, range(connections)))
+        elapsed = time.perf_counter() - t0
+        self.warmed = True
+        get_telemetry().set_gauge("food_bedrock_warmup_seconds", elapsed)
+        logger.info(f"Bedrock warm-up: {connections} connection(s) in {elapsed:.3f}s")
+        return elapsed
+
+    def _record_first_call(self, model_id: str, seconds: float):
+        """Latency của request đầu tiên trong process, tách theo đã warm-up hay chưa."""
+        if self._first_call_logged:
+            return
+        self._first_call_logged = True
+        get_telemetry().set_gauge("food_bedrock_first_call_seconds", seconds,
+                                  model=model_id, warmed=str(self.warmed).lower())
+        logger.info(f"First Bedrock call ({model_id}, warmed={self.warmed}): {seconds:.3f}s")
 
     def _classify(self, err: Exception) -> BedrockError:
         if isinstance(err, ClientError):
@@ -42,31 +151,59 @@ class BedrockClient:
         except Exception:
             return {}
 
-    @retry(
-        reraise=True,
-        stop=stop_after_attempt(4),
-        wait=wait_exponential(multiplier=0.8, min=1, max=8),
-        retry=retry_if_exception_type((BedrockRateLimit, BedrockTimeout, BotoCoreError, ClientError))
-    )
-    def invoke(self, model_id: str, body: dict,
+    @_retry
+    def invoke(self, model_id: str, body: dict | bytes | bytearray,
             accept: str = "application/json",
             content_type: str = "application/json") -> tuple[dict, dict]:
         """
         Trả về (json_result, headers_lowercased).
         Headers chứa token thật: x-amzn-bedrock-input-token-count, x-amzn-bedrock-output-token-count
+        Mỗi lần thử (kể cả retry) được đo riêng: stage "bedrock_attempt" + counter theo kết quả.
+        """
+        return self._attempt(model_id, self._invoke_once, model_id, body, accept, content_type)[0]
+
+    def _attempt(self, model_id: str, fn, *args, keep_slot: bool = False):
         """
+        Một lần gọi trong slot của limiter; trả về (result, started).
+        keep_slot=True (stream): slot chỉ trả khi caller gọi limiter.release lúc stream kết thúc.
+        """
+        started = 0.0
+        if self.limiter is not None:
+            try:
+                started = self.limiter.acquire(model_id)
+            except LimiterTimeout as e:
+                raise BedrockQueueTimeout(str(e))
+        outcome = "ok"
+        t0 = time.perf_counter()
+        try:
+            with span("bedrock_attempt", model_id):
+                try:
+                    result = fn(*args)
+                except Exception as e:
+                    outcome = "throttled" if isinstance(e, BedrockRateLimit) else "error"
+                    get_telemetry().inc("food_bedrock_attempts_total", model=model_id, outcome=type(e).__name__)
+                    raise
+        finally:
+            if self.limiter is not None and (outcome != "ok" or not keep_slot):
+                self.limiter.release(model_id, outcome, started)
+        get_telemetry().inc("food_bedrock_attempts_total", model=model_id, outcome="ok")
+        if not self._first_call_logged:
+            self._record_first_call(model_id, time.perf_counter() - t0)
+        return result, started
+
+    def _invoke_once(self, model_id: str, body, accept: str, content_type: str) -> tuple[dict, dict]:
         try:
             logger.info(f"Invoking model: {model_id}")
             resp = self.client.invoke_model(
                 modelId=model_id,
                 accept=accept,
                 contentType=content_type,
-                body=json.dumps(body)
+                body=_serialize_body(body)
             )
             headers = self._headers_lower(resp)
             # body có thể là StreamingBody
             raw = resp.get("body")
-            if isinstance(raw, StreamingBody):
+            if hasattr(raw, "read"):
                 text = raw.read()
                 text = text.decode("utf-8", errors="ignore")
             else:
@@ -81,22 +218,108 @@ class BedrockClient:
             raise self._classify(e)
 
 
-    def count_tokens(self, model_id: str, request_body: dict, content_type: str = "application/json") -> int:
-        """
-        Dùng Bedrock CountTokens để đếm input tokens CHUẨN trước khi invoke.
-        Không tính phí. Kết quả bằng đúng số sẽ bị tính tiền khi invoke cùng nội dung.
-        """
+    @_retry
+    def _open_stream(self, model_id: str, body: dict | bytes | bytearray, accept: str, content_type: str):
+        return self._attempt(model_id, self._open_stream_once, model_id, body, accept, content_type,
+                             keep_slot=True)
+
+    def _open_stream_once(self, model_id: str, body, accept: str, content_type: str):
         try:
-            resp = self.client.count_tokens(
+            logger.info(f"Invoking model (stream): {model_id}")
+            resp = self.client.invoke_model_with_response_stream(
                 modelId=model_id,
+                accept=accept,
                 contentType=content_type,
-                body=json.dumps(request_body)
+                body=_serialize_body(body)
             )
-            usage = resp.get("body") 
+            return resp.get("body")
+        except (BotoCoreError, ClientError) as e:
+            raise self._classify(e)
 
-            if isinstance(usage, (bytes, str)):
-                usage = json.loads(usage if isinstance(usage, str) else usage.decode("utf-8"))
-            return int(usage.get("totalTokens") or usage.get("inputTokens") or 0)
+    def invoke_stream(self, model_id: str, body: dict | bytes | bytearray,
+                      accept: str = "application/json",
+                      content_type: str = "application/json"):
+        """
+        Gọi InvokeModelWithResponseStream, yield từng event dạng dict:
+          {"type": "text", "text": "..."}       - đoạn text mới
+          {"type": "usage", "usage": {...}}     - token/stop_reason khi model gửi về
+        Chỉ retry lúc mở stream; lỗi giữa stream được raise ra ngoài.
+        Slot của limiter được giữ tới khi stream kết thúc (hoặc caller dừng đọc).
+        """
+        adapter = get_adapter(model_id)
+        stream, started = self._open_stream(model_id, body, accept, content_type)
+        outcome = "error"
+        try:
+            if stream is None:
+                raise BedrockInvalidResponse("Bedrock returned empty stream")
+            for event in stream:
+                err_key = next((k for k in event if k in _STREAM_ERROR_KEYS), None)
+                if err_key:
+                    msg = (event[err_key] or {}).get("message", err_key)
+                    if err_key == "throttlingException":
+                        raise BedrockRateLimit(msg)
+                    if err_key == "modelTimeoutException":
+                        raise BedrockTimeout(msg)
+                    raise BedrockError(msg)
+                chunk = event.get("chunk")
+                if not chunk:
+                    continue
+                try:
+                    payload = json.loads(chunk.get("bytes") or b"{}")
+                except json.JSONDecodeError as e:
+                    raise BedrockInvalidResponse(f"Model stream returned non-JSON chunk: {e}")
+                text, usage = adapter.decode_stream_chunk(payload)
+                if text:
+                    yield {"type": "text", "text": text}
+                if usage:
+                    yield {"type": "usage", "usage": usage}
+            outcome = "ok"
+        except BedrockRateLimit:
+            outcome = "throttled"
+            raise
+        except (BotoCoreError, ClientError) as e:
+            err = self._classify(e)
+            if isinstance(err, BedrockRateLimit):
+                outcome = "throttled"
+            raise err
+        finally:
+            if self.limiter is not None:
+                self.limiter.release(model_id, outcome, started)
+
+    def count_tokens(self, model_id: str, request_body: dict | bytes | bytearray) -> int:
+        """
+        Dùng Bedrock CountTokens để đếm input tokens CHUẨN trước khi invoke.
+        Không tính phí. Kết quả bằng đúng số sẽ bị tính tiền khi invoke cùng nội dung.
+        Request có dạng input={"invokeModel": {"body": <body InvokeModel>}} (như warm_up),
+        response trả inputTokens ở cấp trên cùng.
+        """
+        body = _serialize_body(request_body)
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        try:
+            resp = self.client.count_tokens(modelId=model_id, input={"invokeModel": {"body": body}})
+            return int(resp.get("inputTokens") or 0)
         except Exception as e:
             logger.warning(f"CountTokens failed: {e}")
-            return 0
\ No newline at end of file
+            return 0
+
+_shared: BedrockClient | None = None
+_shared_lock = threading.Lock()
+
+
+def get_bedrock_client(warm_up: bool = BEDROCK_WARMUP) -> BedrockClient:
+    """
+    BedrockClient dùng chung trong process (một boto3 client, một connection pool).
+    warm_up=True: lần tạo đầu tiên mở sẵn kết nối ở thread nền, không chặn caller.
+    """
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                t0 = time.perf_counter()
+                client = BedrockClient()
+                get_telemetry().set_gauge("food_bedrock_client_init_seconds", time.perf_counter() - t0)
+                if warm_up:
+                    threading.Thread(target=client.warm_up, name="bedrock-warmup", daemon=True).start()
+                _shared = client
+    return _shared
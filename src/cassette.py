@@ -0,0 +1,259 @@
+"""Record/replay bedrock-runtime ("cassette") để chạy load test / regression offline.
+
+    BEDROCK_CASSETTE=.cache/bedrock.cassette.jsonl.gz BEDROCK_CASSETTE_MODE=record  -> gọi Bedrock thật, ghi lại
+    BEDROCK_CASSETTE_MODE=replay  -> phát lại, không cần mạng / credentials
+    BEDROCK_CASSETTE_MODE=auto    -> phát lại nếu có, thiếu thì gọi thật và ghi thêm
+
+Mỗi dòng (gzip JSONL, ghi nối tiếp) là một lần gọi: op, key = sha256(model_id + body đã serialize),
+response body, headers, latency đo được, hoặc lỗi (code/message) nếu lần gọi đó bị throttle/timeout.
+Phát lại qua đúng giao diện của boto3 client (invoke_model, invoke_model_with_response_stream,
+count_tokens) nên BedrockClient (retry, span, đọc StreamingBody) chạy y như với Bedrock thật.
+"""
+
+import atexit
+import gzip
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+from .utils import get_logger
+
+logger = get_logger("cassette")
+
+MODES = ("record", "replay", "auto")
+# none: trả ngay; recorded: ngủ đúng latency đã ghi của bản ghi; distribution: lấy mẫu ngẫu nhiên
+# trong các latency đã ghi của cùng model (giữ phân phối, không gắn với request cụ thể)
+LATENCY_MODES = ("none", "recorded", "distribution")
+
+_OPERATIONS = {
+    "invoke_model": "InvokeModel",
+    "invoke_model_with_response_stream": "InvokeModelWithResponseStream",
+    "count_tokens": "CountTokens",
+}
+
+
+class CassetteMiss(LookupError):
+    """Replay không tìm thấy bản ghi cho request."""
+
+
+def request_key(op: str, model_id: str, body: Any) -> str:
+    h = hashlib.sha256()
+    h.update(f"{op}\x00{model_id}\x00".encode("utf-8"))
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    h.update(bytes(body or b""))
+    return h.hexdigest()
+
+
+def _text(data: Any) -> str:
+    if isinstance(data, (bytes, bytearray)):
+        return bytes(data).decode("utf-8", errors="replace")
+    return data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+
+
+class CassetteRuntime:
+    """
+    Bọc một bedrock-runtime client (record/auto) hoặc đứng một mình (replay).
+    Cùng một key có thể có nhiều bản ghi (vd. throttle rồi thành công): replay đi lần lượt
+    theo thứ tự đã ghi và quay vòng khi hết.
+    """
+
+    def __init__(self, path: str, mode: str = "replay", inner_factory: Optional[Callable[[], Any]] = None,
+                 latency: str = "none", replay_errors: bool = False, latency_scale: float = 1.0, seed: int = 0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode: {mode} (expected one of {MODES})")
+        if latency not in LATENCY_MODES:
+            raise ValueError(f"Unknown cassette latency mode: {latency} (expected one of {LATENCY_MODES})")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.replay_errors = replay_errors
+        self.latency_scale = latency_scale
+        self._inner_factory = inner_factory
+        self._inner = None
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursor: Dict[str, int] = {}
+        self._latencies: Dict[str, List[float]] = {}
+        self._writer = None
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        if mode != "record":
+            self._load()
+
+    # ---------- File ----------
+    def _load(self):
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+        except FileNotFoundError:
+            if self.mode == "replay":
+                logger.warning(f"Cassette not found: {self.path}")
+        except (OSError, EOFError, ValueError) as e:
+            # file đang ghi dở (process bị kill): giữ các bản ghi đã đọc được
+            logger.warning(f"Cassette {self.path} partially loaded: {e}")
+        logger.info(f"Cassette {self.path}: {sum(len(v) for v in self._entries.values())} entries ({self.mode})")
+
+    def _index(self, entry: Dict[str, Any]):
+        self._entries.setdefault(entry["key"], []).append(entry)
+        if entry.get("latency_s") is not None:
+            self._latencies.setdefault(entry.get("model_id", ""), []).append(entry["latency_s"])
+
+    def _write(self, entry: Dict[str, Any]):
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            if self._writer is None:
+                # gzip nhiều member nối tiếp vẫn đọc được như một file
+                self._writer = gzip.open(self.path, "ab")
+                atexit.register(self.close)
+            self._writer.write(line)
+            self._writer.flush()
+            self._index(entry)
+            self.recorded += 1
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    # ---------- Replay ----------
+    def _next_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                return None
+            if not self.replay_errors:
+                entries = [e for e in entries if "error" not in e] or None
+                if entries is None:
+                    return None
+            i = self._cursor.get(key, 0)
+            self._cursor[key] = i + 1
+            return entries[i % len(entries)]
+
+    def _sleep(self, entry: Dict[str, Any]):
+        if self.latency == "none":
+            return
+        if self.latency == "recorded":
+            delay = entry.get("latency_s") or 0.0
+        else:
+            with self._lock:
+                pool = self._latencies.get(entry.get("model_id", "")) or [0.0]
+                delay = self._rng.choice(pool)
+        if delay > 0:
+            time.sleep(delay * self.latency_scale)
+
+    def _replay(self, op: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+        self._sleep(entry)
+        if "error" in entry:
+            raise ClientError({"Error": entry["error"]}, _OPERATIONS[op])
+        resp: Dict[str, Any] = {"ResponseMetadata": {"HTTPStatusCode": 200,
+                                                      "HTTPHeaders": dict(entry.get("headers") or {})}}
+        if op == "invoke_model_with_response_stream":
+            resp["body"] = iter([{"chunk": {"bytes": e["chunk"].encode("utf-8")}} if "chunk" in e else e
+                                 for e in entry.get("events", [])])
+        elif op == "count_tokens":
+            resp.update(json.loads(entry["body"]))
+        else:
+            data = entry["body"].encode("utf-8")
+            resp["body"] = StreamingBody(io.BytesIO(data), len(data))
+        return resp
+
+    # ---------- Record ----------
+    def _inner_client(self):
+        if self._inner is None:
+            if self._inner_factory is None:
+                raise CassetteMiss("Cassette has no live client to record with")
+            self._inner = self._inner_factory()
+        return self._inner
+
+    def _record_stream(self, entry: Dict[str, Any], events) -> Iterator[Dict[str, Any]]:
+        """Chuyển tiếp từng event cho caller, ghi lại khi stream kết thúc (kể cả bị huỷ giữa chừng)."""
+        recorded = []
+        try:
+            for event in events:
+                chunk = event.get("chunk") if isinstance(event, dict) else None
+                recorded.append({"chunk": _text(chunk.get("bytes") or b"")} if chunk else event)
+                yield event
+        finally:
+            entry["events"] = recorded
+            self._write(entry)
+
+    def _call(self, op: str, modelId: str, body: Any = None, **kwargs) -> Dict[str, Any]:
+        key = request_key(op, modelId, body)
+        if self.mode != "record":
+            entry = self._next_entry(key)
+            if entry is not None:
+                with self._lock:
+                    self.hits += 1
+                return self._replay(op, entry)
+            with self._lock:
+                self.misses += 1
+            if self.mode == "replay":
+                raise CassetteMiss(f"No cassette entry for {op} {modelId} ({key[:12]})")
+
+        entry: Dict[str, Any] = {"op": op, "key": key, "model_id": modelId, "recorded_at": time.time()}
+        t0 = time.perf_counter()
+        try:
+            # CountTokens nhận input=..., không có body
+            call_kwargs = kwargs if op == "count_tokens" else {"body": body, **kwargs}
+            resp = getattr(self._inner_client(), op)(modelId=modelId, **call_kwargs)
+        except ClientError as e:
+            err = e.response.get("Error", {})
+            entry.update(latency_s=round(time.perf_counter() - t0, 4),
+                         error={"Code": err.get("Code", ""), "Message": err.get("Message", "")})
+            self._write(entry)
+            raise
+        entry["latency_s"] = round(time.perf_counter() - t0, 4)
+        headers = (resp.get("ResponseMetadata") or {}).get("HTTPHeaders") or {}
+        entry["headers"] = dict(headers)
+
+        if op == "invoke_model_with_response_stream":
+            return {**resp, "body": self._record_stream(entry, resp.get("body") or [])}
+        if op == "count_tokens":
+            entry["body"] = json.dumps({k: v for k, v in resp.items() if k != "ResponseMetadata"},
+                                       ensure_ascii=False, default=_text)
+            self._write(entry)
+            return resp
+
+        raw = resp.get("body")
+        data = raw.read() if isinstance(raw, StreamingBody) else raw
+        entry["body"] = _text(data or b"")
+        self._write(entry)
+        encoded = entry["body"].encode("utf-8")
+        return {**resp, "body": StreamingBody(io.BytesIO(encoded), len(encoded))}
+
+    # ---------- Giao diện bedrock-runtime ----------
+    def invoke_model(self, modelId: str, body: Any = None, **kwargs) -> Dict[str, Any]:
+        return self._call("invoke_model", modelId, body, **kwargs)
+
+    def invoke_model_with_response_stream(self, modelId: str, body: Any = None, **kwargs) -> Dict[str, Any]:
+        return self._call("invoke_model_with_response_stream", modelId, body, **kwargs)
+
+    def count_tokens(self, modelId: str, input: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        # Key theo nội dung được đếm: body InvokeModel, hoặc cả input (converse)
+        invoke = (input or {}).get("invokeModel") or {}
+        body = invoke["body"] if "body" in invoke else json.dumps(input or {}, sort_keys=True, default=_text)
+        return self._call("count_tokens", modelId, body, input=input, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "entries": sum(len(v) for v in self._entries.values()),
+                "keys": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "recorded": self.recorded,
+            }
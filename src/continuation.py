@@ -0,0 +1,157 @@
+"""Nối tiếp output bị cắt ở max_tokens thay vì chạy lại cả request.
+
+Output bị coi là cắt khi JSON object đầu tiên chưa đóng VÀ một trong các dấu hiệu:
+  - stop reason là hết token (Claude/Nova "max_tokens", Titan "LENGTH", Llama "length"),
+  - tokens_out đã chạm max_tokens,
+  - response không có stop reason (cassette cũ, stream thiếu chunk cuối) -> chỉ dựa vào cấu trúc.
+Model tự dừng (end_turn/FINISH/stop) với JSON chưa đóng thì nối tiếp cũng không giúp gì, để parser sửa.
+
+Request nối tiếp gửi lại prompt kèm phần JSON đã có: Claude/Nova dùng lượt assistant (prefill) nên model
+viết tiếp đúng từ ký tự cuối; Titan/Llama (text completion) thì phần đã có được nối vào cuối prompt.
+Chạy lại cả request phải trả lại prompt và sinh lại toàn bộ output; nối tiếp chỉ sinh phần còn thiếu,
+phần đã có được tính như input (rẻ hơn output, không tốn thời gian sinh). Mỗi lần nối tiếp cũng gửi lại
+prompt nên request nối tiếp dùng max_tokens lớn hơn (CONTINUATION_MAX_TOKENS) để thường chỉ cần một lần.
+Phần tiết kiệm được so với chạy lại (max_tokens đủ lớn) nằm trong metrics["continuation"].
+"""
+
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from .adapters import get_adapter
+from .json_extract import is_unterminated
+from .models import get_model_cost_estimates
+from .telemetry import get_telemetry, span
+from .token_estimator import get_token_estimator, text_units
+from .utils import get_logger, CONTINUATION_MAX_ROUNDS, CONTINUATION_MAX_TOKENS
+
+logger = get_logger("continuation")
+
+LIMIT_STOP_REASONS = frozenset({"max_tokens", "length", "LENGTH"})
+# Titan/Llama hay lặp lại đoạn cuối của prompt: chỉ coi là trùng khi đoạn lặp đủ dài
+MIN_OVERLAP = 16
+MAX_OVERLAP = 400
+
+
+def truncation_signal(text: str, stop_reason: Optional[str], tokens_out: Optional[int],
+                      max_tokens: int) -> Optional[str]:
+    """Dấu hiệu output bị cắt: "stop_reason" / "token_limit" / "structure", hoặc None nếu không bị cắt."""
+    if not is_unterminated(text):
+        return None
+    if stop_reason in LIMIT_STOP_REASONS:
+        return "stop_reason"
+    if max_tokens and tokens_out and tokens_out >= max_tokens:
+        return "token_limit"
+    if not stop_reason:
+        return "structure"
+    return None
+
+
+def splice(partial: str, continuation: str, prefill: bool = True) -> str:
+    """
+    Ghép phần nối tiếp vào sau output bị cắt.
+    prefill=True: model viết tiếp đúng sau partial (đã bỏ khoảng trắng cuối), chỉ cần nối.
+    prefill=False: model có thể lặp lại đoạn cuối của partial (bỏ phần trùng), hoặc bỏ qua
+    phần đã có và viết lại cả JSON từ đầu (dùng luôn bản mới).
+    """
+    partial = partial.rstrip()
+    if prefill:
+        return partial + continuation
+    if '"dish_name"' in continuation and '"dish_name"' in partial:
+        return continuation.strip()
+    head = continuation.lstrip()
+    for k in range(min(len(partial), len(head), MAX_OVERLAP), MIN_OVERLAP - 1, -1):
+        if partial.endswith(head[:k]):
+            return partial + head[k:]
+    return partial + continuation
+
+
+def _tokens(adapter, raw: Dict[str, Any], hdrs: Dict[str, Any]) -> Tuple[Optional[int], Optional[int]]:
+    tokens_in, tokens_out = adapter.token_counts(raw, hdrs)
+    return (int(tokens_in) if tokens_in else None), (int(tokens_out) if tokens_out else None)
+
+
+def continue_truncated(bedrock_client, model_id: str, body: dict, raw: Dict[str, Any], hdrs: Dict[str, Any],
+                       max_tokens: int, first_call_s: float, units: float = 0.0,
+                       max_rounds: int = CONTINUATION_MAX_ROUNDS) -> Tuple[Dict[str, Any], Dict[str, Any], Optional[Dict[str, Any]]]:
+    """
+    Nối tiếp response `raw` của request `body` nếu output bị cắt, tối đa `max_rounds` lần.
+    Trả về (raw, hdrs, info): raw đã ghép (dạng Claude, giữ stop_reason của lần cuối), hdrs cộng dồn token
+    của mọi lần gọi (bỏ header in/out nếu có lần thiếu số thật), info cho metrics["continuation"]
+    (None nếu không bị cắt, raw/hdrs giữ nguyên).
+    first_call_s, units (units của prompt, xem token_estimator) dùng để ước lượng chi phí chạy lại.
+    """
+    adapter = get_adapter(model_id)
+    try:
+        text = adapter.extract_text(raw)
+    except ValueError:
+        return raw, hdrs, None
+    reason = adapter.stop_reason(raw)
+    first_in, first_out = _tokens(adapter, raw, hdrs)
+    signal = truncation_signal(text, reason, first_out, max_tokens)
+    if signal is None or max_rounds <= 0:
+        return raw, hdrs, None
+
+    exact_in, exact_out = first_in is not None, first_out is not None
+    estimator = get_token_estimator()
+    if first_in is None:
+        first_in = estimator.estimate_units(model_id, units)
+    if first_out is None:
+        first_out = int(text_units(text))
+
+    trigger = signal
+    rounds = cont_in = cont_out = 0
+    cont_s = 0.0
+    logger.info(f"Output truncated ({signal}, stop_reason={reason}), continuing: {model_id}")
+    while signal is not None and rounds < max_rounds:
+        rounds += 1
+        cont_body = adapter.build_continuation_body(body, text, max(max_tokens, CONTINUATION_MAX_TOKENS))
+        t0 = time.perf_counter()
+        with span("continuation", model_id):
+            craw, chdrs = bedrock_client.invoke(model_id=model_id, body=cont_body)
+        cont_s += time.perf_counter() - t0
+        try:
+            piece = adapter.extract_text(craw, strip=False)
+        except ValueError as e:
+            logger.warning(f"Continuation returned no text: {e}")
+            break
+        c_in, c_out = _tokens(adapter, craw, chdrs)
+        exact_in, exact_out = exact_in and c_in is not None, exact_out and c_out is not None
+        cont_in += c_in if c_in is not None else estimator.estimate_units(model_id, units) + int(text_units(text))
+        cont_out += c_out if c_out is not None else int(text_units(piece))
+        text = splice(text, piece, adapter.continuation_prefill)
+        reason = adapter.stop_reason(craw)
+        signal = truncation_signal(text, reason, c_out, max(max_tokens, CONTINUATION_MAX_TOKENS))
+
+    outcome = "complete" if signal is None else "truncated"
+    get_telemetry().inc("food_continuation_total", model=model_id, outcome=outcome)
+
+    merged: Dict[str, Any] = {"content": [{"type": "text", "text": text}]}
+    if reason:
+        merged["stop_reason"] = reason
+    merged_hdrs: Dict[str, Any] = {}
+    if exact_in:
+        merged_hdrs["x-amzn-bedrock-input-token-count"] = str(first_in + cont_in)
+    if exact_out:
+        merged_hdrs["x-amzn-bedrock-output-token-count"] = str(first_out + cont_out)
+
+    # Chạy lại = trả lại prompt + sinh lại phần đã có; thời gian sinh tỉ lệ với số token output
+    cost_in_1k, cost_out_1k = get_model_cost_estimates(model_id)
+    rerun_out = first_out + cont_out
+    rerun_cost = (first_in / 1000.0) * cost_in_1k + (rerun_out / 1000.0) * cost_out_1k
+    cont_cost = (cont_in / 1000.0) * cost_in_1k + (cont_out / 1000.0) * cost_out_1k
+    rerun_s = first_call_s * rerun_out / max(first_out, 1)
+    info = {
+        "signal": trigger,
+        "outcome": outcome,
+        "rounds": rounds,
+        "tokens_in": cont_in,
+        "tokens_out": cont_out,
+        "latency_s": round(cont_s, 3),
+        "rerun_tokens_est": first_in + rerun_out,
+        "tokens_saved": first_in + rerun_out - (cont_in + cont_out),
+        "output_tokens_saved": first_out,
+        "cost_saved_usd": round(rerun_cost - cont_cost, 6),
+        "latency_saved_s": round(rerun_s - cont_s, 3),
+        "tokens_estimated": not (exact_in and exact_out),
+    }
+    return merged, merged_hdrs, info
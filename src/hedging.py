@@ -0,0 +1,166 @@
+"""Hedged request: model chính chưa trả lời sau deadline thì gửi thêm một request tới model nhanh hơn.
+
+Deadline = HEDGE_DEADLINE_S, hoặc học từ p95 (HEDGE_PERCENTILE) thời gian bedrock_call của model chính
+trong telemetry khi đã có đủ HEDGE_MIN_SAMPLES mẫu. Response đầu tiên qua được parse_and_validate
+thắng; request còn lại không huỷ được (InvokeModel đồng bộ) nên bị bỏ qua, chi phí của nó được tính
+là chi phí thêm của hedging (metrics["hedge"]["extra_cost_usd"] và counter
+food_hedge_extra_cost_usd_total khi request thua trả về sau).
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Optional, Tuple
+
+from .adapters import get_adapter
+from .models import get_hedge_model
+from .parser import parse_and_validate
+from .telemetry import get_telemetry
+from .utils import (
+    get_logger, HEDGE_DEADLINE_S, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES, HEDGE_DEFAULT_DEADLINE_S, HEDGE_MAX_WORKERS,
+    RATE_LIMIT_MAX,
+)
+
+logger = get_logger("hedging")
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    """
+    Pool dùng chung cho request chính và dự phòng. Mỗi lần hedge giữ tối đa hai worker (request thua giữ
+    worker tới khi Bedrock trả lời) nên pool đủ cho mọi slot limiter của model: 2 * RATE_LIMIT_MAX.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS or 2 * RATE_LIMIT_MAX,
+                                           thread_name_prefix="hedge")
+    return _pool
+
+
+def hedge_deadline(model_id: str) -> float:
+    """Deadline cấu hình sẵn, hoặc p95 bedrock_call của model (chưa đủ mẫu thì dùng giá trị mặc định)."""
+    if HEDGE_DEADLINE_S > 0:
+        return HEDGE_DEADLINE_S
+    learned = get_telemetry().quantile("bedrock_call", model_id, HEDGE_PERCENTILE, min_samples=HEDGE_MIN_SAMPLES)
+    return learned if learned else HEDGE_DEFAULT_DEADLINE_S
+
+
+def invoke_model_hedged(
+    bedrock_client,
+    desc: str,
+    model_id: str,
+    temperature: float,
+    max_tokens: int,
+    img=None,
+    prompt_version: int = 0,
+    use_cache: bool = True,
+    cache=None,
+    fallback_model: Optional[str] = None,
+    deadline_s: Optional[float] = None,
+    constrained: Optional[bool] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Any], Any]:
+    """
+    Như invoke_model_dish nhưng có hedging: (response, metrics, Dish của model thắng).
+    Response trả về đã chuẩn hoá dạng Claude (model thắng có thể khác họ với model_id). metrics["hedge"]: primary, fallback, deadline_s,
+    fired, winner, extra_cost_usd; metrics["model_id"] là model thắng.
+    """
+    from .inference import invoke_model_dish
+
+    fallback_model = fallback_model or get_hedge_model(model_id, image=img is not None)
+    deadline = hedge_deadline(model_id) if deadline_s is None else deadline_s
+    telemetry = get_telemetry()
+
+    def run(mid: str, started: Optional[threading.Event] = None):
+        if started is not None:
+            started.set()
+        raw, metrics, dish = invoke_model_dish(bedrock_client, desc, mid, temperature, max_tokens, img=img,
+                                               prompt_version=prompt_version, use_cache=use_cache, cache=cache,
+                                               hedge=False, constrained=constrained)
+        if dish is None:
+            try:  # response không hợp lệ: lấy lỗi chi tiết rồi chờ request còn lại
+                dish = parse_and_validate(raw, mid)
+            except Exception as e:
+                return raw, metrics, e, None
+        return get_adapter(mid).normalize(raw), metrics, None, dish
+
+    t0 = time.perf_counter()
+    pool = _executor()
+    primary_started = threading.Event()
+    futures: Dict[Future, str] = {pool.submit(run, model_id, primary_started): model_id}
+    # Deadline đo thời gian của model, không tính lúc request chính còn chờ worker trong pool
+    primary_started.wait()
+    done, _ = wait(futures, timeout=deadline)
+    primary_ok = bool(done) and not _failed(next(iter(done)))
+    fired = not primary_ok and fallback_model is not None
+    if fired:
+        reason = "deadline" if not done else "primary failed"
+        logger.info(f"Hedging {model_id} -> {fallback_model} ({reason}, deadline {deadline:.2f}s)")
+        futures[pool.submit(run, fallback_model)] = fallback_model
+
+    winner: Optional[Tuple[str, Dict[str, Any], Dict[str, Any], Any]] = None
+    extra_cost = 0.0
+    first_error: Optional[BaseException] = None
+    pending = set(futures)
+    while pending and winner is None:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        # Xong cùng lúc thì ưu tiên model chính
+        for fut in sorted(done, key=lambda f: futures[f] != model_id):
+            mid = futures[fut]
+            try:
+                raw, metrics, err, dish = fut.result()
+            except Exception as e:
+                first_error = first_error or e
+                continue
+            if err is not None or winner is not None:
+                extra_cost += metrics.get("cost_est_usd", 0.0)
+                first_error = first_error or err
+                continue
+            winner = (mid, raw, metrics, dish)
+
+    # Request thua còn đang chạy: cộng chi phí khi nó trả về
+    for fut in pending:
+        fut.add_done_callback(lambda f: _count_late_cost(f, model_id))
+
+    if winner is None:
+        telemetry.inc("food_hedge_requests_total", model=model_id, outcome="failed")
+        raise first_error or RuntimeError("Hedged request failed")
+
+    winner_model, raw, metrics, dish = winner
+    outcome = "not_fired" if not fired else ("primary_won" if winner_model == model_id else "fallback_won")
+    telemetry.inc("food_hedge_requests_total", model=model_id, outcome=outcome)
+    if extra_cost:
+        telemetry.inc("food_hedge_extra_cost_usd_total", extra_cost, model=model_id)
+
+    metrics = dict(metrics)
+    metrics["latency_s"] = round(time.perf_counter() - t0, 2)
+    metrics["model_id"] = winner_model
+    metrics["hedge"] = {
+        "primary": model_id,
+        "fallback": fallback_model,
+        "deadline_s": round(deadline, 3),
+        "fired": fired,
+        "winner": winner_model,
+        # Chi phí của request không được dùng (đã biết lúc trả về); request thua còn chạy thì chưa tính
+        "extra_cost_usd": round(extra_cost, 6),
+        "loser_pending": bool(pending),
+    }
+    return raw, metrics, dish
+
+
+def _failed(fut: Future) -> bool:
+    if fut.exception() is not None:
+        return True
+    return fut.result()[2] is not None
+
+
+def _count_late_cost(fut: Future, model_id: str):
+    """model_id: model chính (nhãn giống các counter hedge khác)."""
+    if fut.cancelled() or fut.exception() is not None:
+        return
+    cost = fut.result()[1].get("cost_est_usd", 0.0)
+    if cost:
+        get_telemetry().inc("food_hedge_extra_cost_usd_total", cost, model=model_id)
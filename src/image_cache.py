@@ -0,0 +1,232 @@
+"""Perceptual-hash cache: ảnh gần giống nhau -> kết quả Dish đã validate."""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from .response_cache import connect_cache_db
+from .utils import (
+    get_logger, CACHE_DIR, CACHE_TTL_S, CACHE_MAX_ENTRIES, IMAGE_CACHE_ENABLED, IMAGE_CACHE_MAX_DISTANCE,
+)
+
+logger = get_logger("image_cache")
+
+HASH_BITS = 64
+
+
+def dhash(img: Image.Image, hash_size: int = 8) -> int:
+    """
+    Difference hash 64-bit: thu nhỏ ảnh xám về (hash_size+1) x hash_size
+    rồi so sánh từng cặp pixel liền kề theo hàng.
+    Ổn định khi ảnh bị nén lại, đổi kích thước hoặc crop nhẹ.
+    """
+    w, h = hash_size + 1, hash_size
+    small = img.convert("L").resize((w, h), Image.BILINEAR, reducing_gap=2.0)
+    px = small.tobytes()
+    value = 0
+    for row in range(h):
+        base = row * w
+        for col in range(hash_size):
+            value = (value << 1) | (px[base + col] > px[base + col + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class MultiIndexHash:
+    """
+    Multi-index hashing cho tìm kiếm theo khoảng cách Hamming.
+
+    Hash 64-bit được chia thành (max_distance + 1) đoạn; theo nguyên lý Dirichlet,
+    hai hash cách nhau <= max_distance bit phải trùng khớp hoàn toàn ít nhất một đoạn.
+    Mỗi đoạn có một dict riêng nên lookup chỉ so sánh một nhóm ứng viên nhỏ
+    thay vì quét toàn bộ index.
+    """
+
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        n_chunks = max_distance + 1
+        base, extra = divmod(HASH_BITS, n_chunks)
+        self._chunks: List[Tuple[int, int]] = []  # (shift, mask)
+        shift = 0
+        for i in range(n_chunks):
+            width = base + (1 if i < extra else 0)
+            self._chunks.append((shift, (1 << width) - 1))
+            shift += width
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(n_chunks)]
+        self._hashes: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, h: int) -> int:
+        idx = len(self._hashes)
+        self._hashes.append(h)
+        for (shift, mask), table in zip(self._chunks, self._tables):
+            table.setdefault((h >> shift) & mask, []).append(idx)
+        return idx
+
+    def nearest(self, h: int, max_distance: Optional[int] = None) -> Optional[Tuple[int, int]]:
+        """Trả về (idx, distance) gần nhất trong ngưỡng, hoặc None."""
+        limit = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        best: Optional[Tuple[int, int]] = None
+        seen = set()
+        for (shift, mask), table in zip(self._chunks, self._tables):
+            for idx in table.get((h >> shift) & mask, ()):
+                if idx in seen:
+                    continue
+                seen.add(idx)
+                d = hamming(h, self._hashes[idx])
+                if d <= limit and (best is None or d < best[1]):
+                    best = (idx, d)
+                    if d == 0:
+                        return best
+        return best
+
+
+class ImageResultCache:
+    """
+    Index ảnh -> kết quả Dish (JSON) đã validate, tách theo model_id.
+    Dữ liệu lưu trong SQLite và được nạp vào index trong bộ nhớ ở lần dùng đầu.
+    Giới hạn như response cache: bản ghi hết hạn sau `ttl_s` giây, tối đa `max_entries` bản ghi
+    (vượt thì xoá bản ghi cũ nhất rồi dựng lại index trong bộ nhớ).
+    """
+
+    def __init__(self, path: Optional[str] = None, max_distance: int = IMAGE_CACHE_MAX_DISTANCE,
+                 ttl_s: float = CACHE_TTL_S, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path or os.path.join(CACHE_DIR, "image_results.sqlite3")
+        self.max_distance = max_distance
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._indexes: Dict[str, MultiIndexHash] = {}
+        # (dish_json, tokens_in, tokens_out, created_at)
+        self._records: Dict[str, List[Tuple[str, int, int, float]]] = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._unavailable = False
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        """Kết nối SQLite (nạp index ở lần đầu); None nếu không mở được - khi đó cache coi như trống."""
+        if self._conn is None:
+            if self._unavailable:
+                return None
+            try:
+                conn = connect_cache_db(self.path)
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS image_results ("
+                    " phash TEXT, model_id TEXT, dish TEXT,"
+                    " tokens_in INTEGER, tokens_out INTEGER, created_at REAL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_image_results_created ON image_results(created_at)")
+                self._evict(conn, time.time())
+                conn.commit()
+                self._load(conn)
+            except (OSError, sqlite3.Error) as e:
+                self._unavailable = True
+                self._clear_mem()
+                logger.warning(f"Image cache disabled ({self.path}): {e}")
+                return None
+            self._conn = conn
+        return self._conn
+
+    def _clear_mem(self):
+        self._indexes.clear()
+        self._records.clear()
+        self._count = 0
+
+    def _load(self, conn: sqlite3.Connection):
+        """Dựng lại index trong bộ nhớ từ SQLite (lần dùng đầu và sau mỗi lần xoá bản ghi)."""
+        self._clear_mem()
+        for phash, model_id, dish, t_in, t_out, created_at in conn.execute(
+            "SELECT phash, model_id, dish, tokens_in, tokens_out, created_at FROM image_results"
+            " ORDER BY created_at"
+        ):
+            self._add_mem(model_id, int(phash, 16), dish, t_in or 0, t_out or 0, created_at or 0.0)
+
+    def _add_mem(self, model_id: str, h: int, dish_json: str, tokens_in: int, tokens_out: int,
+                 created_at: float):
+        index = self._indexes.get(model_id)
+        if index is None:
+            index = self._indexes[model_id] = MultiIndexHash(self.max_distance)
+            self._records[model_id] = []
+        index.add(h)
+        self._records[model_id].append((dish_json, tokens_in, tokens_out, created_at))
+        self._count += 1
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> int:
+        """
+        Xoá bản ghi hết hạn; vượt max_entries thì xoá bản ghi cũ nhất xuống còn 90% max_entries
+        (mỗi lần xoá phải dựng lại index trong bộ nhớ, nên không xoá từng bản ghi một).
+        Trả về số bản ghi đã xoá.
+        """
+        removed = db.execute("DELETE FROM image_results WHERE created_at <= ?", (now - self.ttl_s,)).rowcount
+        count = db.execute("SELECT COUNT(*) FROM image_results").fetchone()[0]
+        if count > self.max_entries:
+            overflow = count - self.max_entries * 9 // 10
+            removed += db.execute(
+                "DELETE FROM image_results WHERE rowid IN ("
+                " SELECT rowid FROM image_results ORDER BY created_at ASC LIMIT ?)",
+                (overflow,),
+            ).rowcount
+        return removed
+
+    def lookup(self, model_id: str, h: int) -> Optional[Tuple[str, int, int, int]]:
+        """Trả về (dish_json, distance, tokens_in, tokens_out) hoặc None."""
+        with self._lock:
+            if self._db() is None:
+                return None
+            index = self._indexes.get(model_id)
+            if index is None:
+                return None
+            found = index.nearest(h)
+            if found is None:
+                return None
+            idx, distance = found
+            dish_json, tokens_in, tokens_out, created_at = self._records[model_id][idx]
+            if created_at <= time.time() - self.ttl_s:  # hết hạn, bị xoá ở lần ghi sau
+                return None
+            return dish_json, distance, tokens_in, tokens_out
+
+    def add(self, model_id: str, h: int, dish_json: str, tokens_in: int = 0, tokens_out: int = 0):
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            if db is None:
+                return
+            try:
+                db.execute(
+                    "INSERT INTO image_results VALUES (?, ?, ?, ?, ?, ?)",
+                    (f"{h:016x}", model_id, dish_json, tokens_in, tokens_out, now),
+                )
+                # Chỉ quét/xoá khi có thể vượt giới hạn: index trong bộ nhớ giữ đúng số bản ghi trên đĩa
+                removed = self._evict(db, now) if self._count + 1 > self.max_entries else 0
+                db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Image cache write failed: {e}")
+                return
+            if removed:
+                self._load(db)
+            else:
+                self._add_mem(model_id, h, dish_json, tokens_in, tokens_out, now)
+
+
+_shared_cache: Optional[ImageResultCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_image_cache() -> Optional[ImageResultCache]:
+    """Image cache dùng chung; None nếu tắt qua IMAGE_CACHE_ENABLED=false."""
+    global _shared_cache
+    if not IMAGE_CACHE_ENABLED:
+        return None
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ImageResultCache()
+        return _shared_cache
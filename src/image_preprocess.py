@@ -0,0 +1,195 @@
+"""Tiền xử lý ảnh trước khi gửi lên Bedrock: xoay theo EXIF, thu nhỏ, nén theo ngân sách byte/token."""
+
+import io
+import math
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from .models import get_image_limits
+from .utils import get_logger, IMAGE_FORMAT, IMAGE_QUALITY, IMAGE_MAX_BYTES, IMAGE_TOKEN_BUDGET
+
+logger = get_logger("image_preprocess")
+
+FORMAT_MIME = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+MIN_QUALITY = 40
+
+
+def estimate_image_tokens(width: int, height: int, model_id: str) -> int:
+    """
+    Ước lượng số input token của ảnh sau khi model tự thu nhỏ về cạnh dài tối đa.
+    Claude: ~ (w*h)/750; Nova dùng hệ số xấp xỉ trong models.IMAGE_LIMITS.
+    """
+    limits = get_image_limits(model_id)
+    scale = _fit_scale(width, height, limits["max_side"], limits["max_pixels"])
+    w, h = width * scale, height * scale
+    return int(math.ceil((w * h) / limits["px_per_token"]))
+
+
+def _fit_scale(width: int, height: int, max_side: int, max_pixels: Optional[int]) -> float:
+    scale = min(1.0, max_side / float(max(width, height, 1)))
+    if max_pixels:
+        scale = min(scale, math.sqrt(max_pixels / float(max(width * height, 1))))
+    return scale
+
+
+def _max_pixels(limits: Dict[str, Any], token_budget: Optional[int]) -> Optional[int]:
+    max_pixels = limits["max_pixels"]
+    if token_budget:
+        budget_pixels = token_budget * limits["px_per_token"]
+        max_pixels = min(max_pixels, budget_pixels) if max_pixels else budget_pixels
+    return max_pixels
+
+
+def _to_mode_for(img: Image.Image, fmt: str) -> Image.Image:
+    if fmt == "JPEG":
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            # JPEG không có alpha: ghép lên nền trắng thay vì để nền đen
+            rgba = img.convert("RGBA")
+            background = Image.new("RGB", rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.split()[-1])
+            return background
+        if img.mode != "RGB":
+            return img.convert("RGB")
+    elif fmt == "WEBP" and img.mode not in ("RGB", "RGBA"):
+        return img.convert("RGBA" if "A" in img.mode or "transparency" in img.info else "RGB")
+    return img
+
+
+def _encode(img: Image.Image, fmt: str, quality: int) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "PNG":
+        img.save(buf, fmt, optimize=True)
+    else:
+        img.save(buf, fmt, quality=quality)
+    return buf.getvalue()
+
+
+def preprocess_image(
+    img: Image.Image,
+    model_id: str,
+    fmt: str = IMAGE_FORMAT,
+    quality: int = IMAGE_QUALITY,
+    max_bytes: int = IMAGE_MAX_BYTES,
+    token_budget: Optional[int] = IMAGE_TOKEN_BUDGET,
+) -> Tuple[bytes, str, Dict[str, Any]]:
+    """
+    Trả về (image_bytes, mime, info).
+
+    1) Xoay ảnh theo EXIF orientation.
+    2) Thu nhỏ để cạnh dài <= max_side của model và số token ảnh <= token_budget.
+    3) Encode theo fmt (JPEG/WEBP/PNG); nếu vượt max_bytes thì giảm quality,
+       hết quality thì thu nhỏ tiếp.
+    info: kích thước, số byte và số token ước lượng trước/sau.
+    """
+    fmt = (fmt or "JPEG").upper()
+    if fmt == "JPG":
+        fmt = "JPEG"
+    if fmt not in FORMAT_MIME:
+        raise ValueError(f"Unsupported image format: {fmt}")
+
+    limits = get_image_limits(model_id)
+    src_w, src_h = img.size
+    src_bytes = img.info.get("source_bytes")
+
+    img = ImageOps.exif_transpose(img)
+    scale = _fit_scale(img.width, img.height, limits["max_side"], _max_pixels(limits, token_budget))
+    if scale < 1.0:
+        size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+        img = img.resize(size, Image.LANCZOS, reducing_gap=3.0)
+    img = _to_mode_for(img, fmt)
+
+    q = quality
+    data = _encode(img, fmt, q)
+    while max_bytes and len(data) > max_bytes:
+        if fmt != "PNG" and q > MIN_QUALITY:
+            q = max(MIN_QUALITY, q - 10)
+        elif min(img.size) > 64:
+            img = img.resize((int(img.width * 0.8), int(img.height * 0.8)), Image.LANCZOS)
+        else:
+            logger.warning(f"Image still {len(data)} bytes, over budget {max_bytes}")
+            break
+        data = _encode(img, fmt, q)
+
+    info = {
+        "image_format": fmt,
+        "image_size_before": f"{src_w}x{src_h}",
+        "image_size_after": f"{img.width}x{img.height}",
+        "image_bytes_before": src_bytes,
+        "image_bytes_after": len(data),
+        "image_tokens_before": estimate_image_tokens(src_w, src_h, model_id),
+        "image_tokens_after": estimate_image_tokens(img.width, img.height, model_id),
+    }
+    return data, FORMAT_MIME[fmt], info
+
+
+# =========================
+# Ảnh dạng bytes (upload gốc): gửi thẳng nếu đã đạt yêu cầu
+# =========================
+EXIF_ORIENTATION = 0x0112
+
+
+def sniff_mime(data) -> Optional[str]:
+    """Nhận diện PNG/JPEG qua magic bytes (không decode ảnh)."""
+    head = bytes(memoryview(data)[:8])
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    return None
+
+
+def open_image(data) -> Image.Image:
+    """Mở ảnh từ bytes; Pillow chỉ đọc header cho tới khi cần pixel."""
+    img = Image.open(io.BytesIO(data))
+    img.info["source_bytes"] = len(data)
+    return img
+
+
+def prepare_image_bytes(data, model_id: str, preprocess: bool = True) -> Tuple[Any, str, Dict[str, Any]]:
+    """
+    Trả về (image_bytes, mime, info) cho ảnh upload dạng bytes.
+
+    PNG/JPEG đã nằm trong giới hạn (số byte, kích thước/token, không cần xoay EXIF)
+    được trả về nguyên vẹn - không decode, không encode lại, không copy.
+    Các trường hợp khác mới decode và đi qua preprocess_image.
+    """
+    mime = sniff_mime(data)
+    if mime is not None:
+        img = open_image(data)  # chỉ đọc header
+        w, h = img.size
+        orientation = img.getexif().get(EXIF_ORIENTATION, 1) if mime == "image/jpeg" else 1
+        if preprocess:
+            limits = get_image_limits(model_id)
+            fits = (
+                len(data) <= IMAGE_MAX_BYTES
+                and orientation == 1
+                and _fit_scale(w, h, limits["max_side"], _max_pixels(limits, IMAGE_TOKEN_BUDGET)) >= 1.0
+            )
+        else:
+            fits = True
+        if fits:
+            tokens = estimate_image_tokens(w, h, model_id)
+            return data, mime, {
+                "image_format": "PNG" if mime == "image/png" else "JPEG",
+                "image_passthrough": True,
+                "image_size_before": f"{w}x{h}",
+                "image_size_after": f"{w}x{h}",
+                "image_bytes_before": len(data),
+                "image_bytes_after": len(data),
+                "image_tokens_before": tokens,
+                "image_tokens_after": tokens,
+            }
+    else:
+        img = open_image(data)
+
+    if preprocess:
+        out, out_mime, info = preprocess_image(img, model_id)
+    else:
+        buf = io.BytesIO()
+        img.save(buf, "PNG")
+        out, out_mime = buf.getvalue(), "image/png"
+        info = {"image_format": "PNG", "image_bytes_before": len(data), "image_bytes_after": len(out)}
+    info["image_passthrough"] = False
+    return out, out_mime, info
+
@@ -1,149 +1,640 @@
 """Model inference service with prompt versioning (v0 default, v1/v2/v3)."""
+from __future__ import annotations
 import time
 import io
-from typing import Dict, Any, Optional, Tuple
-from PIL import Image
-
-from .utils import to_base64, get_logger
-from .prompt_builder import (
-    # Default builders
-    build_prompt, build_prompt_titan, build_prompt_llama, build_prompt_nova,
-    build_prompt_with_image, build_prompt_nova_with_image,
-    # Versioned builders
-    build_prompt_v1, build_prompt_v2, build_prompt_v3,
-    build_prompt_titan_v1, build_prompt_titan_v2, build_prompt_titan_v3,
-    build_prompt_llama_v1, build_prompt_llama_v2, build_prompt_llama_v3,
-    build_prompt_nova_v1, build_prompt_nova_v2, build_prompt_nova_v3,
+from typing import TYPE_CHECKING, Dict, Any, Iterator, Optional, Tuple, Union
+
+from .utils import (
+    get_logger, dumps_with_base64, IMAGE_PREPROCESS, HEDGE_ENABLED, KB_AUTO_PROMOTE, CONTINUATION_ENABLED, LENGTH_LEARN,
+    OUTPUT_CONSTRAINED,
 )
-from .models import get_model_cost_estimates
+from .adapters import get_adapter
+from .prompt_builder import OUTPUT_PREFILL
+from .continuation import LIMIT_STOP_REASONS, continue_truncated
+from .length_predictor import get_length_predictor
+from .models import get_model_cost_estimates, get_hedge_model
+from .response_cache import get_response_cache, make_cache_key
+from .semantic_cache import get_semantic_cache
+from .knowledge_base import dish_keys, get_knowledge_base
+from .parser import parse_and_validate, restore_prefill
+from .stream_parser import IngredientStreamParser
+from .telemetry import get_telemetry, span, trace
+from .token_estimator import get_token_estimator, count_exact_async, text_units
+
+# Pillow, image_preprocess, image_cache chỉ được import khi có request ảnh
+if TYPE_CHECKING:
+    from PIL import Image
+    from .schema import Dish
 
 logger = get_logger("inference")
 
+# Ảnh đầu vào: PIL.Image đã mở, hoặc bytes upload gốc (PNG/JPEG)
+ImageInput = Union["Image.Image", bytes, bytearray, memoryview]
+
 
 def _pick_builder(model_id: str, prompt_version: int):
     """
     Chọn hàm build body theo model + phiên bản prompt.
     prompt_version: 0 = dùng prompt mặc định cũ; 1/2/3 = các phiên bản mới.
     """
-    mid = (model_id or "").strip().lower()
-
-    def pick(claude, titan, llama, nova):
-        if "nova" in mid:
-            return nova
-        if "titan-text-lite" in mid or "titan-text-express" in mid:
-            return titan
-        if "llama" in mid:
-            return llama
-        # mặc định Claude
-        return claude
-
-    if prompt_version == 1:
-        return pick(build_prompt_v1, build_prompt_titan_v1, build_prompt_llama_v1, build_prompt_nova_v1)
-    if prompt_version == 2:
-        return pick(build_prompt_v2, build_prompt_titan_v2, build_prompt_llama_v2, build_prompt_nova_v2)
-    if prompt_version == 3:
-        return pick(build_prompt_v3, build_prompt_titan_v3, build_prompt_llama_v3, build_prompt_nova_v3)
-
-    # version 0 (mặc định) dùng prompt cũ
-    return pick(build_prompt, build_prompt_titan, build_prompt_llama, build_prompt_nova)
+    return get_adapter(model_id).text_builder(prompt_version)
 
 
 def build_body_for_model(model_id: str, desc: str, temperature: float, max_tokens: int,
-                         prompt_version: int = 0) -> dict:
+                         prompt_version: int = 0, constrained: Optional[bool] = None) -> dict:
     """
     Tạo request body cho model theo phiên bản prompt (0/1/2/3).
     Backward-compatible: nếu không truyền prompt_version thì dùng prompt mặc định cũ.
+    constrained (mặc định OUTPUT_CONSTRAINED): prefill '{' + stop sequences, xem prompt_builder.constrain_*.
     """
-    logger.info(f"Building prompt for model: {model_id} (v{prompt_version})")
+    logger.debug(f"Building prompt for model: {model_id} (v{prompt_version})")
     builder = _pick_builder(model_id, prompt_version)
-    return builder(desc, temperature=temperature, max_tokens=max_tokens)
+    body = builder(desc, temperature=temperature, max_tokens=max_tokens)
+    if OUTPUT_CONSTRAINED if constrained is None else constrained:
+        body = get_adapter(model_id).constrain(body)
+    return body
 
 
-def invoke_model(
-    bedrock_client,
-    desc: str,
-    model_id: str,
-    temperature: float,
-    max_tokens: int,
-    img: Optional[Image.Image] = None,
-    prompt_version: int = 0,
-) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+def _image_scope(model_id: str, desc: str) -> str:
+    """Kết quả ảnh phụ thuộc cả model lẫn mô tả bổ sung đi kèm."""
+    return f"{model_id}|{(desc or '').strip()}"
+
+
+def dish_response(dish_json: str) -> Dict[str, Any]:
+    """Dựng response dạng Claude từ Dish JSON để render_result xử lý như bình thường."""
+    return {"content": [{"type": "text", "text": dish_json}]}
+
+
+def _text_scope(model_id: str, prompt_version: int) -> str:
+    """Kết quả text phụ thuộc model và phiên bản prompt (không phụ thuộc cách diễn đạt mô tả)."""
+    return f"{model_id}|v{prompt_version}"
+
+
+def _semantic_lookup(semantic, model_id: str, desc: str, prompt_version: int):
+    """Mô tả gần trùng đã có Dish: ((raw, headers), similarity) như một cache hit, hoặc None."""
+    hit = semantic.lookup(_text_scope(model_id, prompt_version), desc)
+    if hit is None:
+        return None
+    dish_json, similarity, tokens_in, tokens_out = hit
+    hdrs = {"x-amzn-bedrock-input-token-count": str(tokens_in),
+            "x-amzn-bedrock-output-token-count": str(tokens_out)}
+    return (dish_response(dish_json), hdrs), similarity
+
+
+def _validated(raw: Dict[str, Any], model_id: str) -> Optional["Dish"]:
+    """Dish của response, hoặc None nếu không hợp lệ (người dùng kết quả tự parse lại để lấy lỗi)."""
+    try:
+        return parse_and_validate(raw, model_id)
+    except Exception as e:
+        logger.warning(f"Response failed validation, result not cached: {e}")
+        return None
+
+
+def _remember_text_result(semantic, kb, model_id: str, desc: str, prompt_version: int, dish: "Dish",
+                          tokens_in: int, tokens_out: int):
     """
-    Invoke model and return (response, metrics).
-    metrics contains: latency_s, tokens_in, tokens_out, cost_est_usd
+    Ghi Dish đã validate vào semantic cache; KB_AUTO_PROMOTE=true thì thêm cả vào knowledge base
+    khi mô tả chính là tên món model trả về (không thừa từ nào).
+    """
+    if semantic is not None:
+        semantic.add(_text_scope(model_id, prompt_version), desc, dish.model_dump_json(), tokens_in, tokens_out)
+    if kb is not None and KB_AUTO_PROMOTE and dish.dish_name \
+            and dish_keys(desc)[0] == dish_keys(dish.dish_name)[0]:
+        kb.promote(dish)
 
-    - Giữ nguyên cách gọi cũ (img=None, không có prompt_version).
-    - Nếu muốn test phiên bản prompt: truyền prompt_version=1/2/3.
+
+def kb_metrics(kb, model_id: str, desc: str, prompt_version: int, dish_json: str, t0: float,
+                stages: Dict[str, float]) -> Dict[str, Any]:
+    """Metrics của câu trả lời từ knowledge base: không gọi model, chi phí tiết kiệm được ước lượng offline."""
+    tokens_in = get_token_estimator().estimate(model_id, desc, prompt_version)
+    tokens_out = int(text_units(dish_json))
+    cost_in_1k, cost_out_1k = get_model_cost_estimates(model_id)
+    elapsed = round(time.perf_counter() - t0, 2)
+    return {
+        "latency_s": elapsed,
+        "time_to_first_ingredient_s": elapsed,
+        "tokens_in": 0,
+        "tokens_out": 0,
+        "cost_est_usd": 0.0,
+        "cost_saved_usd": round((tokens_in / 1000.0) * cost_in_1k + (tokens_out / 1000.0) * cost_out_1k, 6),
+        "cache": "kb",
+        "stages": stages,
+        **kb.stats(),
+    }
+
+
+def resolve_max_tokens(model_id: str, desc: str, max_tokens: int, prompt_version: int,
+                        image: bool) -> Tuple[int, bool]:
+    """(max_tokens, auto): max_tokens <= 0 = tự động theo độ dài output dự đoán (xem length_predictor.py)."""
+    if max_tokens > 0:
+        return max_tokens, False
+    return get_length_predictor().max_tokens(model_id, desc, prompt_version, image=image), True
+
+
+def _cache_key(model_id: str, body: Any, desc: str, temperature: float, prompt_version: int,
+               auto_max_tokens: bool, image: bool, constrained: bool) -> str:
+    """Key response cache; max_tokens tự động đổi theo dự đoán nên request text không đưa giá trị cụ thể vào key."""
+    if auto_max_tokens and not image:
+        body = build_body_for_model(model_id, desc, temperature, 0, prompt_version=prompt_version,
+                                    constrained=constrained)
+    return make_cache_key(model_id, body)
+
+
+def _restore_prefill(model_id: str, raw: Dict[str, Any], hdrs: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
     """
-    if not bedrock_client or not model_id:
-        raise RuntimeError("Bedrock client/model_id not ready")
+    Response của request ràng buộc output -> dạng Claude với JSON đầy đủ (parser.restore_prefill), để cache,
+    continuation, parser và UI xử lý như response thường. Token chỉ có trong body được chuyển sang headers.
+    """
+    adapter = get_adapter(model_id)
+    try:
+        text = adapter.extract_text(raw, strip=False)
+    except ValueError:
+        return raw, hdrs
+    reason = adapter.stop_reason(raw)
+    tokens_in, tokens_out = adapter.token_counts(raw, hdrs)
+    hdrs = dict(hdrs or {})
+    if tokens_in is not None:
+        hdrs.setdefault("x-amzn-bedrock-input-token-count", str(tokens_in))
+    if tokens_out is not None:
+        hdrs.setdefault("x-amzn-bedrock-output-token-count", str(tokens_out))
+    restored = dish_response(restore_prefill(text, reason).strip())
+    if reason:
+        restored["stop_reason"] = reason
+    return restored, hdrs
 
-    t0 = time.time()
 
-    # Build request body
-    if img is not None:
-        # Multimodal: dùng prompt hình như hiện tại (không áp version text)
-        buf = io.BytesIO()
-        img_format = "PNG"
-        mime = "image/png"
-        img.save(buf, img_format)
-        b64 = to_base64(buf.getvalue())
-
-        if "nova" in model_id.lower():
-            body = build_prompt_nova_with_image(desc, b64, mime, temperature=temperature, max_tokens=max_tokens)
+def _observe_length(model_id: str, desc: str, prompt_version: int, image: bool, raw: Dict[str, Any],
+                    tokens_out: int, max_tokens: int, continuation: Optional[Dict[str, Any]]):
+    """Ghi tokens_out của lần gọi model thật vào lịch sử của length predictor (output còn bị cắt = cận dưới)."""
+    if not LENGTH_LEARN or not tokens_out:
+        return
+    if continuation is not None:
+        truncated = continuation["outcome"] != "complete"
+    else:
+        truncated = get_adapter(model_id).stop_reason(raw) in LIMIT_STOP_REASONS
+    get_length_predictor().observe(model_id, desc, prompt_version, image, tokens_out, max_tokens, truncated)
+
+
+# Placeholder cho dữ liệu ảnh base64 trong body, được thay khi serialize (dumps_with_base64)
+_IMAGE_B64_MARKER = "__IMAGE_B64__"
+
+
+def _build_request_body(model_id: str, desc: str, temperature: float, max_tokens: int,
+                        img: Optional[ImageInput], prompt_version: int,
+                        constrained: bool = False) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Trả về (body, image_info); image_info rỗng với request text.
+    Request ảnh trả về body đã serialize sẵn (bytearray) để ảnh chỉ nằm trong một buffer.
+    """
+    if img is None:
+        with span("build_body", model_id):
+            body = build_body_for_model(model_id, desc, temperature, max_tokens, prompt_version=prompt_version,
+                                        constrained=constrained)
+        return body, {}
+
+    from PIL import Image
+    from .image_preprocess import preprocess_image, prepare_image_bytes
+
+    # Multimodal: dùng prompt hình như hiện tại (không áp version text)
+    with span("image_encode", model_id):
+        if not isinstance(img, Image.Image):
+            # bytes upload gốc: PNG/JPEG đạt yêu cầu được gửi thẳng, không decode/encode lại
+            data, mime, image_info = prepare_image_bytes(img, model_id, preprocess=IMAGE_PREPROCESS)
+        elif IMAGE_PREPROCESS:
+            data, mime, image_info = preprocess_image(img, model_id)
         else:
-            body = build_prompt_with_image(desc, b64, mime, temperature=temperature, max_tokens=max_tokens)
+            buf = io.BytesIO()
+            img.save(buf, "PNG")
+            data, mime = buf.getbuffer(), "image/png"
+            image_info = {"image_format": "PNG", "image_bytes_after": len(data)}
+
+    with span("build_body", model_id):
+        body = get_adapter(model_id).build_image_body(desc, _IMAGE_B64_MARKER, mime, temperature, max_tokens,
+                                                      constrained=constrained)
+        return dumps_with_base64(body, _IMAGE_B64_MARKER, data), image_info
+
+
+def _image_hash(img: ImageInput) -> int:
+    from PIL import Image
+    from .image_cache import dhash
+    from .image_preprocess import open_image
+
+    if isinstance(img, Image.Image):
+        return dhash(img)
+    thumb = open_image(img)
+    if thumb.format == "JPEG":
+        # chỉ cần ảnh xám rất nhỏ: decode JPEG ở độ phân giải thấp
+        thumb.draft("L", (64, 64))
+    return dhash(thumb)
+
+
+def _token_counts(bedrock_client, model_id: str, body: Any, raw: Dict[str, Any], hdrs: Dict[str, Any],
+                  units: float, image_tokens: int = 0, calibrate: bool = True) -> Tuple[int, int, bool]:
+    """
+    Lấy (tokens_in, tokens_out, estimated) thật từ headers / body.usage.
+    Thiếu tokens_in thì dùng ước lượng offline (estimated=True) thay vì gọi CountTokens đồng bộ;
+    CountTokens chỉ chạy nền khi TOKEN_COUNT_EXACT=true để hiệu chỉnh estimator.
+    Có số thật thì dùng để hiệu chỉnh estimator của model (calibrate=False với cache hit).
+    """
+    # Headers của InvokeModel, thiếu thì usage trong body (định dạng theo họ model)
+    tokens_in, tokens_out = get_adapter(model_id).token_counts(raw, hdrs)
+
+    estimator = get_token_estimator()
+    estimated = False
+    if tokens_in:
+        if calibrate:
+            estimator.observe(model_id, units, int(tokens_in), image_tokens)
     else:
-        body = build_body_for_model(model_id, desc, temperature, max_tokens, prompt_version=prompt_version)
+        tokens_in = estimator.estimate_units(model_id, units, image_tokens)
+        estimated = True
+        count_exact_async(bedrock_client, model_id, body, units, image_tokens)
+
+    return int(tokens_in or 0), int(tokens_out or 0), estimated
+
+
+class _Call:
+    """
+    Trạng thái một lần gọi, dùng chung cho invoke_model và invoke_model_stream:
+    _prepare (KB, image cache, build body, response/semantic cache) -> gọi model -> _finish
+    (token, ghi cache, lịch sử độ dài output, metrics). Hai đường chỉ khác ở bước gọi model.
+    """
+
+    def __init__(self, model_id: str, desc: str, prompt_version: int, img: Optional[ImageInput],
+                 constrained: bool, t0: float):
+        self.model_id = model_id
+        self.desc = desc
+        self.prompt_version = prompt_version
+        self.img = img
+        self.image = img is not None
+        self.constrained = constrained
+        self.t0 = t0
+        self.stages: Dict[str, float] = {}
+        self.kb = None
+        self.image_cache = None
+        self.image_hash: Optional[int] = None
+        # Trả lời không cần model (knowledge base / ảnh gần giống): (Dish JSON, metrics)
+        self.answer: Optional[Tuple[str, Dict[str, Any]]] = None
+        self.max_tokens = 0
+        self.auto_max_tokens = False
+        self.body: Any = None
+        self.image_info: Dict[str, Any] = {}
+        self.cache = None
+        self.cache_key: Optional[str] = None
+        self.cache_tier = "bypass"
+        self.cached: Optional[Tuple[Dict[str, Any], Dict[str, Any]]] = None
+        self.semantic = None
+        self.similarity: Optional[float] = None
+        self.units = 0.0
+
+
+def _prepare(desc: str, model_id: str, temperature: float, max_tokens: int, img: Optional[ImageInput],
+             prompt_version: int, use_cache: bool, cache, constrained: bool) -> _Call:
+    """Mọi bước trước khi gọi model; call.answer / call.cached khác None thì không cần gọi model."""
+    call = _Call(model_id, desc, prompt_version, img, constrained, time.perf_counter())
+    stages = call.stages
+
+    call.kb = get_knowledge_base() if img is None and use_cache else None
+    if call.kb is not None:
+        with trace(stages):
+            dish_json = call.kb.lookup(desc)
+        if dish_json is not None:
+            call.answer = dish_json, kb_metrics(call.kb, model_id, desc, prompt_version, dish_json, call.t0, stages)
+            return call
 
-    # Call Bedrock: nhận (raw_json, headers)
-    raw, hdrs = bedrock_client.invoke(model_id=model_id, body=body)
-    latency = time.time() - t0
+    if img is not None and use_cache:
+        from .image_cache import get_image_cache
+        call.image_cache = get_image_cache()
+    if call.image_cache is not None:
+        call.image_hash = _image_hash(img)
+        hit = call.image_cache.lookup(_image_scope(model_id, desc), call.image_hash)
+        if hit is not None:
+            dish_json, distance, hit_in, hit_out = hit
+            cost_in_1k, cost_out_1k = get_model_cost_estimates(model_id)
+            saved = (hit_in / 1000.0) * cost_in_1k + (hit_out / 1000.0) * cost_out_1k
+            elapsed = round(time.perf_counter() - call.t0, 2)
+            call.answer = dish_json, {
+                "latency_s": elapsed,
+                "time_to_first_ingredient_s": elapsed,
+                "tokens_in": 0,
+                "tokens_out": 0,
+                "cost_est_usd": 0.0,
+                "cost_saved_usd": round(saved, 6),
+                "cache": "image",
+                "image_hash_distance": distance,
+                "stages": stages,
+            }
+            return call
 
+    # Build request body
+    call.max_tokens, call.auto_max_tokens = resolve_max_tokens(model_id, desc, max_tokens, prompt_version,
+                                                                call.image)
+    with trace(stages):
+        call.body, call.image_info = _build_request_body(model_id, desc, temperature, call.max_tokens, img,
+                                                         prompt_version, constrained)
+
+    if not use_cache:
+        cache = None
+    elif cache is None:
+        cache = get_response_cache()
+    call.cache = cache
+
+    # (raw_json, headers) từ cache nếu có
+    if cache is not None:
+        call.cache_key = _cache_key(model_id, call.body, desc, temperature, prompt_version, call.auto_max_tokens,
+                                    call.image, constrained)
+        call.cached, call.cache_tier = cache.get(call.cache_key)
+
+    call.semantic = get_semantic_cache() if img is None and use_cache else None
+    if call.cached is None and call.semantic is not None:
+        hit = _semantic_lookup(call.semantic, model_id, desc, prompt_version)
+        if hit is not None:
+            (call.cached, call.similarity), call.cache_tier = hit, "semantic"
+
+    call.units = get_token_estimator().units(model_id, desc, prompt_version, image=call.image)
+    return call
+
+
+def _continue(bedrock_client, call: _Call, raw: Dict[str, Any], hdrs: Dict[str, Any], call_s: float):
+    """(raw, headers, continuation): nối tiếp output text bị cắt ở max_tokens (CONTINUATION_ENABLED)."""
+    if not CONTINUATION_ENABLED or call.image or not raw:
+        return raw, hdrs, None
+    with trace(call.stages):
+        return continue_truncated(bedrock_client, call.model_id, call.body, raw, hdrs, call.max_tokens, call_s,
+                                  call.units)
+
+
+def _finish(bedrock_client, call: _Call, raw: Dict[str, Any], hdrs: Dict[str, Any],
+            continuation: Optional[Dict[str, Any]], extra: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional["Dish"]]:
+    """
+    Sau khi có response (gọi model hoặc cache): (metrics, Dish | None). Response mới hợp lệ được ghi vào
+    response cache, semantic cache / knowledge base / image cache (Dish chỉ parse một lần ở đây) và
+    lịch sử độ dài output. extra: metrics riêng của từng đường (time_to_first_*).
+    """
+    latency = time.perf_counter() - call.t0
     if not raw:
         raise RuntimeError("AWS Bedrock returned empty response")
 
-    # ---------- TOKEN THẬT ----------
-    tokens_in: Optional[int] = None
-    tokens_out: Optional[int] = None
-
-    # a) InvokeModel: token nằm ở HTTP headers
-    if hdrs:
-        try:
-            tokens_in = int(hdrs.get("x-amzn-bedrock-input-token-count")
-                            or hdrs.get("x-amzn-bedrock-input-tokens") or 0)
-            tokens_out = int(hdrs.get("x-amzn-bedrock-output-token-count")
-                             or hdrs.get("x-amzn-bedrock-output-tokens") or 0)
-        except Exception:
-            pass
-
-    # b) Converse/ConverseStream: token nằm trong body.usage
-    if (tokens_in is None or tokens_out is None) and isinstance(raw, dict):
-        usage = raw.get("usage") or {}
-        if isinstance(usage, dict):
-            if tokens_in is None:
-                tokens_in = usage.get("inputTokens") or usage.get("input_tokens")
-            if tokens_out is None:
-                tokens_out = usage.get("outputTokens") or usage.get("output_tokens")
-
-    # c) Fallback: đếm input bằng CountTokens (không tốn phí)
-    if not tokens_in:
-        try:
-            tokens_in = bedrock_client.count_tokens(model_id, body) or 0
-        except Exception:
-            tokens_in = 0
-
-    tokens_in = int(tokens_in or 0)
-    tokens_out = int(tokens_out or 0)
+    model_id, fresh = call.model_id, call.cached is None
+
+    image_tokens = call.image_info.get("image_tokens_after") or 0
+    with trace(call.stages):
+        tokens_in, tokens_out, tokens_estimated = _token_counts(
+            bedrock_client, model_id, call.body, raw, hdrs, call.units, image_tokens, calibrate=fresh)
+        dish = _validated(raw, model_id)
+        if fresh:
+            if dish is not None:
+                # Response không hợp lệ / bị từ chối / còn cắt dở không được cache: lần sau gọi lại model
+                if call.cache is not None:
+                    call.cache.put(call.cache_key, model_id, raw, hdrs)
+                _remember_text_result(call.semantic, call.kb, model_id, call.desc, call.prompt_version, dish,
+                                      tokens_in, tokens_out)
+                # Ảnh gần giống được upload lại sau này không cần gọi model
+                if call.image_cache is not None:
+                    call.image_cache.add(_image_scope(model_id, call.desc), call.image_hash,
+                                         dish.model_dump_json(), tokens_in, tokens_out)
+            _observe_length(model_id, call.desc, call.prompt_version, call.image, raw, tokens_out, call.max_tokens,
+                            continuation)
 
     # ---------- GIÁ /1K TOKENS ----------
     cost_in_1k, cost_out_1k = get_model_cost_estimates(model_id)
     cost_est = (tokens_in / 1000.0) * cost_in_1k + (tokens_out / 1000.0) * cost_out_1k
 
+    # Cache hit: không gọi Bedrock nên không tốn phí
     metrics = {
         "latency_s": round(latency, 2),
+        # Không stream: nguyên liệu đầu tiên chỉ có khi toàn bộ response về
+        "time_to_first_ingredient_s": round(latency, 2),
+        **extra,
         "tokens_in": tokens_in,
         "tokens_out": tokens_out,
-        "cost_est_usd": round(cost_est, 6),
+        # True: tokens_in là ước lượng offline (Bedrock không trả header token)
+        "tokens_in_estimated": tokens_estimated,
+        "cost_est_usd": round(cost_est, 6) if fresh else 0.0,
+        "cost_saved_usd": 0.0 if fresh else round(cost_est, 6),
+        "cache": call.cache_tier,
+        "max_tokens": call.max_tokens,
+        "max_tokens_auto": call.auto_max_tokens,
+        "constrained": call.constrained,
+        # Thời gian từng bước (giây, perf_counter): build_body, image_encode, bedrock_call, ...
+        "stages": call.stages,
     }
+    metrics.update(call.image_info)
+    if continuation is not None:
+        metrics["continuation"] = continuation
+    if call.cache is not None:
+        metrics.update(call.cache.stats())
+    if call.semantic is not None:
+        metrics.update(call.semantic.stats())
+        if call.similarity is not None:
+            metrics["semantic_similarity"] = call.similarity
+    if call.kb is not None:
+        metrics.update(call.kb.stats())
+    return metrics, dish
+
+
+def _answer(call: _Call) -> Tuple[Dict[str, Any], Dict[str, Any], Optional["Dish"]]:
+    dish_json, metrics = call.answer
+    raw = dish_response(dish_json)
+    return raw, metrics, _validated(raw, call.model_id)
+
+
+def invoke_model_dish(
+    bedrock_client,
+    desc: str,
+    model_id: str,
+    temperature: float,
+    max_tokens: int,
+    img: Optional[ImageInput] = None,
+    prompt_version: int = 0,
+    use_cache: bool = True,
+    cache=None,
+    hedge: Optional[bool] = None,
+    constrained: Optional[bool] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Any], Optional["Dish"]]:
+    """
+    Như invoke_model nhưng trả về (response, metrics, Dish | None): Dish đã validate một lần trong lúc
+    ghi cache, người dùng kết quả (UI, batch) không cần parse lại. None: response không hợp lệ,
+    parse_and_validate(response) cho lỗi chi tiết.
+    """
+    if not bedrock_client or not model_id:
+        raise RuntimeError("Bedrock client/model_id not ready")
+
+    if (HEDGE_ENABLED if hedge is None else hedge) and get_hedge_model(model_id, image=img is not None):
+        from .hedging import invoke_model_hedged
+        return invoke_model_hedged(bedrock_client, desc, model_id, temperature, max_tokens, img=img,
+                                   prompt_version=prompt_version, use_cache=use_cache, cache=cache,
+                                   constrained=constrained)
+
+    constrained = OUTPUT_CONSTRAINED if constrained is None else constrained
+    call = _prepare(desc, model_id, temperature, max_tokens, img, prompt_version, use_cache, cache, constrained)
+    if call.answer is not None:
+        return _answer(call)
+
+    continuation = None
+    if call.cached is not None:
+        raw, hdrs = call.cached
+    else:
+        t_call = time.perf_counter()
+        with trace(call.stages), span("bedrock_call", model_id):
+            raw, hdrs = bedrock_client.invoke(model_id=model_id, body=call.body)
+        if constrained and raw:
+            raw, hdrs = _restore_prefill(model_id, raw, hdrs)
+        raw, hdrs, continuation = _continue(bedrock_client, call, raw, hdrs, time.perf_counter() - t_call)
+
+    metrics, dish = _finish(bedrock_client, call, raw, hdrs, continuation, {})
+    return raw, metrics, dish
+
+
+def invoke_model(
+    bedrock_client,
+    desc: str,
+    model_id: str,
+    temperature: float,
+    max_tokens: int,
+    img: Optional[ImageInput] = None,
+    prompt_version: int = 0,
+    use_cache: bool = True,
+    cache=None,
+    hedge: Optional[bool] = None,
+    constrained: Optional[bool] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Invoke model and return (response, metrics).
+    metrics contains: latency_s, time_to_first_ingredient_s, tokens_in, tokens_out,
+    cost_est_usd, cache ("memory"/"disk"/"miss"/"bypass"), cache_hits, cache_misses,
+    stages ({stage: seconds} cho từng bước, xem telemetry.py)
+
+    - Giữ nguyên cách gọi cũ (img=None, không có prompt_version).
+    - Nếu muốn test phiên bản prompt: truyền prompt_version=1/2/3.
+    - use_cache=False bỏ qua response cache (không đọc, không ghi).
+    - img có thể là PIL.Image hoặc bytes upload gốc; bytes PNG/JPEG đạt giới hạn
+      được gửi nguyên vẹn (metrics["image_passthrough"]).
+    - Ảnh gần giống ảnh đã xử lý (perceptual hash) trả luôn Dish đã validate,
+      không gọi Bedrock (metrics["cache"] = "image").
+    - Mô tả gần trùng một mô tả đã xử lý (cùng model/prompt, xem semantic_cache.py) trả luôn Dish
+      đã validate (metrics["cache"] = "semantic", metrics["semantic_similarity"]).
+    - Mô tả chỉ là tên một món trong knowledge base (xem knowledge_base.py) được trả lời trong process,
+      trước cả khi build body (metrics["cache"] = "kb").
+    - hedge=True (mặc định HEDGE_ENABLED): quá deadline thì gửi thêm request tới model nhanh hơn,
+      response trả về đã chuẩn hoá dạng Claude, xem src/hedging.py (metrics["hedge"]).
+    - Output text bị cắt ở max_tokens được nối tiếp bằng request mới thay vì trả JSON cắt dở
+      (CONTINUATION_ENABLED, xem src/continuation.py); response trả về là bản đã ghép, dạng Claude,
+      token cộng cả các lần gọi, phần tiết kiệm so với chạy lại trong metrics["continuation"].
+    - max_tokens <= 0: max_tokens tự động theo độ dài output dự đoán của model (xem src/length_predictor.py);
+      giá trị đã dùng ở metrics["max_tokens"], metrics["max_tokens_auto"] = True.
+    - constrained=True (mặc định OUTPUT_CONSTRAINED): request prefill '{' + stop sequences
+      (prompt_builder.constrain_*); response trả về dạng Claude với JSON đã thêm lại '{' (metrics["constrained"]).
+    - Cần cả Dish đã validate thì dùng invoke_model_dish (không parse lại response).
+    """
+    raw, metrics, _ = invoke_model_dish(bedrock_client, desc, model_id, temperature, max_tokens, img=img,
+                                        prompt_version=prompt_version, use_cache=use_cache, cache=cache,
+                                        hedge=hedge, constrained=constrained)
     return raw, metrics
+
+
+def invoke_model_stream(
+    bedrock_client,
+    desc: str,
+    model_id: str,
+    temperature: float,
+    max_tokens: int,
+    img: Optional[ImageInput] = None,
+    prompt_version: int = 0,
+    use_cache: bool = True,
+    cache=None,
+    constrained: Optional[bool] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Bản streaming của invoke_model. Yield các event:
+      {"type": "ingredient", "ingredient": Ingredient}  - ngay khi object nguyên liệu đóng
+      {"type": "done", "raw": raw, "metrics": metrics, "dish": Dish | None}  - cuối cùng, như invoke_model_dish
+    metrics có thêm time_to_first_token_s và time_to_first_ingredient_s.
+    Response hoàn chỉnh, hợp lệ được ghi vào response cache; cache hit (kể cả mô tả gần trùng, knowledge base,
+    ảnh gần giống) thì phát lại ngay. Output bị cắt ở max_tokens được nối tiếp như invoke_model, nguyên
+    liệu của phần nối tiếp được phát tiếp sau các nguyên liệu đã có. constrained như invoke_model:
+    '{' prefill được đưa vào stream parser trước chunk đầu tiên.
+    """
+    if not bedrock_client or not model_id:
+        raise RuntimeError("Bedrock client/model_id not ready")
+
+    constrained = OUTPUT_CONSTRAINED if constrained is None else constrained
+    call = _prepare(desc, model_id, temperature, max_tokens, img, prompt_version, use_cache, cache, constrained)
+    if call.answer is not None:
+        for ingredient in IngredientStreamParser().feed(call.answer[0]):
+            yield {"type": "ingredient", "ingredient": ingredient}
+        raw, metrics, dish = _answer(call)
+        metrics["time_to_first_token_s"] = metrics["latency_s"]
+        yield {"type": "done", "raw": raw, "metrics": metrics, "dish": dish}
+        return
+
+    t0 = call.t0
+    stream_parser = IngredientStreamParser()
+    ttft: Optional[float] = None
+    ttfi: Optional[float] = None
+    continuation = None
+
+    if call.cached is not None:
+        raw, hdrs = call.cached
+        for ingredient in stream_parser.feed(get_adapter(model_id).extract_text(raw)):
+            if ttfi is None:
+                ttfi = time.perf_counter() - t0
+            yield {"type": "ingredient", "ingredient": ingredient}
+    else:
+        usage: Dict[str, Any] = {}
+        emitted = 0
+        # prefill của request ràng buộc output, chờ chunk có chữ đầu tiên (model có thể tự viết lại '{')
+        pending_prefill = OUTPUT_PREFILL if constrained else ""
+        t_call = time.perf_counter()
+        for event in bedrock_client.invoke_stream(model_id=model_id, body=call.body):
+            if event["type"] == "usage":
+                usage.update(event["usage"])
+                continue
+            if ttft is None:
+                ttft = time.perf_counter() - t0
+            text = event["text"]
+            if pending_prefill and text.strip():
+                text = restore_prefill(text, prefill=pending_prefill)
+                pending_prefill = ""
+            for ingredient in stream_parser.feed(text):
+                if ttfi is None:
+                    ttfi = time.perf_counter() - t0
+                emitted += 1
+                yield {"type": "ingredient", "ingredient": ingredient}
+
+        # bedrock_call của stream gồm cả thời gian phía tiêu thụ xử lý event giữa các lần yield
+        call_s = time.perf_counter() - t_call
+        get_telemetry().observe("bedrock_call", model_id, call_s)
+        call.stages["bedrock_call"] = round(call_s, 6)
+
+        if not stream_parser.text.strip():
+            raise RuntimeError("AWS Bedrock returned empty response")
+
+        # Gom lại thành response dạng Claude + headers token giống InvokeModel
+        raw = dish_response(restore_prefill(stream_parser.text, usage.get("stop_reason"), prefill="")
+                             if constrained else stream_parser.text)
+        hdrs = {}
+        if usage.get("input_tokens") is not None:
+            hdrs["x-amzn-bedrock-input-token-count"] = str(usage["input_tokens"])
+        if usage.get("output_tokens") is not None:
+            hdrs["x-amzn-bedrock-output-token-count"] = str(usage["output_tokens"])
+        if usage.get("stop_reason"):
+            raw["stop_reason"] = usage["stop_reason"]
+        raw, hdrs, continuation = _continue(bedrock_client, call, raw, hdrs, call_s)
+        if continuation is not None:
+            text = get_adapter(model_id).extract_text(raw)
+            fed = stream_parser.text.strip()
+            if text.startswith(fed):
+                more = stream_parser.feed(text[len(fed):])
+            else:
+                # model viết lại cả JSON: bỏ các nguyên liệu đã phát
+                more = IngredientStreamParser().feed(text)[emitted:]
+            for ingredient in more:
+                if ttfi is None:
+                    ttfi = time.perf_counter() - t0
+                yield {"type": "ingredient", "ingredient": ingredient}
+
+    metrics, dish = _finish(bedrock_client, call, raw, hdrs, continuation, {
+        "time_to_first_token_s": round(ttft, 2) if ttft is not None else None,
+        "time_to_first_ingredient_s": round(ttfi, 2) if ttfi is not None else None,
+    })
+    yield {"type": "done", "raw": raw, "metrics": metrics, "dish": dish}
@@ -0,0 +1,191 @@
+"""Tìm và sửa JSON object đầu tiên trong output của model (một lượt quét, hiểu chuỗi/escape)."""
+
+import json
+import re
+from typing import List, Optional, Tuple
+
+from .utils import get_logger
+
+logger = get_logger("json_extract")
+
+# Token ngoài chuỗi: chuỗi hoàn chỉnh | ký tự cấu trúc | dấu " mở chuỗi bị cắt.
+# Nội dung giữa các token (số, literal, khoảng trắng) được regex (chạy ở C) bỏ qua.
+_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\],:]|"', re.S)
+# Escape dở dang ở cuối chuỗi bị cắt: chuỗi dấu \ (lẻ = escape chưa xong), có thể kèm uXXX
+_PARTIAL_ESCAPE = re.compile(r'(\\+)(u[0-9a-fA-F]{0,3})?$')
+
+_DECODER = json.JSONDecoder()
+
+# Số lần thử lại với dấu '{' kế tiếp khi object đầu tiên không parse được (vd. "{...}" trong lời dẫn)
+MAX_START_ATTEMPTS = 5
+
+
+class _Frame:
+    """Một container đang mở: vị trí mở và vị trí kết thúc của phần tử hoàn chỉnh cuối cùng."""
+    __slots__ = ("char", "open_pos", "safe_end", "after_colon")
+
+    def __init__(self, char: str, open_pos: int):
+        self.char = char
+        self.open_pos = open_pos
+        self.safe_end: Optional[int] = None
+        self.after_colon = False
+
+
+def _scan(text: str, start: int) -> Tuple[Optional[int], List[_Frame], Optional[int]]:
+    """
+    Quét từ dấu '{' tại `start`.
+    Trả về (end, [], None) nếu object đóng đủ (text[start:end]), hoặc
+    (None, stack, open_string) nếu bị cắt; open_string là vị trí dấu " của chuỗi đang mở.
+    """
+    stack: List[_Frame] = []
+    pos = start
+    while True:
+        m = _TOKEN.search(text, pos)
+        if m is None:
+            return None, stack, None
+        tok = m.group()
+        c = tok[0]
+        pos = m.end()
+        if c == '"':
+            if len(tok) == 1:  # chuỗi bị cắt giữa chừng
+                return None, stack, m.start()
+            top = stack[-1] if stack else None
+            if top is not None and (top.char == "[" or top.after_colon):
+                top.safe_end = pos
+                top.after_colon = False
+        elif c in "{[":
+            if stack:
+                # container con hoàn chỉnh: để json (C) parse và nhảy qua cả khối
+                try:
+                    pos = _DECODER.raw_decode(text, m.start())[1]
+                    top = stack[-1]
+                    if top.char == "[" or top.after_colon:
+                        top.safe_end = pos
+                        top.after_colon = False
+                    continue
+                except json.JSONDecodeError:
+                    pass
+            stack.append(_Frame(c, m.start()))
+        elif c in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return pos, stack, None
+            parent = stack[-1]
+            if parent.char == "[" or parent.after_colon:
+                parent.safe_end = pos
+                parent.after_colon = False
+        elif c == ",":
+            if stack:
+                stack[-1].safe_end = m.start()
+                stack[-1].after_colon = False
+        elif stack:  # ":"
+            stack[-1].after_colon = True
+
+
+def _close(stack: List[_Frame]) -> str:
+    return "".join("}" if f.char == "{" else "]" for f in reversed(stack))
+
+
+def _close_string(text: str) -> str:
+    """Đóng chuỗi đang mở; bỏ escape dở dang ở cuối (\\ lẻ hoặc \\uXX chưa đủ)."""
+    m = _PARTIAL_ESCAPE.search(text)
+    if m and (len(m.group(1)) % 2 == 1):
+        text = text[:m.start(1) + len(m.group(1)) - 1]
+    return text + '"'
+
+
+def _repair(text: str, start: int, stack: List[_Frame], open_string: Optional[int]) -> Optional[str]:
+    """
+    Sửa JSON bị cắt:
+    1) Chuỗi đang mở là giá trị -> đóng chuỗi và giữ lại; là key -> bỏ.
+    2) Bỏ phần tử dở dang cuối cùng của container trong cùng (số/literal bị cắt,
+       key không có giá trị, dấu phẩy thừa), rồi đóng các container còn mở theo đúng thứ tự.
+    3) Nếu vẫn không hợp lệ thì bỏ luôn container đó và lùi ra ngoài một cấp.
+    """
+    frames = list(stack)
+    if open_string is not None and frames:
+        top = frames[-1]
+        if top.char == "[" or top.after_colon:
+            text = _close_string(text)
+            top.safe_end = len(text)
+    while frames:
+        top = frames[-1]
+        cut = top.safe_end if top.safe_end is not None else top.open_pos + 1
+        candidate = text[start:cut] + _close(frames)
+        try:
+            json.loads(candidate)
+            return candidate
+        except json.JSONDecodeError:
+            pass
+        frames.pop()
+        if not frames:
+            return None
+        # bỏ cả container dở dang: cắt tại vị trí mở của nó
+        parent = frames[-1]
+        if parent.safe_end is None or parent.safe_end > top.open_pos:
+            parent.safe_end = None
+    return None
+
+
+def is_unterminated(text: str) -> bool:
+    """True nếu JSON object đầu tiên trong `text` chưa đóng (output bị cắt giữa chừng)."""
+    start = text.find("{")
+    for _ in range(MAX_START_ATTEMPTS):
+        if start == -1:
+            return False
+        try:
+            _DECODER.raw_decode(text, start)
+            return False
+        except json.JSONDecodeError:
+            pass
+        if _scan(text, start)[0] is None:
+            return True
+        # đóng đủ nhưng không hợp lệ (vd. "{...}" trong lời dẫn) -> xét '{' tiếp theo
+        start = text.find("{", start + 1)
+    return False
+
+
+def find_json_object(text: str) -> Tuple[str, bool]:
+    """
+    Trả về (json_text, repaired) cho JSON object đầu tiên trong `text`.
+
+    - Bỏ qua lời dẫn, ```json fence và dấu ngoặc nằm trong chuỗi.
+    - Object đóng đủ nhưng không parse được (vd. "{...}" trong lời dẫn) -> thử '{' tiếp theo.
+    - Output bị cắt (max_tokens) -> sửa cấu trúc, repaired=True.
+    Raise ValueError nếu không có dấu '{' nào.
+    """
+    start = text.find("{")
+    if start == -1:
+        raise ValueError("No JSON found in response")
+
+    first_complete: Optional[str] = None
+    for _ in range(MAX_START_ATTEMPTS):
+        # Đường nhanh: object hoàn chỉnh, hợp lệ -> json (C) tự tìm điểm kết thúc
+        try:
+            obj, end = _DECODER.raw_decode(text, start)
+            if isinstance(obj, dict):
+                return text[start:end], False
+        except json.JSONDecodeError:
+            pass
+        end, stack, open_string = _scan(text, start)
+        if end is None:
+            fixed = _repair(text, start, stack, open_string)
+            if fixed is not None:
+                logger.warning("JSON appears to be truncated, repaired structure")
+                return fixed, True
+            break
+        candidate = text[start:end]
+        try:
+            json.loads(candidate)
+            return candidate, False
+        except json.JSONDecodeError:
+            if first_complete is None:
+                first_complete = candidate
+        start = text.find("{", start + 1)
+        if start == -1:
+            break
+
+    if first_complete is not None:
+        return first_complete, False
+    return text[text.find("{"):], False
@@ -0,0 +1,352 @@
+"""Knowledge base món ăn cục bộ: tên món -> Dish đã validate, trả lời trong process, không gọi model.
+
+Phần lớn request chỉ hỏi nguyên liệu của vài trăm món quen thuộc ("phở bò", "Hãy cho tôi nguyên liệu
+của món bún chả."). Mô tả được chuẩn hoá như semantic cache (bỏ cụm từ hỏi, stopword, không xét thứ tự
+từ) và tra trong hai index băm:
+  - key còn dấu: "bò phở" -> món, dùng khi mô tả có dấu,
+  - key không dấu: "bo pho" -> key còn dấu, dùng khi mô tả gõ không dấu. Nhiều món khác nhau cùng
+    bỏ dấu thành một key ("bánh bò" / "bánh bơ") thì key đó bị đánh dấu nhập nhằng và không trả lời.
+Chỉ trả lời khi mô tả là đúng tên (hoặc tên khác) của một món, không thừa từ nào ("phở bò cho 4 người"
+là yêu cầu khác): không chắc thì để invoke_model gọi model như bình thường.
+
+File nhị phân, ghi nối tiếp theo đoạn (mỗi lần promote là một đoạn):
+    header (magic, số món, độ dài khối key, độ dài khối Dish)
+    khối key (zlib): số byte Dish của từng món (uint32), rồi key còn dấu của từng món (mỗi món một dòng,
+        tên khác cách nhau bởi "|"), TAB, key không dấu theo đúng thứ tự đó
+    khối Dish: Dish JSON của từng món, nén deflate riêng với từ điển chung (_ZDICT)
+Lúc nạp chỉ giải nén khối key (nhỏ, tách bằng vài lệnh split) và giữ nguyên khối Dish trong bộ nhớ;
+Dish của một món chỉ được giải nén (vài µs) khi hit. Món ghi sau đè món ghi trước nếu trùng key
+(promote replace=True).
+
+    python -m src.knowledge_base                       # số món, key, tỉ lệ hit, latency lookup
+    python -m src.knowledge_base promote dishes.jsonl  # thêm Dish đã validate (output của src.batch)
+    python -m src.knowledge_base export all.jsonl      # xuất lại JSONL để rà soát / sửa tay
+"""
+
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from itertools import accumulate, repeat
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .semantic_cache import _fold_word, normalize_words
+from .telemetry import get_telemetry, span
+from .utils import get_logger, CACHE_DIR, KB_ENABLED, KB_FILE
+
+logger = get_logger("knowledge_base")
+
+_MAGIC = b"FKB2"  # đổi khi đổi định dạng hoặc cách chuẩn hoá key
+_SEGMENT = struct.Struct("<4sIII")
+# Các chuỗi lặp lại trong mọi Dish JSON: nén từng món riêng lẻ vẫn đạt tỉ lệ gần như nén cả file
+_ZDICT = (
+    '"notes":["Ước lượng"],"unit":null},{"name":"hành lá","quantity":"1","unit":"muỗng canh"},'
+    '{"name":"nước mắm","quantity":"2","unit":"muỗng cà phê"},{"name":"thịt","quantity":"500","unit":"g"},'
+    '{"name":"nước","quantity":"1","unit":"ml"}],"cuisine":"Vietnamese","ingredients":[{"name":"'
+).encode("utf-8")
+# Mô tả dài hơn chắc chắn không chỉ là tên món: miss ngay, không chuẩn hoá
+MAX_QUERY_CHARS = 160
+
+_AMBIGUOUS = ""  # key không dấu ứng với nhiều món
+
+
+def dish_keys(name: str) -> Tuple[str, str]:
+    """(key còn dấu, key không dấu) của một tên món / mô tả; ("", "") nếu không còn từ nào."""
+    words = normalize_words(name)
+    return " ".join(sorted(words)), " ".join(sorted(_fold_word(w) for w in words))
+
+
+def _le(values: array) -> array:
+    """Mảng uint32 theo little-endian (định dạng file) <-> thứ tự byte của máy."""
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+def _compress(dish: bytes) -> bytes:
+    c = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=_ZDICT)
+    return c.compress(dish) + c.flush()
+
+
+def _decompress(blob) -> bytes:
+    return zlib.decompressobj(-15, zdict=_ZDICT).decompress(blob)
+
+
+class KnowledgeBase:
+    """Index trong bộ nhớ của các Dish đã validate; lookup chỉ đọc dict/array nên không cần khoá."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or KB_FILE or os.path.join(CACHE_DIR, "dishes.kb")
+        self.hits = 0
+        self.misses = 0
+        self.load_s = 0.0
+        self._read_only = False  # file không ghi được: đã log một lần, promote không thêm gì nữa
+        self._reset()
+        self._lock = threading.Lock()
+
+    def _reset(self):
+        self._blocks: List[memoryview] = []  # khối Dish (đã nén) của từng đoạn
+        self._block = array("I")             # món i: nằm ở khối nào, offset, số byte
+        self._offset = array("I")
+        self._size = array("I")
+        self._accented: Dict[str, int] = {}
+        self._folded: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._block)
+
+    # ---------- Nạp / ghi file ----------
+    def load(self) -> "KnowledgeBase":
+        """Nạp file (nếu có); gọi lại thì nạp lại từ đầu."""
+        t0 = time.perf_counter()
+        self._reset()
+        try:
+            with open(self.path, "rb") as f:
+                data = memoryview(f.read())
+        except FileNotFoundError:
+            data = memoryview(b"")
+        except OSError as e:
+            logger.warning(f"Knowledge base {self.path} unreadable, starting empty: {e}")
+            data = memoryview(b"")
+        pos = 0
+        while pos < len(data):
+            if len(data) - pos < _SEGMENT.size:
+                logger.warning(f"Knowledge base {self.path}: đoạn cuối bị cắt, bỏ qua")
+                break
+            magic, count, keys_len, dishes_len = _SEGMENT.unpack_from(data, pos)
+            if magic != _MAGIC:
+                logger.warning(f"Knowledge base {self.path}: định dạng {magic!r} không hỗ trợ, dừng nạp")
+                break
+            start = pos + _SEGMENT.size
+            end = start + keys_len + dishes_len
+            if end > len(data):  # process bị dừng giữa lần ghi
+                logger.warning(f"Knowledge base {self.path}: đoạn cuối bị cắt, bỏ qua")
+                break
+            keys = zlib.decompress(data[start:start + keys_len])
+            sizes = array("I")
+            sizes.frombytes(keys[:4 * count])
+            sizes = _le(sizes)
+            accented, folded = keys[4 * count:].decode("utf-8").split("\t")
+            self._add_block(data[start + keys_len:end], sizes, accented.split("\n"), folded.split("\n"))
+            pos = end
+        self.load_s = time.perf_counter() - t0
+        logger.info(f"Knowledge base: {len(self)} dishes, {len(self._accented)} keys in {self.load_s:.2f}s")
+        return self
+
+    def _add_block(self, block: memoryview, sizes: array, accented: List[str], folded: List[str]):
+        """Đánh chỉ mục một đoạn: sizes / accented / folded theo đúng thứ tự Dish trong khối."""
+        base = len(self._block)
+        self._block.extend(repeat(len(self._blocks), len(sizes)))
+        self._offset.extend(accumulate(sizes[:-1], initial=0) if sizes else ())
+        self._size.extend(sizes)
+        self._blocks.append(block)
+        if len(set(folded)) == len(folded) and not any("|" in a for a in accented):
+            # Trường hợp thường gặp (mỗi món một tên, không trùng trong đoạn): cập nhật dict hàng loạt
+            new = dict(zip(folded, accented))
+            clash = [f for f in self._folded.keys() & new.keys() if self._folded[f] != new[f]]
+            self._accented.update(zip(accented, range(base, base + len(accented))))
+            self._folded.update(new)
+            for f in clash:
+                self._folded[f] = _AMBIGUOUS
+            return
+        for index, (a, f) in enumerate(zip(accented, folded), base):
+            if "|" in a:  # món có tên khác
+                pairs = zip(a.split("|"), f.split("|"))
+            else:
+                pairs = ((a, f),)
+            for a, f in pairs:
+                self._accented[a] = index
+                other = self._folded.get(f)
+                self._folded[f] = a if other is None or other == a else _AMBIGUOUS
+
+    def promote(self, dish: Any, names: Iterable[str] = (), replace: bool = False) -> bool:
+        """
+        Thêm một Dish (model Dish, dict hoặc JSON; được validate lại) vào knowledge base và ghi nối vào file.
+        Key là dish_name cộng các tên khác trong `names`. replace=False: key đã có món thì giữ món cũ
+        (knowledge base đã rà soát được ưu tiên hơn output model). Trả về True nếu đã thêm.
+        """
+        return self.promote_many([(dish, names)], replace=replace) == 1
+
+    def promote_many(self, items: Iterable[Tuple[Any, Iterable[str]]], replace: bool = False) -> int:
+        """
+        promote cho nhiều (dish, names), ghi thành một đoạn; trả về số món đã thêm.
+        Không ghi được file (thư mục chỉ đọc...) thì không thêm món nào, kể cả vào bộ nhớ.
+        """
+        from .schema import Dish, dish_adapter
+
+        with self._lock:
+            if self._read_only:
+                return 0
+            accented_lines, folded_lines, blobs, seen = [], [], [], set()
+            for dish, names in items:
+                if isinstance(dish, (str, bytes)):
+                    dish = dish_adapter().validate_json(dish)
+                elif not isinstance(dish, Dish):
+                    dish = Dish.model_validate(dish)
+                pairs: Dict[str, str] = {}
+                for name in (dish.dish_name, *names):
+                    accented, folded = dish_keys(name or "")
+                    if accented:
+                        pairs[accented] = folded
+                if not pairs or any(k in seen for k in pairs) \
+                        or (not replace and any(k in self._accented for k in pairs)):
+                    continue
+                seen.update(pairs)
+                accented_lines.append("|".join(pairs))
+                folded_lines.append("|".join(pairs.values()))
+                blobs.append(_compress(dish.model_dump_json(exclude_none=True).encode("utf-8")))
+            if not blobs:
+                return 0
+            sizes = array("I", map(len, blobs))
+            block = b"".join(blobs)
+            text = "\n".join(accented_lines) + "\t" + "\n".join(folded_lines)
+            keys = zlib.compress(_le(sizes).tobytes() + text.encode("utf-8"))
+            try:
+                parent = os.path.dirname(self.path)
+                if parent:
+                    os.makedirs(parent, exist_ok=True)
+                with open(self.path, "ab") as f:
+                    f.write(_SEGMENT.pack(_MAGIC, len(blobs), len(keys), len(block)) + keys + block)
+            except OSError as e:
+                self._read_only = True
+                logger.warning(f"Knowledge base {self.path} not writable, promote disabled: {e}")
+                return 0
+            self._add_block(memoryview(block), sizes, accented_lines, folded_lines)
+        return len(blobs)
+
+    # ---------- Tra cứu ----------
+    def _dish(self, index: int) -> str:
+        offset = self._offset[index]
+        return _decompress(self._blocks[self._block[index]][offset:offset + self._size[index]]).decode("utf-8")
+
+    def lookup(self, desc: str) -> Optional[str]:
+        """Dish JSON nếu mô tả là đúng tên một món trong knowledge base, ngược lại None."""
+        dish = None
+        with span("kb_lookup"):
+            if self._accented and desc and len(desc) <= MAX_QUERY_CHARS:
+                accented, folded = dish_keys(desc)
+                if accented == folded:
+                    # Gõ không dấu: chỉ trả lời khi không nhập nhằng giữa các món
+                    accented = self._folded.get(folded) or ""
+                index = self._accented.get(accented) if accented else None
+                if index is not None:
+                    dish = self._dish(index)
+        telemetry = get_telemetry()
+        if dish is None:
+            self.misses += 1
+            telemetry.inc("food_kb_requests_total", result="miss")
+        else:
+            self.hits += 1
+            telemetry.inc("food_kb_requests_total", result="hit")
+        return dish
+
+    def export(self) -> Iterator[Dict[str, Any]]:
+        """Từng món hiện hành: {"dish": {...}, "aliases": [...]} (đọc lại được bằng promote)."""
+        names: Dict[int, List[str]] = {}
+        for key, index in self._accented.items():
+            names.setdefault(index, []).append(key)
+        for index in sorted(names):
+            dish = json.loads(self._dish(index))
+            own = dish_keys(dish.get("dish_name") or "")[0]
+            yield {"dish": dish, "aliases": [k for k in names[index] if k != own]}
+
+    # ---------- Báo cáo ----------
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "kb_hits": self.hits,
+            "kb_misses": self.misses,
+            "kb_hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def report(self) -> Dict[str, Any]:
+        """Số món/key, thời gian nạp, tỉ lệ hit và latency lookup (µs, cửa sổ mẫu gần nhất của telemetry)."""
+        telemetry = get_telemetry()
+        latency = {}
+        for q in (0.5, 0.99):
+            value = telemetry.quantile("kb_lookup", None, q)
+            latency[f"p{int(q * 100)}_us"] = round(value * 1e6, 1) if value is not None else None
+        return {
+            "path": self.path,
+            "dishes": len(self),
+            "keys": len(self._accented),
+            "ambiguous_folded_keys": sum(1 for v in self._folded.values() if v == _AMBIGUOUS),
+            "load_s": round(self.load_s, 3),
+            **self.stats(),
+            "lookup": latency,
+        }
+
+
+def read_promotable(path: str) -> Iterator[Tuple[Dict[str, Any], List[str]]]:
+    """
+    (dish, names) từ một file JSONL: output của src.batch / export ({"dish": {...}}), hoặc Dish trần.
+    Trường "aliases" (tuỳ chọn) là các tên khác của món.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            yield row.get("dish", row), list(row.get("aliases") or ())
+
+
+_shared_kb: Optional[KnowledgeBase] = None
+_shared_lock = threading.Lock()
+
+
+def get_knowledge_base() -> Optional[KnowledgeBase]:
+    """Knowledge base dùng chung (nạp ở lần gọi đầu); None nếu tắt qua KB_ENABLED=false."""
+    global _shared_kb
+    if not KB_ENABLED:
+        return None
+    with _shared_lock:
+        if _shared_kb is None:
+            _shared_kb = KnowledgeBase().load()
+        return _shared_kb
+
+
+def peek_knowledge_base() -> Optional[KnowledgeBase]:
+    """Knowledge base dùng chung nếu đã được nạp, ngược lại None (không nạp file chỉ để đọc thống kê)."""
+    return _shared_kb
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    ap = argparse.ArgumentParser(prog="python -m src.knowledge_base", description=__doc__.splitlines()[0])
+    ap.add_argument("--path", help="File knowledge base (mặc định KB_FILE hoặc CACHE_DIR/dishes.kb)")
+    sub = ap.add_subparsers(dest="command")
+    promote = sub.add_parser("promote", help="Thêm Dish đã validate từ file JSONL")
+    promote.add_argument("input", nargs="+", help="File JSONL (output của src.batch hoặc Dish trần)")
+    promote.add_argument("--replace", action="store_true", help="Ghi đè món đã có cùng tên")
+    export = sub.add_parser("export", help="Xuất các món ra JSONL")
+    export.add_argument("output")
+    lookup = sub.add_parser("lookup", help="Tra một mô tả")
+    lookup.add_argument("desc")
+    args = ap.parse_args(argv)
+
+    kb = KnowledgeBase(args.path).load()
+    if args.command == "promote":
+        added = sum(kb.promote_many(read_promotable(p), replace=args.replace) for p in args.input)
+        print(json.dumps({"promoted": added, **kb.report()}, ensure_ascii=False, indent=2))
+    elif args.command == "export":
+        with open(args.output, "w", encoding="utf-8") as f:
+            for row in kb.export():
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    elif args.command == "lookup":
+        dish = kb.lookup(args.desc)
+        print(dish if dish is not None else "miss")
+        return 0 if dish is not None else 1
+    else:
+        print(json.dumps(kb.report(), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
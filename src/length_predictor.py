@@ -0,0 +1,397 @@
+"""Dự đoán độ dài output (tokens_out) theo model để đặt max_tokens tự động thay vì giá trị cố định.
+
+max_tokens quá nhỏ thì output bị cắt (phải nối tiếp/chạy lại); quá lớn thì request giữ chỗ nhiều token
+hơn cần trong quota tokens/phút (Bedrock trừ input + max_tokens lúc bắt đầu request) và dễ bị throttle.
+
+Mỗi nhóm (model, prompt_version, text/ảnh) có một hồi quy ridge trên log(tokens_out) với đặc trưng:
+  - log(1 + input token ước lượng) (token_estimator, có trước khi gọi model),
+  - log(1 + số thành phần liệt kê trong mô tả) (dấu phẩy, "và", xuống dòng...),
+  - mô tả có số (khẩu phần, khối lượng) hay không.
+Hệ số tính từ thống kê đủ (XᵀX, Xᵀy) nên học online từng mẫu, không cần giữ lại mẫu.
+max_tokens = exp(dự đoán + quantile LENGTH_QUANTILE của sai số gần đây), làm tròn lên bội 64. Sai số
+được đo trước khi học mẫu đó (prequential) nên quantile là sai số thật trên request chưa thấy.
+Nhóm chưa đủ LENGTH_MIN_SAMPLES mẫu dùng nhóm gộp cả model, rồi tới get_default_max_tokens.
+
+Mỗi lần gọi model thật (không phải cache hit) được học ngay (LENGTH_LEARN); output vẫn bị cắt chỉ cho
+biết cận dưới nên không dùng để học. LENGTH_HISTORY=true thì ghi thêm lịch sử JSONL (LENGTH_HISTORY_FILE)
+để train/evaluate lại: chỉ các đặc trưng số, không ghi mô tả của người dùng; file vượt
+LENGTH_HISTORY_MAX_BYTES được đổi tên thành .1 (giữ một file cũ).
+    python -m src.length_predictor             # tỉ lệ bị cắt, token giữ chỗ so với max_tokens cố định
+    python -m src.length_predictor train       # học lại từ đầu theo lịch sử
+    python -m src.length_predictor predict "phở bò cho 4 người" --model-id ...
+"""
+
+import atexit
+import json
+import math
+import os
+import re
+import sys
+import threading
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .models import get_default_max_tokens
+from .telemetry import get_telemetry
+from .token_estimator import get_token_estimator
+from .utils import (
+    get_logger, CACHE_DIR, MAX_TOKENS, CONTINUATION_MAX_TOKENS, LENGTH_QUANTILE, LENGTH_MIN_SAMPLES,
+    LENGTH_MIN_TOKENS, LENGTH_MAX_TOKENS, LENGTH_HISTORY, LENGTH_HISTORY_FILE, LENGTH_HISTORY_MAX_BYTES,
+    LENGTH_MODEL_FILE,
+)
+
+logger = get_logger("length_predictor")
+
+_ITEM_SEP_RE = re.compile(r"[,;+/\n]|\b(?:và|với|voi|and|with)\b", re.I)
+_NUMBER_RE = re.compile(r"\d")
+N_FEATURES = 4
+RIDGE = 1.0
+RESIDUAL_WINDOW = 512
+ROUND_TO = 64
+_SAVE_EVERY = 20
+
+
+def desc_features(desc: str) -> Tuple[int, bool]:
+    """(số thành phần liệt kê, có số hay không) của mô tả: phần đặc trưng lấy từ mô tả."""
+    desc = desc or ""
+    return len(_ITEM_SEP_RE.findall(desc)), bool(_NUMBER_RE.search(desc))
+
+
+def features(tokens_in: int, items: int, has_number: bool) -> Tuple[float, ...]:
+    return 1.0, math.log1p(max(tokens_in, 0)), math.log1p(max(items, 0)), 1.0 if has_number else 0.0
+
+
+def entry_features(entry: Dict[str, Any]) -> Tuple[float, ...]:
+    """Đặc trưng của một bản ghi lịch sử; bản ghi cũ (có "desc", chưa có "items") được tính lại từ mô tả."""
+    if "items" in entry:
+        items, has_number = int(entry["items"]), bool(entry.get("has_number"))
+    else:
+        items, has_number = desc_features(entry.get("desc", ""))
+    return features(int(entry.get("tokens_in_est", 0)), items, has_number)
+
+
+def static_max_tokens(model_id: str) -> int:
+    """max_tokens cố định của model (MAX_TOKENS=0 nghĩa là tự động nên không dùng làm mặc định)."""
+    return get_default_max_tokens(model_id, MAX_TOKENS if MAX_TOKENS > 0 else 512)
+
+
+def _group_key(model_id: str, prompt_version: int, image: bool) -> str:
+    return f"{model_id}|{'image' if image else f'v{prompt_version}'}"
+
+
+def _solve(a: List[List[float]], b: List[float]) -> Optional[List[float]]:
+    """Giải a·x = b (Gauss, chọn pivot); None nếu suy biến."""
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        if abs(m[pivot][col]) < 1e-12:
+            return None
+        m[col], m[pivot] = m[pivot], m[col]
+        for r in range(col + 1, n):
+            f = m[r][col] / m[col][col]
+            if f:
+                for c in range(col, n + 1):
+                    m[r][c] -= f * m[col][c]
+    x = [0.0] * n
+    for r in range(n - 1, -1, -1):
+        x[r] = (m[r][n] - sum(m[r][c] * x[c] for c in range(r + 1, n))) / m[r][r]
+    return x
+
+
+class _Group:
+    """Thống kê đủ của hồi quy + cửa sổ sai số (log) gần nhất của một nhóm."""
+    __slots__ = ("n", "xtx", "xty", "residuals", "_coef", "_offset")
+
+    def __init__(self, state: Optional[Dict[str, Any]] = None):
+        state = state or {}
+        self.n = int(state.get("n", 0))
+        self.xtx = state.get("xtx") or [[0.0] * N_FEATURES for _ in range(N_FEATURES)]
+        self.xty = state.get("xty") or [0.0] * N_FEATURES
+        self.residuals = deque(state.get("residuals") or (), maxlen=RESIDUAL_WINDOW)
+        self._coef: Optional[List[float]] = None
+        self._offset: Optional[float] = None
+
+    def coef(self) -> Optional[List[float]]:
+        if self._coef is None and self.n > N_FEATURES:
+            a = [[v + (RIDGE if i == j and i else 0.0) for j, v in enumerate(row)] for i, row in enumerate(self.xtx)]
+            self._coef = _solve(a, self.xty)
+        return self._coef
+
+    def predict_log(self, x: Sequence[float]) -> Optional[float]:
+        coef = self.coef()
+        return None if coef is None else sum(c * v for c, v in zip(coef, x))
+
+    def offset(self, q: float) -> float:
+        """Quantile q (nearest-rank) của sai số log gần đây."""
+        if self._offset is None:
+            values = sorted(self.residuals)
+            self._offset = values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))] if values else 0.0
+        return self._offset
+
+    def learn(self, x: Sequence[float], y: float):
+        predicted = self.predict_log(x)
+        if predicted is not None:
+            self.residuals.append(y - predicted)
+        for i in range(N_FEATURES):
+            self.xty[i] += x[i] * y
+            row = self.xtx[i]
+            for j in range(N_FEATURES):
+                row[j] += x[i] * x[j]
+        self.n += 1
+        self._coef = self._offset = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"n": self.n, "xtx": self.xtx, "xty": self.xty, "residuals": list(self.residuals)}
+
+
+class LengthPredictor:
+    """max_tokens theo độ dài output dự đoán; thread-safe, lưu trạng thái ra JSON để dùng lại khi khởi động."""
+
+    def __init__(self, path: Optional[str] = None, history_path: Optional[str] = None,
+                 quantile: float = LENGTH_QUANTILE, min_samples: int = LENGTH_MIN_SAMPLES,
+                 history_max_bytes: int = LENGTH_HISTORY_MAX_BYTES):
+        self.path = path
+        self.history_path = history_path
+        self.history_max_bytes = history_max_bytes
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._groups: Dict[str, _Group] = {}
+        self._dirty = 0
+        if path:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._groups = {k: _Group(v) for k, v in json.load(f).items()}
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, TypeError) as e:
+                logger.warning(f"Cannot load length model {path}: {e}")
+
+    def _predict(self, model_id: str, prompt_version: int, image: bool,
+                 x: Sequence[float]) -> Tuple[Optional[int], str]:
+        """(max_tokens, nhóm đã dùng); (None, "static") nếu chưa nhóm nào đủ mẫu."""
+        with self._lock:
+            for key in (_group_key(model_id, prompt_version, image), f"{model_id}|*"):
+                group = self._groups.get(key)
+                if group is None or group.n < self.min_samples:
+                    continue
+                predicted = group.predict_log(x)
+                if predicted is None:
+                    continue
+                tokens = math.exp(predicted + group.offset(self.quantile))
+                tokens = ROUND_TO * math.ceil(tokens / ROUND_TO)
+                return int(min(LENGTH_MAX_TOKENS, max(LENGTH_MIN_TOKENS, tokens))), key
+        return None, "static"
+
+    def max_tokens(self, model_id: str, desc: str, prompt_version: int = 0, image: bool = False) -> int:
+        """max_tokens cho một request; chưa đủ dữ liệu thì dùng giá trị mặc định của model."""
+        tokens_in = get_token_estimator().estimate(model_id, desc, prompt_version, image=image)
+        predicted, source = self._predict(model_id, prompt_version, image, features(tokens_in, *desc_features(desc)))
+        get_telemetry().inc("food_max_tokens_auto_total", model=model_id,
+                            source="static" if source == "static" else "predicted")
+        return predicted if predicted is not None else static_max_tokens(model_id)
+
+    def _learn(self, model_id: str, prompt_version: int, image: bool, x: Sequence[float], tokens_out: int):
+        y = math.log(tokens_out)
+        with self._lock:
+            for key in (_group_key(model_id, prompt_version, image), f"{model_id}|*"):
+                self._groups.setdefault(key, _Group()).learn(x, y)
+            self._dirty += 1
+            return self.path and self._dirty >= _SAVE_EVERY
+
+    def observe(self, model_id: str, desc: str, prompt_version: int, image: bool, tokens_out: int,
+                max_tokens: int, truncated: bool = False):
+        """Ghi nhận tokens_out thật của một lần gọi model vào lịch sử và học nếu output không bị cắt."""
+        if not tokens_out or tokens_out <= 0:
+            return
+        tokens_in = get_token_estimator().estimate(model_id, desc, prompt_version, image=image)
+        items, has_number = desc_features(desc)
+        self._append_history({"model_id": model_id, "prompt_version": prompt_version, "image": image,
+                              "tokens_in_est": tokens_in, "items": items, "has_number": has_number,
+                              "tokens_out": int(tokens_out), "max_tokens": int(max_tokens),
+                              "truncated": bool(truncated)})
+        if truncated:
+            return
+        if self._learn(model_id, prompt_version, image, features(tokens_in, items, has_number), int(tokens_out)):
+            self.save()
+
+    def _append_history(self, entry: Dict[str, Any]):
+        if not self.history_path:
+            return
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.history_path) or ".", exist_ok=True)
+                try:
+                    if self.history_max_bytes > 0 and os.path.getsize(self.history_path) >= self.history_max_bytes:
+                        os.replace(self.history_path, self.history_path + ".1")
+                except FileNotFoundError:
+                    pass
+                with open(self.history_path, "a", encoding="utf-8") as f:
+                    f.write(line)
+        except OSError as e:
+            logger.warning(f"Cannot append length history {self.history_path}: {e}")
+
+    def train(self, entries: Iterable[Dict[str, Any]]) -> int:
+        """Học từ các bản ghi lịch sử (bỏ qua bản ghi bị cắt); trả về số mẫu đã học."""
+        learned = 0
+        for e in entries:
+            if e.get("truncated") or not e.get("tokens_out"):
+                continue
+            self._learn(e["model_id"], int(e.get("prompt_version", 0)), bool(e.get("image")), entry_features(e),
+                        int(e["tokens_out"]))
+            learned += 1
+        return learned
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            snapshot = json.dumps({k: g.to_dict() for k, g in self._groups.items()})
+            self._dirty = 0
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(snapshot)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Cannot save length model {self.path}: {e}")
+
+    def groups(self) -> Dict[str, int]:
+        with self._lock:
+            return {k: g.n for k, g in self._groups.items()}
+
+
+def read_history(path: str) -> Iterator[Dict[str, Any]]:
+    """Các bản ghi lịch sử theo thứ tự ghi: file đã xoay vòng (path + ".1") trước, rồi file hiện tại."""
+    for name in (path + ".1", path):
+        try:
+            with open(name, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            continue
+        except FileNotFoundError:
+            continue
+
+
+def evaluate(entries: Iterable[Dict[str, Any]], quantile: float = LENGTH_QUANTILE,
+             min_samples: int = LENGTH_MIN_SAMPLES) -> Dict[str, Dict[str, Any]]:
+    """
+    Phát lại lịch sử theo thứ tự với predictor mới (dự đoán rồi mới học từng mẫu) và so với
+    get_default_max_tokens: tỉ lệ bị cắt, max_tokens trung bình, token giữ chỗ (input + max_tokens).
+    Request bị cắt tính thêm một request nối tiếp (input + phần đã có + max(max_tokens, CONTINUATION_MAX_TOKENS)).
+    throughput_gain_pct: số request hoàn thành thêm được trong cùng quota tokens/phút.
+    Bản ghi bị cắt (chỉ biết cận dưới của tokens_out) không dùng để so, chỉ đếm ở "censored".
+    """
+    predictor = LengthPredictor(quantile=quantile, min_samples=min_samples)
+    stats: Dict[str, Dict[str, float]] = {}
+    for e in entries:
+        model_id = e["model_id"]
+        s = stats.setdefault(model_id, {"samples": 0, "censored": 0, "fallback": 0, "truncated_static": 0,
+                                        "truncated_auto": 0, "max_tokens_static": 0, "max_tokens_auto": 0,
+                                        "reserved_static": 0, "reserved_auto": 0, "tokens_out": 0})
+        if e.get("truncated") or not e.get("tokens_out"):
+            s["censored"] += 1
+            continue
+        pv, image, tokens_in = int(e.get("prompt_version", 0)), bool(e.get("image")), int(e.get("tokens_in_est", 0))
+        x = entry_features(e)
+        static = static_max_tokens(model_id)
+        auto, source = predictor._predict(model_id, pv, image, x)
+        if auto is None:
+            auto = static
+            s["fallback"] += 1
+        actual = int(e["tokens_out"])
+        s["samples"] += 1
+        s["tokens_out"] += actual
+        s["truncated_static"] += actual > static
+        s["truncated_auto"] += actual > auto
+        s["max_tokens_static"] += static
+        s["max_tokens_auto"] += auto
+        for name, limit in (("static", static), ("auto", auto)):
+            s["reserved_" + name] += tokens_in + limit
+            if actual > limit:
+                s["reserved_" + name] += tokens_in + limit + max(limit, CONTINUATION_MAX_TOKENS)
+        predictor._learn(model_id, pv, image, x, actual)
+
+    out = {}
+    for model_id, s in stats.items():
+        n = s["samples"]
+        out[model_id] = {
+            "samples": n,
+            "censored": s["censored"],
+            "fallback": s["fallback"],
+            "mean_tokens_out": round(s["tokens_out"] / n, 1) if n else None,
+            "truncation_rate_static": round(s["truncated_static"] / n, 4) if n else None,
+            "truncation_rate_auto": round(s["truncated_auto"] / n, 4) if n else None,
+            "mean_max_tokens_static": round(s["max_tokens_static"] / n, 1) if n else None,
+            "mean_max_tokens_auto": round(s["max_tokens_auto"] / n, 1) if n else None,
+            "throughput_gain_pct": round(100.0 * (s["reserved_static"] / s["reserved_auto"] - 1), 1)
+            if s["reserved_auto"] else None,
+        }
+    return out
+
+
+_shared: Optional[LengthPredictor] = None
+_shared_lock = threading.Lock()
+
+
+def _history_path() -> str:
+    return LENGTH_HISTORY_FILE or os.path.join(CACHE_DIR, "output_lengths.jsonl")
+
+
+def _model_path() -> str:
+    return LENGTH_MODEL_FILE or os.path.join(CACHE_DIR, "length_model.json")
+
+
+def get_length_predictor() -> LengthPredictor:
+    """
+    Predictor dùng chung trong process; trạng thái ở LENGTH_MODEL_FILE, lịch sử ở LENGTH_HISTORY_FILE
+    (chỉ khi LENGTH_HISTORY=true).
+    """
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = LengthPredictor(_model_path(), _history_path() if LENGTH_HISTORY else None)
+                atexit.register(_shared.save)
+    return _shared
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    ap = argparse.ArgumentParser(prog="python -m src.length_predictor", description=__doc__.splitlines()[0])
+    ap.add_argument("--history", help="File lịch sử JSONL (mặc định LENGTH_HISTORY_FILE)")
+    ap.add_argument("--quantile", type=float, default=LENGTH_QUANTILE)
+    sub = ap.add_subparsers(dest="command")
+    sub.add_parser("train", help="Học lại từ đầu theo lịch sử và ghi LENGTH_MODEL_FILE")
+    predict = sub.add_parser("predict", help="max_tokens cho một mô tả")
+    predict.add_argument("desc")
+    predict.add_argument("--model-id", required=True)
+    predict.add_argument("--prompt-version", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    history = args.history or _history_path()
+    if args.command == "train":
+        predictor = LengthPredictor(quantile=args.quantile)
+        predictor.path = _model_path()  # không nạp trạng thái cũ
+        learned = predictor.train(read_history(history))
+        predictor.save()
+        print(json.dumps({"learned": learned, "groups": predictor.groups(), "model_file": predictor.path},
+                         ensure_ascii=False, indent=2))
+    elif args.command == "predict":
+        predictor = LengthPredictor(_model_path(), quantile=args.quantile)
+        print(predictor.max_tokens(args.model_id, args.desc, args.prompt_version))
+    else:
+        print(json.dumps(evaluate(read_history(history), quantile=args.quantile), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,6 +12,57 @@ TEXT_MODELS = {
     "us.anthropic.claude-3-5-haiku-20241022-v1:0": "Claude 3.5 Haiku",
 }
 
+# Giới hạn ảnh theo model: cạnh dài / số pixel tối đa trước khi model tự resize, và số pixel ~ 1 token ảnh.
+# Claude: ~ (w*h)/750 token, cạnh dài 1568px, ~1.15MP. Nova: hệ số xấp xỉ từ bảng token của AWS.
+IMAGE_LIMITS = {
+    "anthropic.claude-3-5-sonnet-20240620-v1:0": {"max_side": 1568, "max_pixels": 1_150_000, "px_per_token": 750},
+    "amazon.nova-pro-v1:0": {"max_side": 2048, "max_pixels": None, "px_per_token": 560},
+    "amazon.nova-lite-v1:0": {"max_side": 2048, "max_pixels": None, "px_per_token": 560},
+}
+
+# Model nhanh hơn để gửi request dự phòng (hedge) khi model chính trả lời chậm (xem src/hedging.py)
+HEDGE_FALLBACKS = {
+    "anthropic.claude-3-5-sonnet-20240620-v1:0": "us.anthropic.claude-3-5-haiku-20241022-v1:0",
+    "amazon.nova-pro-v1:0": "amazon.nova-lite-v1:0",
+}
+# Request ảnh chỉ dự phòng sang model có trong IMAGE_MODELS
+IMAGE_HEDGE_FALLBACKS = {
+    "anthropic.claude-3-5-sonnet-20240620-v1:0": "amazon.nova-lite-v1:0",
+    "amazon.nova-pro-v1:0": "amazon.nova-lite-v1:0",
+}
+
+def get_hedge_model(model_id: str, image: bool = False):
+    """Model dự phòng cho hedging; None nếu model không có model nhanh hơn tương ứng."""
+    return (IMAGE_HEDGE_FALLBACKS if image else HEDGE_FALLBACKS).get(model_id)
+
+
+def get_image_limits(model_id: str) -> dict:
+    if model_id in IMAGE_LIMITS:
+        return IMAGE_LIMITS[model_id]
+    if "nova" in (model_id or "").lower():
+        return IMAGE_LIMITS["amazon.nova-lite-v1:0"]
+    return IMAGE_LIMITS["anthropic.claude-3-5-sonnet-20240620-v1:0"]
+
+
+# Giới hạn token theo model: (context window, max token output của một request).
+# Dùng để chọn số mô tả gói chung một request (src/packing.py); Titan tính cả output vào context.
+MODEL_TOKEN_LIMITS = {
+    "anthropic.claude-3-5-sonnet-20240620-v1:0": (200_000, 4096),
+    "us.anthropic.claude-3-5-haiku-20241022-v1:0": (200_000, 8192),
+    "amazon.nova-lite-v1:0": (300_000, 5000),
+    "amazon.nova-pro-v1:0": (300_000, 5000),
+    "amazon.titan-text-lite-v1": (4096, 4096),
+    "amazon.titan-text-express-v1": (8192, 8192),
+    "meta.llama3-8b-instruct-v1:0": (8192, 2048),
+    "meta.llama3-70b-instruct-v1:0": (8192, 2048),
+}
+
+
+def get_model_token_limits(model_id: str) -> tuple[int, int]:
+    """(context window, max token output); model lạ thì dùng giới hạn nhỏ nhất thường gặp."""
+    return MODEL_TOKEN_LIMITS.get(model_id, (8192, 2048))
+
+
 def get_default_max_tokens(model_id: str, default: int = 512) -> int:
     """Get default max tokens for a specific model."""
     if 'titan-text-lite' in model_id:
@@ -0,0 +1,317 @@
+"""Gói nhiều mô tả vào một request: hướng dẫn, schema và ví dụ chỉ gửi một lần cho cả gói.
+
+Model trả về JSON array, mỗi phần tử là một Dish kèm "index" của mô tả (prompt_builder.build_prompt_*_packed).
+Từng phần tử được validate riêng. Mô tả không có phần tử hợp lệ (thiếu, sai schema, bị cắt ở cuối output)
+được gửi lại riêng từng mô tả qua invoke_model (đủ cache, nối tiếp, hedging như request thường).
+
+Số mô tả mỗi gói theo giới hạn của model (models.MODEL_TOKEN_LIMITS):
+  - output dự kiến (max_tokens của từng mô tả: giá trị của request nếu > 0, ngược lại dự đoán theo
+    length_predictor.py, như invoke_model) vừa max token output,
+  - prompt + các mô tả + output dự kiến vừa context window,
+  - tối đa PACK_MAX_ITEMS mô tả.
+Chỉ gói các mô tả text liên tiếp cùng model, temperature, prompt_version và constrained; ảnh, mô tả rỗng
+và mô tả có sẵn trong knowledge base không vào gói. Prompt gói là một template chung cho mọi
+prompt_version; constrained=True thì prefill '[' (prompt_builder.PACKED_PREFILL). Request gói không qua
+response cache / semantic cache.
+"""
+
+import json
+import re
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .adapters import get_adapter
+from .batch_inference import iter_invoke_many, run_one
+from .inference import dish_response, kb_metrics, resolve_max_tokens
+from .knowledge_base import get_knowledge_base
+from .models import get_model_cost_estimates, get_model_token_limits
+from .telemetry import get_telemetry, span
+from .token_estimator import _body_text_units, get_token_estimator, text_units
+from .prompt_builder import PACKED_PREFILL
+from .utils import get_logger, MAX_TOKENS, MODEL_ID, OUTPUT_CONSTRAINED, PACK_MAX_ITEMS, TEMPERATURE
+
+logger = get_logger("packing")
+
+# Phần thêm cho mỗi mô tả: '[12] """..."""' ở input, '"index": 12,' và dấu phẩy ở output
+ITEM_INPUT_UNITS = 6
+ITEM_OUTPUT_TOKENS = 8
+ARRAY_OUTPUT_TOKENS = 8
+
+_ARRAY_START = re.compile(r"\[\s*\{")
+_DECODER = json.JSONDecoder()
+
+
+# =========================
+# Chia gói
+# =========================
+def _prefix_tokens(model_id: str, constrained: bool) -> int:
+    """Token của phần cố định trong prompt gói (không có mô tả nào)."""
+    body = get_adapter(model_id).build_packed_body([], TEMPERATURE, 1, constrained)
+    return get_token_estimator().estimate_units(model_id, _body_text_units(body))
+
+
+def _pack_key(req: Dict[str, Any]) -> Tuple[str, float, int, bool]:
+    """Các mô tả chỉ vào chung gói khi cùng key: một request gói chỉ có một bộ tham số."""
+    constrained = req.get("constrained")
+    return (req.get("model_id") or MODEL_ID, float(req.get("temperature", TEMPERATURE)),
+            int(req.get("prompt_version", 0)), OUTPUT_CONSTRAINED if constrained is None else bool(constrained))
+
+
+class _Pack:
+    def __init__(self, key: Tuple[str, float, int, bool]):
+        self.key = key
+        self.model_id, self.temperature, self.prompt_version, self.constrained = key
+        self.context, self.output_limit = get_model_token_limits(self.model_id)
+        self.tokens_in = _prefix_tokens(self.model_id, self.constrained)
+        self.tokens_out = ARRAY_OUTPUT_TOKENS
+        self.items: List[Tuple[int, Dict[str, Any]]] = []
+        self.item_max_tokens: List[Tuple[int, bool]] = []  # (max_tokens, auto) của từng mô tả
+
+    def fits(self, tokens_in: int, tokens_out: int, max_items: int) -> bool:
+        if not self.items:
+            return True
+        return (len(self.items) < max_items
+                and self.tokens_out + tokens_out <= self.output_limit
+                and self.tokens_in + tokens_in + self.tokens_out + tokens_out <= self.context)
+
+    def add(self, index: int, req: Dict[str, Any], tokens_in: int, max_tokens: Tuple[int, bool]):
+        self.items.append((index, req))
+        self.item_max_tokens.append(max_tokens)
+        self.tokens_in += tokens_in
+        self.tokens_out += max_tokens[0] + ITEM_OUTPUT_TOKENS
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"model_id": self.model_id, "temperature": self.temperature, "prompt_version": self.prompt_version,
+                "constrained": self.constrained, "items": self.items, "item_max_tokens": self.item_max_tokens,
+                "max_tokens": min(self.output_limit, self.tokens_out), "tokens_in_est": self.tokens_in}
+
+
+def plan_packs(requests: Iterable[Dict[str, Any]], max_items: int = PACK_MAX_ITEMS) -> Iterator[Dict[str, Any]]:
+    """
+    Chia dòng request (cùng định dạng iter_invoke_many) thành các gói, theo thứ tự input.
+    Mỗi gói: items [(index, request)], model_id, temperature, prompt_version, constrained, max_tokens (cả gói),
+    item_max_tokens [(max_tokens, auto)], tokens_in_est; gói một mô tả chạy như request thường; "kb_dish"
+    có nghĩa mô tả đã được knowledge base trả lời.
+    """
+    kb = get_knowledge_base()
+    estimator = get_token_estimator()
+    current: Optional[_Pack] = None
+    for index, req in enumerate(requests):
+        model_id = req.get("model_id") or MODEL_ID
+        desc = req.get("desc") or ""
+        if req.get("img") is not None or not desc.strip():
+            if current is not None:
+                yield current.to_dict()
+                current = None
+            yield {"items": [(index, req)]}
+            continue
+        if kb is not None and req.get("use_cache", True):
+            t0 = time.perf_counter()
+            dish_json = kb.lookup(desc)
+            if dish_json is not None:
+                if current is not None:
+                    yield current.to_dict()
+                    current = None
+                yield {"items": [(index, req)], "kb_dish": dish_json, "kb_t0": t0}
+                continue
+
+        key = _pack_key(req)
+        tokens_in = estimator.estimate_units(model_id, text_units(desc) + ITEM_INPUT_UNITS)
+        max_tokens = resolve_max_tokens(model_id, desc, int(req.get("max_tokens", MAX_TOKENS)), key[2], image=False)
+        if current is not None and (current.key != key
+                                    or not current.fits(tokens_in, max_tokens[0] + ITEM_OUTPUT_TOKENS, max_items)):
+            yield current.to_dict()
+            current = None
+        if current is None:
+            current = _Pack(key)
+        current.add(index, req, tokens_in, max_tokens)
+    if current is not None:
+        yield current.to_dict()
+
+
+# =========================
+# Đọc output gói
+# =========================
+def parse_packed(text: str) -> List[Tuple[Any, Any]]:
+    """
+    Các phần tử (index, object) của JSON array trong output, theo thứ tự; index None nếu phần tử không ghi.
+    Dừng ở phần tử hỏng hoặc bị cắt đầu tiên: các phần tử trước đó vẫn dùng được.
+    """
+    m = _ARRAY_START.search(text)
+    if m is None:
+        return []
+    elements = []
+    pos, end = m.start() + 1, len(text)
+    while True:
+        while pos < end and text[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= end or text[pos] != "{":
+            break
+        try:
+            obj, pos = _DECODER.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            break
+        index = obj.pop("index", None) if isinstance(obj, dict) else None
+        elements.append((index, obj))
+    return elements
+
+
+def _element_index(index: Any, position: int, size: int) -> Optional[int]:
+    if index is None:
+        return position
+    try:
+        index = int(index)
+    except (TypeError, ValueError):
+        return None
+    return index if 0 <= index < size else None
+
+
+def validate_packed(text: str, size: int) -> Dict[int, Any]:
+    """{index: Dish} của các phần tử hợp lệ; mỗi index lấy phần tử hợp lệ đầu tiên."""
+    from . import schema
+
+    dishes: Dict[int, Any] = {}
+    for position, (index, obj) in enumerate(parse_packed(text)):
+        index = _element_index(index, position, size)
+        if index is None or index in dishes:
+            continue
+        try:
+            dishes[index] = schema.Dish.model_validate(obj)
+        except ValueError as e:  # pydantic ValidationError
+            logger.info(f"Packed item {index} invalid: {e}")
+    return dishes
+
+
+# =========================
+# Chạy gói
+# =========================
+def _share(total: int, n: int, i: int) -> int:
+    """Phần của mô tả thứ i khi chia đều `total` cho n mô tả (tổng các phần đúng bằng total)."""
+    return total // n + (1 if i < total % n else 0)
+
+
+def _kb_result(index: int, req: Dict[str, Any], pack: Dict[str, Any]) -> Dict[str, Any]:
+    model_id = req.get("model_id") or MODEL_ID
+    metrics = kb_metrics(get_knowledge_base(), model_id, req.get("desc") or "", int(req.get("prompt_version", 0)),
+                          pack["kb_dish"], pack["kb_t0"], {})
+    return {"index": index, "id": req.get("id", index), "model_id": model_id, "ok": True,
+            "raw": dish_response(pack["kb_dish"]), "metrics": metrics, "error": None}
+
+
+def run_pack(bedrock_client, pack_index: int, pack: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Chạy một gói (đơn vị việc của iter_invoke_many). Trả về {"index": pack_index, "items": [kết quả]},
+    mỗi kết quả như của iter_invoke_many, kèm "pack" (size, position, tokens_in, tokens_in_unpacked_est,
+    reissued, reissue_tokens_in). Token/chi phí của lần gọi gói được chia đều cho các mô tả trong gói.
+    """
+    items = pack["items"]
+    if "kb_dish" in pack:
+        return {"index": pack_index, "items": [_kb_result(*items[0], pack)]}
+    if len(items) == 1:
+        return {"index": pack_index, "items": [run_one(bedrock_client, *items[0])]}
+
+    model_id, size = pack["model_id"], len(items)
+    adapter = get_adapter(model_id)
+    estimator = get_token_estimator()
+    body = adapter.build_packed_body([req.get("desc") or "" for _, req in items], pack["temperature"],
+                                     pack["max_tokens"], pack["constrained"])
+    t0 = time.perf_counter()
+    raw = hdrs = None
+    text = ""
+    try:
+        with span("pack_call", model_id):
+            raw, hdrs = bedrock_client.invoke(model_id=model_id, body=body)
+        text = adapter.extract_text(raw)
+        if pack["constrained"] and text.startswith("{"):
+            text = PACKED_PREFILL + text  # prefill nằm trong request, không có trong output
+    except Exception as e:
+        logger.warning(f"Packed request failed ({size} items, {model_id}): {e}")
+    latency = time.perf_counter() - t0
+
+    tokens_in, tokens_out = adapter.token_counts(raw, hdrs) if raw else (None, None)
+    estimated = not tokens_in
+    if estimated:
+        tokens_in = pack["tokens_in_est"] if raw else 0
+    if not tokens_out:
+        tokens_out = estimator.estimate_units(model_id, text_units(text)) if text else 0
+    tokens_in, tokens_out = int(tokens_in), int(tokens_out)
+    cost_in_1k, cost_out_1k = get_model_cost_estimates(model_id)
+
+    dishes = validate_packed(text, size) if text else {}
+    telemetry = get_telemetry()
+    telemetry.inc("food_pack_items_total", len(dishes), model=model_id, outcome="ok")
+    results = []
+    for position, ((index, req), (item_max_tokens, auto)) in enumerate(zip(items, pack["item_max_tokens"])):
+        share_in, share_out = _share(tokens_in, size, position), _share(tokens_out, size, position)
+        info = {"size": size, "position": position, "tokens_in": share_in,
+                "tokens_in_unpacked_est": estimator.estimate(model_id, req.get("desc") or "",
+                                                             pack["prompt_version"]),
+                "reissued": position not in dishes, "reissue_tokens_in": 0}
+        if position in dishes:
+            metrics = {
+                "latency_s": round(latency, 2),
+                "time_to_first_ingredient_s": round(latency, 2),
+                "tokens_in": share_in,
+                "tokens_out": share_out,
+                "tokens_in_estimated": estimated,
+                "cost_est_usd": round((share_in / 1000.0) * cost_in_1k + (share_out / 1000.0) * cost_out_1k, 6),
+                "cost_saved_usd": 0.0,
+                "cache": "bypass",
+                "max_tokens": item_max_tokens,
+                "max_tokens_auto": auto,
+                "constrained": pack["constrained"],
+                "stages": {"pack_call": round(latency, 6)},
+            }
+            dish = dishes[position]
+            result = {"index": index, "id": req.get("id", index), "model_id": model_id, "ok": True,
+                      "raw": dish_response(dish.model_dump_json()), "metrics": metrics, "dish": dish,
+                      "error": None}
+        else:
+            # Gửi lại riêng mô tả này; phần token của nó trong lần gọi gói vẫn tính vào kết quả
+            telemetry.inc("food_pack_items_total", model=model_id, outcome="reissued")
+            result = run_one(bedrock_client, index, req)
+            if result["ok"]:
+                metrics = result["metrics"]
+                info["reissue_tokens_in"] = metrics.get("tokens_in", 0)
+                metrics["tokens_in"] = metrics.get("tokens_in", 0) + share_in
+                metrics["tokens_out"] = metrics.get("tokens_out", 0) + share_out
+                metrics["cost_est_usd"] = round(metrics.get("cost_est_usd", 0.0) + (share_in / 1000.0) * cost_in_1k
+                                                + (share_out / 1000.0) * cost_out_1k, 6)
+        result["pack"] = info
+        results.append(result)
+    return {"index": pack_index, "items": results}
+
+
+def iter_invoke_packed(
+    bedrock_client,
+    requests: Iterable[Dict[str, Any]],
+    max_concurrency: int = 8,
+    ordered: bool = True,
+    max_items: int = PACK_MAX_ITEMS,
+) -> Iterator[Dict[str, Any]]:
+    """Như iter_invoke_many nhưng gói các mô tả text liên tiếp vào chung request; kết quả vẫn từng mô tả."""
+    for pack_result in iter_invoke_many(bedrock_client, plan_packs(requests, max_items), max_concurrency,
+                                        ordered, run=run_pack):
+        yield from pack_result["items"]
+
+
+def estimate_packing(requests: Iterable[Dict[str, Any]], max_items: int = PACK_MAX_ITEMS) -> Dict[str, Any]:
+    """Ước lượng trước (không gọi Bedrock): số request và input token khi gói so với mỗi mô tả một request."""
+    estimator = get_token_estimator()
+    stats = {"items": 0, "requests": 0, "requests_unpacked": 0, "tokens_in_est": 0, "tokens_in_unpacked_est": 0}
+    for pack in plan_packs(requests, max_items):
+        items = pack["items"]
+        stats["items"] += len(items)
+        if "kb_dish" in pack:
+            continue
+        stats["requests"] += 1
+        stats["requests_unpacked"] += len(items)
+        unpacked = sum(estimator.estimate(req.get("model_id") or MODEL_ID, req.get("desc") or "",
+                                          int(req.get("prompt_version", 0))) for _, req in items)
+        stats["tokens_in_unpacked_est"] += unpacked
+        stats["tokens_in_est"] += pack["tokens_in_est"] if len(items) > 1 else unpacked
+    stats["requests_saved"] = stats["requests_unpacked"] - stats["requests"]
+    stats["tokens_in_saved_est"] = stats["tokens_in_unpacked_est"] - stats["tokens_in_est"]
+    stats["tokens_in_saved_pct"] = round(100 * stats["tokens_in_saved_est"] / stats["tokens_in_unpacked_est"], 1) \
+        if stats["tokens_in_unpacked_est"] else 0.0
+    return stats
@@ -1,10 +1,15 @@
-from typing import Any, Dict
-from pydantic import ValidationError
-from .schema import Dish
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any, Dict, Optional
+from .adapters import get_adapter
+from .json_extract import find_json_object, is_unterminated
+from .telemetry import get_telemetry, span
 from .utils import get_logger
 import json
 import re
 
+if TYPE_CHECKING:
+    from .schema import Dish
+
 logger = get_logger("parser")
 
 def _strip_code_fences(text: str) -> str:
@@ -15,33 +20,31 @@ def _strip_code_fences(text: str) -> str:
         t = re.sub(r"\n?```$", "", t).strip()
     return t
 
+def _clean_json_candidate(text: str) -> Optional[str]:
+    """Text chỉ gồm một object JSON (có thể bọc code fence) thì trả lại để validate thẳng; không thì None."""
+    t = text.strip()
+    if t.startswith("```"):
+        t = _strip_code_fences(t)
+    return t if t[:1] == "{" and t[-1:] == "}" else None
+
 def _extract_json_from_text(text: str) -> str:
     """
-    Cố gắng tìm khối JSON { ... } đầu tiên hợp lệ trong chuỗi.
-    Duyệt theo dấu ngoặc nhọn để bắt cặp.
+    Tìm khối JSON { ... } đầu tiên hợp lệ trong chuỗi (bỏ qua ngoặc nằm trong string).
+    JSON bị cắt sẽ được sửa cấu trúc; không có '{' thì trả lại text.
     """
-    t = _strip_code_fences(text)
-    start = t.find("{")
-    if start == -1:
-        return t
-    depth = 0
-    for i in range(start, len(t)):
-        if t[i] == "{":
-            depth += 1
-        elif t[i] == "}":
-            depth -= 1
-            if depth == 0:
-                candidate = t[start:i+1]
-                try:
-                    json.loads(candidate)
-                    return candidate
-                except Exception:
-                    break
+    try:
+        return find_json_object(text)[0]
+    except ValueError:
+        return _strip_code_fences(text)
 
-    m = re.search(r"\{[\s\S]*\}", t)
-    return m.group(0) if m else t
+def extract_text(model_response: Dict[str, Any], model_id: Optional[str] = None) -> str:
+    """
+    Lấy text model trả về. Biết model_id thì đọc thẳng theo adapter của họ model;
+    không thì dò lần lượt các định dạng (Claude, Titan, Nova, Llama, key chung).
+    """
+    if model_id:
+        return get_adapter(model_id).extract_text(model_response)
 
-def extract_text(model_response: Dict[str, Any]) -> str:
     # Claude-like: {"content":[{"type":"text","text":"..."}]}
     content = model_response.get("content", [])
     if content and isinstance(content, list) and len(content) > 0:
@@ -76,16 +79,78 @@ def extract_text(model_response: Dict[str, Any]) -> str:
         if key in model_response:
             return str(model_response[key]).strip()
     
-    logger.error(f"Cannot extract text from response: {model_response}")
+    logger.error(f"Cannot extract text from response: keys={list(model_response.keys())}")
     raise ValueError("Unexpected response format: no recognizable text content")
 
-def parse_and_validate(model_response: Dict[str, Any]) -> Dish:
+# Model dừng vì gặp stop sequence (Claude/Nova "stop_sequence", Titan "STOP_CRITERIA_MET")
+STOP_SEQUENCE_REASONS = frozenset({"stop_sequence", "STOP_CRITERIA_MET"})
+
+def restore_prefill(text: str, stop_reason: Optional[str] = None, prefill: str = "{") -> str:
+    """
+    Text của request ràng buộc output (prompt_builder.constrain_*) -> JSON đầy đủ.
+    - Prefill '{' nằm trong request nên không có trong output: thêm lại khi text bắt đầu như phần thân object
+      (key '"' hoặc '}'); model bỏ qua prefill (tự viết lại '{', lời dẫn, fence) thì giữ nguyên cho parser tìm.
+    - Stop sequence "}\n\n" không nằm trong output nên mất '}' đóng object: model dừng vì stop sequence
+      mà object chỉ thiếu đúng dấu đó thì thêm lại. Bị cắt vì hết token thì để continuation/parser xử lý.
+    """
+    if prefill and text.lstrip()[:1] in ('"', "}"):
+        text = prefill + text
+    if stop_reason in STOP_SEQUENCE_REASONS and is_unterminated(text):
+        closed = text.rstrip() + "}"
+        if not is_unterminated(closed):
+            return closed
+    return text
+
+def _drop_partial_ingredients(data: Any) -> Any:
+    """JSON đã sửa sau khi bị cắt: bỏ nguyên liệu cuối thiếu trường bắt buộc thay vì fail cả món."""
+    items = data.get("ingredients") if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        return data
+    from . import schema
+    kept = []
+    for item in items:
+        try:
+            schema.Ingredient.model_validate(item)
+            kept.append(item)
+        except ValueError:  # pydantic ValidationError
+            logger.warning("Dropping incomplete ingredient from truncated output: %s", item)
+    return {**data, "ingredients": kept}
+
+def parse_and_validate(model_response: Dict[str, Any], model_id: Optional[str] = None) -> Dish:
+    """
+    Fast path: text là JSON sạch thì validate thẳng bằng TypeAdapter(Dish).validate_json.
+    Chỉ khi JSON không parse được (lẫn chữ, bị cắt...) mới đi đường chậm: tìm/sửa object rồi json.loads.
+    """
+    # pydantic nạp lười ở lần validate đầu tiên. Không dùng "from .schema import ...": module có
+    # __getattr__ nên mỗi lần import như vậy tốn một AttributeError (__path__)
+    from . import schema
     try:
-        raw_text = extract_text(model_response)
-        json_text = _extract_json_from_text(raw_text)
-        data = json.loads(json_text)
-        return Dish.model_validate(data)
-    except (json.JSONDecodeError, ValidationError, ValueError) as e:
+        with span("extract_json", model_id):
+            raw_text = extract_text(model_response, model_id)
+        candidate = _clean_json_candidate(raw_text)
+        if candidate is not None:
+            with span("pydantic_validate", model_id):
+                try:
+                    dish = schema.dish_adapter().validate_json(candidate)
+                    get_telemetry().inc("food_parse_path_total", model=model_id or "", path="fast")
+                    return dish
+                except ValueError as e:  # pydantic ValidationError
+                    # JSON hợp lệ nhưng sai schema: đường chậm cũng cho cùng lỗi
+                    if not any(err["type"] == "json_invalid" for err in e.errors()):
+                        raise
+        with span("json_repair", model_id):
+            try:
+                json_text, repaired = find_json_object(raw_text)
+            except ValueError:
+                json_text, repaired = _strip_code_fences(raw_text), False
+            data = json.loads(json_text)
+        with span("pydantic_validate", model_id):
+            if repaired:
+                data = _drop_partial_ingredients(data)
+            dish = schema.Dish.model_validate(data)
+        get_telemetry().inc("food_parse_path_total", model=model_id or "", path="repair")
+        return dish
+    except ValueError as e:  # gồm json.JSONDecodeError và pydantic ValidationError
         logger.exception("Failed to parse/validate: %s", e)
 
         logger.error("Raw text (head): %s", raw_text[:500] if 'raw_text' in locals() else "")
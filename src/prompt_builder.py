@@ -1,5 +1,46 @@
 import json
-from .schema import DISH_JSON_SCHEMA
+from functools import lru_cache
+from typing import Callable
+
+# =========================
+# Prompt compilation
+# =========================
+# Mỗi template chỉ phụ thuộc vào mô tả món ăn; phần còn lại (schema, ví dụ, hướng dẫn)
+# là cố định. Template được render MỘT lần với marker ở vị trí mô tả, tách thành
+# (prefix, suffix); mỗi request chỉ còn nối prefix + desc + suffix.
+_DESC_MARKER = "\x00__DESC__\x00"
+
+
+@lru_cache(maxsize=None)
+def _schema_str() -> str:
+    # import lười: pydantic chỉ được nạp khi render prompt lần đầu
+    from .schema import dish_json_schema
+    return json.dumps(dish_json_schema(), ensure_ascii=False)
+
+
+@lru_cache(maxsize=None)
+def _example_str() -> str:
+    return json.dumps(FEW_SHOT_EXAMPLE, ensure_ascii=False)
+
+
+def _compiled_template(render: Callable[[str], str]) -> Callable[[str], str]:
+    """
+    Decorator: biến hàm render(desc) -> str thành bản đã biên dịch sẵn.
+    Bản gốc (chưa biên dịch) vẫn truy cập được qua thuộc tính `.render`.
+    """
+    parts = None
+
+    def splice(desc: str) -> str:
+        nonlocal parts
+        if parts is None:
+            prefix, suffix = render(_DESC_MARKER).split(_DESC_MARKER)
+            parts = (prefix, suffix)
+        return parts[0] + desc + parts[1]
+
+    splice.__name__ = render.__name__
+    splice.__doc__ = render.__doc__
+    splice.render = render
+    return splice
 
 # =========================
 # System prompts 
@@ -52,7 +93,13 @@ FEW_SHOT_EXAMPLE = {
 # =========================
 def build_user_text(user_dish_description: str, include_example: bool = True) -> str:
     """User text mặc định (prompt gốc)."""
-    schema_str = json.dumps(DISH_JSON_SCHEMA, ensure_ascii=False)
+    if include_example:
+        return _user_text_default(user_dish_description)
+    return _user_text_default_no_example(user_dish_description)
+
+
+def _render_user_text_default(user_dish_description: str, include_example: bool) -> str:
+    schema_str = _schema_str()
 
     user_text = f"""
     Nhiệm vụ: Từ mô tả sau, hãy xuất JSON nguyên liệu theo đúng schema.
@@ -82,7 +129,7 @@ def build_user_text(user_dish_description: str, include_example: bool = True) ->
     {schema_str}"""
 
     if include_example:
-        example_str = json.dumps(FEW_SHOT_EXAMPLE, ensure_ascii=False)
+        example_str = _example_str()
         user_text += f"""
 
     Ví dụ (chỉ tham khảo, KHÔNG lẫn vào output):
@@ -98,6 +145,16 @@ def build_user_text(user_dish_description: str, include_example: bool = True) ->
 
     return user_text.strip()
 
+
+@_compiled_template
+def _user_text_default(desc: str) -> str:
+    return _render_user_text_default(desc, include_example=True)
+
+
+@_compiled_template
+def _user_text_default_no_example(desc: str) -> str:
+    return _render_user_text_default(desc, include_example=False)
+
 # ---- Claude (Anthropic) - mặc định ----
 def build_prompt(user_dish_description: str, temperature: float = 0.2, max_tokens: int = 512):
     user_text = build_user_text(user_dish_description)
@@ -110,15 +167,19 @@ def build_prompt(user_dish_description: str, temperature: float = 0.2, max_token
     }
 
 # ---- Titan Text - mặc định ----
-def build_prompt_titan(user_dish_description: str, temperature: float = 0.2, max_tokens: int = 512):
-    user_text = build_user_text(user_dish_description)
+@_compiled_template
+def _titan_input_text(desc: str) -> str:
     guard = ("CHỈ TRẢ 1 JSON hợp lệ theo schema. "
              "KHÔNG in schema/giải thích/markdown. "
              "'dish_name' bắt buộc có giá trị (không rỗng).")
     example = ('Ví dụ (tham khảo, KHÔNG lẫn vào output): '
                '{"dish_name":"Phở bò","cuisine":"Vietnamese","ingredients":[{"name":"bánh phở","quantity":"200","unit":"g"}]}')
+    return f"{SYSTEM_INSTRUCTIONS}\n\n{guard}\n\n{example}\n\n{build_user_text(desc)}"
+
+
+def build_prompt_titan(user_dish_description: str, temperature: float = 0.2, max_tokens: int = 512):
     return {
-        "inputText": f"{SYSTEM_INSTRUCTIONS}\n\n{guard}\n\n{example}\n\n{user_text}",
+        "inputText": _titan_input_text(user_dish_description),
         "textGenerationConfig": {
             "temperature": temperature, "topP": 0.9,
             "maxTokenCount": max_tokens, "stopSequences": []
@@ -126,10 +187,13 @@ def build_prompt_titan(user_dish_description: str, temperature: float = 0.2, max
     }
 
 # ---- Llama - mặc định ----
+@_compiled_template
+def _llama_prompt_text(desc: str) -> str:
+    return f"{SYSTEM_INSTRUCTIONS}\n\n{build_user_text(desc, include_example=False)}"
+
+
 def build_prompt_llama(user_dish_description: str, temperature: float = 0.2, max_tokens: int = 512):
-    user_text = build_user_text(user_dish_description, include_example=False)
-    prompt_text = f"{SYSTEM_INSTRUCTIONS}\n\n{user_text}"
-    return {"prompt": prompt_text, "temperature": temperature, "top_p": 0.9, "max_gen_len": max_tokens}
+    return {"prompt": _llama_prompt_text(user_dish_description), "temperature": temperature, "top_p": 0.9, "max_gen_len": max_tokens}
 
 # ---- Nova (messages-v1) - mặc định ----
 def build_prompt_nova(user_dish_description: str, temperature: float = 0.2, max_tokens: int = 512):
@@ -151,10 +215,30 @@ def build_prompt_with_image(
     temperature: float = 0.2,
     max_tokens: int = 512,
 ):
-    schema_str = json.dumps(DISH_JSON_SCHEMA, ensure_ascii=False)
-    example_str = json.dumps(FEW_SHOT_EXAMPLE, ensure_ascii=False)
+    user_text = _image_user_text(user_dish_description)
+    return {
+        "anthropic_version": "bedrock-2023-05-31",
+        "system": SYSTEM_INSTRUCTIONS_IMAGE,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "image", "source": {"type": "base64", "media_type": image_mime, "data": image_b64}},
+                    {"type": "text", "text": user_text},
+                ],
+            }
+        ],
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+
 
-    user_text = f"""Hãy PHÂN LOẠI ảnh thành một trong ba loại: dish | ingredient | none.
+@_compiled_template
+def _image_user_text(user_dish_description: str) -> str:
+    schema_str = _schema_str()
+    example_str = _example_str()
+
+    return f"""Hãy PHÂN LOẠI ảnh thành một trong ba loại: dish | ingredient | none.
                     QUY TẮC:
                     - none: trả về {{ "dish_name": null, "cuisine": null, "ingredients": [] }}
                     - ingredient: trả về {{ "dish_name": null, "cuisine": null, "ingredients": [...] }}
@@ -175,21 +259,6 @@ def build_prompt_with_image(
                     {example_str}
 
                     Tự kiểm tra JSON hợp lệ theo schema trước khi trả."""
-    return {
-        "anthropic_version": "bedrock-2023-05-31",
-        "system": SYSTEM_INSTRUCTIONS_IMAGE,
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "image", "source": {"type": "base64", "media_type": image_mime, "data": image_b64}},
-                    {"type": "text", "text": user_text},
-                ],
-            }
-        ],
-        "temperature": temperature,
-        "max_tokens": max_tokens,
-    }
 
 def build_prompt_nova_with_image(
     user_dish_description: str,
@@ -207,10 +276,29 @@ def build_prompt_nova_with_image(
     elif lmime == "image/gif":
         fmt = "gif"
 
-    schema_str = json.dumps(DISH_JSON_SCHEMA, ensure_ascii=False)
-    example_str = json.dumps(FEW_SHOT_EXAMPLE, ensure_ascii=False)
+    user_text = _nova_image_user_text(user_dish_description)
+    return {
+        "schemaVersion": "messages-v1",
+        "system": [{"text": SYSTEM_INSTRUCTIONS_IMAGE}],
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {"text": user_text},
+                    {"image": {"format": fmt, "source": {"bytes": image_b64}}},
+                ],
+            }
+        ],
+        "inferenceConfig": {"temperature": temperature, "topP": 0.9, "maxTokens": max_tokens},
+    }
 
-    user_text = f"""PHÂN LOẠI ảnh: dish | ingredient | none.
+
+@_compiled_template
+def _nova_image_user_text(user_dish_description: str) -> str:
+    schema_str = _schema_str()
+    example_str = _example_str()
+
+    return f"""PHÂN LOẠI ảnh: dish | ingredient | none.
                 QUY TẮC ĐIỀN JSON:
                 - none ⇒ dish_name = null, cuisine = null, ingredients = []
                 - ingredient ⇒ dish_name = null, cuisine = null, có thể liệt kê ingredients nếu nhận ra
@@ -229,27 +317,14 @@ def build_prompt_nova_with_image(
 
                 Mô tả bổ sung (nếu có):
                 \"\"\"{user_dish_description}\"\"\""""
-    return {
-        "schemaVersion": "messages-v1",
-        "system": [{"text": SYSTEM_INSTRUCTIONS_IMAGE}],
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {"text": user_text},
-                    {"image": {"format": fmt, "source": {"bytes": image_b64}}},
-                ],
-            }
-        ],
-        "inferenceConfig": {"temperature": temperature, "topP": 0.9, "maxTokens": max_tokens},
-    }
 
 # =========================
 # Prompt Version 1 / 2 / 3 (TEXT) cho từng model
 # =========================
 
+@_compiled_template
 def _user_text_v1(desc: str) -> str:
-    schema_str = json.dumps(DISH_JSON_SCHEMA, ensure_ascii=False)
+    schema_str = _schema_str()
     return (
         "Trích xuất NGUYÊN LIỆU từ mô tả món ăn thành JSON.\n\n"
         f'Input: """{desc}"""\n\n'
@@ -262,8 +337,9 @@ def _user_text_v1(desc: str) -> str:
         'Ví dụ: {"dish_name":"Phở bò","ingredients":[{"name":"bánh phở","quantity":"200","unit":"g"}]}'
     ).strip()
 
+@_compiled_template
 def _user_text_v2(desc: str) -> str:
-    schema_str = json.dumps(DISH_JSON_SCHEMA, ensure_ascii=False)
+    schema_str = _schema_str()
     return (
         "Trích xuất nguyên liệu → JSON. Chỉ trả JSON.\n\n"
         f'Input: """{desc}"""\n\n'
@@ -274,8 +350,9 @@ def _user_text_v2(desc: str) -> str:
         f"Schema: {schema_str}"
     ).strip()
 
+@_compiled_template
 def _user_text_v3(desc: str) -> str:
-    schema_str = json.dumps(DISH_JSON_SCHEMA, ensure_ascii=False)
+    schema_str = _schema_str()
     return (
         "TASK: Extract ingredients → JSON\n"
         f'INPUT: """{desc}"""\n'
@@ -332,64 +409,83 @@ EXAMPLE = ('Ví dụ (tham khảo, KHÔNG lẫn vào output): '
            '{"dish_name":"Phở bò","cuisine":"Vietnamese","ingredients":[{"name":"bánh phở","quantity":"200","unit":"g"}]}')
 
 
+@_compiled_template
+def _titan_input_v1(desc: str) -> str:
+    # return f"{SYSTEM_SHORT}\n\n{_user_text_v1(desc)}"
+    return f"{SYSTEM_SHORT}\n\n{GUARD}\n\n{EXAMPLE}\n\n{_user_text_v1(desc)}"
+
 def build_prompt_titan_v1(desc: str, temperature: float = 0.2, max_tokens: int = 512):
     return {
-        # "inputText": f"{SYSTEM_SHORT}\n\n{_user_text_v1(desc)}",
-        "inputText": f"{SYSTEM_SHORT}\n\n{GUARD}\n\n{EXAMPLE}\n\n{_user_text_v1(desc)}",
+        "inputText": _titan_input_v1(desc),
         "textGenerationConfig": {"temperature": temperature, "topP": 0.9, "maxTokenCount": max_tokens, "stopSequences": []},
     }
 
+@_compiled_template
+def _titan_input_v2(desc: str) -> str:
+    # return f"{SYSTEM_SHORT}\n\n{_user_text_v2(desc)}"
+    return f"{SYSTEM_SHORT}\n\n{GUARD}\n\n{EXAMPLE}\n\n{_user_text_v2(desc)}"
+
 def build_prompt_titan_v2(desc: str, temperature: float = 0.2, max_tokens: int = 512):
     return {
-        # "inputText": f"{SYSTEM_SHORT}\n\n{_user_text_v2(desc)}",
-        "inputText": f"{SYSTEM_SHORT}\n\n{GUARD}\n\n{EXAMPLE}\n\n{_user_text_v2(desc)}",
+        "inputText": _titan_input_v2(desc),
         "textGenerationConfig": {"temperature": temperature, "topP": 0.9, "maxTokenCount": max_tokens, "stopSequences": []},
     }
 
+@_compiled_template
+def _titan_input_v3(desc: str) -> str:
+    # return f"{SYSTEM_SHORT}\n\n{_user_text_v3(desc)}"
+    return f"{SYSTEM_SHORT}\n\n{GUARD}\n\n{EXAMPLE}\n\n{_user_text_v3(desc)}"
+
 def build_prompt_titan_v3(desc: str, temperature: float = 0.2, max_tokens: int = 512):
     return {
-        # "inputText": f"{SYSTEM_SHORT}\n\n{_user_text_v3(desc)}",
-        "inputText": f"{SYSTEM_SHORT}\n\n{GUARD}\n\n{EXAMPLE}\n\n{_user_text_v3(desc)}",
+        "inputText": _titan_input_v3(desc),
         "textGenerationConfig": {"temperature": temperature, "topP": 0.9, "maxTokenCount": max_tokens, "stopSequences": []},
     }
 
 # ---- Llama V1/V2/V3 ----
+LLAMA_FOCUS = (
+    "LƯU Ý QUAN TRỌNG:\n"
+    "- 'dish_name' LUÔN phải có tên món ăn, không được để trống hoặc rỗng.\n"
+    "- Nếu không chắc chắn, hãy dùng mô tả món ăn của người dùng để điền 'dish_name'.\n"
+)
+
+
+@_compiled_template
+def _llama_prompt_v1(desc: str) -> str:
+    return f"{SYSTEM_SHORT}\n\n{LLAMA_FOCUS}\n\n{_user_text_v1(desc)}"
+
+
 def build_prompt_llama_v1(desc: str, temperature: float = 0.2, max_tokens: int = 512):
-    focus_instruction = (
-        "LƯU Ý QUAN TRỌNG:\n"
-        "- 'dish_name' LUÔN phải có tên món ăn, không được để trống hoặc rỗng.\n"
-        "- Nếu không chắc chắn, hãy dùng mô tả món ăn của người dùng để điền 'dish_name'.\n"
-    )
     return {
-        "prompt": f"{SYSTEM_SHORT}\n\n{focus_instruction}\n\n{_user_text_v1(desc)}",
+        "prompt": _llama_prompt_v1(desc),
         "temperature": temperature,
         "top_p": 0.9,
         "max_gen_len": max_tokens,
     }
 
 
+@_compiled_template
+def _llama_prompt_v2(desc: str) -> str:
+    return f"{SYSTEM_SHORT}\n\n{LLAMA_FOCUS}\n\n{_user_text_v2(desc)}"
+
+
 def build_prompt_llama_v2(desc: str, temperature: float = 0.2, max_tokens: int = 512):
-    focus_instruction = (
-        "LƯU Ý QUAN TRỌNG:\n"
-        "- 'dish_name' LUÔN phải có tên món ăn, không được để trống hoặc rỗng.\n"
-        "- Nếu không chắc chắn, hãy dùng mô tả món ăn của người dùng để điền 'dish_name'.\n"
-    )
     return {
-        "prompt": f"{SYSTEM_SHORT}\n\n{focus_instruction}\n\n{_user_text_v2(desc)}",
+        "prompt": _llama_prompt_v2(desc),
         "temperature": temperature,
         "top_p": 0.9,
         "max_gen_len": max_tokens,
     }
 
 
+@_compiled_template
+def _llama_prompt_v3(desc: str) -> str:
+    return f"{SYSTEM_SHORT}\n\n{LLAMA_FOCUS}\n\n{_user_text_v3(desc)}"
+
+
 def build_prompt_llama_v3(desc: str, temperature: float = 0.2, max_tokens: int = 512):
-    focus_instruction = (
-        "LƯU Ý QUAN TRỌNG:\n"
-        "- 'dish_name' LUÔN phải có tên món ăn, không được để trống hoặc rỗng.\n"
-        "- Nếu không chắc chắn, hãy dùng mô tả món ăn của người dùng để điền 'dish_name'.\n"
-    )
     return {
-        "prompt": f"{SYSTEM_SHORT}\n\n{focus_instruction}\n\n{_user_text_v3(desc)}",
+        "prompt": _llama_prompt_v3(desc),
         "temperature": temperature,
         "top_p": 0.9,
         "max_gen_len": max_tokens,
@@ -420,3 +516,116 @@ def build_prompt_nova_v3(desc: str, temperature: float = 0.2, max_tokens: int =
         "messages": [{"role": "user", "content": [{"text": _user_text_v3(desc)}]}],
         "inferenceConfig": {"temperature": temperature, "topP": 0.9, "maxTokens": max_tokens},
     }
+
+
+# =========================
+# Ràng buộc output (OUTPUT_CONSTRAINED): áp lên body của mọi builder cùng họ model
+# =========================
+# Model chỉ còn viết phần sau '{' nên không có lời dẫn, ```json fence hay giải thích phía trước;
+# stop sequence cắt phần thừa phía sau ngay khi object đã đóng. Prefill và stop sequence không nằm
+# trong output: parser.restore_prefill thêm lại '{' đầu và '}' cuối.
+OUTPUT_PREFILL = "{"
+# "}\n\n": object đã đóng rồi xuống dòng trống (giải thích, JSON thứ hai); JSON không có dòng trống bên trong.
+# "```": code fence đóng.
+JSON_STOP_SEQUENCES = ["}\n\n", "```"]
+# Titan chỉ nhận "|" hoặc "User:" làm stop sequence; hết câu trả lời Titan hay tự viết tiếp lượt "User:"
+TITAN_STOP_SEQUENCES = ["User:"]
+# Llama trên Bedrock không có tham số stop sequence: prompt theo chat template của Llama 3, lượt assistant
+# mở sẵn bằng '{'; model kết thúc lượt bằng <|eot_id|> thay vì viết tiếp "assistant\n\n..."
+LLAMA3_CHAT_TEMPLATE = (
+    "<|begin_of_text|><|start_header_id|>user<|end_header_id|>\n\n{prompt}<|eot_id|>"
+    "<|start_header_id|>assistant<|end_header_id|>\n\n"
+)
+
+
+def constrain_claude(body: dict, prefill: str = OUTPUT_PREFILL, stop_sequences=JSON_STOP_SEQUENCES) -> dict:
+    turn = {"role": "assistant", "content": [{"type": "text", "text": prefill}]}
+    return {**body, "messages": [*body["messages"], turn], "stop_sequences": list(stop_sequences)}
+
+
+def constrain_nova(body: dict, prefill: str = OUTPUT_PREFILL, stop_sequences=JSON_STOP_SEQUENCES) -> dict:
+    turn = {"role": "assistant", "content": [{"text": prefill}]}
+    config = {**body.get("inferenceConfig", {}), "stopSequences": list(stop_sequences)}
+    return {**body, "messages": [*body["messages"], turn], "inferenceConfig": config}
+
+
+def constrain_titan(body: dict, prefill: str = OUTPUT_PREFILL, stop_sequences=TITAN_STOP_SEQUENCES) -> dict:
+    config = {**body.get("textGenerationConfig", {}), "stopSequences": list(stop_sequences)}
+    return {**body, "inputText": f"{body['inputText']}\nBot: {prefill}", "textGenerationConfig": config}
+
+
+def constrain_llama(body: dict, prefill: str = OUTPUT_PREFILL, stop_sequences=()) -> dict:
+    # Không có tham số stop sequence: stop_sequences chỉ để cùng chữ ký với các họ model khác
+    prompt = LLAMA3_CHAT_TEMPLATE.format(prompt=body["prompt"]) + prefill
+    return {**body, "prompt": prompt}
+
+
+# =========================
+# Gói nhiều mô tả vào một request (xem src/packing.py)
+# =========================
+# Hướng dẫn, schema và ví dụ chỉ xuất hiện một lần cho cả gói; output là JSON array,
+# mỗi phần tử là một Dish kèm "index" của mô tả tương ứng.
+# Ràng buộc output của request gói: prefill '[' thay cho '{'; "]\n\n" là array đã đóng rồi xuống dòng trống
+# (không dùng "}\n\n": giữa hai phần tử có thể xuống dòng)
+PACKED_PREFILL = "["
+PACKED_STOP_SEQUENCES = ["]\n\n", "```"]
+PACKED_INSTRUCTIONS = (
+    "Bạn là trợ lý ẩm thực chuyên trích xuất nguyên liệu.\n"
+    "Yêu cầu: trả về DUY NHẤT một JSON array hợp lệ, mỗi phần tử là một JSON theo schema đã cho "
+    "kèm trường \"index\" là số thứ tự của mô tả.\n"
+    "Không trả lời giải thích, không thêm text ngoài JSON.\n"
+    "Nếu thông tin không chắc chắn, để trống hoặc bỏ qua trường đó thay vì bịa.\n"
+    "Ngôn ngữ ưu tiên: giữ tiếng Việt cho tên nguyên liệu.\n"
+)
+
+
+@lru_cache(maxsize=None)
+def _packed_header() -> str:
+    example = json.dumps({"index": 0, **FEW_SHOT_EXAMPLE}, ensure_ascii=False)
+    return (
+        "Nhiệm vụ: với TỪNG mô tả món ăn bên dưới, xuất JSON nguyên liệu theo đúng schema.\n"
+        "- Trả về một JSON array, mỗi mô tả đúng một phần tử, theo thứ tự index; không gộp hay bỏ mô tả nào.\n"
+        "- Mỗi phần tử: {\"index\": <số thứ tự mô tả>, ...các trường theo schema}.\n"
+        "- \"quantity\" chỉ chứa SỐ (\"200\", \"1\", \"0.5\"); \"unit\" là đơn vị phù hợp "
+        "(\"g\", \"ml\", \"củ\", \"nhánh\", \"ít\"), chỉ null khi thực sự không xác định được.\n\n"
+        f"Schema của mỗi phần tử (JSON Schema):\n{_schema_str()}\n\n"
+        f"Ví dụ một phần tử (chỉ tham khảo, KHÔNG lẫn vào output):\n{example}\n\n"
+        "Các mô tả món ăn:"
+    )
+
+
+def build_packed_user_text(descs) -> str:
+    items = "\n".join(f'[{i}] """{desc}"""' for i, desc in enumerate(descs))
+    return f"{_packed_header()}\n{items}"
+
+
+def build_prompt_packed(descs, temperature: float = 0.2, max_tokens: int = 4096):
+    return {
+        "anthropic_version": "bedrock-2023-05-31",
+        "system": PACKED_INSTRUCTIONS,
+        "messages": [{"role": "user", "content": [{"type": "text", "text": build_packed_user_text(descs)}]}],
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+
+
+def build_prompt_titan_packed(descs, temperature: float = 0.2, max_tokens: int = 4096):
+    return {
+        "inputText": f"{PACKED_INSTRUCTIONS}\n{build_packed_user_text(descs)}",
+        "textGenerationConfig": {"temperature": temperature, "topP": 0.9, "maxTokenCount": max_tokens,
+                                 "stopSequences": []},
+    }
+
+
+def build_prompt_llama_packed(descs, temperature: float = 0.2, max_tokens: int = 2048):
+    return {"prompt": f"{PACKED_INSTRUCTIONS}\n{build_packed_user_text(descs)}", "temperature": temperature,
+            "top_p": 0.9, "max_gen_len": max_tokens}
+
+
+def build_prompt_nova_packed(descs, temperature: float = 0.2, max_tokens: int = 4096):
+    return {
+        "schemaVersion": "messages-v1",
+        "system": [{"text": PACKED_INSTRUCTIONS}],
+        "messages": [{"role": "user", "content": [{"text": build_packed_user_text(descs)}]}],
+        "inferenceConfig": {"temperature": temperature, "topP": 0.9, "maxTokens": max_tokens},
+    }
@@ -0,0 +1,140 @@
+"""Giới hạn số request Bedrock đang chạy cùng lúc theo model, dùng chung trong process (AIMD).
+
+Mọi caller (các session Streamlit, worker batch, retry) lấy slot từ cùng một limiter của model:
+  - thành công: limit tăng cộng dồn (+1 sau khoảng `limit` request thành công),
+  - BedrockRateLimit: limit giảm một nửa, tối đa một lần cho mỗi "đợt" (chỉ request bắt đầu
+    sau lần giảm trước mới được giảm tiếp, giống TCP giảm một lần mỗi RTT),
+  - lỗi khác: giữ nguyên.
+Caller vượt limit xếp hàng FIFO; metrics: limit, số request đang chạy, độ dài hàng đợi, thời gian chờ.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from .telemetry import get_telemetry
+from .utils import (
+    get_logger, RATE_LIMIT_INITIAL, RATE_LIMIT_MIN, RATE_LIMIT_MAX, RATE_LIMIT_QUEUE_TIMEOUT_S,
+)
+
+logger = get_logger("rate_limiter")
+
+DECREASE_FACTOR = 0.5
+
+
+class LimiterTimeout(TimeoutError):
+    """Chờ slot quá RATE_LIMIT_QUEUE_TIMEOUT_S."""
+
+
+class _ModelState:
+    __slots__ = ("limit", "inflight", "queue", "last_decrease")
+
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.inflight = 0
+        self.queue: Deque[threading.Event] = deque()
+        self.last_decrease = 0.0
+
+
+class AdaptiveLimiter:
+    def __init__(self, initial: int = RATE_LIMIT_INITIAL, min_limit: int = RATE_LIMIT_MIN,
+                 max_limit: int = RATE_LIMIT_MAX, queue_timeout_s: float = RATE_LIMIT_QUEUE_TIMEOUT_S):
+        self.initial = float(initial)
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.queue_timeout_s = queue_timeout_s
+        self._lock = threading.Lock()
+        self._models: Dict[str, _ModelState] = {}
+
+    def _state(self, model_id: str) -> _ModelState:
+        state = self._models.get(model_id)
+        if state is None:
+            state = self._models[model_id] = _ModelState(
+                min(max(self.initial, self.min_limit), self.max_limit))
+        return state
+
+    def _capacity(self, state: _ModelState) -> int:
+        return max(self.min_limit, int(state.limit))
+
+    def _grant(self, state: _ModelState):
+        """Cấp slot cho người chờ đầu hàng (FIFO) khi còn chỗ; gọi khi đang giữ lock."""
+        while state.queue and state.inflight < self._capacity(state):
+            state.inflight += 1
+            state.queue.popleft().set()
+
+    def _publish(self, model_id: str, limit: float, inflight: int, queued: int):
+        telemetry = get_telemetry()
+        telemetry.set_gauge("food_bedrock_concurrency_limit", limit, model=model_id)
+        telemetry.set_gauge("food_bedrock_inflight", inflight, model=model_id)
+        telemetry.set_gauge("food_bedrock_queue_depth", queued, model=model_id)
+
+    def acquire(self, model_id: str, timeout: Optional[float] = None) -> float:
+        """Chờ tới lượt; trả về thời điểm bắt đầu (truyền lại cho release)."""
+        t0 = time.perf_counter()
+        waiter = None
+        with self._lock:
+            state = self._state(model_id)
+            if state.inflight < self._capacity(state) and not state.queue:
+                state.inflight += 1
+            else:
+                waiter = threading.Event()
+                state.queue.append(waiter)
+            snapshot = (state.limit, state.inflight, len(state.queue))
+        self._publish(model_id, *snapshot)
+
+        if waiter is not None:
+            timeout = self.queue_timeout_s if timeout is None else timeout
+            if not waiter.wait(timeout if timeout and timeout > 0 else None):
+                with self._lock:
+                    granted = waiter.is_set()  # được cấp đúng lúc hết giờ
+                    if not granted:
+                        state.queue.remove(waiter)
+                    snapshot = (state.limit, state.inflight, len(state.queue))
+                if not granted:
+                    self._publish(model_id, *snapshot)
+                    get_telemetry().inc("food_bedrock_limiter_timeouts_total", model=model_id)
+                    raise LimiterTimeout(f"Waited {timeout}s for a Bedrock slot ({model_id})")
+
+        waited = time.perf_counter() - t0
+        get_telemetry().observe("limiter_wait", model_id, waited)
+        return time.monotonic()
+
+    def release(self, model_id: str, outcome: str = "ok", started: float = 0.0):
+        """outcome: "ok" (tăng limit), "throttled" (giảm limit), khác (giữ nguyên)."""
+        decreased = False
+        with self._lock:
+            state = self._state(model_id)
+            state.inflight = max(0, state.inflight - 1)
+            if outcome == "ok":
+                state.limit = min(self.max_limit, state.limit + 1.0 / max(state.limit, 1.0))
+            elif outcome == "throttled" and started >= state.last_decrease:
+                state.limit = max(float(self.min_limit), state.limit * DECREASE_FACTOR)
+                state.last_decrease = time.monotonic()
+                decreased = True
+            self._grant(state)
+            snapshot = (state.limit, state.inflight, len(state.queue))
+        if decreased:
+            logger.info(f"Throttled on {model_id}: concurrency limit -> {snapshot[0]:.1f}")
+            get_telemetry().inc("food_bedrock_limit_decreases_total", model=model_id)
+        self._publish(model_id, *snapshot)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """{model_id: {limit, inflight, queued}}"""
+        with self._lock:
+            return {m: {"limit": round(s.limit, 2), "inflight": s.inflight, "queued": len(s.queue)}
+                    for m, s in self._models.items()}
+
+
+_shared: Optional[AdaptiveLimiter] = None
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter() -> AdaptiveLimiter:
+    """Limiter dùng chung cho mọi BedrockClient trong process."""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = AdaptiveLimiter()
+    return _shared
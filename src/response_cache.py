@@ -0,0 +1,193 @@
+"""Two-tier response cache (in-process LRU + SQLite) in front of Bedrock invoke."""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from .utils import (
+    get_logger, CACHE_ENABLED, CACHE_DIR, CACHE_TTL_S,
+    CACHE_MEMORY_ENTRIES, CACHE_MAX_ENTRIES,
+)
+
+logger = get_logger("response_cache")
+
+
+def make_cache_key(model_id: str, body: Any) -> str:
+    """
+    Hash chuẩn hoá của (model_id, request body).
+    Body dạng dict được dump với sort_keys để thứ tự key không ảnh hưởng tới key.
+    """
+    h = hashlib.sha256()
+    h.update((model_id or "").encode("utf-8"))
+    h.update(b"\x00")
+    if isinstance(body, (bytes, bytearray, memoryview)):
+        h.update(body)
+    else:
+        h.update(json.dumps(body, sort_keys=True, ensure_ascii=False,
+                            separators=(",", ":")).encode("utf-8"))
+    return h.hexdigest()
+
+
+def connect_cache_db(path: str) -> sqlite3.Connection:
+    """
+    Mở file SQLite của một cache, tạo thư mục cha nếu cần.
+    Lỗi hệ thống file (OSError) và lỗi SQLite được để cho cache bắt: cache tự tắt, request vẫn chạy.
+    """
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    return sqlite3.connect(path, check_same_thread=False)
+
+
+class ResponseCache:
+    """
+    Cache (raw_response, headers) theo key của request.
+
+    - Tầng 1: LRU trong process (OrderedDict), giới hạn `memory_entries`.
+    - Tầng 2: SQLite trên đĩa, giới hạn `max_entries`, xoá bản ghi ít dùng nhất khi vượt.
+    - Mỗi bản ghi hết hạn sau `ttl_s` giây.
+    Giá trị được lưu dạng JSON string để mỗi lần hit trả về một dict mới.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl_s: float = CACHE_TTL_S,
+                 memory_entries: int = CACHE_MEMORY_ENTRIES,
+                 max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path or os.path.join(CACHE_DIR, "responses.sqlite3")
+        self.ttl_s = ttl_s
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._mem: "OrderedDict[str, Tuple[float, str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._unavailable = False
+
+    # ---------- SQLite ----------
+    def _db(self) -> Optional[sqlite3.Connection]:
+        """Kết nối SQLite; None nếu không mở được (CACHE_DIR chỉ đọc...) - khi đó chỉ dùng tầng bộ nhớ."""
+        if self._conn is None:
+            if self._unavailable:
+                return None
+            try:
+                conn = connect_cache_db(self.path)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    " key TEXT PRIMARY KEY, model_id TEXT, expires_at REAL,"
+                    " accessed_at REAL, raw TEXT, headers TEXT)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)")
+            except (OSError, sqlite3.Error) as e:
+                self._unavailable = True
+                logger.warning(f"Response cache disk tier disabled ({self.path}): {e}")
+                return None
+            self._conn = conn
+        return self._conn
+
+    def _mem_put(self, key: str, expires_at: float, raw_s: str, hdrs_s: str):
+        self._mem[key] = (expires_at, raw_s, hdrs_s)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.memory_entries:
+            self._mem.popitem(last=False)
+
+    # ---------- API ----------
+    def get(self, key: str) -> Tuple[Optional[Tuple[Dict[str, Any], Dict[str, Any]]], str]:
+        """
+        Trả về ((raw, headers) | None, tier) với tier là "memory" / "disk" / "miss".
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._mem.move_to_end(key)
+                    self.hits += 1
+                    return (json.loads(entry[1]), json.loads(entry[2])), "memory"
+                del self._mem[key]
+
+            try:
+                db = self._db()
+                row = None if db is None else db.execute(
+                    "SELECT expires_at, raw, headers FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if row[0] > now:
+                        db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                        db.commit()
+                        self._mem_put(key, row[0], row[1], row[2])
+                        self.hits += 1
+                        return (json.loads(row[1]), json.loads(row[2])), "disk"
+                    db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache read failed: {e}")
+
+            self.misses += 1
+            return None, "miss"
+
+    def put(self, key: str, model_id: str, raw: Dict[str, Any], headers: Dict[str, Any]):
+        now = time.time()
+        expires_at = now + self.ttl_s
+        raw_s = json.dumps(raw, ensure_ascii=False)
+        hdrs_s = json.dumps(headers or {}, ensure_ascii=False)
+        with self._lock:
+            self._mem_put(key, expires_at, raw_s, hdrs_s)
+            try:
+                db = self._db()
+                if db is None:
+                    return
+                db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model_id, expires_at, now, raw_s, hdrs_s),
+                )
+                self._evict(db, now)
+                db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache write failed: {e}")
+
+    def _evict(self, db: sqlite3.Connection, now: float):
+        db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        count = db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+            try:
+                db = self._db()
+                if db is None:
+                    return
+                db.execute("DELETE FROM responses")
+                db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache clear failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {"cache_hits": self.hits, "cache_misses": self.misses}
+
+
+_shared_cache: Optional[ResponseCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Cache dùng chung trong process; None nếu cache bị tắt qua CACHE_ENABLED=false."""
+    global _shared_cache
+    if not CACHE_ENABLED:
+        return None
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache()
+        return _shared_cache
@@ -1,8 +1,11 @@
 """Response processing utilities."""
 
 import json
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
+from .adapters import get_adapter
+from .json_extract import find_json_object
+from .telemetry import span
 from .utils import get_logger
 
 logger = get_logger("response_processor")
@@ -10,52 +13,29 @@ logger = get_logger("response_processor")
 
 def extract_json_from_text(text: str) -> str:
     """Extract JSON from text, handle cases where text is truncated."""
-    text = text.strip()
+    return find_json_object(text)[0]
 
-    start_idx = text.find('{')
-    if start_idx == -1:
-        raise ValueError("No JSON found in response")
 
-    brace_count = 0
-    end_idx = -1
+def normalize_to_claude_like(raw: Dict[str, Any], model_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Normalize different model responses to Claude-like format.
+    With model_id the family adapter reads the text directly; without it the
+    known formats are probed in turn.
+    """
+    with span("normalize", model_id):
+        return _normalize(raw, model_id)
 
-    for i in range(start_idx, len(text)):
-        if text[i] == '{':
-            brace_count += 1
-        elif text[i] == '}':
-            brace_count -= 1
-            if brace_count == 0:
-                end_idx = i + 1
-                break
 
-    if end_idx == -1:
-        logger.warning("JSON appears to be truncated, attempting to fix...")
-        json_text = text[start_idx:]
-
-        open_braces = json_text.count('{') - json_text.count('}')
-        open_brackets = json_text.count('[') - json_text.count(']')
-
-        if open_brackets > 0:
-            json_text += ']' * open_brackets
-
-        if open_braces > 0:
-            json_text += '}' * open_braces
-
-        return json_text
-
-    return text[start_idx:end_idx]
-
-
-def normalize_to_claude_like(raw: Dict[str, Any]) -> Dict[str, Any]:
-    """Normalize different model responses to Claude-like format."""
-    logger.info(f"normalize_to_claude_like input: {type(raw)} - {raw}")
+def _normalize(raw: Dict[str, Any], model_id: Optional[str]) -> Dict[str, Any]:
+    if model_id:
+        return get_adapter(model_id).normalize(raw)
 
     if isinstance(raw, dict) and "content" in raw:
         return raw
 
     txt = None
     if isinstance(raw, dict):
-        logger.info(f"Raw is dict with keys: {list(raw.keys())}")
+        logger.debug(f"Raw is dict with keys: {list(raw.keys())}")
 
         # Nova messages-v1 format
         try:
@@ -67,7 +47,7 @@ def normalize_to_claude_like(raw: Dict[str, Any]) -> Dict[str, Any]:
                         maybe_text = cont[0].get("text")
                         if isinstance(maybe_text, str) and maybe_text.strip():
                             txt = maybe_text.strip()
-                            logger.info("Extracted Nova messages-v1 text.")
+                            logger.debug("Extracted Nova messages-v1 text.")
         except Exception:
             pass
 
@@ -79,7 +59,7 @@ def normalize_to_claude_like(raw: Dict[str, Any]) -> Dict[str, Any]:
                     ot = res[0].get("outputText")
                     if isinstance(ot, str) and ot.strip():
                         txt = ot.strip()
-                        logger.info("Extracted Titan outputText.")
+                        logger.debug("Extracted Titan outputText.")
             except Exception:
                 pass
 
@@ -88,14 +68,14 @@ def normalize_to_claude_like(raw: Dict[str, Any]) -> Dict[str, Any]:
             ot = raw.get("outputText")
             if isinstance(ot, str) and ot.strip():
                 txt = ot.strip()
-                logger.info("Extracted root outputText.")
+                logger.debug("Extracted root outputText.")
 
         # Llama: generation
         if not txt:
             gen = raw.get("generation")
             if isinstance(gen, str) and gen.strip():
                 txt = gen.strip()
-                logger.info("Extracted Llama generation.")
+                logger.debug("Extracted Llama generation.")
 
         # Other common keys
         if not txt:
@@ -103,7 +83,7 @@ def normalize_to_claude_like(raw: Dict[str, Any]) -> Dict[str, Any]:
                 val = raw.get(key)
                 if isinstance(val, str) and val.strip():
                     txt = val.strip()
-                    logger.info(f"Extracted via key '{key}'.")
+                    logger.debug(f"Extracted via key '{key}'.")
                     break
 
     if not txt:
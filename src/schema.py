@@ -1,4 +1,5 @@
-from pydantic import BaseModel, Field, field_validator
+from functools import lru_cache
+from pydantic import BaseModel, Field, TypeAdapter, field_validator
 from typing import List, Optional
 
 
@@ -15,4 +16,19 @@ class Dish(BaseModel):
     notes: Optional[List[str]] = None
 
 
-DISH_JSON_SCHEMA = Dish.model_json_schema()
\ No newline at end of file
+@lru_cache(maxsize=None)
+def dish_json_schema() -> dict:
+    return Dish.model_json_schema()
+
+
+@lru_cache(maxsize=None)
+def dish_adapter() -> TypeAdapter:
+    """TypeAdapter(Dish) dựng một lần; validate_json đi thẳng từ chuỗi JSON, không qua dict trung gian."""
+    return TypeAdapter(Dish)
+
+
+def __getattr__(name):
+    # DISH_JSON_SCHEMA chỉ được sinh khi dùng tới, không phải lúc import
+    if name == "DISH_JSON_SCHEMA":
+        return dish_json_schema()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,431 @@
+"""Cache mô tả gần trùng: cùng một yêu cầu viết nhiều cách -> Dish đã validate.
+
+"nguyên liệu phở bò", "Hãy cho tôi nguyên liệu của món phở bò." và "phở bò cần gì" đều chuẩn hoá
+thành "bò phở": bỏ cụm từ hỏi và stopword, bỏ dấu câu, không xét thứ tự từ. Từ phủ định / số lượng
+("không", "có", "một") được giữ: "phở bò không hành" và "phở bò có hành" là hai yêu cầu khác nhau.
+
+So khớp trên dạng còn dấu ("cá kho" khác "cà kho"), như knowledge_base. Chỉ khi chính mô tả gõ không
+dấu mới so với dạng bỏ dấu của các entry, và chỉ nhận khi các entry khớp không nhập nhằng (không có
+hai mô tả có dấu khác nhau cùng bỏ dấu thành nó).
+
+Mô tả chuẩn hoá được băm MinHash trên n-gram ký tự và đánh chỉ mục LSH (NUM_BANDS band x
+ROWS_PER_BAND hàng) trong SQLite, nên lookup chỉ đọc vài bucket theo index, không phụ thuộc số entry.
+Ứng viên được kiểm tra lại bằng Jaccard chính xác trên tập n-gram, phải có cùng số từ và cùng các con
+số (khẩu phần, khối lượng) thì mới tính là hit.
+
+Một phần các hit không trùng khớp hoàn toàn được ghi vào bảng audit để rà soát hit sai.
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import unicodedata
+import zlib
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from .response_cache import connect_cache_db
+from .telemetry import get_telemetry
+from .utils import (
+    get_logger, CACHE_DIR, SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_AUDIT_RATE,
+)
+
+logger = get_logger("semantic_cache")
+
+NGRAM = 3
+NUM_BANDS = 6
+ROWS_PER_BAND = 6
+NUM_PERM = NUM_BANDS * ROWS_PER_BAND
+MAX_CANDIDATES = 8
+BUCKET_SCAN = 32
+SCHEMA_VERSION = 2  # đổi khi đổi cách chuẩn hoá: entry cũ bị bỏ lúc mở DB
+FLUSH_EVERY = 10000  # số hit/mẫu audit tối đa giữ trong bộ nhớ; bình thường được ghi cùng lần add kế tiếp
+
+_MASK32 = 0xFFFFFFFF
+# Hoán vị 32-bit (x * a) ^ b với a lẻ, seed cố định để chữ ký ổn định giữa các process/lần chạy.
+# Rẻ hơn (a * x + b) mod p và đủ cho LSH: ứng viên luôn được kiểm tra lại bằng Jaccard chính xác.
+_rng = random.Random(0x5EED)
+_PERMS = tuple((_rng.randrange(1, 1 << 32) | 1, _rng.randrange(0, 1 << 32)) for _ in range(NUM_PERM))
+del _rng
+
+# Cụm từ hỏi (có dấu); cụm dài đứng trước. "có"/"không" chỉ bị bỏ khi nằm trong cụm hỏi
+_STOP_PHRASES = (
+    "như thế nào", "thế nào", "ra sao", "bao gồm", "gồm có", "cần có", "có những gì", "có gì",
+    "những gì", "cái gì", "có được không", "được không", "công thức", "nguyên liệu",
+    "thành phần", "vui lòng", "làm ơn", "hãy cho", "cho tôi", "cho mình", "cho em", "liệt kê",
+    "cách làm", "cách nấu", "để nấu", "để làm", "món ăn",
+)
+# Cụm không dấu tương ứng (người dùng gõ không dấu); chỉ gồm cụm không nhập nhằng với tên món
+_STOP_PHRASES_ASCII = (
+    "nhu the nao", "the nao", "nhung gi", "cong thuc", "nguyen lieu", "thanh phan", "vui long",
+    "lam on", "hay cho toi", "hay cho", "cho toi", "cho minh", "cua mon", "liet ke", "cach lam", "cach nau",
+    "can nhung gi", "can gi", "co nhung gi", "can co", "gom co", "duoc khong",
+)
+# Không gồm từ phủ định / số lượng ("không", "có", "một", "được", "ít", "thêm"...): bỏ chúng làm
+# "phở bò không hành" trùng "phở bò có hành"
+_STOPWORDS = frozenset(
+    "hãy cho tôi mình em bạn ơi của món các những gì cần để nấu làm cách với và nhé nha ạ "
+    "giúp xin muốn biết gồm ra sao nào cái".split()
+)
+# Từ không dấu chỉ bỏ khi người dùng gõ không dấu, và chỉ những từ không trùng nguyên liệu khi bỏ dấu
+# (không có "toi" - tỏi, "cua", "de" - dê, "cai" - cải, "oi" - ổi, "la" - lá)
+_STOPWORDS_ASCII = frozenset(
+    "hay cho minh em ban mon cac nhung gi can nau lam cach voi va nhe nha a giup xin muon biet gom "
+    "ra sao nao".split()
+)
+_NUMBER_WORDS = {
+    "một": "1", "hai": "2", "ba": "3", "bốn": "4", "tư": "4", "năm": "5", "sáu": "6", "bảy": "7",
+    "tám": "8", "chín": "9", "mười": "10",
+}
+_SERVINGS_RE = re.compile(r"\b(" + "|".join(_NUMBER_WORDS) + r")\s+(người|phần|suất)\b")
+_TOKEN_RE = re.compile(r"\w+")
+# Mọi cụm từ hỏi trong một lần quét, cụm dài thử trước; chỉ khớp trọn từ (văn bản đã tách bằng một dấu cách)
+_STOP_PHRASE_RE = re.compile(
+    r"(?<!\S)(?:" + "|".join(map(re.escape, sorted(_STOP_PHRASES + _STOP_PHRASES_ASCII, key=len, reverse=True)))
+    + r")(?!\S)"
+)
+
+
+def _fold(text: str) -> str:
+    """Bỏ dấu tiếng Việt: đ -> d, NFD rồi bỏ dấu kết hợp."""
+    text = text.replace("đ", "d")
+    return "".join(c for c in unicodedata.normalize("NFD", text) if not unicodedata.combining(c))
+
+
+# Bỏ dấu theo từng từ: từ vựng mô tả món ăn nhỏ nên cache gần như luôn trúng
+_fold_word = lru_cache(maxsize=1 << 16)(_fold)
+
+
+def normalize_words(desc: str) -> List[str]:
+    """Các từ còn lại của mô tả (chữ thường, NFC, còn dấu) sau khi bỏ cụm từ hỏi và stopword."""
+    text = unicodedata.normalize("NFC", desc or "").lower()
+    text = _SERVINGS_RE.sub(lambda m: f"{_NUMBER_WORDS[m.group(1)]} {m.group(2)}", text)
+    text = _STOP_PHRASE_RE.sub("", " ".join(_TOKEN_RE.findall(text)))
+    return [token for token in text.split()
+            if token not in (_STOPWORDS_ASCII if token.isascii() else _STOPWORDS)]
+
+
+def normalize_description(desc: str) -> Tuple[str, str]:
+    """
+    (văn bản chuẩn hoá còn dấu, các con số) của một mô tả.
+    Các con số ("4 người", "500g", "bốn phần") được giữ riêng: hai mô tả chỉ khớp khi số giống nhau.
+    """
+    # Thứ tự từ không quan trọng: "thêm sả và gừng" = "thêm gừng và sả" (giữ từ lặp: "cá ... cà chua")
+    words = sorted(normalize_words(desc))
+    numbers = " ".join(w for w in words if any(c.isdigit() for c in w))
+    return " ".join(words), numbers
+
+
+def fold_norm(norm: str) -> str:
+    """Dạng bỏ dấu của văn bản chuẩn hoá (sắp lại thứ tự từ); bằng chính nó nếu mô tả gõ không dấu."""
+    return " ".join(sorted(w if w.isascii() else _fold_word(w) for w in norm.split()))
+
+
+def _folded_scope(scope: str) -> str:
+    """Scope của index bỏ dấu, tách khỏi index còn dấu trong cùng bảng band."""
+    return f"{scope}\x00ascii"
+
+
+def shingles(norm: str) -> FrozenSet[str]:
+    padded = f" {norm} "
+    if len(padded) <= NGRAM:
+        return frozenset((padded,))
+    return frozenset(padded[i:i + NGRAM] for i in range(len(padded) - NGRAM + 1))
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+_perm_arrays = None
+
+
+def minhash(grams: FrozenSet[str]) -> List[int]:
+    """
+    Chữ ký MinHash NUM_PERM giá trị 32-bit; hash n-gram bằng crc32 (ổn định, không phụ thuộc PYTHONHASHSEED).
+    Tính vector hoá bằng numpy (nạp lười): uint64 nhân tràn mod 2^64 nên 32 bit thấp giống hệt (a * x) & MASK.
+    """
+    global _perm_arrays
+    import numpy as np
+
+    if _perm_arrays is None:
+        _perm_arrays = (np.array([a for a, _ in _PERMS], dtype=np.uint64)[:, None],
+                        np.array([b for _, b in _PERMS], dtype=np.uint64)[:, None])
+    a, b = _perm_arrays
+    base = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+    return (((a * base) ^ b) & np.uint64(_MASK32)).min(axis=1).tolist()
+
+
+def _key64(data: bytes) -> int:
+    return struct.unpack("<q", hashlib.blake2b(data, digest_size=8).digest())[0]
+
+
+def norm_key(scope: str, norm: str, numbers: str) -> int:
+    """Key 63-bit của mô tả chuẩn hoá trong scope (tra trùng khớp hoàn toàn trước khi qua LSH)."""
+    return _key64(f"{scope}\x00{norm}\x00{numbers}".encode("utf-8"))
+
+
+def band_keys(scope: str, numbers: str, signature: List[int]) -> List[int]:
+    """
+    Key 63-bit của từng band, tách theo scope (model + phiên bản prompt) và các con số:
+    mô tả khác khẩu phần không bao giờ là ứng viên của nhau, bucket cũng nhỏ hơn.
+    """
+    keys = []
+    prefix = f"{scope}\x00{numbers}\x00".encode("utf-8")
+    for band in range(NUM_BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        keys.append(_key64(prefix + struct.pack(f"<B{ROWS_PER_BAND}I", band, *rows)))
+    return keys
+
+
+class SemanticCache:
+    """
+    Mô tả (đã chuẩn hoá) -> Dish JSON đã validate, tách theo scope.
+    Toàn bộ index nằm trong SQLite (bảng band có index) nên không phải nạp vào bộ nhớ.
+    """
+
+    def __init__(self, path: Optional[str] = None, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 audit_rate: float = SEMANTIC_CACHE_AUDIT_RATE):
+        self.path = path or os.path.join(CACHE_DIR, "semantic.sqlite3")
+        self.threshold = threshold
+        self.audit_rate = audit_rate
+        self.hits = 0
+        self.misses = 0
+        self._rng = random.Random()
+        self._pending_hits: Dict[int, int] = {}
+        self._pending_audit: List[Tuple[float, str, str, str, float, str]] = []
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._unavailable = False
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        """Kết nối SQLite; None nếu không mở được (CACHE_DIR chỉ đọc...) - khi đó mọi lookup là miss."""
+        if self._conn is None:
+            if self._unavailable:
+                return None
+            try:
+                conn = connect_cache_db(self.path)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")  # WAL: mất điện chỉ mất vài entry cache cuối
+                if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                    # Entry chuẩn hoá theo cách cũ (bỏ dấu, bỏ "không"/"có") có thể cho hit sai: bỏ hết
+                    for table in ("semantic_entries", "semantic_bands", "semantic_audit"):
+                        conn.execute(f"DROP TABLE IF EXISTS {table}")
+                    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS semantic_entries ("
+                    " id INTEGER PRIMARY KEY, nkey INTEGER, scope TEXT, norm TEXT, numbers TEXT, desc TEXT,"
+                    " dish TEXT, tokens_in INTEGER, tokens_out INTEGER, hits INTEGER DEFAULT 0, created_at REAL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_semantic_nkey ON semantic_entries(nkey)")
+                # Clustered theo bkey: đọc một bucket là đọc một đoạn liên tiếp, không nhảy sang bảng chính
+                conn.execute("CREATE TABLE IF NOT EXISTS semantic_bands ("
+                             " bkey INTEGER, entry_id INTEGER, PRIMARY KEY (bkey, entry_id)) WITHOUT ROWID")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS semantic_audit ("
+                    " created_at REAL, scope TEXT, query TEXT, matched TEXT, similarity REAL, dish TEXT)"
+                )
+            except (OSError, sqlite3.Error) as e:
+                self._unavailable = True
+                logger.warning(f"Semantic cache disabled ({self.path}): {e}")
+                return None
+            self._conn = conn
+        return self._conn
+
+    def lookup(self, scope: str, desc: str) -> Optional[Tuple[str, float, int, int]]:
+        """Trả về (dish_json, similarity, tokens_in, tokens_out) của entry gần nhất trên ngưỡng, hoặc None."""
+        norm, numbers = normalize_description(desc)
+        best = None
+        with self._lock:
+            db = self._db() if norm else None  # mô tả chỉ gồm cụm từ hỏi thì không tra
+            if db is not None:
+                try:
+                    best = self._best_match(db, scope, norm, numbers)
+                except sqlite3.Error as e:
+                    logger.warning(f"Semantic cache read failed: {e}")
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                sim, row = best
+                # Ghi số hit / mẫu audit theo lô ở lần add sau (vốn đã chậm vì vừa gọi Bedrock), không commit
+                # trên đường lookup: một lần commit tốn hàng chục ms
+                self._pending_hits[row[0]] = self._pending_hits.get(row[0], 0) + 1
+                if sim < 1.0 and self._rng.random() < self.audit_rate:
+                    self._pending_audit.append((time.time(), scope, desc, row[3], sim, row[4]))
+                if len(self._pending_hits) + len(self._pending_audit) >= FLUSH_EVERY:
+                    try:
+                        self._flush(self._conn)
+                        self._conn.commit()
+                    except sqlite3.Error as e:
+                        logger.warning(f"Semantic cache write failed: {e}")
+        get_telemetry().inc("food_semantic_cache_requests_total", result="hit" if best else "miss")
+        if best is None:
+            return None
+        sim, row = best
+        return row[4], round(sim, 4), row[5] or 0, row[6] or 0
+
+    _COLUMNS = "id, norm, numbers, desc, dish, tokens_in, tokens_out"
+
+    def _best_match(self, db: sqlite3.Connection, scope: str, norm: str, numbers: str):
+        if fold_norm(norm) == norm:
+            return self._best_folded_match(db, scope, norm, numbers)
+        row = db.execute(f"SELECT {self._COLUMNS} FROM semantic_entries WHERE nkey = ? AND scope = ? AND norm = ?"
+                         " AND numbers = ?", (norm_key(scope, norm, numbers), scope, norm, numbers)).fetchone()
+        if row is not None:
+            return 1.0, row
+        grams = shingles(norm)
+        best = None
+        for row in self._candidates(db, scope, numbers, band_keys(scope, numbers, minhash(grams)), norm):
+            sim = jaccard(grams, shingles(row[1]))
+            if sim >= self.threshold and (best is None or sim > best[0]):
+                best = (sim, row)
+        return best
+
+    def _best_folded_match(self, db: sqlite3.Connection, scope: str, norm: str, numbers: str):
+        """Mô tả gõ không dấu: so với dạng bỏ dấu của các entry, miss nếu nhập nhằng ("ca kho": cá / cà kho)."""
+        fscope = _folded_scope(scope)
+        ids = [entry_id for (entry_id,) in db.execute("SELECT entry_id FROM semantic_bands WHERE bkey = ? LIMIT ?",
+                                                      (norm_key(fscope, norm, numbers), BUCKET_SCAN))]
+        matches = [(1.0, row) for row in self._rows(db, scope, numbers, ids) if fold_norm(row[1]) == norm]
+        if not matches:
+            grams = shingles(norm)
+            for row in self._candidates(db, scope, numbers, band_keys(fscope, numbers, minhash(grams)), norm):
+                sim = jaccard(grams, shingles(fold_norm(row[1])))
+                if sim >= self.threshold:
+                    matches.append((sim, row))
+        for sim, row in matches:
+            if row[1] == norm:  # entry cũng gõ không dấu, đúng mô tả này
+                return sim, row
+        if len({row[1] for _, row in matches}) != 1:
+            return None
+        return max(matches, key=lambda m: m[0])
+
+    def _rows(self, db: sqlite3.Connection, scope: str, numbers: str, ids: List[int]):
+        if not ids:
+            return []
+        return db.execute(f"SELECT {self._COLUMNS} FROM semantic_entries"
+                          f" WHERE scope = ? AND numbers = ? AND id IN ({','.join('?' * len(ids))})",
+                          (scope, numbers, *ids)).fetchall()
+
+    def _candidates(self, db: sqlite3.Connection, scope: str, numbers: str, keys: List[int], norm: str):
+        """Entry cùng scope, cùng các con số và cùng số từ với norm, chung ít nhất một bucket LSH."""
+        # LSH: mỗi band chỉ đọc tối đa BUCKET_SCAN entry (bucket của n-gram phổ biến có thể rất lớn),
+        # ứng viên trùng nhiều band nhất được kiểm tra trước
+        votes: Dict[int, int] = {}
+        for key in keys:
+            for (entry_id,) in db.execute("SELECT entry_id FROM semantic_bands WHERE bkey = ? LIMIT ?",
+                                          (key, BUCKET_SCAN)):
+                votes[entry_id] = votes.get(entry_id, 0) + 1
+        ids = sorted(votes, key=votes.get, reverse=True)[:MAX_CANDIDATES]
+        n_words = norm.count(" ")
+        # Thêm/bớt một từ (một nguyên liệu) là yêu cầu khác; chỉ chấp nhận sai khác trong từ (gõ sai)
+        return [row for row in self._rows(db, scope, numbers, ids) if row[1].count(" ") == n_words]
+
+    def _flush(self, db: sqlite3.Connection):
+        if self._pending_hits:
+            db.executemany("UPDATE semantic_entries SET hits = hits + ? WHERE id = ?",
+                           [(n, i) for i, n in self._pending_hits.items()])
+            self._pending_hits.clear()
+        if self._pending_audit:
+            db.executemany("INSERT INTO semantic_audit VALUES (?, ?, ?, ?, ?, ?)", self._pending_audit)
+            self._pending_audit.clear()
+
+    def _insert(self, db: sqlite3.Connection, scope: str, desc: str, dish_json: str,
+                tokens_in: int, tokens_out: int, now: float):
+        norm, numbers = normalize_description(desc)
+        if not norm:
+            return
+        nkey = norm_key(scope, norm, numbers)
+        # Mô tả chuẩn hoá đã có trong scope: giữ entry cũ
+        if db.execute("SELECT 1 FROM semantic_entries WHERE nkey = ? AND scope = ? AND norm = ? AND numbers = ?",
+                      (nkey, scope, norm, numbers)).fetchone():
+            return
+        cur = db.execute(
+            "INSERT INTO semantic_entries (nkey, scope, norm, numbers, desc, dish, tokens_in, tokens_out, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (nkey, scope, norm, numbers, desc, dish_json, tokens_in, tokens_out, now))
+        folded = fold_norm(norm)
+        fscope = _folded_scope(scope)
+        # Index bỏ dấu (key trùng khớp + band) cho mô tả gõ không dấu; index còn dấu chỉ cần khi có dấu
+        keys = [norm_key(fscope, folded, numbers)] + band_keys(fscope, numbers, minhash(shingles(folded)))
+        if folded != norm:
+            keys += band_keys(scope, numbers, minhash(shingles(norm)))
+        db.executemany("INSERT OR IGNORE INTO semantic_bands VALUES (?, ?)", [(k, cur.lastrowid) for k in keys])
+
+    def add(self, scope: str, desc: str, dish_json: str, tokens_in: int = 0, tokens_out: int = 0):
+        self.add_many(scope, [(desc, dish_json, tokens_in, tokens_out)])
+
+    def add_many(self, scope: str, items: Iterable[Tuple[str, str, int, int]]):
+        """Ghi nhiều (desc, dish_json, tokens_in, tokens_out) trong một transaction (nạp sẵn từ output batch)."""
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            if db is None:
+                return
+            try:
+                for desc, dish_json, tokens_in, tokens_out in items:
+                    self._insert(db, scope, desc, dish_json, tokens_in, tokens_out, now)
+                self._flush(db)
+                db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Semantic cache write failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "semantic_hits": self.hits,
+            "semantic_misses": self.misses,
+            "semantic_hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def report(self, audit_limit: int = 20) -> Dict[str, Any]:
+        """Số entry, tổng hit đã ghi nhận trên đĩa và các mẫu audit gần nhất (hit không trùng khớp hoàn toàn)."""
+        with self._lock:
+            db = self._db()
+            if db is None:
+                return {"entries": 0, "hits_total": 0, **self.stats(), "audit_samples": []}
+            self._flush(db)
+            db.commit()
+            entries, hits = db.execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM semantic_entries").fetchone()
+            audit = [
+                {"query": q, "matched": m, "similarity": round(s, 4), "scope": sc}
+                for sc, q, m, s in db.execute(
+                    "SELECT scope, query, matched, similarity FROM semantic_audit"
+                    " ORDER BY created_at DESC LIMIT ?", (audit_limit,))
+            ]
+        return {"entries": entries, "hits_total": hits, **self.stats(), "audit_samples": audit}
+
+
+_shared_cache: Optional[SemanticCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Semantic cache dùng chung; None nếu tắt qua SEMANTIC_CACHE_ENABLED=false."""
+    global _shared_cache
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = SemanticCache()
+        return _shared_cache
+
+
+def peek_semantic_cache() -> Optional[SemanticCache]:
+    """Semantic cache dùng chung nếu đã được tạo, ngược lại None (không mở SQLite chỉ để đọc thống kê)."""
+    return _shared_cache
+
+
+if __name__ == "__main__":
+    cache = SemanticCache(sys.argv[1] if len(sys.argv) > 1 else None)
+    print(json.dumps(cache.report(), ensure_ascii=False, indent=2))
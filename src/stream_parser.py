@@ -0,0 +1,108 @@
+"""Incremental JSON parser: trả về từng Ingredient ngay khi object của nó đóng lại."""
+
+from __future__ import annotations
+
+import json
+from typing import TYPE_CHECKING, List, Optional
+
+from .utils import get_logger
+
+if TYPE_CHECKING:
+    from .schema import Ingredient
+
+logger = get_logger("stream_parser")
+
+
+class IngredientStreamParser:
+    """
+    Nhận text theo từng đoạn (feed) từ stream của model.
+    Theo dõi cấu trúc JSON (chuỗi, escape, độ sâu ngoặc) để biết khi nào một
+    object trong mảng "ingredients" của object gốc được đóng, khi đó parse +
+    validate object đó thành Ingredient.
+    Text trước dấu '{' đầu tiên (lời dẫn, ```json) được bỏ qua.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._stack: List[str] = []       # "{" / "["
+        self._keys: List[Optional[str]] = []  # key hiện tại của từng object trong stack
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_string: Optional[str] = None
+        self._ingredients_depth = -1      # độ sâu của mảng "ingredients" (nếu đang ở trong)
+        self._item_start = -1
+        self.done = False
+        self.count = 0
+
+    def feed(self, chunk: str) -> List[Ingredient]:
+        self.text += chunk
+        out: List[Ingredient] = []
+        text = self.text
+        i = self._pos
+        n = len(text)
+        while i < n and not self.done:
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    try:
+                        self._last_string = json.loads(text[self._string_start:i + 1])
+                    except json.JSONDecodeError:
+                        self._last_string = None
+            elif not self._stack and c != "{":
+                pass  # chưa vào JSON
+            elif c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == ":":
+                if self._keys:
+                    self._keys[-1] = self._last_string
+            elif c == ",":
+                if self._stack and self._stack[-1] == "{":
+                    self._keys[-1] = None
+            elif c == "{":
+                self._stack.append("{")
+                self._keys.append(None)
+                if len(self._stack) - 1 == self._ingredients_depth + 1 and self._ingredients_depth >= 0:
+                    self._item_start = i
+            elif c == "[":
+                # mảng "ingredients" nằm ngay trong object gốc
+                if len(self._stack) == 1 and self._keys and self._keys[-1] == "ingredients":
+                    self._ingredients_depth = len(self._stack)
+                self._stack.append("[")
+            elif c == "}":
+                if self._stack:
+                    self._stack.pop()
+                    self._keys.pop()
+                depth = len(self._stack)
+                if self._item_start >= 0 and depth == self._ingredients_depth + 1:
+                    item = self._parse_item(text[self._item_start:i + 1])
+                    if item is not None:
+                        out.append(item)
+                    self._item_start = -1
+                if not self._stack:
+                    self.done = True
+            elif c == "]":
+                if self._stack:
+                    self._stack.pop()
+                if len(self._stack) == self._ingredients_depth:
+                    self._ingredients_depth = -1
+            i += 1
+        self._pos = i
+        return out
+
+    def _parse_item(self, candidate: str) -> Optional[Ingredient]:
+        from . import schema  # pydantic nạp lười ở nguyên liệu đầu tiên
+        try:
+            item = schema.Ingredient.model_validate(json.loads(candidate))
+        except ValueError as e:  # json.JSONDecodeError / pydantic ValidationError
+            logger.warning(f"Skipping invalid streamed ingredient: {e}")
+            return None
+        self.count += 1
+        return item
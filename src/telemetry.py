@@ -0,0 +1,266 @@
+"""Đo thời gian từng bước (span, đồng hồ monotonic) và gom thành histogram theo model.
+
+    with span("bedrock_call", model_id):
+        ...
+
+Mỗi (stage, model) có một histogram kiểu Prometheus (bucket cố định, sum, count) và một
+cửa sổ các mẫu gần nhất để tính p50/p95/p99. Xuất ra text format của Prometheus:
+  - METRICS_PORT: HTTP server local, GET /metrics
+  - METRICS_FILE: ghi file định kỳ (node_exporter textfile collector, hoặc đọc tay)
+"""
+
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .utils import get_logger, METRICS_PORT, METRICS_FILE, METRICS_FILE_INTERVAL_S, METRICS_WINDOW
+
+logger = get_logger("telemetry")
+
+# Các bước được đo trong pipeline
+STAGES = (
+    "kb_lookup", "build_body", "image_encode", "limiter_wait", "bedrock_call", "bedrock_attempt", "continuation",
+    "pack_call", "count_tokens", "normalize", "extract_json", "json_repair", "pydantic_validate",
+)
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank quantile trên danh sách đã sắp xếp."""
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[idx]
+
+
+class _Series:
+    __slots__ = ("buckets", "count", "sum", "window")
+
+    def __init__(self, window: int):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.window = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.window.append(value)
+        for i, le in enumerate(BUCKETS):
+            if value <= le:
+                self.buckets[i] += 1
+                break
+
+
+class Telemetry:
+    """Registry thread-safe: histogram theo (stage, model), counter và gauge theo (name, labels)."""
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, str], _Series] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._gauges: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+    def observe(self, stage: str, model_id: Optional[str], seconds: float):
+        key = (stage, model_id or "")
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(self.window)
+            series.observe(seconds)
+
+    def inc(self, name: str, value: float = 1.0, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def counter(self, name: str) -> Dict[Tuple[Tuple[str, str], ...], float]:
+        """Giá trị hiện tại của một counter theo từng bộ nhãn."""
+        with self._lock:
+            return {labels: v for (n, labels), v in self._counters.items() if n == name}
+
+    def set_gauge(self, name: str, value: float, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = float(value)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    def summary(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """{model_id: {stage: {count, mean_s, p50_s, p95_s, p99_s}}} trên cửa sổ mẫu gần nhất."""
+        with self._lock:
+            items = [(k, s.count, s.sum, sorted(s.window)) for k, s in self._series.items()]
+        out: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for (stage, model_id), count, total, values in items:
+            out.setdefault(model_id, {})[stage] = {
+                "count": count,
+                "mean_s": round(total / count, 6) if count else 0.0,
+                **{f"p{int(q * 100)}_s": round(_quantile(values, q), 6) for q in QUANTILES},
+            }
+        return out
+
+    def quantile(self, stage: str, model_id: Optional[str], q: float, min_samples: int = 1) -> Optional[float]:
+        """Quantile trên cửa sổ mẫu gần nhất; None nếu chưa đủ min_samples mẫu."""
+        with self._lock:
+            series = self._series.get((stage, model_id or ""))
+            values = sorted(series.window) if series else []
+        return _quantile(values, q) if values and len(values) >= max(1, min_samples) else None
+
+    def render_prometheus(self) -> str:
+        """Text exposition format của Prometheus."""
+        with self._lock:
+            items = [(k, list(s.buckets), s.count, s.sum, sorted(s.window)) for k, s in sorted(self._series.items())]
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+
+        lines = [
+            "# HELP food_stage_duration_seconds Thời gian từng bước xử lý request.",
+            "# TYPE food_stage_duration_seconds histogram",
+        ]
+        for (stage, model_id), buckets, count, total, _ in items:
+            labels = f'stage="{stage}",model="{model_id}"'
+            cumulative = 0
+            for le, n in zip(BUCKETS, buckets):
+                cumulative += n
+                lines.append(f'food_stage_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'food_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"food_stage_duration_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"food_stage_duration_seconds_count{{{labels}}} {count}")
+
+        lines += [
+            "# HELP food_stage_duration_quantile_seconds p50/p95/p99 trên các mẫu gần nhất.",
+            "# TYPE food_stage_duration_quantile_seconds gauge",
+        ]
+        for (stage, model_id), _, _, _, values in items:
+            for q in QUANTILES:
+                lines.append(
+                    f'food_stage_duration_quantile_seconds{{stage="{stage}",model="{model_id}",quantile="{q}"}} '
+                    f"{_quantile(values, q):.6f}"
+                )
+
+        seen = set()
+        for kind, metrics in (("counter", counters), ("gauge", gauges)):
+            for (name, labels), value in metrics:
+                if name not in seen:
+                    lines.append(f"# TYPE {name} {kind}")
+                    seen.add(name)
+                label_str = ",".join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f"{name}{{{label_str}}} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+# =========================
+# Span
+# =========================
+_local = threading.local()
+
+
+@contextmanager
+def span(stage: str, model_id: Optional[str] = None) -> Iterator[None]:
+    """Đo một bước bằng perf_counter; ghi vào registry và vào trace của request hiện tại (nếu có)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        get_telemetry().observe(stage, model_id, elapsed)
+        stages = getattr(_local, "stages", None)
+        if stages is not None:
+            stages[stage] = round(stages.get(stage, 0.0) + elapsed, 6)
+
+
+@contextmanager
+def trace(stages: Optional[Dict[str, float]] = None) -> Iterator[Dict[str, float]]:
+    """
+    Gom thời gian các span trong thread hiện tại thành dict {stage: seconds} cho một request.
+    Truyền lại cùng một dict để cộng dồn qua nhiều đoạn (vd. giữa các lần yield của generator).
+    """
+    previous = getattr(_local, "stages", None)
+    stages = {} if stages is None else stages
+    _local.stages = stages
+    try:
+        yield stages
+    finally:
+        _local.stages = previous
+
+
+# =========================
+# Exporters
+# =========================
+def write_metrics_file(path: str):
+    """Ghi atomically để collector không đọc phải file đang ghi dở."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(get_telemetry().render_prometheus())
+    os.replace(tmp, path)
+
+
+def _metrics_handler():
+    # http.server chỉ được import khi bật METRICS_PORT
+    from http.server import BaseHTTPRequestHandler
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            payload = get_telemetry().render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):  # không in access log ra console
+            pass
+
+    return _MetricsHandler
+
+
+def _start_exporters(telemetry: Telemetry):
+    if METRICS_PORT:
+        from http.server import ThreadingHTTPServer
+        try:
+            server = ThreadingHTTPServer(("127.0.0.1", METRICS_PORT), _metrics_handler())
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            logger.info(f"Metrics endpoint: http://127.0.0.1:{METRICS_PORT}/metrics")
+        except OSError as e:
+            logger.warning(f"Metrics endpoint not started on port {METRICS_PORT}: {e}")
+
+    if METRICS_FILE:
+        def loop():
+            while True:
+                time.sleep(METRICS_FILE_INTERVAL_S)
+                try:
+                    write_metrics_file(METRICS_FILE)
+                except OSError as e:
+                    logger.warning(f"Cannot write metrics file {METRICS_FILE}: {e}")
+
+        threading.Thread(target=loop, name="metrics-file", daemon=True).start()
+        atexit.register(write_metrics_file, METRICS_FILE)
+
+
+_shared: Optional[Telemetry] = None
+_shared_lock = threading.Lock()
+
+
+def get_telemetry() -> Telemetry:
+    """Registry dùng chung trong process; exporter (nếu cấu hình) khởi động ở lần gọi đầu."""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                telemetry = Telemetry()
+                _start_exporters(telemetry)
+                _shared = telemetry
+    return _shared
@@ -0,0 +1,222 @@
+"""Ước lượng input token offline, hiệu chỉnh theo từng model từ header token thật của Bedrock.
+
+Ước lượng = overhead + ratio * units, với units đếm từ text của prompt:
+  - mỗi từ / dấu câu là 1 unit,
+  - mỗi ký tự ngoài ASCII (dấu tiếng Việt) thêm NON_ASCII_WEIGHT unit vì tokenizer hay tách nhỏ.
+Phần cố định của prompt (system, schema, ví dụ) chỉ đếm một lần cho mỗi (model, version, ảnh/text).
+ratio của mỗi model được cập nhật (EWMA) mỗi khi có x-amzn-bedrock-input-token-count thật;
+sai số ước lượng (MAE, MAPE) được theo dõi theo model để biết nên tin tới đâu.
+"""
+
+import atexit
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+from .adapters import get_adapter, model_family
+from .models import get_model_cost_estimates
+from .telemetry import get_telemetry, span
+from .utils import get_logger, CACHE_DIR, TOKEN_CALIBRATION_FILE, TOKEN_COUNT_EXACT
+
+logger = get_logger("token_estimator")
+
+_UNIT_RE = re.compile(r"\w+|[^\w\s]")
+_NON_ASCII_RE = re.compile(r"[^\x00-\x7f]")
+NON_ASCII_WEIGHT = 0.35
+
+# Giá trị ban đầu theo họ model trước khi có dữ liệu thật: (overhead, ratio)
+FAMILY_PRIORS = {
+    "claude": (12.0, 1.25),
+    "nova": (10.0, 1.25),
+    "titan": (2.0, 1.3),
+    "llama": (4.0, 1.2),
+}
+EWMA_ALPHA = 0.1
+_SAVE_EVERY = 20
+
+# Key chứa text của prompt trong body các họ model (bỏ qua dữ liệu ảnh base64, config)
+_TEXT_KEYS = ("text", "system", "prompt", "inputText")
+
+
+def text_units(text: str) -> float:
+    if not text:
+        return 0.0
+    return len(_UNIT_RE.findall(text)) + NON_ASCII_WEIGHT * len(_NON_ASCII_RE.findall(text))
+
+
+def _body_text_units(node: Any) -> float:
+    """Cộng units của mọi chuỗi prompt trong body (dict/list lồng nhau)."""
+    if isinstance(node, dict):
+        total = 0.0
+        for key, value in node.items():
+            if isinstance(value, str):
+                if key in _TEXT_KEYS:
+                    total += text_units(value)
+            else:
+                total += _body_text_units(value)
+        return total
+    if isinstance(node, list):
+        return sum(_body_text_units(v) for v in node)
+    return 0.0
+
+
+@lru_cache(maxsize=256)
+def static_units(model_id: str, prompt_version: int = 0, image: bool = False) -> float:
+    """Units của phần cố định trong prompt (build với mô tả rỗng)."""
+    adapter = get_adapter(model_id)
+    if image:
+        body = adapter.build_image_body("", "", "image/jpeg", 0.2, 512)
+    else:
+        body = adapter.build_body("", 0.2, 512, prompt_version)
+    return _body_text_units(body)
+
+
+class TokenEstimator:
+    """Ước lượng + hiệu chỉnh theo model; thread-safe, lưu hệ số ra JSON để dùng lại khi khởi động."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._models: Dict[str, Dict[str, float]] = {}
+        self._dirty = 0
+        if path:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._models = json.load(f)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                logger.warning(f"Cannot load token calibration {path}: {e}")
+
+    def _state(self, model_id: str) -> Dict[str, float]:
+        state = self._models.get(model_id)
+        if state is None:
+            overhead, ratio = FAMILY_PRIORS[model_family(model_id)]
+            state = self._models[model_id] = {
+                "overhead": overhead, "ratio": ratio,
+                "samples": 0, "abs_err_sum": 0.0, "abs_pct_err_sum": 0.0,
+            }
+        return state
+
+    def units(self, model_id: str, desc: str, prompt_version: int = 0, image: bool = False) -> float:
+        return static_units(model_id, prompt_version, image) + text_units(desc or "")
+
+    def estimate_units(self, model_id: str, units: float, image_tokens: int = 0) -> int:
+        with self._lock:
+            state = self._state(model_id)
+            return int(round(state["overhead"] + state["ratio"] * units)) + int(image_tokens or 0)
+
+    def estimate(self, model_id: str, desc: str, prompt_version: int = 0, image_tokens: int = 0,
+                 image: bool = False) -> int:
+        """Số input token ước lượng cho một request."""
+        return self.estimate_units(model_id, self.units(model_id, desc, prompt_version, image), image_tokens)
+
+    def observe(self, model_id: str, units: float, actual_tokens: int, image_tokens: int = 0):
+        """Ghi nhận số token thật: cập nhật sai số rồi hiệu chỉnh ratio của model."""
+        if not actual_tokens or units <= 0:
+            return
+        with self._lock:
+            state = self._state(model_id)
+            estimate = state["overhead"] + state["ratio"] * units + image_tokens
+            err = abs(estimate - actual_tokens)
+            state["samples"] += 1
+            state["abs_err_sum"] += err
+            state["abs_pct_err_sum"] += err / actual_tokens
+            # Token ảnh chỉ là ước lượng: request ảnh chỉ dùng để đo sai số, không hiệu chỉnh ratio
+            observed_ratio = (actual_tokens - state["overhead"]) / units if not image_tokens else 0.0
+            if observed_ratio > 0:
+                alpha = max(EWMA_ALPHA, 1.0 / state["samples"])  # mẫu đầu tiên hội tụ nhanh
+                state["ratio"] += alpha * (observed_ratio - state["ratio"])
+            self._dirty += 1
+            save = self.path and self._dirty >= _SAVE_EVERY
+        telemetry = get_telemetry()
+        telemetry.inc("food_token_estimate_samples_total", model=model_id)
+        telemetry.inc("food_token_estimate_abs_error_tokens_total", err, model=model_id)
+        if save:
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            snapshot = json.dumps(self._models)
+            self._dirty = 0
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(snapshot)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Cannot save token calibration {self.path}: {e}")
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """{model_id: {samples, ratio, mae_tokens, mape_pct}} - sai số ước lượng so với token thật."""
+        with self._lock:
+            out = {}
+            for model_id, s in self._models.items():
+                n = s["samples"]
+                out[model_id] = {
+                    "samples": n,
+                    "ratio": round(s["ratio"], 4),
+                    "mae_tokens": round(s["abs_err_sum"] / n, 1) if n else None,
+                    "mape_pct": round(100.0 * s["abs_pct_err_sum"] / n, 1) if n else None,
+                }
+            return out
+
+
+def estimate_cost_preflight(model_id: str, desc: str, max_tokens: int, prompt_version: int = 0,
+                            image_tokens: int = 0) -> Tuple[int, float]:
+    """(tokens_in_est, chi phí tối đa USD) trước khi gọi model: input ước lượng + output = max_tokens."""
+    tokens_in = get_token_estimator().estimate(model_id, desc, prompt_version, image_tokens,
+                                               image=bool(image_tokens))
+    cost_in_1k, cost_out_1k = get_model_cost_estimates(model_id)
+    return tokens_in, round((tokens_in / 1000.0) * cost_in_1k + (max_tokens / 1000.0) * cost_out_1k, 6)
+
+
+# =========================
+# Đếm chính xác bất đồng bộ (tuỳ chọn, TOKEN_COUNT_EXACT=true)
+# =========================
+_exact_pool: Optional[ThreadPoolExecutor] = None
+
+
+def count_exact_async(bedrock_client, model_id: str, body: Any, units: float, image_tokens: int = 0):
+    """
+    Gọi CountTokens ở thread nền (ngoài đường xử lý request) và dùng kết quả để hiệu chỉnh.
+    Không làm gì nếu TOKEN_COUNT_EXACT=false.
+    """
+    global _exact_pool
+    if not TOKEN_COUNT_EXACT:
+        return None
+    if _exact_pool is None:
+        with _shared_lock:
+            if _exact_pool is None:
+                _exact_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="count-tokens")
+
+    def run():
+        with span("count_tokens", model_id):
+            actual = bedrock_client.count_tokens(model_id, body)
+        if actual:
+            get_token_estimator().observe(model_id, units, actual, image_tokens)
+        return actual
+
+    return _exact_pool.submit(run)
+
+
+_shared: Optional[TokenEstimator] = None
+_shared_lock = threading.Lock()
+
+
+def get_token_estimator() -> TokenEstimator:
+    """Estimator dùng chung trong process; hệ số hiệu chỉnh lưu ở TOKEN_CALIBRATION_FILE."""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = TokenEstimator(TOKEN_CALIBRATION_FILE or os.path.join(CACHE_DIR, "token_calibration.json"))
+                atexit.register(_shared.save)
+    return _shared
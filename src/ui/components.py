@@ -1,10 +1,10 @@
 """UI input and display components."""
 
 import streamlit as st
-from PIL import Image
 from typing import Optional, Tuple
 
-from ..models import TEXT_MODELS, IMAGE_MODELS, get_default_max_tokens
+from ..length_predictor import static_max_tokens
+from ..models import TEXT_MODELS, IMAGE_MODELS
 from ..utils import TEMPERATURE, MAX_TOKENS
 
 
@@ -43,8 +43,13 @@ def render_controls(selected_model_id: str) -> Tuple[float, int, bool]:
         temperature = st.number_input("Temperature", 0.0, 1.0, TEMPERATURE, 0.1)
 
     with col2:
-        default_max_tokens = get_default_max_tokens(selected_model_id, MAX_TOKENS)
-        max_tokens = st.number_input("Max tokens", 64, 4096, default_max_tokens, 64)
+        # Auto: max_tokens = 0, invoke_model đặt theo độ dài output dự đoán của model (src/length_predictor.py)
+        auto = st.checkbox("Auto max tokens", value=MAX_TOKENS <= 0,
+                           help="Đặt max_tokens theo độ dài output dự đoán từ lịch sử của model")
+        default_max_tokens = static_max_tokens(selected_model_id)
+        max_tokens = st.number_input("Max tokens", 64, 4096, default_max_tokens, 64, disabled=auto)
+        if auto:
+            max_tokens = 0
 
     with col3:
         st.markdown("<br>", unsafe_allow_html=True)
@@ -62,8 +67,8 @@ def render_text_input() -> str:
     )
 
 
-def render_image_input() -> Optional[Image.Image]:
-    """Render image upload and display."""
+def render_image_input() -> Optional[bytes]:
+    """Render image upload and display. Returns the uploaded bytes (not decoded)."""
     image_file = st.file_uploader(
         "Tải ảnh món ăn (PNG/JPG/JPEG)",
         type=["png", "jpg", "jpeg"]
@@ -71,16 +76,15 @@ def render_image_input() -> Optional[Image.Image]:
 
     img = None
     if image_file is not None:
-        img = Image.open(image_file)
+        # Giữ nguyên bytes upload: invoke_model chỉ decode khi thật sự cần resize/nén lại
+        img = image_file.getvalue()
         with st.expander("📷 Ảnh đầu vào", expanded=False):
-            thumb = img.copy()
-            thumb.thumbnail((320, 320))
-            st.image(thumb, use_container_width=False)
+            st.image(img, width=320)
 
     return img
 
 
-def render_validation_warnings(input_mode: str, user_desc: str, img: Optional[Image.Image]) -> bool:
+def render_validation_warnings(input_mode: str, user_desc: str, img: Optional[bytes]) -> bool:
     """Render validation warnings and return True if input is valid."""
     if input_mode == "Text" and not user_desc.strip():
         st.warning("Vui lòng nhập mô tả món ăn.")
@@ -2,23 +2,30 @@
 
 import json
 import streamlit as st
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 from ..parser import parse_and_validate, extract_text
 from ..response_processor import normalize_to_claude_like, extract_json_from_text
 from ..schema import Dish
+from ..telemetry import trace
 
 
-def render_result(raw_response: Dict[str, Any], metrics: Dict[str, Any], model_name: str):
-    """Render result with 2 columns layout."""
+def render_result(raw_response: Dict[str, Any], metrics: Dict[str, Any], model_name: str,
+                  model_id: Optional[str] = None, dish: Optional[Dish] = None):
+    """
+    Render result with 2 columns layout. model_id chọn thẳng adapter để đọc response.
+    dish: Dish đã validate trong invoke_model_dish / invoke_model_stream (không parse lại).
+    """
     try:
         with st.expander("🔧 Debug - Raw Response", expanded=False):
             st.write("**Response structure:**")
             st.write("Keys:", list(raw_response.keys()) if isinstance(raw_response, dict) else "Not a dict")
             st.json(raw_response)
 
-        # Normalize and extract text
-        normalized = normalize_to_claude_like(raw_response)
+        # Normalize and extract text (thời gian parse/validate được cộng vào metrics["stages"])
+        stages = metrics.setdefault("stages", {})
+        with trace(stages):
+            normalized = normalize_to_claude_like(raw_response, model_id)
         extracted_text = extract_text(normalized)
 
         with st.expander("🔧 Debug - Extracted Text", expanded=False):
@@ -29,7 +36,9 @@ def render_result(raw_response: Dict[str, Any], metrics: Dict[str, Any], model_n
                 st.warning("⚠️ JSON có thể bị cắt (unbalanced braces)")
                 st.write(f"Open braces: {extracted_text.count('{')}, Close braces: {extracted_text.count('}')}")
 
-        dish: Dish = parse_and_validate(normalized)
+        if dish is None:
+            with trace(stages):
+                dish = parse_and_validate(normalized, model_id)
 
         col1, col2 = st.columns([2, 1])
 
@@ -44,7 +53,21 @@ def render_result(raw_response: Dict[str, Any], metrics: Dict[str, Any], model_n
             _render_metrics(metrics, model_name, extracted_text)
 
     except Exception as e:
-        _render_error(e, raw_response, model_name)
+        _render_error(e, raw_response, model_name, model_id, metrics)
+
+
+def render_stream(events, model_name: str, model_id: Optional[str] = None):
+    """Render ingredients progressively from invoke_model_stream, then the full result."""
+    st.write("**🥕 Nguyên liệu (đang nhận...)**")
+    placeholder = st.empty()
+    rows = []
+    for event in events:
+        if event["type"] == "ingredient":
+            rows.append(event["ingredient"].model_dump(mode="json"))
+            placeholder.table(rows)
+        elif event["type"] == "done":
+            placeholder.empty()
+            render_result(event["raw"], event["metrics"], model_name, model_id, dish=event.get("dish"))
 
 
 def _render_metrics(metrics: Dict[str, Any], model_name: str, extracted_text: str):
@@ -52,9 +75,45 @@ def _render_metrics(metrics: Dict[str, Any], model_name: str, extracted_text: st
     st.subheader("📊 Thông số Model")
     st.metric("Model", model_name)
     st.metric("Thời gian xử lý", f"{metrics['latency_s']}s")
+    if metrics.get("time_to_first_ingredient_s") is not None:
+        st.metric("Nguyên liệu đầu tiên", f"{metrics['time_to_first_ingredient_s']}s")
     st.metric("Tokens đầu vào", f"{metrics['tokens_in']:,}")
     st.metric("Tokens đầu ra", f"{metrics['tokens_out']:,}")
     st.metric("Chi phí ước tính", f"${metrics['cost_est_usd']:.6f}")
+    if metrics.get("max_tokens_auto"):
+        st.caption(f"🎯 max_tokens tự động: {metrics['max_tokens']} (theo độ dài output dự đoán)")
+    if metrics.get("image_bytes_after"):
+        before = metrics.get("image_bytes_before")
+        st.caption(
+            f"🖼️ Ảnh {metrics.get('image_size_after', '')} {metrics.get('image_format', '')}: "
+            + (f"{before / 1024:,.0f} KB → " if before else "")
+            + f"{metrics['image_bytes_after'] / 1024:,.0f} KB"
+        )
+    if metrics.get("cache") in ("memory", "disk", "image", "semantic", "kb"):
+        similar = metrics.get("semantic_similarity")
+        st.caption(
+            f"💾 Cache hit ({metrics['cache']}) • tiết kiệm ${metrics.get('cost_saved_usd', 0):.6f}"
+            + (f" • mô tả gần trùng (độ giống {similar:.2f})" if similar is not None and similar < 1.0 else "")
+            + (" • knowledge base món ăn, không gọi model" if metrics["cache"] == "kb" else "")
+        )
+    cont = metrics.get("continuation")
+    if cont:
+        st.caption(
+            f"✂️ Output bị cắt ở max_tokens → nối tiếp {cont['rounds']} lần"
+            + (" (vẫn chưa đủ)" if cont["outcome"] != "complete" else "")
+            + f" • so với chạy lại: tiết kiệm ${cont['cost_saved_usd']:.6f}, {cont['latency_saved_s']}s"
+            + f", {cont['output_tokens_saved']:,} tokens output không phải sinh lại"
+        )
+    hedge = metrics.get("hedge")
+    if hedge and hedge.get("fired"):
+        st.caption(
+            f"⚡ Hedge sau {hedge['deadline_s']}s • thắng: {hedge['winner']}"
+            + f" • chi phí thêm ${hedge['extra_cost_usd']:.6f}"
+            + (" (+ request chậm chưa xong)" if hedge.get("loser_pending") else "")
+        )
+    if metrics.get("stages"):
+        with st.expander("⏱️ Thời gian từng bước", expanded=False):
+            st.table([{"Bước": k, "ms": round(v * 1000, 1)} for k, v in metrics["stages"].items()])
 
     # Performance indicators
     if metrics['latency_s'] < 2:
@@ -65,8 +124,9 @@ def _render_metrics(metrics: Dict[str, Any], model_name: str, extracted_text: st
         st.warning("🐌 Tốc độ: Chậm")
 
 
-def _render_error(error: Exception, raw_response: Dict[str, Any], model_name: str):
-    """Render error information and debugging details."""
+def _render_error(error: Exception, raw_response: Dict[str, Any], model_name: str,
+                  model_id: Optional[str] = None, metrics: Optional[Dict[str, Any]] = None):
+    """Render error information and debugging details. metrics["continuation"]: output đã được nối tiếp."""
     st.error(f"❌ Parse/Validate thất bại: {error}")
 
     col1, col2 = st.columns(2)
@@ -77,14 +137,19 @@ def _render_error(error: Exception, raw_response: Dict[str, Any], model_name: st
 
     with col2:
         try:
-            normalized = normalize_to_claude_like(raw_response)
+            normalized = normalize_to_claude_like(raw_response, model_id)
             extracted = extract_text(normalized)
             st.write(f"**📝 Extracted text ({len(extracted)} chars):**")
             st.code(extracted)
 
             if extracted.count('{') != extracted.count('}'):
                 st.error(f"🔥 JSON bị cắt! Open: {extracted.count('{')}, Close: {extracted.count('}')}")
-                st.info("💡 **Giải pháp:** Tăng max_tokens lên 1024-2048")
+                cont = (metrics or {}).get("continuation")
+                if cont and cont.get("outcome") == "truncated":
+                    st.info(f"💡 **Giải pháp:** Đã nối tiếp {cont['rounds']} lần (CONTINUATION_MAX_ROUNDS) mà JSON "
+                            "vẫn chưa đủ - tăng max_tokens hoặc số lần nối tiếp")
+                else:
+                    st.info("💡 **Giải pháp:** Tăng max_tokens lên 1024-2048")
 
             try:
                 fixed_json = extract_json_from_text(extracted)
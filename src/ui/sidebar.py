@@ -1,13 +1,34 @@
 """Sidebar components."""
 
 import streamlit as st
-from ..utils import MODEL_ID, REGION
+from ..utils import MODEL_ID, REGION, HEDGE_ENABLED, OUTPUT_CONSTRAINED
 
 
 def render_sidebar():
     """Render the sidebar with configuration options."""
     st.sidebar.header("⚙️ Cấu hình")
 
+    bypass_cache = st.sidebar.checkbox(
+        "Bỏ qua cache", value=False,
+        help="Luôn gọi Bedrock, không đọc/ghi response cache"
+    )
+    streaming = st.sidebar.checkbox(
+        "Streaming", value=False,
+        help="Hiển thị từng nguyên liệu ngay khi model trả về"
+    )
+
+    # Stream không hedge được (nguyên liệu đã hiển thị không đổi sang model khác giữa chừng)
+    hedge = st.sidebar.checkbox(
+        "Hedging", value=HEDGE_ENABLED, disabled=streaming,
+        help="Model chính trả lời chậm quá deadline thì gửi thêm request tới model nhanh hơn, lấy kết quả đến trước"
+             " (không áp dụng khi bật Streaming)"
+    ) and not streaming
+
+    constrained = st.sidebar.checkbox(
+        "Ràng buộc output", value=OUTPUT_CONSTRAINED,
+        help="Mở sẵn '{' cho câu trả lời và dừng ngay sau JSON: bớt lời dẫn, code fence, giải thích (token output)"
+    )
+
     with st.sidebar.expander("🐛 Debug Mode"):
         show_debug_info = st.checkbox("Show debug info", value=False)
         if show_debug_info:
@@ -16,4 +37,5 @@ def render_sidebar():
             st.write(f"- REGION: `{REGION}`")
             st.write("Session state:", st.session_state)
 
-    return {"show_debug_info": show_debug_info}
\ No newline at end of file
+    return {"show_debug_info": show_debug_info, "bypass_cache": bypass_cache, "streaming": streaming,
+            "hedge": hedge, "constrained": constrained}
\ No newline at end of file
@@ -1,8 +1,28 @@
 import logging, os
-from dotenv import load_dotenv
 import base64
+import binascii
+import json
 
-load_dotenv()
+
+def _load_dotenv():
+    """
+    Như load_dotenv(): tìm .env từ thư mục chứa file này đi ngược lên gốc,
+    nhưng chỉ import python-dotenv khi thật sự có file.
+    """
+    path = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        candidate = os.path.join(path, ".env")
+        if os.path.isfile(candidate):
+            from dotenv import load_dotenv
+            load_dotenv(candidate)
+            return
+        parent = os.path.dirname(path)
+        if parent == path:
+            return
+        path = parent
+
+
+_load_dotenv()
 
 
 def get_logger(name="app"):
@@ -21,6 +41,124 @@ MODEL_ID = os.getenv("MODEL_ID", "anthropic.claude-3-5-sonnet-20240620-v1:0")
 MAX_TOKENS = int(os.getenv("MAX_TOKENS", "512"))
 TEMPERATURE = float(os.getenv("TEMPERATURE", "0.2"))
 
-print(f"Config: MODEL_ID={MODEL_ID}, REGION={REGION}, MAX_TOKENS={MAX_TOKENS}, TEMPERATURE={TEMPERATURE}")
+# Response cache (xem src/response_cache.py)
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+CACHE_TTL_S = float(os.getenv("CACHE_TTL_S", "86400"))
+CACHE_MEMORY_ENTRIES = int(os.getenv("CACHE_MEMORY_ENTRIES", "256"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+
+# Image result cache theo perceptual hash (xem src/image_cache.py)
+IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+IMAGE_CACHE_MAX_DISTANCE = int(os.getenv("IMAGE_CACHE_MAX_DISTANCE", "6"))
+
+# Cache mô tả gần trùng (MinHash/LSH trên mô tả đã chuẩn hoá, xem src/semantic_cache.py)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))  # Jaccard n-gram ký tự
+SEMANTIC_CACHE_AUDIT_RATE = float(os.getenv("SEMANTIC_CACHE_AUDIT_RATE", "0.05"))  # tỉ lệ hit gần đúng ghi lại để rà
+
+# Knowledge base món ăn cục bộ: tên món -> Dish, không gọi model (xem src/knowledge_base.py)
+KB_ENABLED = os.getenv("KB_ENABLED", "true").lower() in ("1", "true", "yes")
+KB_FILE = os.getenv("KB_FILE", "")  # rỗng = CACHE_DIR/dishes.kb
+KB_AUTO_PROMOTE = os.getenv("KB_AUTO_PROMOTE", "false").lower() in ("1", "true", "yes")  # thêm kết quả model
+
+# Output bị cắt ở max_tokens: gửi request nối tiếp thay vì báo lỗi (xem src/continuation.py)
+CONTINUATION_ENABLED = os.getenv("CONTINUATION_ENABLED", "true").lower() in ("1", "true", "yes")
+CONTINUATION_MAX_ROUNDS = int(os.getenv("CONTINUATION_MAX_ROUNDS", "2"))  # số request nối tiếp tối đa
+# max_tokens của request nối tiếp (không nhỏ hơn max_tokens gốc): mỗi lần nối tiếp gửi lại cả prompt,
+# nên phải đủ để xong trong một lần
+CONTINUATION_MAX_TOKENS = int(os.getenv("CONTINUATION_MAX_TOKENS", "1024"))
+
+# Gói nhiều mô tả vào một request (batch --pack, xem src/packing.py); số mô tả mỗi gói còn bị giới hạn
+# bởi context window / max token output của model (models.MODEL_TOKEN_LIMITS)
+PACK_MAX_ITEMS = int(os.getenv("PACK_MAX_ITEMS", "16"))
+
+# Ràng buộc output (xem prompt_builder.constrain_*): Claude/Nova prefill '{' ở lượt assistant, Titan/Llama
+# mở sẵn '{' cuối prompt, kèm stop sequence sau '}' đóng JSON -> bớt token output (lời dẫn, fence, giải thích)
+OUTPUT_CONSTRAINED = os.getenv("OUTPUT_CONSTRAINED", "false").lower() in ("1", "true", "yes")
+
+# max_tokens tự động theo độ dài output dự đoán (xem src/length_predictor.py): max_tokens=0 (MAX_TOKENS=0,
+# --max-tokens 0, "Auto" trong UI) = quantile LENGTH_QUANTILE của tokens_out dự đoán
+LENGTH_LEARN = os.getenv("LENGTH_LEARN", "true").lower() in ("1", "true", "yes")  # học online từ mỗi lần gọi
+# Ghi thêm lịch sử JSONL để train/evaluate lại (chỉ đặc trưng số, không có mô tả); vượt LENGTH_HISTORY_MAX_BYTES
+# thì file được đổi tên thành .1 (giữ một file cũ)
+LENGTH_HISTORY = os.getenv("LENGTH_HISTORY", "false").lower() in ("1", "true", "yes")
+LENGTH_HISTORY_MAX_BYTES = int(os.getenv("LENGTH_HISTORY_MAX_BYTES", str(16 << 20)))
+LENGTH_QUANTILE = float(os.getenv("LENGTH_QUANTILE", "0.99"))
+LENGTH_MIN_SAMPLES = int(os.getenv("LENGTH_MIN_SAMPLES", "30"))   # chưa đủ thì dùng get_default_max_tokens
+LENGTH_MIN_TOKENS = int(os.getenv("LENGTH_MIN_TOKENS", "128"))
+LENGTH_MAX_TOKENS = int(os.getenv("LENGTH_MAX_TOKENS", "4096"))
+LENGTH_HISTORY_FILE = os.getenv("LENGTH_HISTORY_FILE", "")        # rỗng = CACHE_DIR/output_lengths.jsonl
+LENGTH_MODEL_FILE = os.getenv("LENGTH_MODEL_FILE", "")            # rỗng = CACHE_DIR/length_model.json
+
+# Tiền xử lý ảnh trước khi upload (xem src/image_preprocess.py)
+IMAGE_PREPROCESS = os.getenv("IMAGE_PREPROCESS", "true").lower() in ("1", "true", "yes")
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG")
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", "400000"))
+IMAGE_TOKEN_BUDGET = int(os.getenv("IMAGE_TOKEN_BUDGET", "1200")) or None
+
+# Ước lượng input token offline (xem src/token_estimator.py)
+TOKEN_COUNT_EXACT = os.getenv("TOKEN_COUNT_EXACT", "false").lower() in ("1", "true", "yes")  # CountTokens chạy nền
+TOKEN_CALIBRATION_FILE = os.getenv("TOKEN_CALIBRATION_FILE", "")  # rỗng = CACHE_DIR/token_calibration.json
+
+# Hedging: gửi thêm request tới model nhanh hơn khi model chính quá hạn (xem src/hedging.py)
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+HEDGE_DEADLINE_S = float(os.getenv("HEDGE_DEADLINE_S", "0"))          # 0 = học từ p95 bedrock_call của model
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))         # chưa đủ mẫu thì dùng HEDGE_DEFAULT_DEADLINE_S
+HEDGE_DEFAULT_DEADLINE_S = float(os.getenv("HEDGE_DEFAULT_DEADLINE_S", "8"))
+HEDGE_MAX_WORKERS = int(os.getenv("HEDGE_MAX_WORKERS", "0"))          # 0 = 2 * RATE_LIMIT_MAX
+
+# Kết nối tới bedrock-runtime (xem get_bedrock_client trong src/bedrock_client.py)
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.getenv("BEDROCK_MAX_POOL_CONNECTIONS", "64"))  # >= RATE_LIMIT_MAX
+BEDROCK_WARMUP = os.getenv("BEDROCK_WARMUP", "false").lower() in ("1", "true", "yes")
+BEDROCK_WARMUP_CONNECTIONS = int(os.getenv("BEDROCK_WARMUP_CONNECTIONS", "2"))
+
+# Record/replay Bedrock (xem src/cassette.py)
+BEDROCK_CASSETTE = os.getenv("BEDROCK_CASSETTE", "")                        # rỗng = gọi Bedrock trực tiếp
+BEDROCK_CASSETTE_MODE = os.getenv("BEDROCK_CASSETTE_MODE", "replay")        # record / replay / auto
+BEDROCK_CASSETTE_LATENCY = os.getenv("BEDROCK_CASSETTE_LATENCY", "none")    # none / recorded / distribution
+BEDROCK_CASSETTE_ERRORS = os.getenv("BEDROCK_CASSETTE_ERRORS", "false").lower() in ("1", "true", "yes")
+
+# Giới hạn số request Bedrock đồng thời theo model, AIMD (xem src/rate_limiter.py)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_INITIAL = int(os.getenv("RATE_LIMIT_INITIAL", "8"))
+RATE_LIMIT_MIN = int(os.getenv("RATE_LIMIT_MIN", "1"))
+RATE_LIMIT_MAX = int(os.getenv("RATE_LIMIT_MAX", "64"))
+RATE_LIMIT_QUEUE_TIMEOUT_S = float(os.getenv("RATE_LIMIT_QUEUE_TIMEOUT_S", "60"))  # 0 = chờ không giới hạn
+
+# Telemetry theo từng bước (xem src/telemetry.py)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))            # 0 = không mở HTTP endpoint
+METRICS_FILE = os.getenv("METRICS_FILE", "")                  # rỗng = không ghi file
+METRICS_FILE_INTERVAL_S = float(os.getenv("METRICS_FILE_INTERVAL_S", "15"))
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "2048"))     # số mẫu gần nhất để tính p50/p95/p99
+
 def to_base64(b: bytes) -> str:
-    return base64.b64encode(b).decode("utf-8")
\ No newline at end of file
+    return base64.b64encode(b).decode("utf-8")
+
+
+# Số byte đầu vào mỗi lần encode base64 (bội số của 3 để không sinh padding giữa chừng)
+_B64_CHUNK = 3 * 16384
+
+
+def dumps_with_base64(obj, marker: str, data) -> bytearray:
+    """
+    json.dumps(obj) nhưng chuỗi `marker` được thay bằng base64 của `data`,
+    ghi thẳng vào một bytearray duy nhất.
+    Không tạo bản sao base64 str/bytes của cả ảnh: input được đọc qua memoryview
+    và encode từng đoạn nhỏ vào đúng vị trí trong buffer.
+    """
+    head, tail = json.dumps(obj, ensure_ascii=False).encode("utf-8").split(marker.encode("ascii"), 1)
+    src = memoryview(data).cast("B")
+    b64_len = 4 * ((len(src) + 2) // 3)
+    buf = bytearray(len(head) + b64_len + len(tail))
+    buf[:len(head)] = head
+    pos = len(head)
+    for i in range(0, len(src), _B64_CHUNK):
+        piece = binascii.b2a_base64(src[i:i + _B64_CHUNK], newline=False)
+        buf[pos:pos + len(piece)] = piece
+        pos += len(piece)
+    buf[pos:] = tail
+    return buf
+
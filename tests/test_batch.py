@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+from benchmarks.stub_bedrock import FakeBedrockRuntime
+from src.batch import iter_rows, run_batch
+from src.bedrock_client import BedrockClient
+
+CLAUDE = "anthropic.claude-3-5-sonnet-20240620-v1:0"
+
+
+class _Crash(BaseException):
+    """Giả lập process bị dừng giữa batch (không phải Exception nên run_one không bắt)."""
+
+
+class _CrashingRuntime(FakeBedrockRuntime):
+    def __init__(self, crash_at: int):
+        super().__init__()
+        self.crash_at = crash_at
+
+    def invoke_model(self, **kwargs):
+        if self.calls >= self.crash_at:
+            raise _Crash()
+        return super().invoke_model(**kwargs)
+
+
+def _write_input(tmp_path, lines):
+    path = tmp_path / "in.jsonl"
+    path.write_text("".join(line + "\n" for line in lines), encoding="utf-8")
+    return path
+
+
+def _desc_lines(n):
+    return [json.dumps({"id": f"r{i}", "desc": f"món {i}"}, ensure_ascii=False) for i in range(n)]
+
+
+def _lines(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def _run(runtime, tmp_path, **kw):
+    return run_batch(BedrockClient(client=runtime), str(tmp_path / "in.jsonl"), str(tmp_path / "out.jsonl"),
+                     model_id=CLAUDE, max_tokens=300, max_concurrency=1, use_cache=False, checkpoint_every=2, **kw)
+
+
+def test_iter_rows_marks_invalid_lines(tmp_path):
+    _write_input(tmp_path, ['"phở bò"', "{bad json", "", "[1, 2]", '{"desc": "bún chả"}'])
+    rows = list(iter_rows(str(tmp_path / "in.jsonl")))
+    assert [r["id"] for r in rows] == [0, 1, 3, 4]
+    assert rows[0]["desc"] == "phở bò" and rows[3]["desc"] == "bún chả"
+    assert rows[1]["_invalid"]["line"] == 2 and rows[1]["_invalid"]["error"].startswith("JSONDecodeError")
+    assert rows[2]["_invalid"]["line"] == 4 and "list" in rows[2]["_invalid"]["error"]
+
+
+@pytest.mark.parametrize("pack", [False, True])
+def test_invalid_rows_recorded_and_run_continues(tmp_path, monkeypatch, pack):
+    monkeypatch.setattr("src.packing.get_knowledge_base", lambda: None)
+    _write_input(tmp_path, ["{bad json", '{"desc": "phở bò"}', "42", '{"desc": "bún chả", "max_tokens": "x"}',
+                            '{"desc": "cơm tấm"}', "null"])
+    stub = FakeBedrockRuntime()
+    summary = _run(stub, tmp_path, pack=pack)
+    assert (summary["total"], summary["ok"], summary["failed"]) == (6, 2, 4)
+    assert stub.calls == (1 if pack else 2)
+    out = _lines(tmp_path / "out.jsonl")
+    errors = _lines(tmp_path / "out.jsonl.errors.jsonl")
+    assert [(r["id"], r["index"]) for r in out] == [(1, 1), (4, 4)]
+    assert [(r["index"], r.get("line")) for r in errors] == [(0, 1), (2, 3), (3, None), (5, 6)]
+    assert errors[0]["raw_text"] == "{bad json"
+    assert errors[2]["error"].startswith("ValueError")
+
+    # chạy lại: checkpoint đã qua hết các dòng hỏng, không gọi lại model
+    stub = FakeBedrockRuntime()
+    assert _run(stub, tmp_path, pack=pack)["total"] == 0 and stub.calls == 0
+
+
+def test_resume_after_crash_has_no_duplicate_or_missing_rows(tmp_path):
+    _write_input(tmp_path, _desc_lines(7))
+    with pytest.raises(_Crash):
+        _run(_CrashingRuntime(crash_at=3), tmp_path)
+    assert [r["id"] for r in _lines(tmp_path / "out.jsonl")] == ["r0", "r1", "r2"]
+
+    stub = FakeBedrockRuntime()
+    summary = _run(stub, tmp_path)
+    assert summary["total"] == 4 and stub.calls == 4
+    out = _lines(tmp_path / "out.jsonl")
+    assert [r["id"] for r in out] == [f"r{i}" for i in range(7)]
+    assert [r["index"] for r in out] == list(range(7))
+
+
+def test_resume_truncates_partial_output_line(tmp_path):
+    _write_input(tmp_path, _desc_lines(5))
+    with pytest.raises(_Crash):
+        _run(_CrashingRuntime(crash_at=2), tmp_path)
+    # process bị kill giữa lúc ghi: phần sau offset của checkpoint là một dòng dở
+    out_path = tmp_path / "out.jsonl"
+    with open(out_path, "ab") as f:
+        f.write(b'{"id": "r2", "index": 2, "di')
+
+    _run(FakeBedrockRuntime(), tmp_path)
+    assert [r["id"] for r in _lines(out_path)] == [f"r{i}" for i in range(5)]
+
+
+def test_checkpoint_of_other_input_rejected(tmp_path):
+    _write_input(tmp_path, _desc_lines(2))
+    _run(FakeBedrockRuntime(), tmp_path)
+    other = tmp_path / "other.jsonl"
+    other.write_text(_desc_lines(1)[0] + "\n", encoding="utf-8")
+    with pytest.raises(RuntimeError, match="another input"):
+        run_batch(BedrockClient(client=FakeBedrockRuntime()), str(other), str(tmp_path / "out.jsonl"))
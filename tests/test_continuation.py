@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from src.continuation import MIN_OVERLAP, splice, truncation_signal
+
+FULL = json.dumps({
+    "dish_name": "Canh chua cá lóc",
+    "ingredients": [
+        {"name": "cá lóc", "quantity": "500", "unit": "g"},
+        {"name": "me chua", "quantity": "30", "unit": "g"},
+        {"name": "dứa", "quantity": "0.25", "unit": "quả"},
+    ],
+}, ensure_ascii=False)
+CUT = FULL.index('me chua') + 2  # giữa một chuỗi, không có khoảng trắng cuối
+
+
+def test_prefill_splice_is_plain_concatenation():
+    assert splice(FULL[:CUT] + "  \n", FULL[CUT:]) == FULL
+
+
+def test_repeated_tail_is_dropped():
+    # Titan/Llama viết lại đoạn cuối của prompt trước khi viết tiếp
+    overlap = FULL[CUT - 40:CUT]
+    assert splice(FULL[:CUT], " " + overlap + FULL[CUT:], prefill=False) == FULL
+
+
+def test_short_overlap_is_not_treated_as_repeat():
+    partial, piece = FULL[:CUT], FULL[CUT:]
+    head = partial[-(MIN_OVERLAP - 1):]
+    assert splice(partial, head + piece, prefill=False) == partial + head + piece
+
+
+def test_rewritten_json_replaces_partial():
+    assert splice(FULL[:CUT], "\n" + FULL + "\n", prefill=False) == FULL
+
+
+def test_no_overlap_appends():
+    assert splice(FULL[:CUT], FULL[CUT:], prefill=False) == FULL
+
+
+@pytest.mark.parametrize("stop_reason, tokens_out, max_tokens, expected", [
+    ("max_tokens", 100, 512, "stop_reason"),
+    ("LENGTH", None, 512, "stop_reason"),
+    ("length", None, 512, "stop_reason"),
+    ("end_turn", 512, 512, "token_limit"),
+    (None, None, 512, "structure"),
+    ("end_turn", 100, 512, None),
+])
+def test_truncation_signal_on_unterminated_json(stop_reason, tokens_out, max_tokens, expected):
+    assert truncation_signal(FULL[:CUT], stop_reason, tokens_out, max_tokens) == expected
+
+
+def test_complete_json_is_never_truncated():
+    assert truncation_signal(FULL, "max_tokens", 512, 512) is None
@@ -0,0 +1,62 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src import hedging
+
+PRIMARY = "anthropic.claude-3-5-sonnet-20240620-v1:0"
+FALLBACK = "anthropic.claude-3-haiku-20240307-v1:0"
+DISH = '{"dish_name": "Phở bò", "ingredients": [{"name": "Bánh phở", "quantity": "200g"}]}'
+
+
+@pytest.fixture
+def fake_invoke(monkeypatch):
+    delays = {}
+    calls = []
+
+    def invoke_model_dish(client, desc, model_id, *args, **kwargs):
+        calls.append(model_id)
+        time.sleep(delays.get(model_id, 0.0))
+        raw = {"content": [{"type": "text", "text": DISH}]}
+        return raw, {"cost_est_usd": 0.001}, hedging.parse_and_validate(raw, model_id)
+
+    monkeypatch.setattr("src.inference.invoke_model_dish", invoke_model_dish)
+    return delays, calls
+
+
+def test_executor_sized_from_rate_limit(monkeypatch):
+    monkeypatch.setattr(hedging, "_pool", None)
+    monkeypatch.setattr(hedging, "HEDGE_MAX_WORKERS", 0)
+    assert hedging._executor()._max_workers == 2 * hedging.RATE_LIMIT_MAX
+    monkeypatch.setattr(hedging, "_pool", None)
+    monkeypatch.setattr(hedging, "HEDGE_MAX_WORKERS", 3)
+    assert hedging._executor()._max_workers == 3
+
+
+def test_fast_primary_wins_without_hedge(fake_invoke):
+    delays, calls = fake_invoke
+    _, metrics, dish = hedging.invoke_model_hedged(None, "phở bò", PRIMARY, 0.0, 300, fallback_model=FALLBACK,
+                                                   deadline_s=1.0)
+    assert dish.dish_name == "Phở bò" and calls == [PRIMARY]
+    assert (metrics["hedge"]["fired"], metrics["hedge"]["winner"]) == (False, PRIMARY)
+
+
+def test_slow_primary_fires_fallback(fake_invoke):
+    delays, calls = fake_invoke
+    delays[PRIMARY] = 0.5
+    _, metrics, _ = hedging.invoke_model_hedged(None, "phở bò", PRIMARY, 0.0, 300, fallback_model=FALLBACK,
+                                                deadline_s=0.05)
+    assert metrics["hedge"]["fired"] and metrics["hedge"]["winner"] == FALLBACK
+
+
+def test_deadline_excludes_time_queued_for_a_worker(fake_invoke, monkeypatch):
+    delays, calls = fake_invoke
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(hedging, "_pool", pool)
+    busy = pool.submit(time.sleep, 0.3)  # request chính phải chờ worker lâu hơn deadline
+    _, metrics, _ = hedging.invoke_model_hedged(None, "phở bò", PRIMARY, 0.0, 300, fallback_model=FALLBACK,
+                                                deadline_s=0.1)
+    busy.result()
+    pool.shutdown()
+    assert not metrics["hedge"]["fired"] and calls == [PRIMARY]
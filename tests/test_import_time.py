@@ -0,0 +1,11 @@
+import pytest
+
+from benchmarks.bench_import_time import TARGETS, measure
+
+
+@pytest.mark.parametrize("name", sorted(TARGETS))
+def test_import_within_budget_without_heavy_modules(name):
+    result = measure(name, runs=3, budget_ms=TARGETS[name][1])
+    assert result["forbidden_loaded"] == [], f"{result['module']} eagerly imports {result['forbidden_loaded']}"
+    assert result["import_ms"] <= result["budget_ms"], \
+        f"{result['module']} took {result['import_ms']}ms (budget {result['budget_ms']}ms): {result['heaviest_ms']}"
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from src.json_extract import find_json_object, is_unterminated
+
+FULL = json.dumps({
+    "dish_name": "Bún chả",
+    "ingredients": [
+        {"name": "bún", "quantity": "300", "unit": "g"},
+        {"name": "thịt ba chỉ", "quantity": "250", "unit": "g"},
+        {"name": "nước mắm \"nhĩ\"", "quantity": "2", "unit": "muỗng"},
+    ],
+    "notes": ["ăn kèm rau sống"],
+}, ensure_ascii=False)
+
+
+def test_complete_object_after_lead_in():
+    text = "Kết quả {tham khảo}:\n```json\n" + FULL + "\n```\nChúc ngon miệng!"
+    assert find_json_object(text) == (FULL, False)
+    assert not is_unterminated(text)
+
+
+def test_no_object_raises():
+    with pytest.raises(ValueError):
+        find_json_object("không có JSON")
+
+
+def _is_prefix_of(value, original) -> bool:
+    """value là phần đầu của original: không thêm key / phần tử / ký tự nào không có trong output."""
+    if isinstance(value, dict):
+        return isinstance(original, dict) and all(k in original and _is_prefix_of(v, original[k])
+                                                  for k, v in value.items())
+    if isinstance(value, list):
+        return isinstance(original, list) and len(value) <= len(original) \
+            and all(_is_prefix_of(v, o) for v, o in zip(value, original))
+    if isinstance(value, str):
+        return isinstance(original, str) and original.startswith(value)
+    return value == original
+
+
+@pytest.mark.parametrize("cut", range(len('{"dish_name": "B'), len(FULL) - 1))
+def test_truncated_output_repaired_to_valid_json(cut):
+    partial = FULL[:cut]
+    assert is_unterminated(partial)
+    fixed, repaired = find_json_object(partial)
+    assert repaired
+    assert _is_prefix_of(json.loads(fixed), json.loads(FULL))
+
+
+def test_truncated_string_value_kept_and_partial_key_dropped():
+    fixed, repaired = find_json_object('{"dish_name": "Phở b')
+    assert repaired and json.loads(fixed) == {"dish_name": "Phở b"}
+    fixed, _ = find_json_object('{"dish_name": "Phở", "cuis')
+    assert json.loads(fixed) == {"dish_name": "Phở"}
+
+
+def test_partial_escape_dropped():
+    fixed, _ = find_json_object('{"dish_name": "a\\')
+    assert json.loads(fixed) == {"dish_name": "a"}
+    fixed, _ = find_json_object('{"dish_name": "a\\u00')
+    assert json.loads(fixed) == {"dish_name": "a"}
+
+
+def test_truncated_ingredient_kept_as_far_as_complete():
+    partial = FULL[:FULL.index('"thịt ba chỉ"') + len('"thịt ba chỉ", "quan')]
+    data = json.loads(find_json_object(partial)[0])
+    assert data["ingredients"][0] == {"name": "bún", "quantity": "300", "unit": "g"}
+    assert data["ingredients"][-1] == {"name": "thịt ba chỉ"}
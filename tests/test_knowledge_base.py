@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from src.knowledge_base import KnowledgeBase, dish_keys
+
+
+def _dish(name, *ingredients):
+    return {"dish_name": name, "ingredients": [{"name": i, "quantity": "1"} for i in ingredients or ("muối",)]}
+
+
+@pytest.fixture
+def kb(tmp_path):
+    kb = KnowledgeBase(str(tmp_path / "dishes.kb")).load()
+    kb.promote_many([
+        (_dish("Phở bò", "bánh phở"), ["pho bo ha noi"]),
+        (_dish("Bánh bò"), []),
+        (_dish("Bánh bơ"), []),
+        (_dish("Canh chua không cá", "me"), []),
+    ])
+    return kb
+
+
+def _name(dish_json):
+    return json.loads(dish_json)["dish_name"] if dish_json else None
+
+
+def test_dish_keys_ignore_case_order_and_question_phrasing():
+    assert dish_keys("Phở bò") == ("bò phở", "bo pho")
+    assert dish_keys("Hãy cho tôi nguyên liệu của món bò phở.") == ("bò phở", "bo pho")
+    assert dish_keys("có gì") == ("", "")
+
+
+@pytest.mark.parametrize("desc", [
+    "phở bò", "PHỞ BÒ", "Hãy cho tôi nguyên liệu của món phở bò.", "phở bò cần gì", "pho bo", "pho bo ha noi",
+])
+def test_lookup_by_name_and_alias(kb, desc):
+    assert _name(kb.lookup(desc)) == "Phở bò"
+
+
+@pytest.mark.parametrize("desc", [
+    "phở bò cho 4 người",   # thừa từ: yêu cầu khác
+    "phở gà",
+    "banh bo",              # bánh bò / bánh bơ cùng bỏ dấu thành "banh bo"
+    "canh chua có cá",      # giữ từ phủ định: không trùng "canh chua không cá"
+    "canh chua cá",
+    "",
+    "phở bò " * 40,         # dài hơn MAX_QUERY_CHARS
+])
+def test_lookup_miss(kb, desc):
+    assert kb.lookup(desc) is None
+
+
+def test_accented_lookup_still_answers_ambiguous_folded_key(kb):
+    assert _name(kb.lookup("bánh bò")) == "Bánh bò"
+    assert _name(kb.lookup("bánh bơ")) == "Bánh bơ"
+    assert kb.report()["ambiguous_folded_keys"] == 1
+
+
+def test_promote_keeps_existing_unless_replace(kb):
+    assert not kb.promote(_dish("Phở bò", "thịt gà"))
+    assert json.loads(kb.lookup("phở bò"))["ingredients"][0]["name"] == "bánh phở"
+    assert kb.promote(_dish("Phở bò", "thịt bò"), replace=True)
+    assert json.loads(kb.lookup("phở bò"))["ingredients"][0]["name"] == "thịt bò"
+
+
+def test_reload_from_file(kb):
+    kb.promote(_dish("Bún chả", "bún"), replace=True)
+    reloaded = KnowledgeBase(kb.path).load()
+    assert len(reloaded) == len(kb)
+    assert _name(reloaded.lookup("bun cha")) == "Bún chả"
+    assert reloaded.lookup("banh bo") is None
+    assert {e["dish"]["dish_name"] for e in reloaded.export()} >= {"Phở bò", "Bánh bò", "Bún chả"}
+
+
+def test_unwritable_path_does_not_add_to_memory(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    kb = KnowledgeBase(str(blocker / "dishes.kb")).load()
+    assert kb.promote(_dish("Phở bò")) is False
+    assert kb.lookup("phở bò") is None
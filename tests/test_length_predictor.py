@@ -0,0 +1,59 @@
+import math
+
+from src.length_predictor import LengthPredictor, desc_features, entry_features, features, read_history
+
+MODEL = "amazon.titan-text-express-v1"
+
+
+def test_desc_features():
+    assert desc_features("phở bò với hành, ớt và chanh cho 4 người") == (3, True)
+    assert desc_features("") == (0, False)
+
+
+def test_history_has_features_but_no_description(tmp_path):
+    path = str(tmp_path / "lengths.jsonl")
+    predictor = LengthPredictor(history_path=path)
+    predictor.observe(MODEL, "phở bò của tôi, không hành", 0, False, 250, 512)
+    (entry,) = read_history(path)
+    assert "desc" not in entry
+    assert entry["items"] == 1 and entry["has_number"] is False and entry["tokens_out"] == 250
+    assert "phở" not in open(path, encoding="utf-8").read()
+
+
+def test_history_rotates_at_max_bytes(tmp_path):
+    path = str(tmp_path / "lengths.jsonl")
+    predictor = LengthPredictor(history_path=path, history_max_bytes=1000)
+    for i in range(40):
+        predictor.observe(MODEL, "phở bò", 0, False, 100 + i, 512)
+    assert (tmp_path / "lengths.jsonl").stat().st_size < 1000 + 300
+    assert (tmp_path / "lengths.jsonl.1").exists()
+    outputs = [e["tokens_out"] for e in read_history(path)]
+    assert outputs == sorted(outputs) and outputs[-1] == 139 and len(outputs) < 40
+
+
+def test_no_history_file_without_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    predictor = LengthPredictor()
+    predictor.observe(MODEL, "phở bò", 0, False, 250, 512)
+    assert list(tmp_path.iterdir()) == []
+    assert predictor.groups()[f"{MODEL}|v0"] == 1
+
+
+def test_legacy_entries_with_desc_still_train():
+    legacy = {"model_id": MODEL, "desc": "bún, chả và 2 người", "tokens_in_est": 100, "tokens_out": 300}
+    assert entry_features(legacy) == features(100, 2, True)
+    predictor = LengthPredictor(min_samples=5)
+    entries = [dict(legacy, tokens_out=300 + i) for i in range(20)]
+    assert predictor.train(entries) == 20
+    assert predictor.train([dict(legacy, truncated=True)]) == 0
+    assert predictor.groups()[f"{MODEL}|v0"] == 20
+
+
+def test_predicts_from_feature_only_history():
+    predictor = LengthPredictor(min_samples=5, quantile=0.5)
+    entries = [{"model_id": MODEL, "tokens_in_est": 100 + i, "items": i % 3, "has_number": False,
+                "tokens_out": int(200 * math.exp(0.2 * (i % 3)))} for i in range(60)]
+    predictor.train(entries)
+    small, large = predictor._predict(MODEL, 0, False, features(100, 0, False))[0], \
+        predictor._predict(MODEL, 0, False, features(100, 2, False))[0]
+    assert small is not None and large is not None and small <= large
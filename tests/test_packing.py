@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from src import packing
+from src.packing import parse_packed, plan_packs, validate_packed
+
+CLAUDE = "anthropic.claude-3-5-sonnet-20240620-v1:0"
+ITEM = {"dish_name": "Phở bò", "ingredients": [{"name": "bánh phở", "quantity": "200", "unit": "g"}]}
+
+
+def _array(*indexes):
+    return json.dumps([{"index": i, **ITEM} for i in indexes], ensure_ascii=False)
+
+
+def test_parse_packed_skips_lead_in_and_keeps_order():
+    text = "Kết quả [tham khảo]:\n```json\n" + _array(1, 0) + "\n```"
+    assert [index for index, _ in parse_packed(text)] == [1, 0]
+
+
+def test_parse_packed_stops_at_truncated_element():
+    text = _array(0, 1, 2)
+    elements = parse_packed(text[:text.rindex('"ingredients"')])
+    assert [index for index, _ in elements] == [0, 1]
+
+
+def test_parse_packed_without_array():
+    assert parse_packed('{"dish_name": "x"}') == []
+
+
+def test_validate_packed_per_item():
+    elements = [
+        {"index": 0, **ITEM},
+        {"index": 1, "dish_name": "x", "ingredients": [{"name": ""}]},  # sai schema
+        {"index": 0, "dish_name": "trùng index"},
+        {"index": 9, **ITEM},                                           # ngoài gói
+        {"index": "abc", **ITEM},
+        {**ITEM, "dish_name": "không ghi index"},                      # dùng vị trí (5)
+    ]
+    dishes = validate_packed(json.dumps(elements, ensure_ascii=False), size=6)
+    assert sorted(dishes) == [0, 5]
+    assert dishes[0].dish_name == "Phở bò"
+    assert dishes[5].dish_name == "không ghi index"
+
+
+def test_validate_packed_truncated_output_keeps_complete_items():
+    text = _array(0, 1, 2)
+    assert sorted(validate_packed(text[:-30], size=3)) == [0, 1]
+
+
+@pytest.fixture
+def no_kb(monkeypatch):
+    monkeypatch.setattr(packing, "get_knowledge_base", lambda: None)
+
+
+def _req(desc, **kw):
+    return {"desc": desc, "model_id": CLAUDE, "max_tokens": 300, "use_cache": False, **kw}
+
+
+def test_plan_packs_groups_by_model_parameters(no_kb):
+    requests = [
+        _req("phở bò"), _req("bún chả"),
+        _req("bánh xèo", prompt_version=2),
+        _req("cơm tấm", constrained=True),
+        _req("gỏi cuốn", temperature=0.7),
+        _req("chả giò", temperature=0.7),
+        _req(""),
+        _req("ảnh", img=b"..."),
+    ]
+    packs = list(plan_packs(requests))
+    assert [[index for index, _ in p["items"]] for p in packs] == [[0, 1], [2], [3], [4, 5], [6], [7]]
+    assert (packs[1]["prompt_version"], packs[2]["constrained"], packs[3]["temperature"]) == (2, True, 0.7)
+
+
+def test_plan_packs_respects_explicit_max_tokens(no_kb):
+    packs = list(plan_packs([_req("phở bò"), _req("bún chả", max_tokens=1000)]))
+    assert packs[0]["item_max_tokens"] == [(300, False), (1000, False)]
+    assert packs[0]["max_tokens"] >= 1300
+
+
+def test_plan_packs_splits_on_output_limit(no_kb):
+    _, output_limit = packing.get_model_token_limits(CLAUDE)
+    per_item = output_limit // 3
+    packs = list(plan_packs([_req(f"món {i}", max_tokens=per_item) for i in range(6)]))
+    assert all(p["max_tokens"] <= output_limit for p in packs)
+    assert sum(len(p["items"]) for p in packs) == 6 and len(packs) > 2
+
+
+def test_plan_packs_max_items(no_kb):
+    packs = list(plan_packs([_req(f"món {i}") for i in range(10)], max_items=4))
+    assert [len(p["items"]) for p in packs] == [4, 4, 2]
+
+
+@pytest.mark.parametrize("constrained", [False, True])
+@pytest.mark.parametrize("model_id", [CLAUDE, "amazon.nova-lite-v1:0", "amazon.titan-text-express-v1",
+                                      "meta.llama3-8b-instruct-v1:0"])
+def test_iter_invoke_packed_with_stub(no_kb, model_id, constrained):
+    from benchmarks.stub_bedrock import FakeBedrockRuntime
+    from src.bedrock_client import BedrockClient
+
+    stub = FakeBedrockRuntime()
+    requests = [_req(f"món {i}", model_id=model_id, constrained=constrained) for i in range(5)]
+    results = list(packing.iter_invoke_packed(BedrockClient(client=stub), requests))
+    assert stub.calls == 1
+    assert [r["index"] for r in results] == list(range(5))
+    assert all(r["ok"] and r["dish"].ingredients and not r["pack"]["reissued"] for r in results)
+    assert {(r["metrics"]["max_tokens"], r["metrics"]["constrained"]) for r in results} == {(300, constrained)}
@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+from src.rate_limiter import AdaptiveLimiter, LimiterTimeout
+
+MODEL = "test-model"
+
+
+def test_additive_increase_after_limit_successes():
+    limiter = AdaptiveLimiter(initial=4, min_limit=1, max_limit=8)
+    for _ in range(4):
+        limiter.release(MODEL, "ok", limiter.acquire(MODEL))
+    assert limiter.snapshot()[MODEL]["limit"] == pytest.approx(5.0, abs=0.1)
+
+
+def test_increase_capped_at_max():
+    limiter = AdaptiveLimiter(initial=2, min_limit=1, max_limit=3)
+    for _ in range(50):
+        limiter.release(MODEL, "ok", limiter.acquire(MODEL))
+    assert limiter.snapshot()[MODEL]["limit"] == 3
+
+
+def test_throttle_halves_once_per_round():
+    limiter = AdaptiveLimiter(initial=8, min_limit=1, max_limit=16)
+    started = [limiter.acquire(MODEL) for _ in range(4)]
+    # bốn request cùng đợt bị throttle: chỉ giảm một lần
+    for t in started:
+        limiter.release(MODEL, "throttled", t)
+    assert limiter.snapshot()[MODEL]["limit"] == 4
+    # request bắt đầu sau lần giảm thì được giảm tiếp
+    limiter.release(MODEL, "throttled", limiter.acquire(MODEL))
+    assert limiter.snapshot()[MODEL]["limit"] == 2
+
+
+def test_limit_never_below_min_and_other_errors_keep_limit():
+    limiter = AdaptiveLimiter(initial=2, min_limit=2, max_limit=8)
+    limiter.release(MODEL, "throttled", limiter.acquire(MODEL))
+    assert limiter.snapshot()[MODEL]["limit"] == 2
+    limiter.release(MODEL, "error", limiter.acquire(MODEL))
+    assert limiter.snapshot()[MODEL] == {"limit": 2, "inflight": 0, "queued": 0}
+
+
+def test_waiters_granted_in_fifo_order():
+    limiter = AdaptiveLimiter(initial=1, min_limit=1, max_limit=1)
+    first = limiter.acquire(MODEL)
+    order, threads = [], []
+    for n in range(3):
+        def worker(n=n):
+            t = limiter.acquire(MODEL, timeout=5)
+            order.append(n)
+            limiter.release(MODEL, "error", t)
+        thread = threading.Thread(target=worker)
+        thread.start()
+        threads.append(thread)
+        while limiter.snapshot()[MODEL]["queued"] < n + 1:  # xếp hàng đúng thứ tự tạo thread
+            time.sleep(0.001)
+    limiter.release(MODEL, "error", first)
+    for thread in threads:
+        thread.join(5)
+    assert order == [0, 1, 2]
+    assert limiter.snapshot()[MODEL] == {"limit": 1, "inflight": 0, "queued": 0}
+
+
+def test_queue_timeout():
+    limiter = AdaptiveLimiter(initial=1, min_limit=1, max_limit=1)
+    limiter.acquire(MODEL)
+    with pytest.raises(LimiterTimeout):
+        limiter.acquire(MODEL, timeout=0.01)
+    assert limiter.snapshot()[MODEL]["queued"] == 0
+
+
+def test_models_limited_independently():
+    limiter = AdaptiveLimiter(initial=1, min_limit=1, max_limit=1)
+    limiter.acquire(MODEL)
+    limiter.acquire("other-model", timeout=0.01)
+    assert limiter.snapshot()["other-model"]["inflight"] == 1
+
+
+class _TimeoutLimiter:
+    def __init__(self):
+        self.acquires = 0
+
+    def acquire(self, model_id, timeout=None):
+        self.acquires += 1
+        raise LimiterTimeout(f"Waited 60s for a Bedrock slot ({model_id})")
+
+    def release(self, model_id, outcome="ok", started=0.0):
+        raise AssertionError("release without a slot")
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_queue_timeout_not_retried_by_client(stream):
+    from benchmarks.stub_bedrock import FakeBedrockRuntime
+    from src.bedrock_client import BedrockClient, BedrockQueueTimeout
+
+    stub = FakeBedrockRuntime()
+    client = BedrockClient(client=stub)
+    client.limiter = _TimeoutLimiter()
+    with pytest.raises(BedrockQueueTimeout):
+        if stream:
+            list(client.invoke_stream(MODEL, {}))
+        else:
+            client.invoke(MODEL, {})
+    assert client.limiter.acquires == 1
+    assert stub.calls == 0
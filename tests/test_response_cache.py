@@ -0,0 +1,151 @@
+import json
+
+import pytest
+
+from src import inference
+from src.response_cache import ResponseCache, make_cache_key
+
+CLAUDE = "anthropic.claude-3-5-sonnet-20240620-v1:0"
+HDRS = {"x-amzn-bedrock-input-token-count": "50", "x-amzn-bedrock-output-token-count": "20"}
+DISH = {"dish_name": "Phở bò", "ingredients": [{"name": "Bánh phở", "quantity": "200g"}]}
+
+
+def _raw(text):
+    return {"content": [{"type": "text", "text": text}], "stop_reason": "end_turn"}
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = _Clock()
+    monkeypatch.setattr("src.response_cache.time", c)
+    return c
+
+
+def test_cache_key_ignores_dict_order():
+    assert make_cache_key(CLAUDE, {"a": 1, "b": 2}) == make_cache_key(CLAUDE, {"b": 2, "a": 1})
+    assert make_cache_key(CLAUDE, {"a": 1}) != make_cache_key("other", {"a": 1})
+
+
+def test_get_put_roundtrip_memory_then_disk(tmp_path):
+    path = str(tmp_path / "r.sqlite3")
+    cache = ResponseCache(path=path)
+    assert cache.get("k") == (None, "miss")
+    cache.put("k", CLAUDE, _raw("x"), HDRS)
+    (raw, hdrs), tier = cache.get("k")
+    assert (raw, hdrs, tier) == (_raw("x"), HDRS, "memory")
+    # mỗi hit là một dict mới
+    raw["content"] = []
+    assert cache.get("k")[0][0] == _raw("x")
+
+    fresh = ResponseCache(path=path)
+    assert fresh.get("k")[1] == "disk"
+    assert fresh.get("k")[1] == "memory"
+    assert (cache.stats(), fresh.stats()) == ({"cache_hits": 2, "cache_misses": 1},
+                                              {"cache_hits": 2, "cache_misses": 0})
+
+
+def test_ttl_expiry(tmp_path, clock):
+    path = str(tmp_path / "r.sqlite3")
+    cache = ResponseCache(path=path, ttl_s=10)
+    cache.put("k", CLAUDE, _raw("x"), HDRS)
+    clock.now += 9
+    assert cache.get("k")[1] == "memory"
+    clock.now += 2
+    assert cache.get("k") == (None, "miss")
+    assert ResponseCache(path=path, ttl_s=10).get("k") == (None, "miss")
+
+
+def test_memory_lru_eviction(tmp_path):
+    cache = ResponseCache(path=str(tmp_path / "r.sqlite3"), memory_entries=2)
+    for key in ("a", "b"):
+        cache.put(key, CLAUDE, _raw(key), HDRS)
+    cache.get("a")
+    cache.put("c", CLAUDE, _raw("c"), HDRS)
+    assert list(cache._mem) == ["a", "c"]
+    # "b" rơi khỏi bộ nhớ nhưng vẫn còn trên đĩa
+    assert cache.get("b")[1] == "disk"
+
+
+def test_disk_size_eviction_drops_least_recently_used(tmp_path, clock):
+    path = str(tmp_path / "r.sqlite3")
+    cache = ResponseCache(path=path, memory_entries=0, max_entries=2)
+    for key in ("a", "b"):
+        cache.put(key, CLAUDE, _raw(key), HDRS)
+        clock.now += 1
+    assert cache.get("a")[1] == "disk"
+    clock.now += 1
+    cache.put("c", CLAUDE, _raw("c"), HDRS)
+    assert [cache.get(k)[1] for k in ("a", "b", "c")] == ["disk", "miss", "disk"]
+
+
+def test_disk_unavailable_falls_back_to_memory(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    cache = ResponseCache(path=str(blocker / "r.sqlite3"))
+    cache.put("k", CLAUDE, _raw("x"), HDRS)
+    assert cache.get("k")[1] == "memory"
+
+
+class _FakeClient:
+    def __init__(self, text):
+        self.text = text
+        self.calls = 0
+
+    def invoke(self, model_id, body):
+        self.calls += 1
+        return _raw(self.text), dict(HDRS)
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    monkeypatch.setattr(inference, "get_knowledge_base", lambda: None)
+    monkeypatch.setattr(inference, "get_semantic_cache", lambda: None)
+    monkeypatch.setattr(inference, "_observe_length", lambda *a, **kw: None)
+
+
+def _invoke(client, cache, **kw):
+    return inference.invoke_model_dish(client, "phở bò", CLAUDE, 0.0, 300, cache=cache, hedge=False,
+                                       constrained=False, **kw)
+
+
+def test_valid_response_is_cached(tmp_path, pipeline):
+    cache = ResponseCache(path=str(tmp_path / "r.sqlite3"))
+    client = _FakeClient(json.dumps(DISH, ensure_ascii=False))
+    _, metrics, dish = _invoke(client, cache)
+    assert metrics["cache"] == "miss" and dish.dish_name == "Phở bò"
+    _, metrics, dish = _invoke(client, cache)
+    assert metrics["cache"] == "memory" and dish.dish_name == "Phở bò"
+    assert client.calls == 1
+
+
+def test_invalid_response_is_not_cached(tmp_path, pipeline):
+    cache = ResponseCache(path=str(tmp_path / "r.sqlite3"))
+    client = _FakeClient("Sorry, I cannot help with that.")
+    for _ in range(2):
+        _, metrics, dish = _invoke(client, cache)
+        assert metrics["cache"] == "miss" and dish is None
+    assert client.calls == 2
+
+
+def test_use_cache_false_bypasses_cache(tmp_path, pipeline):
+    cache = ResponseCache(path=str(tmp_path / "r.sqlite3"))
+    client = _FakeClient(json.dumps(DISH, ensure_ascii=False))
+    for _ in range(2):
+        _, metrics, _ = _invoke(client, cache, use_cache=False)
+        assert metrics["cache"] == "bypass"
+    assert client.calls == 2
+    assert cache.stats() == {"cache_hits": 0, "cache_misses": 0}
+
+
+def test_cache_disabled_by_config(monkeypatch):
+    from src import response_cache
+    monkeypatch.setattr(response_cache, "CACHE_ENABLED", False)
+    assert response_cache.get_response_cache() is None
@@ -0,0 +1,75 @@
+import pytest
+
+from src.semantic_cache import SemanticCache, fold_norm, normalize_description
+
+SCOPE = "model|v1"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SemanticCache(str(tmp_path / "semantic.sqlite3"))
+
+
+@pytest.mark.parametrize("a, b", [
+    ("phở bò không hành", "phở bò có hành"),
+    ("cá kho", "cà kho"),
+    ("một tô phở bò", "tô phở bò"),
+])
+def test_normalize_keeps_distinct_requests_apart(a, b):
+    assert normalize_description(a) != normalize_description(b)
+
+
+@pytest.mark.parametrize("desc", [
+    "nguyên liệu phở bò", "Hãy cho tôi nguyên liệu của món phở bò.", "phở bò cần gì", "phở bò có những gì",
+])
+def test_normalize_drops_question_phrasing(desc):
+    assert normalize_description(desc) == ("bò phở", "")
+
+
+def test_normalize_numbers_and_folding():
+    norm, numbers = normalize_description("phở bò cho bốn người")
+    assert numbers == "4"
+    assert fold_norm(norm) == "4 bo nguoi pho"
+    assert fold_norm("bo pho") == "bo pho"
+
+
+@pytest.mark.parametrize("stored, query", [
+    ("phở bò không hành", "phở bò có hành"),
+    ("phở bò có hành", "phở bò không hành"),
+    ("cá kho", "cà kho"),
+    ("phở bò cho 2 người", "phở bò cho 4 người"),
+])
+def test_lookup_no_false_hit(cache, stored, query):
+    cache.add(SCOPE, stored, '{"dish_name": "stored"}')
+    assert cache.lookup(SCOPE, query) is None
+
+
+def test_lookup_paraphrase_and_scope(cache):
+    cache.add(SCOPE, "phở bò không hành", '{"dish_name": "A"}', 100, 50)
+    assert cache.lookup(SCOPE, "Hãy cho tôi nguyên liệu của món phở bò, không hành.") == (
+        '{"dish_name": "A"}', 1.0, 100, 50)
+    assert cache.lookup("other|v1", "phở bò không hành") is None
+
+
+def test_lookup_unaccented_query(cache):
+    cache.add(SCOPE, "phở bò không hành", '{"dish_name": "A"}')
+    assert cache.lookup(SCOPE, "pho bo khong hanh")[0] == '{"dish_name": "A"}'
+    assert cache.lookup(SCOPE, "pho bo co hanh") is None
+
+
+def test_lookup_unaccented_query_ambiguous(cache):
+    cache.add(SCOPE, "cá kho", '{"dish_name": "cá kho"}')
+    assert cache.lookup(SCOPE, "ca kho")[0] == '{"dish_name": "cá kho"}'
+    cache.add(SCOPE, "cà kho", '{"dish_name": "cà kho"}')
+    # hai món khác nhau cùng bỏ dấu thành "ca kho": không đoán
+    assert cache.lookup(SCOPE, "ca kho") is None
+    assert cache.lookup(SCOPE, "cà kho")[0] == '{"dish_name": "cà kho"}'
+
+
+def test_unwritable_cache_dir_is_a_miss(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    cache = SemanticCache(str(blocker / "semantic.sqlite3"))
+    assert cache.lookup(SCOPE, "phở bò") is None
+    cache.add(SCOPE, "phở bò", "{}")
+    assert cache.report()["entries"] == 0
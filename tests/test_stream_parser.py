@@ -0,0 +1,60 @@
+import json
+
+from src.stream_parser import IngredientStreamParser
+
+DISH = {
+    "dish_name": "Phở bò",
+    "cuisine": "Vietnamese",
+    "ingredients": [
+        {"name": "bánh phở", "quantity": "200", "unit": "g"},
+        {"name": "nước dùng {xương}", "quantity": "1", "unit": "l"},
+        {"name": "hành \"lá\"", "quantity": "2", "unit": "nhánh"},
+    ],
+    "notes": ["{không phải nguyên liệu}"],
+}
+
+
+def _feed_all(chunks):
+    parser = IngredientStreamParser()
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed(chunk))
+    return parser, items
+
+
+def test_ingredients_emitted_as_each_object_closes():
+    text = json.dumps(DISH, ensure_ascii=False)
+    parser, items = _feed_all(text[i:i + 7] for i in range(0, len(text), 7))
+    assert [i.name for i in items] == ["bánh phở", "nước dùng {xương}", 'hành "lá"']
+    assert parser.done and parser.count == 3
+    assert parser.text == text
+
+
+def test_first_ingredient_before_stream_ends():
+    text = json.dumps(DISH, ensure_ascii=False)
+    cut = text.index("}") + 1  # ngay sau nguyên liệu đầu tiên
+    parser = IngredientStreamParser()
+    assert [i.name for i in parser.feed(text[:cut])] == ["bánh phở"]
+    assert not parser.done
+
+
+def test_lead_in_and_fence_ignored():
+    text = "Đây là kết quả:\n```json\n" + json.dumps(DISH, ensure_ascii=False) + "\n```"
+    _, items = _feed_all(text)  # từng ký tự một
+    assert len(items) == 3
+
+
+def test_invalid_item_skipped_and_nested_arrays_ignored():
+    text = json.dumps({
+        "dish_name": "x",
+        "notes": [{"name": "không phải", "quantity": "1"}],
+        "ingredients": [{"name": "", "quantity": "1"}, {"name": "muối", "quantity": "1", "unit": None}],
+    })
+    parser, items = _feed_all([text])
+    assert [i.name for i in items] == ["muối"]
+    assert parser.count == 1
+
+
+def test_text_after_root_object_not_parsed():
+    parser, items = _feed_all([json.dumps(DISH), '\n{"ingredients": [{"name": "a", "quantity": "1"}]}'])
+    assert len(items) == 3 and parser.done